@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+# built in
+import argparse
+import logging
+
+# local imports
+from objs.autotune import tune_fetch, tune_mapreduce, save_settings, \
+    SETTINGS_PATH, FETCH_LEVELS
+from objs.site import Website
+from objs.testserver import TestServer, synthetic_page
+
+logger = logging.getLogger(__name__)
+
+
+def synthetic_words(pages):
+    """
+    Splits synthetic homepages into words the same way the sites are, to
+    have a corpus for the mapreduce measurements.
+    """
+    words = []
+    for i in range(pages):
+        path = '/site%d' % i
+        words.extend(Website(url=path, content=synthetic_page(path))
+                     .word_list)
+    return words
+
+
+def main(
+        pages=200,
+        latency=0.05,
+        error_rate=0.0,
+        url_file=None,
+        corpus_pages=100,
+        max_error_rate=0.05,
+        settings_path=SETTINGS_PATH,
+        save=True
+):
+    server = None
+    if url_file:
+        # replay against pages that are already being served
+        with open(url_file) as urls:
+            fetch_urls = [line.strip() for line in urls if line.strip()]
+    else:
+        server = TestServer(latency=latency, error_rate=error_rate).start()
+        fetch_urls = server.site_urls(pages)
+
+    try:
+        logger.info('Tuning fetch workers with %d pages', len(fetch_urls))
+        fetch_workers, _ = tune_fetch(fetch_urls, levels=FETCH_LEVELS,
+                                      max_error_rate=max_error_rate)
+    finally:
+        if server is not None:
+            server.stop()
+
+    words = synthetic_words(corpus_pages)
+    logger.info('Tuning mapreduce workers with %d words', len(words))
+    worker_processes, _ = tune_mapreduce(words)
+
+    logger.info('Fetch workers: %d', fetch_workers)
+    logger.info('Worker processes: %d', worker_processes)
+    if save:
+        save_settings(fetch_workers, worker_processes, path=settings_path)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    parser = argparse.ArgumentParser(
+        description='Find the best number of fetch and word counting '
+                    'processes for this host and save them for later runs')
+
+    parser.add_argument(
+        '--pages',
+        dest='pages',
+        default=200,
+        type=int,
+        help='Number of test server pages fetched at each worker count'
+    )
+    parser.add_argument(
+        '--latency',
+        dest='latency',
+        default=0.05,
+        type=float,
+        help='Average seconds the test server waits before each response, '
+             'to act like a remote site'
+    )
+    parser.add_argument(
+        '--error-rate',
+        dest='error_rate',
+        default=0.0,
+        type=float,
+        help='Share of test server requests that fail'
+    )
+    parser.add_argument(
+        '--url-file',
+        dest='url_file',
+        default=None,
+        help='File with one URL per line to fetch instead of starting the '
+             'test server'
+    )
+    parser.add_argument(
+        '--corpus-pages',
+        dest='corpus_pages',
+        default=100,
+        type=int,
+        help='Number of synthetic pages whose words are counted to tune the '
+             'mapreduce workers'
+    )
+    parser.add_argument(
+        '--max-error-rate',
+        dest='max_error_rate',
+        default=0.05,
+        type=float,
+        help='Stop adding fetch workers once more requests than this fail'
+    )
+    parser.add_argument(
+        '--settings',
+        dest='settings_path',
+        default=SETTINGS_PATH,
+        help='File the tuned settings are saved to'
+    )
+    parser.add_argument(
+        '--dry-run',
+        dest='save',
+        action='store_false',
+        help='Only report the tuned settings without saving them'
+    )
+
+    args = parser.parse_args()
+
+    main(pages=args.pages, latency=args.latency, error_rate=args.error_rate,
+         url_file=args.url_file, corpus_pages=args.corpus_pages,
+         max_error_rate=args.max_error_rate,
+         settings_path=args.settings_path, save=args.save)
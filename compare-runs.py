@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+# built in
+import argparse
+import logging
+
+# local imports
+from objs.output import RunResults, compare_runs
+
+logger = logging.getLogger(__name__)
+
+
+def main(run_a_dir, run_b_dir, top=20):
+    run_a = RunResults(run_a_dir)
+    run_b = RunResults(run_b_dir)
+
+    diff = compare_runs(run_a, run_b, top=top)
+
+    logger.info('Comparing run %s to run %s', run_a.run_id, run_b.run_id)
+    logger.info('Sites: %d vs %d (%d in common, %d dropped, %d new)',
+                diff['sites_a'], diff['sites_b'], diff['common_sites'],
+                diff['only_in_a'], diff['only_in_b'])
+    logger.info('Average word count: %.2f vs %.2f',
+                diff['average_word_count'][0], diff['average_word_count'][1])
+
+    logger.info('Largest word count rank changes')
+    for url, rank_a, rank_b, word_delta in diff['rank_changes']:
+        logger.info('Site: %s - Rank: %d -> %d (words %+d)',
+                    url, rank_a, rank_b, word_delta)
+
+    logger.info('Largest header percentage changes')
+    for header, pct_a, pct_b in diff['header_changes']:
+        logger.info('Header: %s - Pct: %05.2f -> %05.2f', header, pct_a, pct_b)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(
+        description='Compare the word count ranks and header percentages of '
+                    'two runs written with --output-dir')
+
+    parser.add_argument(
+        'run_a',
+        help='Directory of the baseline run'
+    )
+    parser.add_argument(
+        'run_b',
+        help='Directory of the run to compare against the baseline'
+    )
+    parser.add_argument(
+        '--top',
+        dest='top',
+        default=20,
+        type=int,
+        help='Number of the largest changes to show'
+    )
+
+    args = parser.parse_args()
+
+    main(args.run_a, args.run_b, top=args.top)
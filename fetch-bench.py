@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+# built in
+from __future__ import division
+
+import argparse
+import logging
+import multiprocessing
+import time
+
+# local imports
+from objs.fetch_policy import FetchPolicy, configure_policy, get_policy
+from objs.testserver import TestServer
+
+logger = logging.getLogger(__name__)
+
+
+def _fetch(url):
+    """
+    Fetches a page with the policy of the worker process.
+    Returns:
+        (float): Seconds until the page was read, None if it failed.
+    """
+    start = time.time()
+    try:
+        response, _ = get_policy().get(url)
+    except Exception:
+        return None
+    if response.status_code >= 400:
+        return None
+    return time.time() - start
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1,
+                       int(round(percent / 100.0 * (len(ordered) - 1))))]
+
+
+def measure(name, policy, urls, workers):
+    """
+    Fetches the pages with a pool using the policy and logs the share of
+    pages read and their latency percentiles.
+    """
+    configure_policy(policy)
+    pool = multiprocessing.Pool(processes=workers)
+    try:
+        start = time.time()
+        latencies = pool.map(_fetch, urls, chunksize=1)
+        elapsed = time.time() - start
+    finally:
+        pool.close()
+        pool.join()
+    fetched = [latency for latency in latencies if latency is not None]
+    logger.info('%-10s yield %5.1f%%  p50 %6.3fs  p95 %6.3fs  p99 %6.3fs  '
+                'total %6.1fs', name, len(fetched) / len(urls) * 100.0,
+                _percentile(fetched, 50) if fetched else 0.0,
+                _percentile(fetched, 95) if fetched else 0.0,
+                _percentile(fetched, 99) if fetched else 0.0, elapsed)
+
+
+def main(pages=200, workers=8, latency=0.05, slow_rate=0.1, slow_latency=1.5,
+         stall_rate=0.05, stall_time=3.0, error_rate=0.02, timeout=1.0,
+         retries=2):
+    server = TestServer(latency=latency, error_rate=error_rate,
+                        slow_rate=slow_rate, slow_latency=slow_latency,
+                        stall_rate=stall_rate, stall_time=stall_time).start()
+    urls = server.site_urls(pages)
+    policies = [
+        ('fixed', FetchPolicy(timeout=timeout)),
+        ('retry', FetchPolicy(timeout=timeout, retries=retries)),
+        ('adaptive', FetchPolicy(timeout=timeout, adaptive=True,
+                                 retries=retries)),
+        ('hedged', FetchPolicy(timeout=timeout, adaptive=True,
+                               retries=retries, hedge=True)),
+    ]
+    try:
+        for name, policy in policies:
+            measure(name, policy, urls, workers)
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    parser = argparse.ArgumentParser(
+        description='Compare the yield and tail latency of the fetch '
+                    'policies against a local server that injects delays')
+
+    parser.add_argument(
+        '--pages',
+        dest='pages',
+        default=200,
+        type=int,
+        help='Number of test server pages fetched with each policy'
+    )
+    parser.add_argument(
+        '--workers',
+        dest='workers',
+        default=8,
+        type=int,
+        help='Number of fetch processes'
+    )
+    parser.add_argument(
+        '--latency',
+        dest='latency',
+        default=0.05,
+        type=float,
+        help='Average seconds the test server waits before each response'
+    )
+    parser.add_argument(
+        '--slow-rate',
+        dest='slow_rate',
+        default=0.1,
+        type=float,
+        help='Share of pages that are always slow but do answer'
+    )
+    parser.add_argument(
+        '--slow-latency',
+        dest='slow_latency',
+        default=1.5,
+        type=float,
+        help='Average extra seconds of a slow page'
+    )
+    parser.add_argument(
+        '--stall-rate',
+        dest='stall_rate',
+        default=0.05,
+        type=float,
+        help='Share of requests that stall'
+    )
+    parser.add_argument(
+        '--stall-time',
+        dest='stall_time',
+        default=3.0,
+        type=float,
+        help='Seconds a stalled request waits'
+    )
+    parser.add_argument(
+        '--error-rate',
+        dest='error_rate',
+        default=0.02,
+        type=float,
+        help='Share of requests that fail with a 500'
+    )
+    parser.add_argument(
+        '--timeout',
+        dest='timeout',
+        default=1.0,
+        type=float,
+        help='Fixed timeout, and the first timeout of the adaptive policies'
+    )
+    parser.add_argument(
+        '--retries',
+        dest='retries',
+        default=2,
+        type=int,
+        help='Retries of the retrying policies'
+    )
+
+    args = parser.parse_args()
+
+    main(pages=args.pages, workers=args.workers, latency=args.latency,
+         slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+         stall_rate=args.stall_rate, stall_time=args.stall_time,
+         error_rate=args.error_rate, timeout=args.timeout,
+         retries=args.retries)
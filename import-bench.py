@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+# built in
+from __future__ import division
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# modules and scripts whose import time matters for workers and cold starts
+TARGETS = [
+    ('objs.site', 'import objs.site'),
+    ('objs.top_sites', 'import objs.top_sites'),
+    ('top-sites.py',
+     'import runpy; runpy.run_path("top-sites.py", run_name="bench")'),
+    ('lambda.py',
+     'import runpy; runpy.run_path("lambda.py", run_name="bench")'),
+]
+
+# libraries that should only be loaded when they are actually used
+HEAVY_MODULES = ['requests', 'bs4', 'boto3', 'botocore', 'numpy', 'pyarrow',
+                 'cProfile']
+
+CHILD_TEMPLATE = '''
+import json, sys, time
+start = time.time()
+{statement}
+elapsed = time.time() - start
+print(json.dumps({{
+    "elapsed": elapsed,
+    "heavy": [m for m in {heavy!r} if m in sys.modules]
+}}))
+'''
+
+
+def time_import(statement, repeat):
+    """
+    Times a statement in fresh interpreters so nothing is already cached.
+    Args:
+        statement (str): Python code that imports the module.
+        repeat (int): Number of interpreters to start.
+    Returns:
+        (float, list): Median time in ms and the heavy modules it loaded.
+    """
+    code = CHILD_TEMPLATE.format(statement=statement, heavy=HEAVY_MODULES)
+    times = []
+    heavy = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         cwd=ROOT)
+        result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+        times.append(result['elapsed'] * 1000)
+        heavy = result['heavy']
+    times.sort()
+    return times[len(times) // 2], heavy
+
+
+def _noop(value):
+    return value
+
+
+def time_pool_spawn(worker_processes, repeat):
+    """
+    Times creating a pool, running a task on every worker and shutting it
+    down, which is what every mapreduce call pays.
+    Returns:
+        (float): Median time in ms.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        pool = multiprocessing.Pool(processes=worker_processes)
+        pool.map(_noop, range(worker_processes))
+        pool.close()
+        pool.join()
+        times.append((time.time() - start) * 1000)
+    times.sort()
+    return times[len(times) // 2]
+
+
+def main(repeat=5, worker_processes=4):
+    logger.info('Import time (median of %d fresh interpreters)', repeat)
+    for name, statement in TARGETS:
+        elapsed, heavy = time_import(statement, repeat)
+        logger.info('%-16s %8.1f ms  heavy modules loaded: %s',
+                    name, elapsed, ', '.join(heavy) or 'none')
+
+    elapsed = time_pool_spawn(worker_processes, repeat)
+    logger.info('Pool of %d workers spawn and shutdown: %.1f ms',
+                worker_processes, elapsed)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    parser = argparse.ArgumentParser(
+        description='Measure the import time of the scripts and modules and '
+                    'the cost of spawning pool workers')
+
+    parser.add_argument(
+        '--repeat',
+        dest='repeat',
+        default=5,
+        type=int,
+        help='Number of times to repeat each measurement'
+    )
+    parser.add_argument(
+        '--worker-processes',
+        dest='worker_count',
+        default=4,
+        type=int,
+        help='Number of workers to spawn for the pool measurement'
+    )
+
+    args = parser.parse_args()
+
+    main(repeat=args.repeat, worker_processes=args.worker_count)
@@ -4,7 +4,6 @@ import json
 import logging
 import string
 
-import bs4
 import re
 
 
@@ -32,6 +31,8 @@ class Website(object):
         return self.name
 
     def _find_title(self):
+        import bs4
+
         html = bs4.BeautifulSoup(str(self._content), "html.parser")
         if html.title:
             return html.title.text
@@ -43,6 +44,8 @@ class Website(object):
         return headers.keys()
 
     def split_words(self):
+        import bs4
+
         html = bs4.BeautifulSoup(str(self._content), "html.parser")
         data = html.findAll(text=True)
 
@@ -0,0 +1,202 @@
+from __future__ import division
+
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import time
+from datetime import datetime
+
+from objs.site import mapreduce, partition_data, map_function, \
+    reduce_function
+
+logger = logging.getLogger(__name__)
+
+SETTINGS_PATH = os.path.join(os.path.expanduser('~'), '.topsites',
+                             'autotune.json')
+
+FETCH_LEVELS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def _fetch(url, timeout=5):
+    """
+    Fetches a page for the fetch benchmark.
+    Returns:
+        (bool): True if the page was read.
+    """
+    import requests
+
+    try:
+        response = requests.get('http://' + url, timeout=timeout)
+        return response.status_code < 400
+    except Exception:
+        return False
+
+
+def measure_fetch(urls, workers):
+    """
+    Fetches the URLs with a pool of workers.
+    Returns:
+        (float, float): Pages fetched per second and the share of requests
+        that failed.
+    """
+    pool = multiprocessing.Pool(processes=workers)
+    try:
+        # start the workers before the clock so spawning isn't measured
+        pool.map(_noop, range(workers))
+        start = time.time()
+        results = pool.map(_fetch, urls, chunksize=1)
+        elapsed = time.time() - start
+    finally:
+        pool.close()
+        pool.join()
+    errors = results.count(False)
+    return (len(results) - errors) / elapsed, errors / len(results)
+
+
+def _noop(value):
+    return value
+
+
+def measure_mapreduce(words, workers, repeat=3):
+    """
+    Counts the words with the mapreduce workers.
+    Returns:
+        (float): Words counted per second, best of repeat runs.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        mapreduce(
+            all_items=words,
+            worker_count=workers,
+            partition_func=partition_data,
+            reduce_func=reduce_function,
+            map_func=map_function
+        )
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return len(words) / best
+
+
+def _climb(levels, measure, min_gain, max_error_rate=None):
+    """
+    Tries increasing levels of concurrency until the throughput stops
+    improving by min_gain or the error rate climbs past max_error_rate.
+    Args:
+        levels (list int): Worker counts to try, lowest first.
+        measure: Function of a worker count returning the throughput, or
+          (throughput, error rate).
+    Returns:
+        (int, list): The best worker count and (workers, throughput, error
+        rate) of every level tried.
+    """
+    best_level = levels[0]
+    best_rate = 0.0
+    trials = []
+    for level in levels:
+        result = measure(level)
+        rate, error_rate = result if isinstance(result, tuple) \
+            else (result, 0.0)
+        trials.append((level, rate, error_rate))
+        logger.info('%4d workers: %10.1f per second, %.1f%% errors',
+                    level, rate, error_rate * 100.0)
+
+        if max_error_rate is not None and error_rate > max_error_rate:
+            logger.info('Error rate climbed past %.1f%%, stopping',
+                        max_error_rate * 100.0)
+            break
+        if rate > best_rate * (1 + min_gain):
+            best_level, best_rate = level, rate
+        else:
+            logger.info('Throughput plateaued, stopping')
+            break
+    return best_level, trials
+
+
+def tune_fetch(urls, levels=FETCH_LEVELS, min_gain=0.1,
+               max_error_rate=0.05):
+    """
+    Finds the number of fetch processes with the highest page throughput.
+    Args:
+        urls (list str): Pages to fetch at each level, like the homepages
+          of a local test server.
+        levels (list int): Worker counts to try.
+        min_gain (float): Smallest relative throughput gain that is worth
+          doubling the workers for.
+        max_error_rate (float): Stop when more requests than this fail.
+    Returns:
+        (int, list): The chosen worker count and the trials.
+    """
+    return _climb(levels, lambda workers: measure_fetch(urls, workers),
+                  min_gain, max_error_rate)
+
+
+def tune_mapreduce(words, levels=None, min_gain=0.05):
+    """
+    Finds the number of mapreduce workers that counts words the fastest.
+    Args:
+        words (list str): Words to count at each level.
+        levels (list int): Worker counts to try. Defaults to 1 up to twice
+          the number of CPUs.
+        min_gain (float): Smallest relative speed up that is worth adding
+          workers for.
+    Returns:
+        (int, list): The chosen worker count and the trials.
+    """
+    if levels is None:
+        cpus = multiprocessing.cpu_count()
+        levels = sorted(set([1, 2] + list(range(2, cpus * 2 + 1, 2))))
+    return _climb(levels, lambda workers: measure_mapreduce(words, workers),
+                  min_gain)
+
+
+def _host_key():
+    return socket.gethostname()
+
+
+def load_settings(path=SETTINGS_PATH):
+    """
+    Gets the settings tuned for this host.
+    Returns:
+        (dict): fetch_workers and worker_processes, or an empty dict if
+        this host hasn't been tuned.
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as settings_file:
+            settings = json.load(settings_file)
+    except (IOError, ValueError):
+        logger.warning('Could not read tuned settings from %s', path)
+        return {}
+    return settings.get(_host_key(), {})
+
+
+def save_settings(fetch_workers, worker_processes, path=SETTINGS_PATH):
+    """
+    Saves the tuned settings for this host, keeping the ones of other
+    hosts that share the file.
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    settings = {}
+    if os.path.exists(path):
+        try:
+            with open(path) as settings_file:
+                settings = json.load(settings_file)
+        except (IOError, ValueError):
+            settings = {}
+    settings[_host_key()] = {
+        'fetch_workers': fetch_workers,
+        'worker_processes': worker_processes,
+        'cpu_count': multiprocessing.cpu_count(),
+        'tuned': datetime.utcnow().isoformat()
+    }
+    with open(path + '.tmp', 'w') as settings_file:
+        json.dump(settings, settings_file, indent=2)
+    os.rename(path + '.tmp', path)
+    logger.info('Saved tuned settings to %s', path)
@@ -0,0 +1,541 @@
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from functools import partial
+from multiprocessing.managers import BaseManager
+
+from objs.profiling import profiled
+from objs.telemetry import tracked
+from objs.site import Website
+
+logger = logging.getLogger(__name__)
+
+# environment variable the shared key can be defined in
+CLUSTER_KEY_ENV = 'TOPSITES_CLUSTER_KEY'
+
+
+def is_loopback(host):
+    """
+    Returns:
+        (bool): Whether an address host only accepts connections from this
+        machine.
+    """
+    return host == 'localhost' or host.startswith('127.') or host == '::1'
+
+
+def resolve_authkey(host, authkey=None, key_file=None):
+    """
+    Picks the key the coordinator and its worker nodes authenticate with.
+    The manager connection unpickles what it is sent, so a coordinator
+    that listens beyond this machine must have a secret key. One that only
+    listens on loopback gets a random key that its local nodes inherit.
+    Args:
+        host (str): Host the coordinator listens on or a worker node
+          connects to, None for a worker node.
+        authkey (str): Key given on the command line or environment.
+        key_file (str): File holding the key.
+    Returns:
+        (bytes): The key.
+    Raises:
+        ValueError: No key was given and the coordinator isn't loopback
+          only, or this is a worker node.
+    """
+    if key_file:
+        with open(key_file, 'rb') as authkey_file:
+            authkey = authkey_file.read().strip()
+    if authkey:
+        if not isinstance(authkey, bytes):
+            authkey = authkey.encode('utf-8')
+        return authkey
+    if host is not None and is_loopback(host):
+        return os.urandom(16)
+    raise ValueError('A --cluster-authkey or --cluster-authkey-file is '
+                     'needed to listen on or connect to %s' %
+                     (host or 'a coordinator'))
+
+
+# counters every worker node reduces its batches to
+SHARD_COUNTERS = ('sites', 'failed', 'distinct_words', 'total_words',
+                  'content_size', 'pages_crawled')
+
+
+class HashRing(object):
+    """
+    Consistent hash ring used to shard URLs across the worker nodes. Each
+    node is placed on the ring many times so the URLs spread out evenly and
+    only the URLs of a node that joins or leaves move to another node.
+    """
+    def __init__(self, nodes=None, replicas=64):
+        self._replicas = replicas
+        self._keys = []
+        self._ring = {}
+        for node in nodes or []:
+            self.add(node)
+
+    @staticmethod
+    def _hash(value):
+        return int(hashlib.md5(value.encode('utf-8')).hexdigest()[:16], 16)
+
+    def add(self, node):
+        for i in range(self._replicas):
+            key = self._hash('%s:%d' % (node, i))
+            self._ring[key] = node
+            bisect.insort(self._keys, key)
+
+    def remove(self, node):
+        for i in range(self._replicas):
+            key = self._hash('%s:%d' % (node, i))
+            if self._ring.pop(key, None) is not None:
+                self._keys.remove(key)
+
+    @property
+    def nodes(self):
+        return set(self._ring.values())
+
+    def node_for(self, item):
+        """
+        Finds the node that owns an item.
+        Args:
+            item (str): Key to place on the ring, a URL here.
+        Returns:
+            (str): Node id or None when the ring is empty.
+        """
+        if not self._keys:
+            return None
+        index = bisect.bisect(self._keys, self._hash(item)) % len(self._keys)
+        return self._ring[self._keys[index]]
+
+
+class Coordinator(object):
+    """
+    Hands out batches of URLs to the worker nodes and collects the analyzed
+    site records they send back. URLs are owned by nodes through the hash
+    ring. A node that stops sending heartbeats is dropped from the ring and
+    its queued and leased URLs are given to the nodes that are left.
+    """
+    def __init__(self, urls, batch_size=10, node_timeout=30.0):
+        self._lock = threading.Lock()
+        self._batch_size = batch_size
+        self._node_timeout = node_timeout
+
+        self._ring = HashRing()
+        # URLs waiting to be handed out before any node has joined
+        self._unassigned = deque(urls)
+        self._pending = {}
+        self._leases = {}
+        self._heartbeats = {}
+        self._records = {}
+        self._shards = {}
+        self._word_sketch = None
+        self._total = len(urls)
+
+    def _assign(self, urls):
+        for url in urls:
+            node = self._ring.node_for(url)
+            if node is None:
+                self._unassigned.append(url)
+            else:
+                self._pending[node].append(url)
+
+    def _drop_node(self, node):
+        logger.warning('Lost worker node %s, reassigning its URLs', node)
+        self._ring.remove(node)
+        self._heartbeats.pop(node, None)
+        urls = list(self._pending.pop(node, []))
+        for batch_id, (owner, batch) in list(self._leases.items()):
+            if owner == node:
+                del self._leases[batch_id]
+                urls.extend(batch)
+        self._assign(urls)
+
+    def _check_nodes(self):
+        now = time.time()
+        for node, last_seen in list(self._heartbeats.items()):
+            if now - last_seen > self._node_timeout:
+                self._drop_node(node)
+
+    def register(self, node):
+        """
+        Adds a worker node to the ring. Only the queued URLs that now hash
+        to the new node are moved to it.
+        """
+        with self._lock:
+            logger.info('Worker node %s joined', node)
+            self._ring.add(node)
+            self._pending[node] = deque()
+            self._heartbeats[node] = time.time()
+
+            queued = list(self._unassigned)
+            self._unassigned.clear()
+            for other in list(self._pending):
+                if other == node:
+                    continue
+                queued.extend(self._pending[other])
+                self._pending[other].clear()
+            self._assign(queued)
+
+    def heartbeat(self, node):
+        with self._lock:
+            if node in self._heartbeats:
+                self._heartbeats[node] = time.time()
+                return True
+            # the node was dropped, it needs to register again
+            return False
+
+    def get_batch(self, node):
+        """
+        Leases the next batch of URLs owned by a node.
+        Returns:
+            (batch_id, urls) tuple or None if the node has no work queued.
+        """
+        with self._lock:
+            self._check_nodes()
+            if node not in self._heartbeats:
+                return None
+            self._heartbeats[node] = time.time()
+
+            queue = self._pending[node]
+            if not queue:
+                return None
+            batch = [queue.popleft()
+                     for _ in range(min(self._batch_size, len(queue)))]
+            batch_id = uuid.uuid4().hex
+            self._leases[batch_id] = (node, batch)
+            return batch_id, batch
+
+    def submit(self, node, batch_id, batch):
+        """
+        Takes the reduced results of a leased batch and adds its counters
+        to the node's shard. Results for a batch that was already
+        reassigned to another node are ignored.
+        Args:
+            batch (dict): Made by reduce_batch.
+        """
+        with self._lock:
+            if node in self._heartbeats:
+                self._heartbeats[node] = time.time()
+            if self._leases.pop(batch_id, None) is None:
+                logger.debug('Ignoring stale batch %s from %s',
+                             batch_id, node)
+                return False
+            for record in batch['sites']:
+                self._records[record['url']] = record
+
+            shard = self._shards.get(node)
+            if shard is None:
+                shard = self._shards[node] = {
+                    'counters': dict.fromkeys(SHARD_COUNTERS, 0),
+                    'headers': {}}
+            for name, value in batch['counters'].items():
+                shard['counters'][name] += value
+            for header, count in batch['headers'].items():
+                shard['headers'][header] = \
+                    shard['headers'].get(header, 0) + count
+            if batch['word_sketch']:
+                from objs.sketch import WordSketch
+
+                sketch = WordSketch.from_record(batch['word_sketch'])
+                if self._word_sketch is None:
+                    self._word_sketch = sketch
+                else:
+                    self._word_sketch.merge(sketch)
+            return True
+
+    def status(self):
+        with self._lock:
+            self._check_nodes()
+            queued = len(self._unassigned) + sum(
+                len(queue) for queue in self._pending.values())
+            return {
+                'nodes': len(self._heartbeats),
+                'queued': queued,
+                'leased': sum(len(batch)
+                              for _, batch in self._leases.values()),
+                'completed': len(self._records),
+                'total': self._total
+            }
+
+    def is_finished(self):
+        status = self.status()
+        return status['queued'] == 0 and status['leased'] == 0
+
+    def records(self):
+        with self._lock:
+            return list(self._records.values())
+
+    def shards(self):
+        """
+        Returns:
+            (dict): node -> counters and header counts of the batches it
+            analyzed.
+        """
+        with self._lock:
+            return dict(self._shards)
+
+    @property
+    def word_sketch(self):
+        """
+        Word sketch merged from the shards, None when the nodes don't
+        sketch.
+        """
+        return self._word_sketch
+
+
+class CoordinatorManager(BaseManager):
+    pass
+
+
+def parse_address(address):
+    """
+    Splits a host:port string into an address tuple.
+    """
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+
+def analyze_url(url, header_values=False, crawler=None, word_sketch=None):
+    """
+    Fetches a site's homepage and counts its words on a worker node.
+    Args:
+        url (str): URL of the site.
+        header_values (bool): Keep the header values of the response.
+        crawler (SiteCrawler): Also crawl the pages linked from the
+          homepage.
+        word_sketch (SketchMapper): Sketch the words instead of counting
+          them.
+    Returns:
+        (Website): The analyzed site without its content.
+    """
+    site = Website(url=url)
+    site.request_homepage(capture_header_values=header_values,
+                          crawler=crawler)
+    if word_sketch:
+        site.calculate_word_sketch(word_sketch)
+    else:
+        site.calculate_word_count()
+    site.release_content()
+    return site
+
+
+def reduce_batch(sites):
+    """
+    Reduces a batch on its worker node to what the coordinator needs, so
+    the word counts of the sites never leave the node: a summary record
+    of each site with its distinct and total words but not its word count
+    or sketch, the shard counters, the header counts and the word
+    sketches of the sites merged into one.
+    Args:
+        sites (list Website): Sites analyzed by analyze_url.
+    Returns:
+        (dict): The reduced batch.
+    """
+    counters = dict.fromkeys(SHARD_COUNTERS, 0)
+    headers = {}
+    word_sketch = None
+    summaries = []
+    for site in sites:
+        # the record is taken before the sketch is merged into
+        record = site.to_record()
+        record['word_count'] = {}
+        record['word_sketch'] = None
+        summaries.append(record)
+
+        counters['sites'] += 1
+        if site.fetch_error:
+            counters['failed'] += 1
+        counters['distinct_words'] += record['distinct_words']
+        counters['total_words'] += record['total_words']
+        counters['content_size'] += site.content_size
+        counters['pages_crawled'] += site.pages_crawled
+        for header in site.headers:
+            headers[header] = headers.get(header, 0) + 1
+        if site.word_sketch is not None:
+            if word_sketch is None:
+                word_sketch = site.word_sketch
+            else:
+                word_sketch.merge(site.word_sketch)
+    return {
+        'sites': summaries,
+        'counters': counters,
+        'headers': headers,
+        'word_sketch': word_sketch.to_record()
+        if word_sketch is not None else None
+    }
+
+
+def _heartbeat_loop(coordinator, node, stop, interval):
+    while not stop.wait(interval):
+        try:
+            coordinator.heartbeat(node)
+        except Exception:
+            logger.exception('Heartbeat from %s failed', node)
+
+
+def run_worker_node(
+        address,
+        authkey,
+        worker_processes=4,
+        node=None,
+        poll_interval=0.5,
+        heartbeat_interval=5.0,
+        header_values=False,
+        crawler=None,
+        word_sketch=None
+):
+    """
+    Runs a worker node that pulls batches of URLs from the coordinator,
+    analyzes them with a local pool of processes and sends each batch
+    back reduced to site summaries and shard counters.
+    Args:
+        address (tuple): (host, port) of the coordinator.
+        authkey (bytes): Shared key used to connect to the coordinator.
+        worker_processes (int): Number of local processes fetching sites.
+        node (str): Id of this node. Defaults to a random id.
+        poll_interval (float): Seconds to wait when no batch is available.
+        heartbeat_interval (float): Seconds between heartbeats while a
+          batch is being analyzed.
+        header_values (bool): Keep the header values of the responses.
+        crawler (SiteCrawler): Also crawl the pages linked from the
+          homepages.
+        word_sketch (SketchMapper): Sketch the words instead of counting
+          them.
+    """
+    node = node or 'node-%s' % uuid.uuid4().hex[:8]
+    CoordinatorManager.register('get_coordinator')
+    manager = CoordinatorManager(address=address, authkey=authkey)
+    manager.connect()
+    coordinator = manager.get_coordinator()
+    coordinator.register(node)
+
+    pool = multiprocessing.Pool(processes=worker_processes)
+    analyze = profiled(tracked(partial(analyze_url,
+                                       header_values=header_values,
+                                       crawler=crawler,
+                                       word_sketch=word_sketch)))
+    try:
+        while True:
+            lease = coordinator.get_batch(node)
+            if lease is None:
+                if coordinator.is_finished():
+                    break
+                if not coordinator.heartbeat(node):
+                    coordinator.register(node)
+                time.sleep(poll_interval)
+                continue
+
+            batch_id, urls = lease
+            logger.info('%s analyzing batch of %d sites', node, len(urls))
+            stop = threading.Event()
+            beat = threading.Thread(
+                target=_heartbeat_loop,
+                args=(coordinator, node, stop, heartbeat_interval))
+            beat.daemon = True
+            beat.start()
+            try:
+                sites = pool.map(analyze, urls)
+            finally:
+                stop.set()
+            coordinator.submit(node, batch_id, reduce_batch(sites))
+    finally:
+        pool.close()
+        pool.join()
+    logger.info('%s finished', node)
+
+
+def run_coordinator(
+        urls,
+        address=('127.0.0.1', 0),
+        authkey=None,
+        local_nodes=0,
+        worker_processes=4,
+        batch_size=10,
+        node_timeout=30.0,
+        poll_interval=0.5,
+        header_values=False,
+        crawler=None,
+        word_sketch=None
+):
+    """
+    Serves the URL list to worker nodes and waits for all of them to be
+    analyzed.
+    Args:
+        urls (list str): URLs of the sites to analyze.
+        address (tuple): (host, port) to listen on. Port 0 picks a free port.
+        authkey (bytes): Shared key the worker nodes connect with, only
+          optional when listening on loopback.
+        local_nodes (int): Number of worker nodes to start as local
+          processes.
+        worker_processes (int): Number of fetch processes per local node.
+        batch_size (int): Number of URLs handed out in each batch.
+        node_timeout (float): Seconds without a heartbeat before a node is
+          considered lost.
+        poll_interval (float): Seconds between progress checks.
+        header_values (bool): Have the local nodes keep the header values.
+        crawler (SiteCrawler): Have the local nodes crawl the pages linked
+          from the homepages.
+        word_sketch (SketchMapper): Have the local nodes sketch the words
+          instead of counting them.
+    Returns:
+        (list Website, WordSketch): Analyzed sites rebuilt from the node
+        summaries, which have their word totals but not their word
+        counts, and the word sketch merged from the shards, None if the
+        words weren't sketched.
+    """
+    generated = not authkey
+    authkey = resolve_authkey(address[0], authkey)
+    if generated and not local_nodes:
+        logger.warning('No --cluster-authkey, only local worker nodes can '
+                       'connect to the coordinator')
+    coordinator = Coordinator(urls, batch_size=batch_size,
+                              node_timeout=node_timeout)
+    CoordinatorManager.register('get_coordinator',
+                                callable=lambda: coordinator)
+    manager = CoordinatorManager(address=address, authkey=authkey)
+    server = manager.get_server()
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+    logger.info('Coordinator listening on %s:%d', *server.address)
+
+    nodes = []
+    for i in range(local_nodes):
+        process = multiprocessing.Process(
+            target=run_worker_node,
+            kwargs={
+                'address': server.address,
+                'authkey': authkey,
+                'worker_processes': worker_processes,
+                'node': 'local-%d' % i,
+                'header_values': header_values,
+                'crawler': crawler,
+                'word_sketch': word_sketch
+            })
+        process.start()
+        nodes.append(process)
+
+    while not coordinator.is_finished():
+        status = coordinator.status()
+        logger.debug('Cluster status: %s', status)
+        if nodes and status['nodes'] == 0 and \
+                not any(process.is_alive() for process in nodes):
+            raise RuntimeError('All local worker nodes exited with %d sites '
+                               'left' % status['queued'])
+        time.sleep(poll_interval)
+
+    for process in nodes:
+        process.join()
+
+    for node, shard in sorted(coordinator.shards().items()):
+        counters = shard['counters']
+        logger.info('Shard %s: %d sites, %d failed, %d words, %d bytes, '
+                    '%d distinct headers', node, counters['sites'],
+                    counters['failed'], counters['total_words'],
+                    counters['content_size'], len(shard['headers']))
+    return ([Website.from_record(record)
+             for record in coordinator.records()], coordinator.word_sketch)
@@ -0,0 +1,65 @@
+import zlib
+
+CODEC_ZLIB = 'zlib'
+CODEC_ZSTD = 'zstd'
+
+try:
+    import zstandard
+except ImportError:
+    # zstandard is optional, without it content is compressed with zlib
+    zstandard = None
+
+# picked once, this module is only imported when content is first stored
+DEFAULT_CODEC = CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+
+# zstd contexts are reused, making them is slower than compressing a page
+_zstd_compressor = None
+_zstd_decompressor = None
+
+
+def default_codec():
+    """
+    Returns:
+        (str): zstd when zstandard is installed, otherwise zlib.
+    """
+    return DEFAULT_CODEC
+
+
+def compress(text, codec=None):
+    """
+    Compresses page text.
+    Args:
+        text (str): Text to compress.
+        codec (str): zlib or zstd. Defaults to the best one available.
+    Returns:
+        (str, bytes): The codec used and the compressed UTF-8 bytes.
+    """
+    global _zstd_compressor
+    codec = codec or DEFAULT_CODEC
+    data = text.encode('utf-8')
+    if codec == CODEC_ZSTD:
+        if _zstd_compressor is None:
+            _zstd_compressor = zstandard.ZstdCompressor(level=3)
+        return codec, _zstd_compressor.compress(data)
+    if codec == CODEC_ZLIB:
+        return codec, zlib.compress(data, 6)
+    raise ValueError('Unknown codec: %s' % codec)
+
+
+def decompress(codec, blob):
+    """
+    Returns:
+        (str): The text compressed into blob with codec.
+    """
+    global _zstd_decompressor
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError('zstandard is needed to decompress zstd content')
+        if _zstd_decompressor is None:
+            _zstd_decompressor = zstandard.ZstdDecompressor()
+        data = _zstd_decompressor.decompress(blob)
+    elif codec == CODEC_ZLIB:
+        data = zlib.decompress(blob)
+    else:
+        raise ValueError('Unknown codec: %s' % codec)
+    return data.decode('utf-8')
@@ -0,0 +1,146 @@
+import logging
+from collections import deque
+
+from objs.sketch import BloomFilter
+
+try:
+    from urlparse import urljoin, urldefrag, urlparse
+except ImportError:
+    from urllib.parse import urljoin, urldefrag, urlparse
+
+logger = logging.getLogger(__name__)
+
+
+def _site_host(netloc):
+    host = netloc.lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+def same_site_links(url, hrefs):
+    """
+    Resolves the links of a page and keeps the ones on the same site.
+    Args:
+        url (str): Url of the page without the scheme, like the top sites
+          list.
+        hrefs (list str): href values of the page's links.
+    Returns:
+        Generator of the linked urls without the scheme or fragment. The
+        www. prefix doesn't make a link another site.
+    """
+    base = 'http://' + url
+    host = _site_host(urlparse(base).netloc)
+    for href in hrefs:
+        absolute = urldefrag(urljoin(base, href.strip()))[0]
+        parsed = urlparse(absolute)
+        if parsed.scheme not in ('http', 'https') or \
+                _site_host(parsed.netloc) != host:
+            continue
+        link = parsed.netloc + (parsed.path or '/')
+        if parsed.query:
+            link += '?' + parsed.query
+        yield link
+
+
+class CrawlFrontier(object):
+    """
+    Pages of one site waiting to be crawled, breadth first. Urls are only
+    queued the first time they are seen, which is checked with a Bloom
+    filter so millions of links take a fixed amount of memory. The queue
+    never holds more pages than the budget has left, since a page behind
+    those would never be crawled.
+    """
+    def __init__(self, max_pages, max_depth, capacity=None,
+                 error_rate=0.001):
+        """
+        Args:
+            max_pages (int): Most pages crawled, the homepage included.
+            max_depth (int): Most links followed from the homepage.
+            capacity (int): Links the Bloom filter is sized for. Defaults
+              to 100 per page of the budget.
+            error_rate (float): Share of new links wrongly taken as seen
+              once capacity links have been seen.
+        """
+        self._max_pages = max_pages
+        self._max_depth = max_depth
+        self._seen = BloomFilter(capacity or max(1000, max_pages * 100),
+                                 error_rate)
+        self._queue = deque()
+        self.crawled = 0
+
+    def visit(self, url):
+        """
+        Marks a url as crawled so links back to it are skipped.
+        """
+        self._seen.add(url)
+        self.crawled += 1
+
+    def add(self, links, depth):
+        """
+        Queues the links of a page found depth links away from the
+        homepage.
+        """
+        if depth > self._max_depth:
+            return
+        for link in links:
+            if len(self._queue) >= self._max_pages - self.crawled:
+                return
+            if self._seen.add(link):
+                self._queue.append((link, depth))
+
+    def pop(self):
+        """
+        Returns:
+            (str, int): Next url to crawl and its depth, None when the
+            queue is empty or the budget is spent.
+        """
+        if not self._queue or self.crawled >= self._max_pages:
+            return None
+        return self._queue.popleft()
+
+    @property
+    def discovered(self):
+        return self._seen.count
+
+
+class SiteCrawler(object):
+    """
+    Crawls the pages of a site linked from its homepage, up to a depth
+    and a page budget, and adds their words to the site.
+    """
+    def __init__(self, max_depth=1, max_pages=10):
+        """
+        Args:
+            max_depth (int): Most links followed from the homepage.
+            max_pages (int): Most pages crawled per site, the homepage
+              included.
+        """
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+
+    def crawl(self, site):
+        """
+        Crawls the pages linked from a site's fetched homepage.
+        Args:
+            site (Website): Site whose homepage was fetched with
+              extract_links.
+        """
+        from objs.site import Website
+
+        frontier = CrawlFrontier(self.max_pages, self.max_depth)
+        frontier.visit(site.url)
+        frontier.add(site.links, 1)
+        while True:
+            item = frontier.pop()
+            if item is None:
+                break
+            url, depth = item
+            frontier.visit(url)
+            page = Website(url=url)
+            page.request_homepage(extract_links=depth < self.max_depth)
+            if page.fetch_error:
+                continue
+            frontier.add(page.links, depth + 1)
+            site.add_page(page)
+        site.release_links()
+        logger.debug('Crawled %d pages of %s, %d links found',
+                     site.pages_crawled, site.url, frontier.discovered)
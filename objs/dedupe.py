@@ -0,0 +1,200 @@
+import re
+
+from objs.sketch import _hash128
+
+# cheap tokenizer used to fingerprint a page before it is parsed. It only
+# has to be good enough to tell similar pages apart, the real word split is
+# still done with BeautifulSoup for the pages that get analyzed.
+INVISIBLE_RE = re.compile(r'<(script|style)\b.*?</\1\s*>', re.I | re.S)
+TAG_RE = re.compile(r'<[^>]*>')
+TOKEN_RE = re.compile(r'\w+', re.U)
+
+FINGERPRINT_BITS = 64
+
+
+def page_tokens(content):
+    """
+    Splits the visible text of some HTML into lower case tokens without
+    parsing it.
+    """
+    if not content:
+        return []
+    text = TAG_RE.sub(' ', INVISIBLE_RE.sub(' ', content))
+    return TOKEN_RE.findall(text.lower())
+
+
+def shingles(tokens, size=3):
+    """
+    Yields the runs of size tokens, so word order counts and not just the
+    vocabulary.
+    """
+    if len(tokens) < size:
+        if tokens:
+            yield ' '.join(tokens)
+        return
+    for i in range(len(tokens) - size + 1):
+        yield ' '.join(tokens[i:i + size])
+
+
+def simhash(features):
+    """
+    64 bit SimHash of some features. Similar feature sets get fingerprints
+    that only differ in a few bits.
+    Returns:
+        (int): The fingerprint or None if there were no features.
+    """
+    weights = [0] * FINGERPRINT_BITS
+    seen = False
+    for feature in features:
+        seen = True
+        value = _hash128(feature)[0]
+        for bit in range(FINGERPRINT_BITS):
+            if value & (1 << bit):
+                weights[bit] += 1
+            else:
+                weights[bit] -= 1
+    if not seen:
+        return None
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def page_fingerprint(content):
+    return simhash(shingles(page_tokens(content)))
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+class NearDuplicateIndex(object):
+    """
+    LSH index of SimHash fingerprints. A fingerprint is split into
+    max_distance + 1 bands, so any two fingerprints within max_distance
+    bits share at least one band exactly and only the fingerprints in the
+    same band buckets have to be compared.
+    """
+    def __init__(self, max_distance=3):
+        self._max_distance = max_distance
+        bands = max_distance + 1
+        self._band_bits = FINGERPRINT_BITS // bands
+        self._band_mask = (1 << self._band_bits) - 1
+        self._tables = [{} for _ in range(bands)]
+        self._size = 0
+
+    def _bands(self, fingerprint):
+        for band in range(len(self._tables)):
+            yield band, (fingerprint >> (band * self._band_bits)) & \
+                self._band_mask
+
+    def find(self, fingerprint):
+        """
+        Finds the closest fingerprint in the index within max_distance.
+        Returns:
+            The key it was added with, or None.
+        """
+        if fingerprint is None:
+            return None
+        best = None
+        best_distance = self._max_distance + 1
+        for band, value in self._bands(fingerprint):
+            for other, key in self._tables[band].get(value, ()):
+                distance = hamming_distance(fingerprint, other)
+                if distance < best_distance:
+                    best, best_distance = key, distance
+        return best
+
+    def add(self, fingerprint, key):
+        if fingerprint is None:
+            return
+        for band, value in self._bands(fingerprint):
+            self._tables[band].setdefault(value, []).append(
+                (fingerprint, key))
+        self._size += 1
+
+    def remove(self, fingerprint, key):
+        """
+        Drops a fingerprint added with a key, so it isn't found again.
+        """
+        if fingerprint is None:
+            return
+        removed = False
+        for band, value in self._bands(fingerprint):
+            bucket = self._tables[band].get(value, [])
+            if (fingerprint, key) in bucket:
+                bucket.remove((fingerprint, key))
+                removed = True
+                if not bucket:
+                    del self._tables[band][value]
+        if removed:
+            self._size -= 1
+
+    def __len__(self):
+        return self._size
+
+
+class DuplicateGroups(object):
+    """
+    Groups fetched sites with their near duplicates so only one site of
+    each group, its representative, is analyzed. The others wait for the
+    representative's analysis and reuse it. If the representative's
+    analysis fails, the first duplicate waiting on it is analyzed in its
+    place.
+
+    Both methods return the sites to submit for analysis and the sites
+    that are done.
+    """
+    def __init__(self, max_distance=3):
+        self._index = NearDuplicateIndex(max_distance=max_distance)
+        # analyzed representatives by url
+        self._analyzed = {}
+        # url of each representative being analyzed -> its fingerprint and
+        # the duplicates waiting on it
+        self._waiting = {}
+        self.reused = 0
+
+    def _represent(self, site, duplicates):
+        self._index.add(site.fingerprint, site.url)
+        self._waiting[site.url] = (site.fingerprint, duplicates)
+        return [site], []
+
+    def fetched(self, site):
+        """
+        Args:
+            site (Website): Fetched and fingerprinted site.
+        Returns:
+            (list Website, list Website): Sites to analyze and sites done.
+        """
+        representative = self._index.find(site.fingerprint)
+        if representative is None:
+            return self._represent(site, [])
+        if representative in self._analyzed:
+            site.reuse_analysis(self._analyzed[representative])
+            self.reused += 1
+            return [], [site]
+        self._waiting[representative][1].append(site)
+        return [], []
+
+    def analyzed(self, url, site):
+        """
+        Args:
+            url (str): Url of the representative that was analyzed.
+            site (Website): Its analysis, None if it failed.
+        Returns:
+            (list Website, list Website): Sites to analyze and sites done.
+        """
+        fingerprint, duplicates = self._waiting.pop(url, (None, []))
+        if site is None:
+            self._index.remove(fingerprint, url)
+            if not duplicates:
+                return [], []
+            # the first duplicate is analyzed for the rest of the group
+            return self._represent(duplicates[0], duplicates[1:])
+        self._analyzed[url] = site
+        for duplicate in duplicates:
+            duplicate.reuse_analysis(site)
+        self.reused += len(duplicates)
+        return [], [site] + duplicates
@@ -0,0 +1,365 @@
+import binascii
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+from multiprocessing.managers import BaseManager
+from multiprocessing.pool import ThreadPool
+
+logger = logging.getLogger(__name__)
+
+# where the fetch processes find the cache served by the main process
+DNS_CACHE_ENV = 'TOPSITES_DNS_CACHE'
+DNS_AUTHKEY_ENV = 'TOPSITES_DNS_AUTHKEY'
+
+# the resolver the fetch processes fall back on for hosts the cache
+# doesn't have
+_system_getaddrinfo = socket.getaddrinfo
+
+# pid of the process the getaddrinfo hook was installed in
+_hooked_pid = None
+
+
+def url_host(url):
+    """
+    Returns:
+        (str): Host name of a url from the top sites list, without the
+        port.
+    """
+    host = url.split('/', 1)[0]
+    if host.startswith('['):
+        return host[1:].split(']', 1)[0].lower()
+    return host.rsplit(':', 1)[0].lower() if host.count(':') == 1 \
+        else host.lower()
+
+
+class SystemResolver(object):
+    """
+    Resolves hosts with the operating system resolver, which doesn't say
+    how long the answer can be kept for.
+    """
+    def __init__(self, ttl=300):
+        """
+        Args:
+            ttl (int): Seconds the answers are cached for.
+        """
+        self._ttl = ttl
+
+    def resolve(self, host):
+        """
+        Returns:
+            (list str, int): Addresses of the host and the seconds they can
+            be cached for. No addresses if the host doesn't exist.
+        """
+        try:
+            infos = _system_getaddrinfo(host, None, 0, socket.SOCK_STREAM)
+        except socket.gaierror:
+            return [], self._ttl
+        addresses = []
+        for info in infos:
+            address = info[4][0]
+            if address not in addresses:
+                addresses.append(address)
+        return addresses, self._ttl
+
+
+class DnsPythonResolver(object):
+    """
+    Resolves hosts with dnspython, which gives the TTL of the records.
+    """
+    def __init__(self, ttl=300):
+        """
+        Args:
+            ttl (int): Seconds a missing host is cached for.
+        """
+        import dns.resolver
+
+        self._dns = dns
+        self._resolver = dns.resolver.Resolver()
+        self._ttl = ttl
+
+    def resolve(self, host):
+        addresses = []
+        ttl = None
+        for record_type in ('A', 'AAAA'):
+            try:
+                # resolve() replaced query() in dnspython 2
+                lookup = getattr(self._resolver, 'resolve', None) or \
+                    self._resolver.query
+                answer = lookup(host, record_type)
+            except Exception:
+                continue
+            addresses.extend(record.address for record in answer)
+            ttl = answer.rrset.ttl if ttl is None else \
+                min(ttl, answer.rrset.ttl)
+        return addresses, self._ttl if ttl is None else ttl
+
+
+class StaticResolver(object):
+    """
+    Resolves hosts from a fixed map, like a hosts file, so runs can be
+    tested without a network.
+    """
+    def __init__(self, hosts, ttl=300):
+        """
+        Args:
+            hosts (dict): Host name to a list of addresses.
+            ttl (int): Seconds the answers are cached for.
+        """
+        self._hosts = dict((host.lower(), list(addresses))
+                           for host, addresses in hosts.items())
+        self._ttl = ttl
+
+    @classmethod
+    def from_file(cls, path, ttl=300):
+        """
+        Reads a hosts file, an address followed by its host names on each
+        line.
+        """
+        hosts = {}
+        with open(path) as hosts_file:
+            for line in hosts_file:
+                fields = line.split('#', 1)[0].split()
+                if len(fields) < 2:
+                    continue
+                for host in fields[1:]:
+                    hosts.setdefault(host, []).append(fields[0])
+        return cls(hosts, ttl=ttl)
+
+    def resolve(self, host):
+        return list(self._hosts.get(host.lower(), [])), self._ttl
+
+
+def default_resolver(ttl=300):
+    """
+    Returns:
+        DnsPythonResolver if dnspython is installed, it keeps the record
+        TTLs, otherwise SystemResolver.
+    """
+    try:
+        return DnsPythonResolver(ttl=ttl)
+    except ImportError:
+        return SystemResolver(ttl=ttl)
+
+
+class DnsCache(object):
+    """
+    Addresses of the hosts resolved so far, kept until their TTL runs out.
+    One cache lives in the main process and the fetch processes look hosts
+    up in it through a manager.
+    """
+    def __init__(self, negative_ttl=30):
+        """
+        Args:
+            negative_ttl (int): Most seconds a host that doesn't exist is
+              cached for.
+        """
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, host):
+        """
+        Returns:
+            (list str): Addresses of the host, an empty list if it is known
+            not to exist and None if it isn't cached or has expired.
+        """
+        with self._lock:
+            entry = self._entries.get(host)
+            if entry is None or entry[1] < time.time():
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def fresh(self, host):
+        """
+        Returns:
+            (bool): True if the host is cached and hasn't expired, without
+            counting as a lookup.
+        """
+        with self._lock:
+            entry = self._entries.get(host)
+            return entry is not None and entry[1] >= time.time()
+
+    def put(self, host, addresses, ttl):
+        if not addresses:
+            ttl = min(ttl, self._negative_ttl)
+        with self._lock:
+            self._entries[host] = (list(addresses), time.time() + ttl)
+
+    def stats(self):
+        with self._lock:
+            return {'hosts': len(self._entries), 'hits': self.hits,
+                    'misses': self.misses}
+
+
+class DnsCacheManager(BaseManager):
+    pass
+
+
+def _address_info(addresses, port, family, socktype, proto):
+    infos = []
+    for address in addresses:
+        address_family = socket.AF_INET6 if ':' in address \
+            else socket.AF_INET
+        if family not in (0, socket.AF_UNSPEC, address_family):
+            continue
+        sockaddr = (address, port, 0, 0) \
+            if address_family == socket.AF_INET6 else (address, port)
+        infos.append((address_family, socktype or socket.SOCK_STREAM,
+                      proto or socket.IPPROTO_TCP, '', sockaddr))
+    return infos
+
+
+def _cached_getaddrinfo(cache):
+    """
+    Makes a getaddrinfo that answers from the shared cache first and adds
+    the hosts it had to resolve itself to the cache.
+    """
+    def getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+        if not host:
+            return _system_getaddrinfo(host, port, family, type, proto,
+                                       flags)
+        if isinstance(host, bytes):
+            host = host.decode('idna')
+        host = host.lower()
+        try:
+            addresses = cache.get(host)
+        except Exception:
+            logger.debug('DNS cache lookup of %s failed', host,
+                         exc_info=True)
+            addresses = None
+        if addresses is None:
+            return _system_getaddrinfo(host, port, family, type, proto,
+                                       flags)
+        if not addresses:
+            raise socket.gaierror(socket.EAI_NONAME,
+                                  'Name or service not known')
+
+        if isinstance(port, (bytes, str)) and not port.isdigit():
+            port = socket.getservbyname(port)
+        infos = _address_info(addresses, int(port or 0), family, type, proto)
+        if not infos:
+            return _system_getaddrinfo(host, port, family, type, proto,
+                                       flags)
+        return infos
+    return getaddrinfo
+
+
+def install_resolver_hook():
+    """
+    Points socket.getaddrinfo of this process at the DNS cache of the main
+    process, when one is being served. Called before every fetch, only the
+    first call in a process does anything.
+    """
+    global _hooked_pid
+    if _hooked_pid == os.getpid():
+        return
+    _hooked_pid = os.getpid()
+
+    address = os.environ.get(DNS_CACHE_ENV)
+    if not address:
+        return
+    host, port = address.rsplit(':', 1)
+    DnsCacheManager.register('get_dns_cache')
+    manager = DnsCacheManager(
+        address=(host, int(port)),
+        authkey=binascii.unhexlify(os.environ[DNS_AUTHKEY_ENV]))
+    try:
+        manager.connect()
+        cache = manager.get_dns_cache()
+    except Exception:
+        logger.warning('Could not connect to the DNS cache at %s', address)
+        return
+    socket.getaddrinfo = _cached_getaddrinfo(cache)
+
+
+class DnsPrefetcher(object):
+    """
+    Resolves the hosts of the site list with a pool of threads ahead of the
+    fetchers and serves the answers to the fetch processes, so a fetch only
+    waits on DNS when the prefetcher hasn't got to its host yet.
+    """
+    def __init__(self, resolver=None, threads=32, lookahead=200):
+        """
+        Args:
+            resolver: Has resolve(host) returning (addresses, ttl).
+              Defaults to default_resolver().
+            threads (int): Hosts resolved at once.
+            lookahead (int): Most sites resolved ahead of the ones handed
+              to the fetchers.
+        """
+        self._resolver = resolver or default_resolver()
+        self._threads = threads
+        self._lookahead = lookahead
+        self.cache = DnsCache()
+        self._pool = None
+        self._server = None
+
+    def start(self):
+        """
+        Serves the cache to the fetch processes started after this.
+        """
+        DnsCacheManager.register('get_dns_cache', callable=lambda: self.cache)
+        authkey = os.urandom(16)
+        manager = DnsCacheManager(address=('127.0.0.1', 0), authkey=authkey)
+        self._server = manager.get_server()
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        os.environ[DNS_CACHE_ENV] = '%s:%d' % self._server.address
+        os.environ[DNS_AUTHKEY_ENV] = binascii.hexlify(authkey).decode()
+        self._pool = ThreadPool(self._threads)
+        logger.info('Serving the DNS cache on %s:%d', *self._server.address)
+        return self
+
+    def resolve(self, host):
+        """
+        Resolves a host into the cache unless a fresh answer is cached.
+        """
+        if self.cache.fresh(host):
+            return
+        try:
+            addresses, ttl = self._resolver.resolve(host)
+        except Exception:
+            logger.debug('Could not resolve %s', host, exc_info=True)
+            return
+        self.cache.put(host, addresses, ttl)
+
+    def resolve_ahead(self, urls):
+        """
+        Passes the urls on in order once their hosts are resolved, keeping
+        up to lookahead hosts resolving at once.
+        Args:
+            urls: Iterable of site urls.
+        Returns:
+            Generator of the same urls.
+        """
+        pending = deque()
+        for url in urls:
+            pending.append((url, self._pool.apply_async(
+                self.resolve, args=(url_host(url),))))
+            if len(pending) >= self._lookahead:
+                url, result = pending.popleft()
+                result.wait()
+                yield url
+        while pending:
+            url, result = pending.popleft()
+            result.wait()
+            yield url
+
+    def stop(self):
+        """
+        Logs how the cache did. The manager thread ends with the process.
+        """
+        self._pool.terminate()
+        os.environ.pop(DNS_CACHE_ENV, None)
+        os.environ.pop(DNS_AUTHKEY_ENV, None)
+        stats = self.cache.stats()
+        logger.info('DNS cache: %d hosts, %d hits, %d misses',
+                    stats['hosts'], stats['hits'], stats['misses'])
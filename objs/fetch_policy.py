@@ -0,0 +1,427 @@
+from __future__ import division
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+logger = logging.getLogger(__name__)
+
+# the policy settings and latency history file are passed through the
+# environment so every pool worker and local worker node uses them
+FETCH_POLICY_ENV = 'TOPSITES_FETCH_POLICY'
+FETCH_HISTORY_ENV = 'TOPSITES_FETCH_HISTORY'
+
+# history of every host together, used for hosts and domains that haven't
+# been seen enough yet
+GLOBAL_KEY = '*'
+
+# responses worth asking for again, the server might answer next time
+RETRY_STATUSES = (500, 502, 503, 504)
+
+# per process policy, replaced when a forked worker sees a new pid
+_process_policy = None
+
+
+def _host(url):
+    return url.split('/', 1)[0].lower()
+
+
+def _domain(host):
+    """
+    Returns:
+        (str): Last two labels of the host name, shared by the subdomains
+        and regional hosts of a site. IP addresses are kept whole.
+    """
+    name = host.split(':', 1)[0]
+    labels = name.split('.')
+    if labels[-1].isdigit():
+        return name
+    return '.'.join(labels[-2:])
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1,
+                       int(round(percent / 100.0 * (len(ordered) - 1))))]
+
+
+class LatencyHistory(object):
+    """
+    Most recent fetch latencies of every host, domain and of all hosts
+    together.
+    """
+    def __init__(self, window=100):
+        """
+        Args:
+            window (int): Latencies kept for each key, older ones are
+              dropped.
+        """
+        self._window = window
+        self._samples = {}
+
+    def record(self, key, latency):
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = deque(maxlen=self._window)
+        samples.append(latency)
+
+    def count(self, key):
+        return len(self._samples.get(key, ()))
+
+    def percentile(self, key, percent):
+        """
+        Returns:
+            (float): Latency at the percentile for the key, None if it has
+            no history.
+        """
+        samples = self._samples.get(key)
+        if not samples:
+            return None
+        return _percentile(samples, percent)
+
+    def load(self, path):
+        """
+        Adds the history saved by an earlier run.
+        """
+        try:
+            with open(path) as history_file:
+                saved = json.load(history_file)
+        except (IOError, ValueError):
+            logger.warning('Could not read fetch history from %s', path)
+            return
+        for key, latencies in saved.items():
+            for latency in latencies:
+                self.record(key, latency)
+
+    def save(self, path):
+        with open(path + '.tmp', 'w') as history_file:
+            json.dump(dict((key, list(samples))
+                           for key, samples in self._samples.items()),
+                      history_file)
+        os.rename(path + '.tmp', path)
+
+
+class FetchPolicy(object):
+    """
+    How homepages are requested: the timeout, when to retry and when to
+    hedge a slow request with a second one.
+
+    With adaptive timeouts the timeout of a request comes from the
+    latency history of its host, or its domain or all hosts when the host
+    hasn't been seen enough, instead of being fixed. A request that times
+    out is recorded at its timeout, so the timeouts of slow hosts grow.
+    Retries back off with full jitter and are limited by a budget, a
+    share of all the requests made, so a run against a failing network
+    doesn't double its load. Hedging sends a second request once the
+    first has taken longer than the host's usual tail latency and keeps
+    whichever answers first, hedges count against the retry budget too.
+    """
+    def __init__(self, timeout=1.0, adaptive=False, min_timeout=0.5,
+                 max_timeout=10.0, timeout_percentile=99,
+                 timeout_multiplier=2.0, min_samples=5, retries=0,
+                 retry_budget=0.1, min_retries=3, backoff=0.1, hedge=False,
+                 hedge_percentile=95, window=100):
+        """
+        Args:
+            timeout (float): Seconds to wait for a response, and the first
+              timeout of a host without history when adaptive.
+            adaptive (bool): Derive the timeouts from the latency history.
+            min_timeout (float): Shortest adaptive timeout.
+            max_timeout (float): Longest timeout, also the cap when a
+              timeout is doubled for a retry.
+            timeout_percentile (float): Latency percentile the adaptive
+              timeout is based on.
+            timeout_multiplier (float): Headroom over that percentile.
+            min_samples (int): Latencies needed before a host or domain
+              history is trusted.
+            retries (int): Most retries of one request.
+            retry_budget (float): Retries and hedges allowed as a share of
+              the requests made.
+            min_retries (int): Retries allowed before the budget applies,
+              so the first failures of a worker can be retried.
+            backoff (float): Base seconds of the jittered backoff, doubled
+              each attempt.
+            hedge (bool): Send a second request when the first is slower
+              than the hedge percentile.
+            hedge_percentile (float): Latency percentile to hedge after.
+            window (int): Latencies kept per host and domain.
+        """
+        self.timeout = timeout
+        self.adaptive = adaptive
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_percentile = timeout_percentile
+        self.timeout_multiplier = timeout_multiplier
+        self.min_samples = min_samples
+        self.retries = retries
+        self.retry_budget = retry_budget
+        self.min_retries = min_retries
+        self.backoff = backoff
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.window = window
+
+        self.history = LatencyHistory(window)
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retried = 0
+        self.hedged = 0
+
+    def settings(self):
+        """
+        Returns:
+            (dict): Arguments to create the same policy in another process.
+        """
+        return dict(
+            timeout=self.timeout, adaptive=self.adaptive,
+            min_timeout=self.min_timeout, max_timeout=self.max_timeout,
+            timeout_percentile=self.timeout_percentile,
+            timeout_multiplier=self.timeout_multiplier,
+            min_samples=self.min_samples, retries=self.retries,
+            retry_budget=self.retry_budget, min_retries=self.min_retries,
+            backoff=self.backoff, hedge=self.hedge,
+            hedge_percentile=self.hedge_percentile, window=self.window)
+
+    def record(self, url, latency):
+        """
+        Adds a fetch latency to the history of the url's host and domain.
+        """
+        host = _host(url)
+        with self._lock:
+            self.history.record('host:' + host, latency)
+            self.history.record('domain:' + _domain(host), latency)
+            self.history.record(GLOBAL_KEY, latency)
+
+    def expected_latency(self, url, percent):
+        """
+        Returns:
+            (float): Latency percentile of the url's host, falling back to
+            its domain and then all hosts. None without enough history.
+        """
+        host = _host(url)
+        with self._lock:
+            for key in ('host:' + host, 'domain:' + _domain(host),
+                        GLOBAL_KEY):
+                if self.history.count(key) >= self.min_samples:
+                    return self.history.percentile(key, percent)
+        return None
+
+    def timeout_for(self, url):
+        if not self.adaptive:
+            return self.timeout
+        latency = self.expected_latency(url, self.timeout_percentile)
+        if latency is None:
+            return self.timeout
+        return min(self.max_timeout,
+                   max(self.min_timeout, latency * self.timeout_multiplier))
+
+    def _take_retry(self):
+        with self._lock:
+            allowed = self.min_retries + self.retry_budget * self.requests
+            if self.retried + self.hedged >= allowed:
+                return False
+            return True
+
+    def _request(self, url, timeout):
+        import requests
+
+        return requests.get('http://' + url, timeout=timeout)
+
+    def _send(self, url, timeout):
+        """
+        Makes one attempt at the request, hedging it if it is slow.
+        Returns:
+            (Response, bool): The response and if it came from the hedge.
+        """
+        delay = None
+        if self.hedge:
+            delay = self.expected_latency(url, self.hedge_percentile)
+        if delay is None or delay >= timeout:
+            return self._request(url, timeout), False
+
+        results = Queue()
+
+        def attempt(hedged):
+            try:
+                results.put((self._request(url, timeout), None, hedged))
+            except Exception as e:
+                results.put((None, e, hedged))
+
+        def start(hedged):
+            thread = threading.Thread(target=attempt, args=(hedged,))
+            thread.daemon = True
+            thread.start()
+
+        start(False)
+        outstanding = 1
+        try:
+            response, error, hedged = results.get(timeout=delay)
+        except Empty:
+            if not self._take_retry():
+                response, error, hedged = results.get()
+            else:
+                with self._lock:
+                    self.hedged += 1
+                start(True)
+                outstanding += 1
+                response, error, hedged = results.get()
+        outstanding -= 1
+        if error is not None and outstanding:
+            # the other request might still make it
+            response, error, hedged = results.get()
+        if error is not None:
+            raise error
+        return response, hedged
+
+    def get(self, url):
+        """
+        Requests a url, retrying timeouts, connection errors and server
+        errors while the retry budget allows.
+        Args:
+            url (str): Url without the scheme, like the top sites list.
+        Returns:
+            (Response, int): The last response and the number of attempts
+            made.
+        Raises:
+            The error of the last attempt if none got a response.
+        """
+        import requests
+
+        with self._lock:
+            self.requests += 1
+        timeout = self.timeout_for(url)
+        attempts = 0
+        while True:
+            attempts += 1
+            start = time.time()
+            try:
+                response, hedged = self._send(url, timeout)
+            except requests.exceptions.RequestException as e:
+                timed_out = isinstance(e, requests.exceptions.Timeout)
+                if timed_out:
+                    # it took at least this long, push the timeout up
+                    self.record(url, timeout)
+                if attempts > self.retries or not self._take_retry():
+                    raise
+                if timed_out:
+                    timeout = min(self.max_timeout, timeout * 2)
+            else:
+                # a hedge that won started later than the clock
+                if not hedged:
+                    self.record(url, time.time() - start)
+                if response.status_code not in RETRY_STATUSES or \
+                        attempts > self.retries or not self._take_retry():
+                    return response, attempts
+
+            with self._lock:
+                self.retried += 1
+            logger.debug('Retrying %s, attempt %d', url, attempts + 1)
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempts))
+
+
+class FetchReport(object):
+    """
+    Tallies how the fetches of the analyzed sites went, and collects
+    their latencies in the main process so the history can be saved for
+    the next run.
+    """
+    def __init__(self, policy):
+        """
+        Args:
+            policy (FetchPolicy): Policy of the main process.
+        """
+        self._policy = policy
+        self._latencies = []
+        self.sites = 0
+        self.pages = 0
+        self.failed = 0
+        self.retried = 0
+        self.errors = {}
+
+    def add(self, site):
+        self.sites += 1
+        self.pages += site.pages_crawled
+        if site.fetch_attempts > 1:
+            self.retried += 1
+        if site.fetch_error:
+            self.failed += 1
+            self.errors[site.fetch_error] = \
+                self.errors.get(site.fetch_error, 0) + 1
+        elif site.fetch_time is not None:
+            self._latencies.append(site.fetch_time)
+            self._policy.record(site.url, site.fetch_time)
+
+    def latency_percentile(self, percent):
+        if not self._latencies:
+            return None
+        return _percentile(self._latencies, percent)
+
+    def log(self):
+        logger.info('Fetched %d of %d sites, %d needed more than one '
+                    'attempt', self.sites - self.failed, self.sites,
+                    self.retried)
+        if self.pages > self.sites - self.failed:
+            logger.info('Crawled %d pages of the fetched sites', self.pages)
+        for error, count in sorted(self.errors.items(),
+                                   key=lambda x: x[1], reverse=True):
+            logger.info('Fetch error: %s - Sites: %d', error, count)
+        if self._latencies:
+            logger.info('Fetch latency p50 %.3fs p95 %.3fs p99 %.3fs',
+                        self.latency_percentile(50),
+                        self.latency_percentile(95),
+                        self.latency_percentile(99))
+
+    def save(self, path):
+        """
+        Saves the latency history, including what earlier runs saved, for
+        the next run.
+        """
+        self._policy.history.save(path)
+        logger.info('Saved fetch latency history to %s', path)
+
+
+def configure_policy(policy, history_path=None):
+    """
+    Makes the policy the one used by this process and by the pool workers
+    and worker nodes it starts.
+    Args:
+        policy (FetchPolicy): Settings to fetch with.
+        history_path (str): Latency history saved by an earlier run, loaded
+          by every process.
+    """
+    global _process_policy
+    os.environ[FETCH_POLICY_ENV] = json.dumps(policy.settings())
+    if history_path:
+        os.environ[FETCH_HISTORY_ENV] = history_path
+        if os.path.exists(history_path):
+            policy.history.load(history_path)
+    _process_policy = policy
+
+
+def get_policy():
+    """
+    Returns:
+        (FetchPolicy): Policy of this process, made from the settings in
+        the environment. Defaults to a fixed 1 second timeout without
+        retries.
+    """
+    global _process_policy
+    if _process_policy is None or _process_policy.pid != os.getpid():
+        settings = os.environ.get(FETCH_POLICY_ENV)
+        policy = FetchPolicy(**json.loads(settings)) if settings \
+            else FetchPolicy()
+        history_path = os.environ.get(FETCH_HISTORY_ENV)
+        if history_path and os.path.exists(history_path):
+            policy.history.load(history_path)
+        _process_policy = policy
+    return _process_policy
@@ -0,0 +1,182 @@
+from __future__ import division
+
+import logging
+from array import array
+
+from objs.site import mapreduce, partition_data, map_function, \
+    reduce_function
+
+logger = logging.getLogger(__name__)
+
+# headers that are different on almost every response. Interning their
+# values would only grow the string table so they are left out.
+SKIPPED_HEADERS = frozenset([
+    'date', 'expires', 'last-modified', 'etag', 'set-cookie', 'age',
+    'x-request-id', 'x-amz-request-id', 'x-amz-id-2', 'cf-ray', 'x-served-by',
+    'x-timer', 'report-to', 'nel'
+])
+# header values are cut to this many characters
+MAX_VALUE_LENGTH = 200
+
+
+def content_length_bucket(value):
+    """
+    Groups a Content-Length value into a power of two range so page sizes
+    can be counted like any other header value.
+    """
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return value
+    if size <= 0:
+        return '0'
+    low = 1 << (size.bit_length() - 1)
+    return '%d-%d' % (low, low * 2 - 1)
+
+
+def normalize_header_values(headers, only=None):
+    """
+    Picks the header values worth keeping from a response.
+    Args:
+        headers: Header map from a web response to the site.
+        only (set str): Lower case names of the headers to keep. All but
+          the skipped headers if None.
+    Returns:
+        (dict): Lower case header name -> value.
+    """
+    values = {}
+    for name, value in headers.items():
+        name = name.lower()
+        if only is not None:
+            if name not in only:
+                continue
+        elif name in SKIPPED_HEADERS:
+            continue
+        if name == 'content-length':
+            value = content_length_bucket(value)
+        values[name] = value.strip()[:MAX_VALUE_LENGTH]
+    return values
+
+
+class StringTable(object):
+    """
+    Interns strings to small integer ids so each distinct header name and
+    value is only stored once no matter how many sites return it.
+    """
+    def __init__(self):
+        self._ids = {}
+        self._strings = []
+
+    def intern(self, value):
+        string_id = self._ids.get(value)
+        if string_id is None:
+            string_id = len(self._strings)
+            self._ids[value] = string_id
+            self._strings.append(value)
+        return string_id
+
+    def __getitem__(self, string_id):
+        return self._strings[string_id]
+
+    def __len__(self):
+        return len(self._strings)
+
+
+class HeaderValueTable(object):
+    """
+    Header values of every site kept as interned id pairs. Each site only
+    costs an array of two ints per header.
+    """
+    def __init__(self):
+        self.strings = StringTable()
+        self._urls = []
+        self._sites = []
+
+    def add(self, site):
+        """
+        Interns the header values of a site and releases the site's own
+        copy of them.
+        """
+        pairs = array('I')
+        for name, value in site.header_values.items():
+            pairs.append(self.strings.intern(name))
+            pairs.append(self.strings.intern(value))
+        self._urls.append(site.url)
+        self._sites.append(pairs)
+        site.release_header_values()
+
+    def __len__(self):
+        return len(self._sites)
+
+    def values_of(self, index):
+        """
+        Returns:
+            (tuple): url and dict of header name -> value of a site.
+        """
+        pairs = self._sites[index]
+        strings = self.strings
+        return self._urls[index], dict(
+            (strings[pairs[i]], strings[pairs[i + 1]])
+            for i in range(0, len(pairs), 2))
+
+    def _pair_keys(self):
+        # each name and value id pair packed into one int so the workers
+        # count plain ints
+        keys = []
+        for pairs in self._sites:
+            keys.extend((pairs[i] << 32) | pairs[i + 1]
+                        for i in range(0, len(pairs), 2))
+        return keys
+
+    def distributions(self, worker_count=4):
+        """
+        Counts how many sites returned each value of each header with the
+        mapreduce workers.
+        Args:
+            worker_count (int): Number of processes counting values.
+        Returns:
+            (dict): header name -> list of (value, site count) tuples with
+            the most common value first.
+        """
+        keys = self._pair_keys()
+        if not keys:
+            return {}
+        counts = mapreduce(
+            all_items=keys,
+            worker_count=worker_count,
+            partition_func=partition_data,
+            reduce_func=reduce_function,
+            map_func=map_function
+        )
+
+        strings = self.strings
+        distributions = {}
+        for key, count in counts.items():
+            name = strings[key >> 32]
+            value = strings[key & 0xffffffff]
+            distributions.setdefault(name, []).append((value, count))
+        for values in distributions.values():
+            values.sort(key=lambda x: (-x[1], x[0]))
+        return distributions
+
+    def top_values(self, distributions, headers=None, count=5):
+        """
+        Picks the most common values of some headers.
+        Args:
+            distributions (dict): Made by distributions().
+            headers (list str): Header names to report on, every header
+              if None.
+            count (int): Number of values to keep per header.
+        Returns:
+            (list): (header, [(value, percentage of sites)]) tuples.
+        """
+        if not self._sites:
+            return []
+        if headers is None:
+            headers = sorted(distributions)
+        top = []
+        for name in headers:
+            values = distributions.get(name.lower(), [])
+            top.append((name, [(value, site_count / len(self._sites) * 100.0)
+                               for value, site_count in values[:count]]))
+        return top
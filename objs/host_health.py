@@ -0,0 +1,161 @@
+import json
+import logging
+import os
+import time
+
+from objs.fetch_policy import _host
+
+logger = logging.getLogger(__name__)
+
+# how a host is treated by the next run
+HEALTHY = 'healthy'
+PROBE = 'probe'
+SKIP = 'skip'
+
+
+class HostHealth(object):
+    """
+    Persisted health of the hosts fetched by earlier runs: how they last
+    failed, how many times in a row, their latency and when they last
+    answered.
+
+    A host that failed is skipped until its re-probe time, which doubles
+    with every failure in a row from the probe interval up to the max
+    interval, so hosts that never serve a homepage stop taking a worker
+    and a full timeout on every run. Once the re-probe time comes the
+    host is fetched again, after the healthy hosts. A host that answers
+    is healthy again right away.
+    """
+    def __init__(self, probe_interval=3600, max_interval=7 * 86400,
+                 latency_weight=0.3):
+        """
+        Args:
+            probe_interval (int): Seconds a host is skipped for after its
+              first failure.
+            max_interval (int): Most seconds a host is skipped for.
+            latency_weight (float): Weight of the newest fetch time in the
+              moving average latency of a host.
+        """
+        self._probe_interval = probe_interval
+        self._max_interval = max_interval
+        self._latency_weight = latency_weight
+        self._hosts = {}
+        self.skipped = 0
+        self.probed = 0
+        self.recovered = 0
+
+    def __len__(self):
+        return len(self._hosts)
+
+    def load(self, path):
+        """
+        Adds the hosts saved by an earlier run.
+        """
+        try:
+            with open(path) as health_file:
+                self._hosts.update(json.load(health_file))
+        except (IOError, ValueError):
+            logger.warning('Could not read host health from %s', path)
+
+    def save(self, path):
+        with open(path + '.tmp', 'w') as health_file:
+            json.dump(self._hosts, health_file, sort_keys=True)
+        os.rename(path + '.tmp', path)
+
+    def host(self, url):
+        """
+        Returns:
+            (dict): Health of the url's host, None if it hasn't been
+            fetched before.
+        """
+        return self._hosts.get(_host(url))
+
+    def status(self, url, now=None):
+        """
+        Returns:
+            (str): HEALTHY for hosts that answered last time or are new,
+            PROBE for failed hosts due a re-probe and SKIP for failed
+            hosts that aren't yet.
+        """
+        entry = self.host(url)
+        if entry is None or not entry['failures']:
+            return HEALTHY
+        if (now or time.time()) < entry['next_probe']:
+            return SKIP
+        return PROBE
+
+    def schedule(self, urls, now=None):
+        """
+        Drops the sites of hosts that are being skipped and moves the
+        sites due a re-probe after the others.
+        Args:
+            urls: Iterable of site urls in the order to fetch them.
+        Returns:
+            Generator of the urls to fetch.
+        """
+        now = now or time.time()
+        probes = []
+        for url in urls:
+            status = self.status(url, now)
+            if status == HEALTHY:
+                yield url
+            elif status == PROBE:
+                probes.append(url)
+            else:
+                self.skipped += 1
+        self.probed += len(probes)
+        for url in probes:
+            yield url
+
+    def record(self, site, now=None):
+        """
+        Updates the health of a site's host from its fetch.
+        Args:
+            site (Website): Fetched site.
+        """
+        now = now or time.time()
+        key = _host(site.url)
+        entry = self._hosts.setdefault(key, {
+            'failures': 0, 'error': None, 'latency': None,
+            'last_success': None, 'last_failure': None, 'next_probe': 0})
+        if site.fetch_error:
+            if entry['failures'] and now < entry['next_probe']:
+                # another site of a host that already failed this probe
+                entry['error'] = site.fetch_error
+                entry['last_failure'] = now
+                return
+            entry['failures'] += 1
+            entry['error'] = site.fetch_error
+            entry['last_failure'] = now
+            entry['next_probe'] = now + min(
+                self._max_interval,
+                self._probe_interval * 2 ** (entry['failures'] - 1))
+            return
+
+        if entry['failures']:
+            self.recovered += 1
+        entry['failures'] = 0
+        entry['error'] = None
+        entry['last_success'] = now
+        entry['next_probe'] = 0
+        if site.fetch_time is not None:
+            latency = entry['latency']
+            entry['latency'] = site.fetch_time if latency is None else \
+                latency + self._latency_weight * (site.fetch_time - latency)
+
+    def log(self, now=None):
+        now = now or time.time()
+        failing = [entry for entry in self._hosts.values()
+                   if entry['failures']]
+        logger.info('Host health: %d hosts, %d failing, %d skipped this '
+                    'run, %d re-probed, %d recovered', len(self._hosts),
+                    len(failing), self.skipped, self.probed, self.recovered)
+        errors = {}
+        for entry in failing:
+            errors[entry['error']] = errors.get(entry['error'], 0) + 1
+        for error, count in sorted(errors.items(), key=lambda x: x[1],
+                                   reverse=True):
+            logger.info('Failing hosts: %s - Hosts: %d', error, count)
+        due = sum(1 for entry in failing if entry['next_probe'] <= now)
+        if failing:
+            logger.info('%d failing hosts are due a re-probe', due)
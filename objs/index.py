@@ -0,0 +1,539 @@
+import heapq
+import json
+import logging
+import mmap
+import os
+import struct
+
+import numpy
+
+logger = logging.getLogger(__name__)
+
+# an index directory holds a manifest and one or more segments. Each segment
+# is written once and never changed apart from its deleted docs:
+#   <name>.terms  sorted terms, utf-8, back to back
+#   <name>.lex    one LEXICON_ENTRY per term, in the same order
+#   <name>.post   postings of each term, varint doc id deltas and counts
+#   <name>.docs   urls, one per line
+# the doc ids of a segment replaced by later segments are kept in a json
+# list named in the manifest, <name>.del.<n> where n is the segment that
+# replaced them. A new list is written for every change and the manifest
+# is the one place that says which is current, so a run that stops before
+# writing it leaves the index as it was.
+MANIFEST = 'index.json'
+# term offset, term length, postings offset, postings length, doc count
+LEXICON_ENTRY = struct.Struct('<QIQII')
+
+
+def encode_varint(value, out):
+    """
+    Appends an unsigned int to a bytearray, 7 bits per byte with the high
+    bit set on every byte but the last.
+    """
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def encode_postings(postings):
+    """
+    Args:
+        postings (list): (doc id, count) tuples sorted by doc id.
+    Returns:
+        (bytearray): Doc id gaps and counts as varints.
+    """
+    out = bytearray()
+    last = 0
+    for doc_id, count in postings:
+        encode_varint(doc_id - last, out)
+        encode_varint(count, out)
+        last = doc_id
+    return out
+
+
+def decode_varints(data):
+    """
+    Decodes back to back varints with numpy instead of a byte at a time.
+    Args:
+        data (bytes): Varints written by encode_varint.
+    Returns:
+        (numpy.ndarray): The values as uint64.
+    """
+    buf = numpy.frombuffer(data, dtype=numpy.uint8)
+    # the last byte of each varint is the one without the high bit
+    ends = numpy.flatnonzero(buf < 0x80)
+    if len(ends) == len(buf):
+        # every value fit in one byte, as most counts and dense gaps do
+        return buf.astype(numpy.uint64)
+    starts = numpy.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    # 7 more bits of shift for each byte after the first of its varint
+    owner = numpy.repeat(numpy.arange(len(ends)), ends - starts + 1)
+    shifts = (7 * (numpy.arange(len(buf)) - starts[owner])).astype(
+        numpy.uint64)
+    parts = numpy.left_shift((buf & 0x7f).astype(numpy.uint64), shifts)
+    # the parts of a varint have no bits in common so adding them is or
+    return numpy.add.reduceat(parts, starts)
+
+
+def decode_postings_arrays(data):
+    """
+    Args:
+        data (bytes): Postings written by encode_postings.
+    Returns:
+        (numpy.ndarray, numpy.ndarray): Doc ids and counts sorted by doc
+        id.
+    """
+    values = decode_varints(data).astype(numpy.int64)
+    return numpy.cumsum(values[0::2]), values[1::2]
+
+
+def decode_postings(data):
+    """
+    Args:
+        data (bytes): Postings written by encode_postings.
+    Returns:
+        (list): (doc id, count) tuples sorted by doc id.
+    """
+    doc_ids, counts = decode_postings_arrays(data)
+    return list(zip(doc_ids.tolist(), counts.tolist()))
+
+
+def _write_segment(index_dir, name, urls, terms):
+    """
+    Writes a segment from the terms of some docs.
+    Args:
+        urls (list str): Url of each doc, the doc id is its position.
+        terms: Iterable of (utf-8 term, postings) sorted by term, where
+          postings are (doc id, count) tuples sorted by doc id.
+    """
+    path = os.path.join(index_dir, name)
+    with open(path + '.terms', 'wb') as terms_file, \
+            open(path + '.lex', 'wb') as lex_file, \
+            open(path + '.post', 'wb') as post_file:
+        term_offset = 0
+        post_offset = 0
+        for encoded_term, postings in terms:
+            data = encode_postings(postings)
+            terms_file.write(encoded_term)
+            post_file.write(data)
+            lex_file.write(LEXICON_ENTRY.pack(
+                term_offset, len(encoded_term), post_offset, len(data),
+                len(postings)))
+            term_offset += len(encoded_term)
+            post_offset += len(data)
+
+    with open(path + '.docs', 'wb') as docs_file:
+        for url in urls:
+            docs_file.write(url.encode('utf-8') + b'\n')
+
+
+def _map_file(path):
+    with open(path, 'rb') as mapped_file:
+        if os.fstat(mapped_file.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(mapped_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class Segment(object):
+    """
+    Read only view of a segment. The lexicon, terms and postings are
+    memory-mapped and terms are found with a binary search so opening a
+    segment doesn't load it.
+    """
+    def __init__(self, index_dir, name, deleted_file=None):
+        """
+        Args:
+            index_dir (str): Directory of the index.
+            name (str): Name of the segment.
+            deleted_file (str): File of the segment's deleted doc ids
+              named in the manifest, None if it has none.
+        """
+        self.name = name
+        path = os.path.join(index_dir, name)
+        self._terms = _map_file(path + '.terms')
+        self._lexicon = _map_file(path + '.lex')
+        self._postings = _map_file(path + '.post')
+        self._docs_path = path + '.docs'
+        self._urls = None
+        self.deleted = set()
+        if deleted_file:
+            with open(os.path.join(index_dir, deleted_file)) as del_file:
+                self.deleted = set(json.load(del_file))
+        self._deleted_ids = numpy.array(sorted(self.deleted),
+                                        dtype=numpy.int64)
+        self.term_count = len(self._lexicon) // LEXICON_ENTRY.size
+
+    def _entry(self, position):
+        return LEXICON_ENTRY.unpack_from(self._lexicon,
+                                         position * LEXICON_ENTRY.size)
+
+    def _term(self, position):
+        term_offset, term_length = self._entry(position)[:2]
+        return self._terms[term_offset:term_offset + term_length]
+
+    def _find(self, term):
+        encoded_term = term
+        if not isinstance(term, bytes):
+            encoded_term = term.encode('utf-8')
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < encoded_term:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.term_count and self._term(low) == encoded_term:
+            return self._entry(low)
+        return None
+
+    def postings_arrays(self, term):
+        """
+        Returns:
+            (numpy.ndarray, numpy.ndarray): Doc ids and counts of the live
+            docs with the term, sorted by doc id.
+        """
+        entry = self._find(term)
+        if entry is None:
+            return (numpy.zeros(0, dtype=numpy.int64),
+                    numpy.zeros(0, dtype=numpy.int64))
+        post_offset, post_length = entry[2:4]
+        doc_ids, counts = decode_postings_arrays(
+            self._postings[post_offset:post_offset + post_length])
+        if len(self._deleted_ids):
+            live = ~numpy.isin(doc_ids, self._deleted_ids,
+                               assume_unique=True)
+            doc_ids, counts = doc_ids[live], counts[live]
+        return doc_ids, counts
+
+    def postings(self, term):
+        """
+        Returns:
+            (list): (doc id, count) tuples of the live docs with the term.
+        """
+        doc_ids, counts = self.postings_arrays(term)
+        return list(zip(doc_ids.tolist(), counts.tolist()))
+
+    def terms(self):
+        """
+        Yields every (utf-8 term, postings) pair in term order, deleted
+        docs included.
+        """
+        for position in range(self.term_count):
+            term = self._term(position)
+            post_offset, post_length = self._entry(position)[2:4]
+            yield term, decode_postings(
+                self._postings[post_offset:post_offset + post_length])
+
+    @property
+    def urls(self):
+        if self._urls is None:
+            with open(self._docs_path, 'rb') as docs_file:
+                self._urls = [line.rstrip(b'\n').decode('utf-8')
+                              for line in docs_file]
+        return self._urls
+
+    def close(self):
+        for mapped in (self._terms, self._lexicon, self._postings):
+            if hasattr(mapped, 'close'):
+                mapped.close()
+
+
+def _read_manifest(index_dir):
+    path = os.path.join(index_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {'segments': [], 'next_segment': 0, 'deleted': {}}
+    with open(path) as manifest_file:
+        manifest = json.load(manifest_file)
+    if 'deleted' not in manifest:
+        # indexes written before the deleted docs were in the manifest
+        # had a <name>.del for every segment
+        manifest['deleted'] = dict(
+            (name, name + '.del') for name in manifest['segments']
+            if os.path.exists(os.path.join(index_dir, name + '.del')))
+    return manifest
+
+
+def _write_manifest(index_dir, manifest):
+    # written to a temp file and renamed so readers never see half of it,
+    # the rename is what commits a new segment and its deleted docs
+    path = os.path.join(index_dir, MANIFEST)
+    with open(path + '.tmp', 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.rename(path + '.tmp', path)
+
+
+def _open_segment(index_dir, manifest, name):
+    return Segment(index_dir, name,
+                   deleted_file=manifest['deleted'].get(name))
+
+
+def _write_deleted(index_dir, file_name, deleted):
+    with open(os.path.join(index_dir, file_name), 'w') as del_file:
+        json.dump(sorted(deleted), del_file)
+
+
+def _remove_files(index_dir, file_names):
+    for file_name in file_names:
+        try:
+            os.remove(os.path.join(index_dir, file_name))
+        except OSError:
+            logger.warning('Could not remove %s', file_name)
+
+
+class IndexWriter(object):
+    """
+    Builds an inverted index from the word counts of analyzed sites. Sites
+    are buffered in memory and written out as a new segment every
+    segment_size sites, so a run only ever holds one segment's postings.
+    A site that was indexed by an earlier run is replaced by the new one.
+    """
+    def __init__(self, index_dir, segment_size=10000):
+        self._index_dir = index_dir
+        self._segment_size = segment_size
+        if not os.path.isdir(index_dir):
+            os.makedirs(index_dir)
+        self._urls = []
+        self._postings = {}
+        # url -> (segment, doc id) of its live docs, read once from the
+        # segments so a flush only opens the ones it replaces docs in
+        self._locations = {}
+        self._located_segments = None
+
+    def add(self, site):
+        """
+        Adds the word counts of a site. Sites without word counts, like
+        the ones sketched, are skipped.
+        """
+        if not site.word_count:
+            return
+        doc_id = len(self._urls)
+        self._urls.append(site.url)
+        for word, count in site.word_count.items():
+            self._postings.setdefault(word, []).append((doc_id, count))
+        if len(self._urls) >= self._segment_size:
+            self.flush()
+
+    def _locate_docs(self, manifest):
+        locations = {}
+        for name in manifest['segments']:
+            segment = _open_segment(self._index_dir, manifest, name)
+            for doc_id, url in enumerate(segment.urls):
+                if doc_id not in segment.deleted:
+                    locations.setdefault(url, []).append((name, doc_id))
+            segment.close()
+        self._locations = locations
+        self._located_segments = list(manifest['segments'])
+
+    def flush(self):
+        """
+        Writes the buffered sites as a new segment and adds it to the
+        manifest.
+        """
+        if not self._urls:
+            return
+        manifest = _read_manifest(self._index_dir)
+        if manifest['segments'] != self._located_segments:
+            # first flush, or the segments were merged since the last one
+            self._locate_docs(manifest)
+        name = 'segment-%06d' % manifest['next_segment']
+        terms = sorted((term.encode('utf-8'), postings)
+                       for term, postings in self._postings.items())
+        _write_segment(self._index_dir, name, self._urls, terms)
+
+        # sites indexed again replace the docs of the older segments, in
+        # new files that only count once the manifest names them
+        new_locations = {}
+        for doc_id, url in enumerate(self._urls):
+            new_locations.setdefault(url, []).append((name, doc_id))
+        replaced = {}
+        for url in new_locations:
+            for old_name, doc_id in self._locations.get(url, []):
+                replaced.setdefault(old_name, set()).add(doc_id)
+        superseded = []
+        for old_name in sorted(replaced):
+            segment = _open_segment(self._index_dir, manifest, old_name)
+            deleted_file = '%s.del.%d' % (old_name, manifest['next_segment'])
+            _write_deleted(self._index_dir, deleted_file,
+                           segment.deleted | replaced[old_name])
+            if old_name in manifest['deleted']:
+                superseded.append(manifest['deleted'][old_name])
+            manifest['deleted'][old_name] = deleted_file
+            segment.close()
+
+        manifest['segments'].append(name)
+        manifest['next_segment'] += 1
+        _write_manifest(self._index_dir, manifest)
+        _remove_files(self._index_dir, superseded)
+        self._locations.update(new_locations)
+        self._located_segments.append(name)
+        logger.info('Indexed %d sites in %s', len(self._urls), name)
+        self._urls = []
+        self._postings = {}
+
+    def close(self):
+        self.flush()
+
+
+def merge_segments(index_dir):
+    """
+    Merges every segment of an index into one, dropping deleted docs. The
+    terms of each segment are already sorted so they are merged as a
+    stream without loading the segments.
+    Args:
+        index_dir (str): Directory of the index.
+    Returns:
+        (str): Name of the merged segment or None if there was nothing to
+        merge.
+    """
+    manifest = _read_manifest(index_dir)
+    if len(manifest['segments']) < 2:
+        return None
+    segments = [_open_segment(index_dir, manifest, name)
+                for name in manifest['segments']]
+
+    # renumber the live docs of each segment after the ones before it
+    urls = []
+    doc_maps = []
+    for segment in segments:
+        doc_map = {}
+        for doc_id, url in enumerate(segment.urls):
+            if doc_id not in segment.deleted:
+                doc_map[doc_id] = len(urls)
+                urls.append(url)
+        doc_maps.append(doc_map)
+
+    def remapped(number, segment):
+        doc_map = doc_maps[number]
+        for term, postings in segment.terms():
+            postings = [(doc_map[doc_id], count)
+                        for doc_id, count in postings if doc_id in doc_map]
+            if postings:
+                yield term, number, postings
+
+    def merged_terms():
+        current = None
+        merged = []
+        # segments are merged oldest first so the doc ids stay sorted
+        for encoded_term, _, postings in heapq.merge(*streams):
+            if encoded_term != current:
+                if current is not None:
+                    yield current, merged
+                current = encoded_term
+                merged = []
+            merged.extend(postings)
+        if current is not None:
+            yield current, merged
+
+    streams = [remapped(number, segment)
+               for number, segment in enumerate(segments)]
+    name = 'segment-%06d' % manifest['next_segment']
+    _write_segment(index_dir, name, urls, merged_terms())
+
+    for segment in segments:
+        segment.close()
+    old_segments = manifest['segments']
+    old_deleted = manifest['deleted']
+    manifest['segments'] = [name]
+    manifest['deleted'] = {}
+    manifest['next_segment'] += 1
+    _write_manifest(index_dir, manifest)
+
+    for old_name in old_segments:
+        _remove_files(index_dir, [old_name + extension for extension in
+                                  ('.terms', '.lex', '.post', '.docs')])
+    _remove_files(index_dir, old_deleted.values())
+    logger.info('Merged %d segments into %s with %d sites',
+                len(old_segments), name, len(urls))
+    return name
+
+
+class Index(object):
+    """
+    Queries an inverted index of site word counts.
+    """
+    def __init__(self, index_dir):
+        self._index_dir = index_dir
+        manifest = _read_manifest(index_dir)
+        self._segments = [_open_segment(index_dir, manifest, name)
+                          for name in manifest['segments']]
+
+    def _matches(self, terms, match_all):
+        """
+        Returns:
+            (dict): url -> summed count of the terms for the matching sites.
+        """
+        matches = {}
+        # a word repeated in the query only counts once
+        terms = sorted(set(terms))
+        for segment in self._segments:
+            doc_ids = counts = None
+            for term in terms:
+                term_ids, term_counts = segment.postings_arrays(term)
+                if doc_ids is None:
+                    doc_ids, counts = term_ids, term_counts
+                elif match_all:
+                    doc_ids, first, second = numpy.intersect1d(
+                        doc_ids, term_ids, assume_unique=True,
+                        return_indices=True)
+                    counts = counts[first] + term_counts[second]
+                else:
+                    doc_ids, inverse = numpy.unique(
+                        numpy.concatenate([doc_ids, term_ids]),
+                        return_inverse=True)
+                    counts = numpy.bincount(
+                        inverse, weights=numpy.concatenate(
+                            [counts, term_counts])).astype(numpy.int64)
+                if match_all and not len(doc_ids):
+                    break
+            if doc_ids is None or not len(doc_ids):
+                continue
+            urls = segment.urls
+            for doc_id, count in zip(doc_ids.tolist(), counts.tolist()):
+                matches[urls[doc_id]] = count
+        return matches
+
+    def term(self, term, top=None):
+        """
+        Finds the sites that use a word.
+        Returns:
+            (list): (url, count) tuples with the most uses first.
+        """
+        return self.top([term], top=top)
+
+    def all_of(self, terms):
+        """
+        Returns:
+            (set str): Urls of the sites that use every one of the words.
+        """
+        return set(self._matches(terms, match_all=True))
+
+    def any_of(self, terms):
+        """
+        Returns:
+            (set str): Urls of the sites that use any of the words.
+        """
+        return set(self._matches(terms, match_all=False))
+
+    def top(self, terms, top=None, match_all=False):
+        """
+        Ranks the sites by how often they use the words.
+        Args:
+            terms (list str): Words to look up.
+            top (int): Number of sites to return, all of them if None.
+            match_all (bool): Only rank sites that use every word.
+        Returns:
+            (list): (url, summed count) tuples with the highest count first.
+        """
+        matches = self._matches(terms, match_all=match_all)
+        key = lambda x: (-x[1], x[0])
+        if top:
+            return heapq.nsmallest(top, matches.items(), key=key)
+        return sorted(matches.items(), key=key)
+
+    def close(self):
+        for segment in self._segments:
+            segment.close()
+        self._segments = []
@@ -0,0 +1,112 @@
+import json
+import logging
+import os
+from collections import OrderedDict
+
+from objs.site import Website
+
+logger = logging.getLogger(__name__)
+
+
+class SiteJournal(object):
+    """
+    Append-only journal of the sites that have finished their analysis.
+    Every completed site is written as a single JSON line and the file is
+    synced to disk in batches so that a crawl that dies part way through
+    can be resumed without fetching those sites again.
+    """
+    def __init__(self, path, batch_size=50, resume=False):
+        """
+        Args:
+            path (str): Location of the journal file.
+            batch_size (int): Number of records written between each fsync.
+            resume (bool): Keep the records already in the journal. When
+              False any existing journal is truncated.
+        """
+        self._path = path
+        self._batch_size = max(1, batch_size)
+        self._pending = 0
+
+        if resume and os.path.exists(path):
+            self._repair()
+            mode = 'a'
+        else:
+            mode = 'w'
+        self._file = open(path, mode)
+
+    @property
+    def path(self):
+        return self._path
+
+    def _repair(self):
+        """
+        Drops a partially written last line left behind by a crash so new
+        records start on their own line.
+        """
+        with open(self._path, 'rb+') as journal_file:
+            data = journal_file.read()
+            if data and not data.endswith(b'\n'):
+                end = data.rfind(b'\n') + 1
+                logger.warning('Dropping %d bytes of incomplete journal '
+                               'record', len(data) - end)
+                journal_file.truncate(end)
+
+    def record(self, site):
+        """
+        Appends the analyzed data of a site to the journal.
+        Args:
+            site (Website): Site that has its word count calculated.
+        """
+        self._file.write(json.dumps(site.to_record()))
+        self._file.write('\n')
+        self._pending += 1
+        if self._pending >= self._batch_size:
+            self.sync()
+
+    def sync(self):
+        """
+        Flushes the written records and forces them to disk.
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.sync()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_journal(path):
+    """
+    Reads the records of the completed sites back out of a journal.
+    Args:
+        path (str): Location of the journal file.
+    Returns:
+        (list Website): Sites rebuilt from the journal records. A site that
+        was recorded more than once only shows up with its last record.
+    """
+    if not os.path.exists(path):
+        return []
+
+    sites = OrderedDict()
+    with open(path, 'r') as journal_file:
+        for line_number, line in enumerate(journal_file):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # only the last line can be cut off by a crash
+                logger.warning('Skipping unreadable journal line %d',
+                               line_number + 1)
+                continue
+            sites[record['url']] = record
+
+    logger.info('Read %d completed sites from %s', len(sites), path)
+    return [Website.from_record(record) for record in sites.values()]
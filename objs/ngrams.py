@@ -0,0 +1,129 @@
+from collections import deque
+
+from objs.sketch import TopItems, _hash128
+
+MASK_64 = (1 << 64) - 1
+# 64 bit FNV prime, base of the polynomial that mixes the word hashes of an
+# n-gram into one key
+HASH_BASE = 1099511628211
+
+
+def ngram_keys(words, n, token_hashes=None):
+    """
+    Hashes every run of n consecutive words into a 64 bit integer key
+    without building the phrases.
+    Args:
+        words (list str): Words in page order.
+        n (int): Words per n-gram.
+        token_hashes (dict): Cache of the hash of each word, shared
+          between calls to hash every distinct word only once.
+    Returns:
+        Generator of the key of each n-gram, in page order.
+    """
+    if token_hashes is None:
+        token_hashes = {}
+    # rolling polynomial hash, the oldest word is taken out of the key as
+    # the window moves instead of hashing all n words again
+    power = pow(HASH_BASE, n - 1, 1 << 64)
+    window = deque()
+    key = 0
+    for word in words:
+        token = token_hashes.get(word)
+        if token is None:
+            token = token_hashes[word] = _hash128(word)[0]
+        if len(window) == n:
+            key = (key - window.popleft() * power) & MASK_64
+        key = (key * HASH_BASE + token) & MASK_64
+        window.append(token)
+        if len(window) == n:
+            yield key
+
+
+def partition_overlapping(items, workers, n):
+    """
+    Cuts the words in about equal parts for the workers. Each part also
+    gets the first n - 1 words of the next one, so the n-grams that cross
+    a cut are counted once, by the part they start in.
+    """
+    size = max(1, -(-len(items) // workers))
+    for start in range(0, len(items), size):
+        yield items[start:start + size + n - 1]
+
+
+class NgramCounter(object):
+    """
+    Counts the n-grams of a site's words. It is a class so n and the
+    pruning settings go along with it to the worker processes.
+
+    The map step counts integer keys of the n-grams instead of tuples of
+    words, which the existing reduce_function sums across partitions.
+    Only the keys seen at least min_count times, top of them, are turned
+    back into phrases and kept on the site.
+    """
+    def __init__(self, n=2, top=20, min_count=2):
+        """
+        Args:
+            n (int): Words per n-gram.
+            top (int): Most frequent n-grams kept per site.
+            min_count (int): Fewest occurrences of an n-gram to keep it.
+        """
+        self.n = n
+        self.top = top
+        self.min_count = min_count
+
+    def partition(self, items, workers):
+        return partition_overlapping(items, workers, self.n)
+
+    def __call__(self, words):
+        """
+        Map function, counts the n-gram keys of a partition of words.
+        Returns:
+            dict of n-gram key to count.
+        """
+        counts = {}
+        for key in ngram_keys(words, self.n):
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def top_phrases(self, counts, words):
+        """
+        Keeps the most frequent keys and finds their phrases with one more
+        pass over the words.
+        Args:
+            counts (dict): n-gram key to count, reduced from every
+              partition.
+            words (list str): Words the keys were counted from.
+        Returns:
+            (list): (phrase, count) tuples, most frequent first.
+        """
+        frequent = sorted(
+            ((count, key) for key, count in counts.items()
+             if count >= self.min_count), reverse=True)[:self.top]
+        wanted = dict((key, count) for count, key in frequent)
+        phrases = {}
+        for start, key in enumerate(ngram_keys(words, self.n)):
+            if key in wanted and key not in phrases:
+                phrases[key] = ' '.join(words[start:start + self.n])
+                if len(phrases) == len(wanted):
+                    break
+        return [(phrases[key], count) for count, key in frequent]
+
+
+class CorpusNgrams(object):
+    """
+    Heavy hitter n-grams across all the sites, merged from the frequent
+    n-grams kept on each site.
+    """
+    def __init__(self, top_k=50, epsilon=0.005, delta=0.01):
+        self._phrases = TopItems(top_k=top_k, epsilon=epsilon, delta=delta)
+
+    def add(self, site):
+        for phrase, count in site.ngram_counts:
+            self._phrases.add(phrase, count)
+
+    def top(self, count=20):
+        """
+        Returns:
+            (list): (phrase, estimated count) tuples, most frequent first.
+        """
+        return self._phrases.top(count)
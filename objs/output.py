@@ -0,0 +1,352 @@
+from __future__ import division
+
+import csv
+import errno
+import gzip
+import json
+import logging
+import os
+from datetime import datetime
+
+import numpy
+
+logger = logging.getLogger(__name__)
+
+RUN_META_FILE = 'run.json'
+SITES_TABLE = 'sites'
+HEADERS_TABLE = 'headers'
+# which sites returned which headers, packed bits with the sites in rank
+# order and the headers in the order of the headers table
+HEADER_BITMAP_FILE = 'header_bitmap.npy'
+
+FORMAT_ARROW = 'arrow'
+FORMAT_PARQUET = 'parquet'
+FORMAT_CSV = 'csv'
+
+FORMAT_EXTENSIONS = {
+    FORMAT_ARROW: '.arrow',
+    FORMAT_PARQUET: '.parquet',
+    FORMAT_CSV: '.csv.gz'
+}
+
+SITE_COLUMNS = (
+    'rank',
+    'url',
+    'distinct_words',
+    'total_words',
+    'content_size',
+    'fetch_time'
+)
+
+HEADER_COLUMNS = (
+    'header',
+    'site_count',
+    'percentage'
+)
+
+
+def _pyarrow():
+    """
+    Loads pyarrow the first time it is needed. It is optional, without it
+    runs are written as compressed CSV.
+    Returns:
+        The pyarrow module or None if it is not installed.
+    """
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def default_format():
+    """
+    Picks the best output format the installed libraries support. Arrow IPC
+    files can be memory-mapped directly when they are compared.
+    """
+    if _pyarrow() is not None:
+        return FORMAT_ARROW
+    return FORMAT_CSV
+
+
+def _site_order(stats):
+    # stable sort so sites with the same count keep their fetch order
+    return numpy.argsort(-stats.metric('distinct_words'), kind='mergesort')
+
+
+def _header_order(stats):
+    return numpy.argsort(-stats.header_counts().astype(numpy.int64),
+                         kind='mergesort')
+
+
+def build_site_table(stats):
+    """
+    Creates the per-site columns from the corpus stats ordered by their rank
+    in word count.
+    Args:
+        stats (CorpusStats): Metrics for all the websites analyzed.
+    Returns:
+        (dict): Column name to numpy array.
+    """
+    distinct_words = stats.metric('distinct_words')
+    order = _site_order(stats)
+    urls = numpy.array(stats.urls, dtype=object)
+    return {
+        'rank': numpy.arange(1, len(order) + 1, dtype=numpy.int64),
+        'url': urls[order] if len(order) else urls,
+        'distinct_words': distinct_words[order],
+        'total_words': stats.metric('total_words')[order],
+        'content_size': stats.metric('content_size')[order],
+        'fetch_time': stats.metric('fetch_time')[order]
+    }
+
+
+def build_header_table(stats):
+    """
+    Creates the header frequency columns from the corpus stats.
+    Args:
+        stats (CorpusStats): Metrics for all the websites analyzed.
+    Returns:
+        (dict): Column name to numpy array.
+    """
+    counts = stats.header_counts().astype(numpy.int64)
+    if len(stats):
+        percentages = counts / len(stats) * 100.0
+    else:
+        percentages = numpy.zeros(len(counts), dtype=numpy.float64)
+    order = _header_order(stats)
+    headers = numpy.array(stats.header_names, dtype=object)
+    return {
+        'header': headers[order] if len(order) else headers,
+        'site_count': counts[order],
+        'percentage': percentages[order]
+    }
+
+
+def _open_csv(path, mode):
+    # the python 2 csv module only works with byte streams
+    if str is bytes:
+        return gzip.open(path, mode + 'b')
+    return gzip.open(path, mode + 't', encoding='utf-8', newline='')
+
+
+def _write_table(path, columns, names, output_format):
+    if output_format == FORMAT_CSV:
+        with _open_csv(path, 'w') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(names)
+            for row in zip(*[columns[name] for name in names]):
+                writer.writerow(row)
+        return
+
+    pyarrow = _pyarrow()
+    if pyarrow is None:
+        raise ValueError('pyarrow is required for the %s format'
+                         % output_format)
+
+    table = pyarrow.Table.from_arrays(
+        [pyarrow.array(list(columns[name]) if columns[name].dtype == object
+                       else columns[name]) for name in names],
+        names=list(names)
+    )
+    if output_format == FORMAT_PARQUET:
+        pyarrow.parquet.write_table(table, path)
+    else:
+        with pyarrow.OSFile(path, 'wb') as sink:
+            writer = pyarrow.RecordBatchFileWriter(sink, table.schema)
+            writer.write_table(table)
+            writer.close()
+
+
+def write_run(output_dir, stats, output_format=None, run_id=None,
+              labels=None):
+    """
+    Writes the results of a run to its own directory so that it can be
+    compared against other runs later.
+    Args:
+        output_dir (str): Directory that holds all the runs.
+        stats (CorpusStats): Metrics for all the websites analyzed.
+        output_format (str): One of arrow, parquet or csv. Defaults to the
+          best format available.
+        run_id (str): Name of the run. Defaults to the current UTC time
+          down to the microsecond.
+        labels (dict): Extra values saved in the run metadata, like how
+          much of the site list a budgeted run covered.
+    Returns:
+        (str): Path to the directory the run was written to.
+    Raises:
+        ValueError: If the output directory already has a run with the
+          same id.
+    """
+    output_format = output_format or default_format()
+    if output_format not in FORMAT_EXTENSIONS:
+        raise ValueError('Unknown output format: %s' % output_format)
+
+    run_id = run_id or datetime.utcnow().strftime('%Y%m%dT%H%M%S.%f')
+    run_dir = os.path.join(output_dir, run_id)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    try:
+        # never mixes the files of two runs that got the same id
+        os.mkdir(run_dir)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+        raise ValueError('Run %s already exists in %s' %
+                         (run_id, output_dir))
+
+    extension = FORMAT_EXTENSIONS[output_format]
+    _write_table(os.path.join(run_dir, SITES_TABLE + extension),
+                 build_site_table(stats), SITE_COLUMNS, output_format)
+    _write_table(os.path.join(run_dir, HEADERS_TABLE + extension),
+                 build_header_table(stats), HEADER_COLUMNS, output_format)
+    numpy.save(os.path.join(run_dir, HEADER_BITMAP_FILE),
+               stats.header_bitmap(_site_order(stats), _header_order(stats)))
+
+    # run.json is written last, a run directory without it is incomplete
+    meta = {
+        'run_id': run_id,
+        'format': output_format,
+        'created': datetime.utcnow().isoformat(),
+        'site_count': len(stats),
+        'average_word_count': stats.mean('distinct_words')
+    }
+    meta.update(labels or {})
+    with open(os.path.join(run_dir, RUN_META_FILE), 'w') as meta_file:
+        json.dump(meta, meta_file, indent=2)
+
+    logger.info('Run output written to %s', run_dir)
+    return run_dir
+
+
+def _read_csv_table(path):
+    with _open_csv(path, 'r') as csv_file:
+        reader = csv.reader(csv_file)
+        file_names = next(reader)
+        rows = list(reader)
+    columns = {}
+    for i, name in enumerate(file_names):
+        columns[name] = [row[i] for row in rows]
+    return columns
+
+
+def _read_table(path, output_format):
+    if output_format == FORMAT_CSV:
+        return _read_csv_table(path)
+
+    pyarrow = _pyarrow()
+    if pyarrow is None:
+        raise ValueError('pyarrow is required to read the %s format'
+                         % output_format)
+
+    if output_format == FORMAT_PARQUET:
+        table = pyarrow.parquet.read_table(path, memory_map=True)
+    else:
+        # the Arrow file is mapped and its columns are used in place
+        table = pyarrow.ipc.open_file(pyarrow.memory_map(path, 'r')) \
+            .read_all()
+    return dict((name, table.column(name).to_numpy())
+                for name in table.column_names)
+
+
+class RunResults(object):
+    """
+    The per-site and header tables of a run loaded from its output
+    directory.
+    """
+    def __init__(self, run_dir):
+        self._run_dir = run_dir
+        with open(os.path.join(run_dir, RUN_META_FILE)) as meta_file:
+            self._meta = json.load(meta_file)
+
+        output_format = self._meta['format']
+        extension = FORMAT_EXTENSIONS[output_format]
+        sites = _read_table(os.path.join(run_dir, SITES_TABLE + extension),
+                            output_format)
+        headers = _read_table(
+            os.path.join(run_dir, HEADERS_TABLE + extension), output_format)
+
+        self.urls = numpy.asarray(sites['url'], dtype=object)
+        self.ranks = numpy.asarray(sites['rank'], dtype=numpy.int64)
+        self.distinct_words = numpy.asarray(sites['distinct_words'],
+                                            dtype=numpy.int64)
+        self.total_words = numpy.asarray(sites['total_words'],
+                                         dtype=numpy.int64)
+        self.content_size = numpy.asarray(sites['content_size'],
+                                          dtype=numpy.int64)
+        self.fetch_time = numpy.asarray(
+            [numpy.nan if value in ('', None) else value
+             for value in sites['fetch_time']]
+            if output_format == FORMAT_CSV else sites['fetch_time'],
+            dtype=numpy.float64)
+
+        self.header_names = numpy.asarray(headers['header'], dtype=object)
+        self.header_counts = numpy.asarray(headers['site_count'],
+                                           dtype=numpy.int64)
+        self.header_percentages = numpy.asarray(headers['percentage'],
+                                                dtype=numpy.float64)
+
+        # runs written before the bitmap was saved don't have it
+        bitmap_path = os.path.join(run_dir, HEADER_BITMAP_FILE)
+        self.header_bitmap = None
+        if os.path.exists(bitmap_path):
+            self.header_bitmap = numpy.load(bitmap_path, mmap_mode='r')
+
+    @property
+    def run_id(self):
+        return self._meta['run_id']
+
+    @property
+    def meta(self):
+        return self._meta
+
+    def __len__(self):
+        return len(self.urls)
+
+
+def compare_runs(run_a, run_b, top=20):
+    """
+    Diffs the word count ranks and header percentages of two runs.
+    Args:
+        run_a (RunResults): Baseline run.
+        run_b (RunResults): Run to compare against the baseline.
+        top (int): Number of the largest changes to return.
+    Returns:
+        (dict): Summary of the differences between the runs.
+    """
+    common, index_a, index_b = numpy.intersect1d(
+        run_a.urls.astype(str), run_b.urls.astype(str),
+        return_indices=True)
+    rank_delta = run_b.ranks[index_b] - run_a.ranks[index_a]
+    word_delta = run_b.distinct_words[index_b] - \
+        run_a.distinct_words[index_a]
+    moved = numpy.argsort(-numpy.abs(rank_delta), kind='mergesort')[:top]
+
+    headers_a = dict(zip(run_a.header_names, run_a.header_percentages))
+    headers_b = dict(zip(run_b.header_names, run_b.header_percentages))
+    header_delta = [
+        (header, float(headers_a.get(header, 0.0)),
+         float(headers_b.get(header, 0.0)))
+        for header in sorted(set(headers_a) | set(headers_b))
+    ]
+    header_delta.sort(key=lambda x: abs(x[2] - x[1]), reverse=True)
+
+    average_a = float(run_a.distinct_words.mean()) if len(run_a) else 0.0
+    average_b = float(run_b.distinct_words.mean()) if len(run_b) else 0.0
+
+    return {
+        'sites_a': len(run_a),
+        'sites_b': len(run_b),
+        'common_sites': len(common),
+        'only_in_a': len(run_a) - len(common),
+        'only_in_b': len(run_b) - len(common),
+        'average_word_count': (average_a, average_b),
+        'rank_changes': [
+            (common[i], int(run_a.ranks[index_a[i]]),
+             int(run_b.ranks[index_b[i]]), int(word_delta[i]))
+            for i in moved if rank_delta[i] != 0
+        ],
+        'header_changes': header_delta[:top]
+    }
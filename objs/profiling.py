@@ -0,0 +1,377 @@
+from __future__ import print_function
+
+import glob
+import json
+import logging
+import multiprocessing.util
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+# tracemalloc is only in python 3.4+, peak RSS is used without it
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# the profile settings are passed through the environment so every pool
+# worker, including the nested mapreduce pools, picks them up
+PROFILE_DIR_ENV = 'TOPSITES_PROFILE_DIR'
+PROFILE_MODE_ENV = 'TOPSITES_PROFILE_MODE'
+PROFILE_INTERVAL_ENV = 'TOPSITES_PROFILE_INTERVAL'
+
+# tasks a worker runs between dumps of its stats, a pool terminated when
+# the time budget runs out doesn't give its workers a chance to dump them
+# at exit
+DUMP_EVERY_TASKS = 100
+
+MODE_CPROFILE = 'cprofile'
+MODE_SAMPLE = 'sample'
+MODES = (MODE_CPROFILE, MODE_SAMPLE)
+
+# functions reported on from the merged cProfile stats
+REPORT_FUNCTIONS = (
+    'get_site_urls',
+    'fill_site_data',
+    'stream_site_data',
+    'calculate_word_count',
+    'map_function',
+    'find_corpus_stats',
+    'find_average_word_count',
+    'find_top_20_headers_vectorized'
+)
+
+# per process profiler, replaced when a forked worker sees a new pid
+_process_profiler = None
+_stages = None
+
+
+def _peak_rss_kb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class SamplingProfiler(object):
+    """
+    Low overhead statistical profiler. A CPU timer interrupts the process
+    every interval seconds and the stack that was running is counted.
+    """
+    def __init__(self, interval=0.005):
+        self._interval = interval
+        self.self_samples = {}
+        self.total_samples = {}
+
+    @staticmethod
+    def _key(code):
+        return '%s:%d(%s)' % (code.co_filename, code.co_firstlineno,
+                              code.co_name)
+
+    def _sample(self, signum, frame):
+        if frame is None:
+            return
+        leaf = self._key(frame.f_code)
+        self.self_samples[leaf] = self.self_samples.get(leaf, 0) + 1
+        seen = set()
+        while frame is not None:
+            key = self._key(frame.f_code)
+            if key not in seen:
+                seen.add(key)
+                self.total_samples[key] = self.total_samples.get(key, 0) + 1
+            frame = frame.f_back
+
+    def enable(self):
+        signal.signal(signal.SIGPROF, self._sample)
+        # restart system calls the timer interrupts, python 2 doesn't retry
+        # them and the pool's pipes would fail with EINTR
+        signal.siginterrupt(signal.SIGPROF, False)
+        signal.setitimer(signal.ITIMER_PROF, self._interval, self._interval)
+
+    def disable(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+
+    def dump_stats(self, path):
+        # copy first, the timer can fire while the counts are being written
+        # and dict() copies without running any python code in between
+        samples = {'self': dict(self.self_samples),
+                   'total': dict(self.total_samples)}
+        with open(path, 'w') as samples_file:
+            json.dump(samples, samples_file)
+
+
+class _ProcessProfiler(object):
+    """
+    Profiler of a single process. Its stats are dumped when the process
+    exits and every DUMP_EVERY_TASKS tasks, since pool workers can be
+    terminated without running any exit handlers.
+    """
+    def __init__(self, profile_dir, mode, interval):
+        self.pid = os.getpid()
+        self._mode = mode
+        # a forked worker inherits the main process profiler, drop it so
+        # the task is only profiled by the worker's own profiler
+        sys.setprofile(None)
+        if mode == MODE_SAMPLE:
+            self._profiler = SamplingProfiler(interval)
+            self._path = os.path.join(profile_dir, '%d.samples' % self.pid)
+            self._profiler.enable()
+        else:
+            import cProfile
+
+            self._profiler = cProfile.Profile()
+            self._path = os.path.join(profile_dir, '%d.prof' % self.pid)
+        self._memory_path = os.path.join(profile_dir,
+                                         '%d.memory' % self.pid)
+        self._task_peaks = {}
+        self._tasks = 0
+        if tracemalloc is not None and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        # run by a pool worker that is closed and joined, unlike atexit
+        multiprocessing.util.Finalize(None, self.dump, exitpriority=10)
+
+    def run(self, func, *args, **kwargs):
+        if tracemalloc is not None:
+            tracemalloc.clear_traces()
+        if self._mode == MODE_CPROFILE:
+            result = self._profiler.runcall(func, *args, **kwargs)
+        else:
+            result = func(*args, **kwargs)
+
+        name = getattr(func, '__name__', None) or \
+            getattr(getattr(func, 'func', None), '__name__', None) or \
+            type(func).__name__
+        if tracemalloc is not None:
+            peak = tracemalloc.get_traced_memory()[1] // 1024
+        else:
+            peak = _peak_rss_kb()
+        if peak is not None:
+            self._task_peaks[name] = max(self._task_peaks.get(name, 0), peak)
+        self._tasks += 1
+        if self._tasks % DUMP_EVERY_TASKS == 0:
+            self.dump()
+        return result
+
+    def dump(self):
+        self._profiler.dump_stats(self._path)
+        with open(self._memory_path, 'w') as memory_file:
+            json.dump(self._task_peaks, memory_file)
+
+
+def _profiler_for_process():
+    global _process_profiler
+    if _process_profiler is None or _process_profiler.pid != os.getpid():
+        _process_profiler = _ProcessProfiler(
+            os.environ[PROFILE_DIR_ENV],
+            os.environ.get(PROFILE_MODE_ENV, MODE_CPROFILE),
+            float(os.environ.get(PROFILE_INTERVAL_ENV, '0.005')))
+    return _process_profiler
+
+
+class ProfiledTask(object):
+    """
+    Wraps a function sent to a pool so it is profiled inside the worker.
+    The function must be picklable on its own.
+    """
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, *args, **kwargs):
+        return _profiler_for_process().run(self.func, *args, **kwargs)
+
+
+def profiled(func):
+    """
+    Wraps a pool task function for profiling when a profile run is active.
+    Args:
+        func: Function that is going to be run in a worker process.
+    Returns:
+        The wrapped function, or the function itself if profiling is off.
+    """
+    if os.environ.get(PROFILE_DIR_ENV):
+        return ProfiledTask(func)
+    return func
+
+
+class _StageTracker(object):
+    """
+    Records the peak memory of each stage of a run in the main process.
+    """
+    def __init__(self):
+        self.stages = []
+        self._current = None
+        self._started = None
+
+    def begin(self, name):
+        self.end()
+        if tracemalloc is not None:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.clear_traces()
+        self._current = name
+        self._started = time.time()
+
+    def end(self):
+        if self._current is None:
+            return
+        if tracemalloc is not None:
+            peak = tracemalloc.get_traced_memory()[1] // 1024
+            source = 'tracemalloc'
+        else:
+            peak = _peak_rss_kb()
+            source = 'peak rss'
+        self.stages.append({
+            'stage': self._current,
+            'seconds': time.time() - self._started,
+            'peak_kb': peak,
+            'source': source
+        })
+        self._current = None
+
+
+def begin_stage(name):
+    """
+    Starts tracking a new stage of the run, ending the one before it. Does
+    nothing unless profiling is enabled.
+    """
+    if _stages is not None:
+        _stages.begin(name)
+
+
+def end_stage():
+    if _stages is not None:
+        _stages.end()
+
+
+class RunProfiler(object):
+    """
+    Profiles the main process of a run and collects the profiles written by
+    every worker into one report.
+    """
+    def __init__(self, profile_dir=None, mode=MODE_CPROFILE, interval=0.005):
+        global _stages
+        if mode not in MODES:
+            raise ValueError('Unknown profile mode: %s' % mode)
+        self._keep_dir = profile_dir is not None
+        self._profile_dir = profile_dir or tempfile.mkdtemp(
+            prefix='topsites-profile-')
+        if not os.path.isdir(self._profile_dir):
+            os.makedirs(self._profile_dir)
+        self._mode = mode
+
+        os.environ[PROFILE_DIR_ENV] = self._profile_dir
+        os.environ[PROFILE_MODE_ENV] = mode
+        os.environ[PROFILE_INTERVAL_ENV] = str(interval)
+
+        _stages = _StageTracker()
+        if mode == MODE_SAMPLE:
+            self._profiler = SamplingProfiler(interval)
+        else:
+            import cProfile
+
+            self._profiler = cProfile.Profile()
+        self._profiler.enable()
+
+    @property
+    def profile_dir(self):
+        return self._profile_dir
+
+    def finish(self):
+        """
+        Stops profiling and writes the main process profile next to the
+        worker profiles.
+        Returns:
+            (str): The merged report.
+        """
+        self._profiler.disable()
+        end_stage()
+        extension = 'samples' if self._mode == MODE_SAMPLE else 'prof'
+        self._profiler.dump_stats(os.path.join(
+            self._profile_dir, 'main-%d.%s' % (os.getpid(), extension)))
+        for name in (PROFILE_DIR_ENV, PROFILE_MODE_ENV,
+                     PROFILE_INTERVAL_ENV):
+            os.environ.pop(name, None)
+
+        report = self.report()
+        if not self._keep_dir:
+            shutil.rmtree(self._profile_dir, ignore_errors=True)
+        return report
+
+    def _cprofile_report(self, out):
+        import pstats
+
+        paths = glob.glob(os.path.join(self._profile_dir, '*.prof'))
+        stats = pstats.Stats(paths[0], stream=out)
+        for path in paths[1:]:
+            stats.add(path)
+        print('Merged profile of %d processes' % len(paths), file=out)
+        # don't list every per-process file in front of each table
+        stats.files = []
+        stats.sort_stats('cumulative')
+        for name in REPORT_FUNCTIONS:
+            stats.print_stats(name)
+        stats.sort_stats('tottime')
+        stats.print_stats(25)
+
+    def _sample_report(self, out, top=25):
+        paths = glob.glob(os.path.join(self._profile_dir, '*.samples'))
+        self_samples = {}
+        total_samples = {}
+        for path in paths:
+            with open(path) as samples_file:
+                samples = json.load(samples_file)
+            for merged, counts in ((self_samples, samples['self']),
+                                   (total_samples, samples['total'])):
+                for key, count in counts.items():
+                    merged[key] = merged.get(key, 0) + count
+
+        all_samples = sum(self_samples.values()) or 1
+        print('Merged samples of %d processes, %d samples' % (
+            len(paths), sum(self_samples.values())), file=out)
+        for title, counts in (('self', self_samples),
+                              ('total', total_samples)):
+            print('\nTop functions by %s samples' % title, file=out)
+            ranked = sorted(counts.items(), key=lambda x: x[1],
+                            reverse=True)
+            for key, count in ranked[:top]:
+                print('%6.2f%% %8d  %s' % (count * 100.0 / all_samples,
+                                           count, key), file=out)
+
+    def _memory_report(self, out):
+        print('\nPeak memory by stage of the main process', file=out)
+        for stage in _stages.stages:
+            print('%-20s %8.2fs %10s KB (%s)' % (
+                stage['stage'], stage['seconds'], stage['peak_kb'],
+                stage['source']), file=out)
+
+        task_peaks = {}
+        for path in glob.glob(os.path.join(self._profile_dir, '*.memory')):
+            with open(path) as memory_file:
+                for name, peak in json.load(memory_file).items():
+                    task_peaks[name] = max(task_peaks.get(name, 0), peak)
+        print('\nPeak memory of a single worker task', file=out)
+        for name, peak in sorted(task_peaks.items()):
+            print('%-30s %10s KB' % (name, peak), file=out)
+
+    def report(self):
+        out = StringIO()
+        if self._mode == MODE_SAMPLE:
+            self._sample_report(out)
+        else:
+            self._cprofile_report(out)
+        self._memory_report(out)
+        return out.getvalue()
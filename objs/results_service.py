@@ -0,0 +1,400 @@
+from __future__ import division
+
+import json
+import logging
+import os
+import threading
+
+import numpy
+
+from objs.output import RunResults, RUN_META_FILE
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+    from urllib import unquote
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs, unquote
+
+logger = logging.getLogger(__name__)
+
+# per-site columns that rankings and percentiles can be asked for
+METRICS = ('distinct_words', 'total_words', 'content_size', 'fetch_time')
+
+
+class ResultsIndex(object):
+    """
+    In-memory indexes over the results of one finished run. Everything is
+    computed when the run is loaded so the queries are only lookups into
+    sorted arrays, dicts and the header bitmap.
+    """
+    def __init__(self, run_dir):
+        """
+        Args:
+            run_dir (str): Directory a run was written to with --output-dir.
+        """
+        run = RunResults(run_dir)
+        self.run_dir = run_dir
+        self.meta = run.meta
+        self._urls = run.urls
+        self._ranks = run.ranks
+        self._metrics = dict((metric, getattr(run, metric))
+                             for metric in METRICS)
+        # ascending copy of every metric without the missing values, for
+        # percentiles
+        self._sorted = dict(
+            (metric, numpy.sort(values[~numpy.isnan(values)]
+                                if values.dtype.kind == 'f' else values))
+            for metric, values in self._metrics.items())
+        # highest first, the sites table is already in distinct word order
+        self._orders = dict(
+            (metric, numpy.argsort(-numpy.nan_to_num(values),
+                                   kind='mergesort'))
+            for metric, values in self._metrics.items()
+            if metric != 'distinct_words')
+        self._rows = dict((url, row) for row, url in enumerate(run.urls))
+
+        self._header_names = run.header_names
+        self._header_counts = run.header_counts
+        self._header_percentages = run.header_percentages
+        self._header_columns = dict(
+            (header.lower(), col)
+            for col, header in enumerate(run.header_names))
+        self._bitmap = None
+        if run.header_bitmap is not None:
+            # unpacked once so per-site lookups don't have to shift bits
+            self._bitmap = numpy.unpackbits(
+                numpy.asarray(run.header_bitmap), axis=0)[:len(run)] \
+                .astype(bool)
+
+    @property
+    def run_id(self):
+        return self.meta['run_id']
+
+    def __len__(self):
+        return len(self._urls)
+
+    def _site(self, row):
+        site = {
+            'rank': int(self._ranks[row]),
+            'url': self._urls[row]
+        }
+        for metric, values in self._metrics.items():
+            value = values[row].item()
+            site[metric] = None if value != value else value
+        return site
+
+    def ranking(self, offset=0, limit=20, metric='distinct_words'):
+        """
+        Gets a page of the sites ordered by a metric, highest first.
+        Returns:
+            (list dict): The sites of the page.
+        """
+        if metric == 'distinct_words':
+            rows = range(offset, min(offset + limit, len(self)))
+        else:
+            rows = self._orders[metric][offset:offset + limit]
+        return [self._site(row) for row in rows]
+
+    def percentile(self, metric, percent):
+        """
+        Returns:
+            (float): Value of the metric at the given percentile, None if
+            no site has it.
+        """
+        values = self._sorted[metric]
+        if not len(values):
+            return None
+        position = min(len(values) - 1,
+                       int(round(percent / 100.0 * (len(values) - 1))))
+        return values[position].item()
+
+    def headers(self, top=None):
+        """
+        Returns:
+            (list dict): Headers with the number and share of the sites that
+            return them, most common first.
+        """
+        count = len(self._header_names) if top is None else top
+        return [{
+            'header': self._header_names[col],
+            'site_count': int(self._header_counts[col]),
+            'percentage': float(self._header_percentages[col])
+        } for col in range(min(count, len(self._header_names)))]
+
+    def sites_with_header(self, header, offset=0, limit=20):
+        """
+        Gets the sites that return a header, in rank order.
+        Returns:
+            (list str): Urls of the sites, None if the header is unknown or
+            the run has no header bitmap.
+        """
+        col = self._header_columns.get(header.lower())
+        if col is None or self._bitmap is None:
+            return None
+        rows = numpy.flatnonzero(self._bitmap[:, col])[offset:offset + limit]
+        return [self._urls[row] for row in rows]
+
+    def site(self, url):
+        """
+        Returns:
+            (dict): Metrics and headers of a site, None if it isn't in the
+            run.
+        """
+        row = self._rows.get(url)
+        if row is None:
+            return None
+        site = self._site(row)
+        if self._bitmap is not None:
+            site['headers'] = list(
+                self._header_names[numpy.flatnonzero(self._bitmap[row])])
+        return site
+
+
+def latest_run(output_dir):
+    """
+    Finds the newest finished run of an output directory. Runs are named
+    by their UTC start time and only get their metadata once they are
+    completely written.
+    Returns:
+        (str): Path of the run, None if there is none yet.
+    """
+    runs = sorted(
+        name for name in os.listdir(output_dir)
+        if os.path.exists(os.path.join(output_dir, name, RUN_META_FILE)))
+    return os.path.join(output_dir, runs[-1]) if runs else None
+
+
+class ResultsService(object):
+    """
+    Holds the index of the run being served. A new run is indexed on the
+    side and swapped in with a single assignment, so queries never wait
+    for a load and always see one whole run.
+    """
+    def __init__(self, run_dir=None, output_dir=None):
+        """
+        Args:
+            run_dir (str): Run to serve.
+            output_dir (str): Serve the newest run of this directory
+              instead, see watch().
+        """
+        self._output_dir = output_dir
+        self._load_lock = threading.Lock()
+        self.index = None
+        # newest run of the output directory seen so far, a run loaded by
+        # hand is kept until a newer one is written
+        self._latest = None
+        if run_dir:
+            self.load(run_dir)
+        else:
+            self.reload()
+
+    def load(self, run_dir):
+        """
+        Indexes a run and starts serving it.
+        Returns:
+            (bool): True if a different run was swapped in.
+        """
+        if run_dir is None:
+            return False
+        with self._load_lock:
+            current = self.index
+            if current is not None and os.path.abspath(current.run_dir) == \
+                    os.path.abspath(run_dir):
+                return False
+            index = ResultsIndex(run_dir)
+            self.index = index
+        logger.info('Serving run %s with %d sites', index.run_id, len(index))
+        return True
+
+    def run_path(self, run):
+        """
+        Finds a run of the output directory by name.
+        Args:
+            run (str): Directory of the run, relative to the output
+              directory.
+        Returns:
+            (str): Path of the run, None if it isn't a finished run.
+        Raises:
+            ValueError: Runs can't be picked without an output directory,
+              or the path leads out of it.
+        """
+        if not self._output_dir:
+            raise ValueError('runs can only be picked with --output-dir')
+        base = os.path.realpath(self._output_dir)
+        path = os.path.realpath(os.path.join(base, run))
+        if not path.startswith(base + os.sep):
+            raise ValueError('run must be a directory in the output '
+                             'directory')
+        if not os.path.exists(os.path.join(path, RUN_META_FILE)):
+            return None
+        return path
+
+    def reload(self):
+        """
+        Swaps in the newest run of the output directory if a new one was
+        written since the last check.
+        Returns:
+            (bool): True if a different run was swapped in.
+        """
+        if not self._output_dir:
+            return False
+        latest = latest_run(self._output_dir)
+        if latest is None or latest == self._latest:
+            return False
+        self._latest = latest
+        return self.load(latest)
+
+    def watch(self, interval=10.0):
+        """
+        Checks the output directory for a newer run every interval seconds
+        from a background thread.
+        """
+        stop = threading.Event()
+
+        def poll():
+            while not stop.wait(interval):
+                try:
+                    self.reload()
+                except Exception:
+                    logger.exception('Could not load the newest run')
+
+        thread = threading.Thread(target=poll)
+        thread.daemon = True
+        thread.start()
+        return stop
+
+
+def _int_arg(query, name, default):
+    try:
+        value = int(query.get(name, [default])[0])
+    except ValueError:
+        raise ValueError('%s must be a number' % name)
+    if value < 0:
+        raise ValueError('%s must not be negative' % name)
+    return value
+
+
+class ResultsRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API over the run being served:
+        GET  /run                           metadata of the run
+        GET  /ranking?offset=&limit=&metric= page of the ranking
+        GET  /percentile?metric=&p=         value at a percentile
+        GET  /headers?top=                  most common headers
+        GET  /headers/<name>?offset=&limit= sites that return a header
+        GET  /site?url=                     metrics and headers of a site
+        POST /reload?run=                   swap in a run of the output
+                                            directory, or the newest one
+    """
+    def _send(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _route(self, method):
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        path = parsed.path.rstrip('/')
+        service = self.server.service
+        # keep the same run for the whole request even if one is swapped in
+        index = service.index
+
+        if method == 'POST' and path == '/reload':
+            run = query.get('run', [None])[0]
+            if run:
+                run_dir = service.run_path(run)
+                if run_dir is None:
+                    return 404, {'error': 'unknown run %s' % run}
+                changed = service.load(run_dir)
+            else:
+                changed = service.reload()
+            if service.index is None:
+                return 503, {'error': 'no run loaded'}
+            return 200, {'run_id': service.index.run_id, 'changed': changed}
+        if method != 'GET':
+            return 405, {'error': 'method not allowed'}
+        if index is None:
+            return 503, {'error': 'no run loaded'}
+
+        if path == '/run':
+            return 200, index.meta
+        if path == '/ranking':
+            metric = query.get('metric', ['distinct_words'])[0]
+            if metric not in METRICS:
+                return 400, {'error': 'unknown metric %s' % metric}
+            return 200, {'run_id': index.run_id, 'sites': index.ranking(
+                _int_arg(query, 'offset', 0), _int_arg(query, 'limit', 20),
+                metric)}
+        if path == '/percentile':
+            metric = query.get('metric', ['distinct_words'])[0]
+            if metric not in METRICS:
+                return 400, {'error': 'unknown metric %s' % metric}
+            try:
+                percent = float(query.get('p', [50])[0])
+            except ValueError:
+                return 400, {'error': 'p must be a number'}
+            return 200, {'run_id': index.run_id, 'metric': metric,
+                         'percentile': percent,
+                         'value': index.percentile(metric, percent)}
+        if path == '/headers':
+            top = query.get('top')
+            return 200, {'run_id': index.run_id, 'headers': index.headers(
+                _int_arg(query, 'top', 0) if top else None)}
+        if path.startswith('/headers/'):
+            header = unquote(path[len('/headers/'):])
+            urls = index.sites_with_header(
+                header, _int_arg(query, 'offset', 0),
+                _int_arg(query, 'limit', 20))
+            if urls is None:
+                return 404, {'error': 'unknown header %s' % header}
+            return 200, {'run_id': index.run_id, 'header': header,
+                         'sites': urls}
+        if path == '/site':
+            url = query.get('url', [''])[0]
+            site = index.site(url)
+            if site is None:
+                return 404, {'error': 'unknown site %s' % url}
+            return 200, dict(site, run_id=index.run_id)
+        return 404, {'error': 'not found'}
+
+    def _handle(self, method):
+        try:
+            status, body = self._route(method)
+        except ValueError as e:
+            status, body = 400, {'error': str(e)}
+        except Exception as e:
+            logger.exception('Error answering %s', self.path)
+            status, body = 500, {'error': str(e)}
+        self._send(status, body)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def log_message(self, format, *args):
+        logger.debug('%s - %s', self.address_string(), format % args)
+
+
+class ResultsServer(ThreadingMixIn, HTTPServer):
+    """
+    Threaded HTTP server answering queries about a run.
+    """
+    daemon_threads = True
+
+    def __init__(self, service, address=('127.0.0.1', 8000)):
+        """
+        Args:
+            service (ResultsService): Holds the run being served.
+            address (tuple): (host, port) to listen on.
+        """
+        HTTPServer.__init__(self, address, ResultsRequestHandler)
+        self.service = service
@@ -0,0 +1,198 @@
+from __future__ import division
+
+import logging
+import math
+import random
+
+logger = logging.getLogger(__name__)
+
+# z score of a 95% confidence interval
+Z_95 = 1.96
+
+
+class Stratum(object):
+    """
+    Sites of one rank bucket and the running totals of the ones sampled
+    from it.
+    """
+    def __init__(self, entries, rng):
+        self.entries = list(entries)
+        rng.shuffle(self.entries)
+        self.next = 0
+        self.count = 0
+        self.total = 0.0
+        self.squares = 0.0
+        self.header_counts = {}
+
+    @property
+    def size(self):
+        return len(self.entries)
+
+    def take(self, count):
+        """
+        Returns:
+            (list SiteEntry): The next count sites of the stratum that
+            haven't been sampled yet.
+        """
+        taken = self.entries[self.next:self.next + count]
+        self.next += len(taken)
+        return taken
+
+    def add(self, value, headers):
+        self.count += 1
+        self.total += value
+        self.squares += value * value
+        for header in headers:
+            self.header_counts[header] = self.header_counts.get(header, 0) + 1
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def variance(self):
+        if self.count < 2:
+            return 0.0
+        return max(0.0, (self.squares - self.total * self.total /
+                         self.count) / (self.count - 1))
+
+    def correction(self):
+        # finite population correction, a stratum that was fully sampled
+        # adds no error
+        if not self.size:
+            return 0.0
+        return 1.0 - self.count / self.size
+
+
+class StratifiedSample(object):
+    """
+    Stratified random sample of the top sites list by rank bucket. Every
+    stratum is sampled in proportion to its size, and the estimates weight
+    each stratum by its share of the list.
+    """
+    def __init__(self, entries, strata=10, seed=None):
+        """
+        Args:
+            entries (list SiteEntry): Sites from the top sites list.
+            strata (int): Number of rank buckets, each with about the same
+              number of sites.
+            seed: Seed of the random order the sites are sampled in.
+        """
+        rng = random.Random(seed)
+        ranked = sorted(entries,
+                        key=lambda entry: (entry.rank is None, entry.rank))
+        strata = max(1, min(strata, len(ranked)))
+        bounds = [int(round(i * len(ranked) / strata))
+                  for i in range(strata + 1)]
+        self._strata = [Stratum(ranked[bounds[i]:bounds[i + 1]], rng)
+                        for i in range(strata)]
+        self._strata_by_url = {}
+        for stratum in self._strata:
+            for entry in stratum.entries:
+                self._strata_by_url[entry.url] = stratum
+        self._population = len(ranked)
+
+    @property
+    def population(self):
+        return self._population
+
+    @property
+    def sampled(self):
+        return sum(stratum.next for stratum in self._strata)
+
+    @property
+    def analyzed(self):
+        return sum(stratum.count for stratum in self._strata)
+
+    def grow(self, fraction):
+        """
+        Picks more sites so that fraction of every stratum has been
+        sampled, with at least two sites from each stratum so its variance
+        can be estimated.
+        Returns:
+            (list str): Urls of the newly picked sites.
+        """
+        urls = []
+        for stratum in self._strata:
+            target = max(min(2, stratum.size),
+                         int(math.ceil(stratum.size * fraction)))
+            urls.extend(entry.url for entry in
+                        stratum.take(target - stratum.next))
+        return urls
+
+    def add(self, site):
+        """
+        Folds an analyzed site into the totals of its stratum.
+        """
+        stratum = self._strata_by_url.get(site.url)
+        if stratum is None:
+            return
+        stratum.add(site.word_count_size, site.headers)
+
+    def _weights(self):
+        return [(stratum, stratum.size / self._population)
+                for stratum in self._strata if stratum.count]
+
+    def mean(self):
+        """
+        Estimates the average distinct word count of the whole list.
+        Returns:
+            (float, float): The estimate and the half width of its 95%
+            confidence interval.
+        """
+        weights = self._weights()
+        # strata without any analyzed sites are left out of the weights
+        covered = sum(weight for _, weight in weights) or 1.0
+        mean = sum(weight * stratum.mean()
+                   for stratum, weight in weights) / covered
+        variance = sum((weight / covered) ** 2 * stratum.correction() *
+                       stratum.variance() / stratum.count
+                       for stratum, weight in weights)
+        return mean, Z_95 * math.sqrt(variance)
+
+    def header_percentages(self, count=20):
+        """
+        Estimates the percentage of sites that return each header.
+        Returns:
+            (list): (header, percentage, half width of the 95% interval)
+            tuples of the most common headers.
+        """
+        weights = self._weights()
+        covered = sum(weight for _, weight in weights) or 1.0
+        headers = set()
+        for stratum, _ in weights:
+            headers.update(stratum.header_counts)
+
+        estimates = []
+        for header in headers:
+            share = 0.0
+            variance = 0.0
+            for stratum, weight in weights:
+                weight /= covered
+                p = stratum.header_counts.get(header, 0) / stratum.count
+                share += weight * p
+                if stratum.count > 1:
+                    variance += weight ** 2 * stratum.correction() * \
+                        p * (1 - p) / (stratum.count - 1)
+            estimates.append((header, share * 100.0,
+                              Z_95 * math.sqrt(variance) * 100.0))
+        estimates.sort(key=lambda x: x[1], reverse=True)
+        return estimates[:count]
+
+    def precision_met(self, precision):
+        """
+        Args:
+            precision (float): Largest allowed half width of the average
+              word count interval, relative to the average.
+        Returns:
+            (bool): True if the estimate is precise enough or every site
+            has been sampled.
+        """
+        if self.sampled >= self._population:
+            return True
+        # every stratum needs two sites before its variance means anything
+        if any(stratum.count < min(2, stratum.size)
+               for stratum in self._strata):
+            return False
+        mean, half_width = self.mean()
+        if not mean:
+            return False
+        return half_width / mean <= precision
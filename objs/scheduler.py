@@ -0,0 +1,195 @@
+from __future__ import division
+
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _rank_key(entry):
+    # unranked sites go last
+    return (entry.rank is None, entry.rank)
+
+
+def _reach_key(entry):
+    return -(entry.reach or 0)
+
+
+def _page_views_key(entry):
+    return -(entry.page_views or 0)
+
+
+PRIORITY_KEYS = {
+    'rank': _rank_key,
+    'reach': _reach_key,
+    'page-views': _page_views_key
+}
+
+
+def prioritize(entries, key='rank'):
+    """
+    Orders the sites so the most important ones are fetched first.
+    Args:
+        entries (list SiteEntry): Sites from the top sites list.
+        key: One of the PRIORITY_KEYS names or a function that takes a
+          SiteEntry and returns a sort key, lowest first.
+    Returns:
+        (list SiteEntry): The entries in the order they should be fetched.
+    """
+    if not callable(key):
+        if key not in PRIORITY_KEYS:
+            raise ValueError('Unknown priority: %s' % key)
+        key = PRIORITY_KEYS[key]
+    return sorted(entries, key=key)
+
+
+class Deadline(object):
+    """
+    Time budget shared by the scheduling loops. A budget of None never
+    runs out.
+    """
+    def __init__(self, budget=None):
+        self.budget = budget
+        self._start = time.time()
+        self.expired = False
+
+    def remaining(self):
+        """
+        Returns:
+            (float): Seconds left or None if there is no budget.
+        """
+        if self.budget is None:
+            return None
+        return max(0.0, self.budget - (time.time() - self._start))
+
+    def check(self):
+        """
+        Returns:
+            (bool): True once the budget has run out.
+        """
+        if self.budget is not None and not self.expired and \
+                self.remaining() == 0.0:
+            logger.warning('Time budget of %.1fs ran out', self.budget)
+            self.expired = True
+        return self.expired
+
+    @property
+    def elapsed(self):
+        return time.time() - self._start
+
+
+class BudgetReport(object):
+    """
+    Describes how much of the site list a budgeted run got through, so a
+    partial result is labeled with what it covers.
+    """
+    def __init__(self, entries, deadline):
+        """
+        Args:
+            entries (list SiteEntry): Sites that were scheduled, in priority
+              order.
+            deadline (Deadline): Budget of the run.
+        """
+        self._entries = entries
+        self._deadline = deadline
+        self._analyzed = set()
+        self._word_counts = []
+
+    def add(self, site):
+        """
+        Counts an analyzed site towards the coverage. Only its url and word
+        count are kept.
+        """
+        self._analyzed.add(site.url)
+        self._word_counts.append(site.word_count_size)
+
+    @property
+    def _completed(self):
+        return [entry for entry in self._entries
+                if entry.url in self._analyzed]
+
+    @property
+    def _prefix(self):
+        # the scheduled sites before the first one that wasn't analyzed
+        prefix = 0
+        for entry in self._entries:
+            if entry.url not in self._analyzed:
+                break
+            prefix += 1
+        return prefix
+
+    @property
+    def complete(self):
+        # every scheduled site was tried, some may still have failed
+        return not self._deadline.expired
+
+    def _share(self, field, completed):
+        total = sum(getattr(entry, field) or 0 for entry in self._entries)
+        if not total:
+            return None
+        return sum(getattr(entry, field) or 0 for entry in completed) / total
+
+    def _mean_interval(self, z=1.96):
+        counts = self._word_counts
+        if len(counts) < 2:
+            return None
+        mean = sum(counts) / len(counts)
+        variance = sum((count - mean) ** 2 for count in counts) / \
+            (len(counts) - 1)
+        margin = z * math.sqrt(variance / len(counts))
+        # the sites are not a random sample, the interval only describes
+        # the sites that were analyzed
+        if not self.complete and len(self._entries) > 1:
+            margin *= math.sqrt((len(self._entries) - len(counts)) /
+                                (len(self._entries) - 1))
+        return mean - margin, mean + margin
+
+    def labels(self):
+        """
+        Returns:
+            (dict): Coverage of the run that can be saved with its results.
+        """
+        completed = self._completed
+        ranks = [entry.rank for entry in completed if entry.rank is not None]
+        return {
+            'complete': self.complete,
+            'time_budget': self._deadline.budget,
+            'elapsed': self._deadline.elapsed,
+            'scheduled_sites': len(self._entries),
+            'analyzed_sites': len(completed),
+            'site_coverage': len(completed) / len(self._entries)
+            if self._entries else 1.0,
+            'priority_prefix': self._prefix,
+            'rank_range': [min(ranks), max(ranks)] if ranks else None,
+            'reach_coverage': self._share('reach', completed),
+            'page_views_coverage': self._share('page_views', completed),
+            'word_count_interval': self._mean_interval()
+        }
+
+    def log(self):
+        labels = self.labels()
+        if labels['complete']:
+            logger.info('All %d scheduled sites were analyzed in %.1fs',
+                        labels['scheduled_sites'], labels['elapsed'])
+            return
+        logger.warning('PARTIAL RESULTS: %d of %d sites (%.1f%%) analyzed '
+                       'in the %.1fs budget', labels['analyzed_sites'],
+                       labels['scheduled_sites'],
+                       labels['site_coverage'] * 100.0,
+                       labels['time_budget'])
+        logger.warning('Every site up to priority position %d was analyzed',
+                       labels['priority_prefix'])
+        if labels['rank_range']:
+            logger.warning('Analyzed ranks %d to %d', *labels['rank_range'])
+        if labels['reach_coverage'] is not None:
+            logger.warning('Analyzed sites account for %.1f%% of the reach',
+                           labels['reach_coverage'] * 100.0)
+        if labels['page_views_coverage'] is not None:
+            logger.warning('Analyzed sites account for %.1f%% of the page '
+                           'views', labels['page_views_coverage'] * 100.0)
+        if labels['word_count_interval']:
+            logger.warning('Average word count of the scheduled sites is '
+                           '%.2f to %.2f (95%% interval, assuming the '
+                           'sites left out are like the ones analyzed)',
+                           *labels['word_count_interval'])
@@ -3,17 +3,28 @@ import logging
 import string
 import multiprocessing
 import re
+import time
 
-# external
-import requests
-import bs4
-import boto3
+from objs.profiling import profiled
+
+# external libraries (requests, bs4, boto3) are imported where they are
+# used so pool workers and runs that never touch AWS don't pay to load them
 
 logger = logging.getLogger(__name__)
 
 DB_TABLE = 'alexa-site-data'
 
 
+def _db_table():
+    """
+    Gets the DynamoDB table the site data is stored in.
+    """
+    import boto3
+
+    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+    return dynamodb.Table(DB_TABLE)
+
+
 class Website(object):
     """
     Class to represent a website and it's content. This has methods to
@@ -30,14 +41,49 @@ class Website(object):
 
         self._words = []
         self._word_count = {}
+        # fixed size word summary used instead of the word count in
+        # sketch mode
+        self._word_sketch = None
+        # distinct and total words of a site restored from a record that
+        # has neither its word count nor its sketch
+        self._distinct_words = 0
+        self._total_words = 0
+
+        # most frequent phrases as (phrase, count), only counted when asked
+        # for
+        self._ngram_counts = []
+
+        # header name -> value, only captured when asked for
+        self._header_values = {}
+
+        # SimHash of the page and the site whose analysis was reused for it
+        self._fingerprint = None
+        self._duplicate_of = None
+
+        # size of the raw response body and how long the fetch took
+        self._content_size = 0
+        self._fetch_time = None
+        # requests made for the homepage and why the last one failed
+        self._fetch_attempts = 0
+        self._fetch_error = None
+
+        # same-site links of the page and the number of pages whose words
+        # were added to the site when it was crawled
+        self._links = []
+        self._pages_crawled = 0
+
+        # the content is only kept compressed and decompressed when it is
+        # read, the words, title and links parsed from it are kept apart
+        self._content_codec = None
+        self._content_blob = None
 
         # if the content was passed in go ahead and
         # parse it for the site title
         # split up the words for analysis
-        self._content = content
-        if self._content:
-            self._name = self._find_title()
-            self._words = self.split_words()
+        self._set_content(content)
+        if content:
+            self._content_size = len(content)
+            self.parse_content(content=content)
 
         # no headers were passed in set default to empty list
         if headers is None:
@@ -47,34 +93,147 @@ class Website(object):
     def __repr__(self):
         return self.url
 
-    def request_homepage(self):
+    def request_homepage(self, capture_header_values=False, parse=True,
+                         extract_links=False, crawler=None,
+                         fingerprint=False):
         """
         Makes a request to the website's homepage and sets up response
         for further analysis
+        Args:
+            capture_header_values (bool): Keep the header values along with
+              the header keys.
+            parse (bool): Parse the content for the title and words. Pass
+              False to only fetch it and call parse_content later.
+            extract_links (bool): Keep the same-site links of the page.
+            crawler (SiteCrawler): Also crawl the pages the homepage links
+              to and add their words to the site's.
+            fingerprint (bool): Also calculate the fingerprint of the
+              content.
         """
+        from objs.dns_cache import install_resolver_hook
+        from objs.fetch_policy import get_policy
+
+        # look hosts up in the main process DNS cache when it is served
+        install_resolver_hook()
         try:
             logger.info('Making request to %s', self._url)
-            resp = requests.get('http://' + self._url, timeout=1)
+            start = time.time()
+            # timeouts, retries and hedging come from the process policy
+            resp, self._fetch_attempts = get_policy().get(self._url)
+            self._fetch_time = time.time() - start
+            self._content_size = len(resp.content)
 
             # ignore any undecodable chars
-            self._content = resp.text.encode('utf-8').decode('ascii', 'ignore')
+            text = resp.text.encode('utf-8').decode('ascii', 'ignore')
+            self._set_content(text)
             self._headers = self._filter_headers(resp.headers)
+            if capture_header_values:
+                from objs.header_values import normalize_header_values
+
+                self._header_values = normalize_header_values(resp.headers)
             logger.debug('headers: %s', self._headers)
 
+            # the text is parsed and fingerprinted here, only the
+            # compressed content is kept
+            if fingerprint:
+                self.calculate_fingerprint(content=text)
             # fill out site data with the returned content
-            self._name = self._find_title()
-            self._words = self.split_words()
+            if parse:
+                self.parse_content(
+                    extract_links=extract_links or crawler is not None,
+                    content=text)
+            self._pages_crawled = 1
         except Exception as e:
             # many different exceptions have been encountered running requests
             # to the sites in the list
+            self._fetch_error = type(e).__name__
             logging.exception('Could not read %s homepage', self.url)
+            return
+
+        if crawler is not None and parse:
+            crawler.crawl(self)
+
+    def parse_content(self, extract_links=False, content=None):
+        """
+        Parses the site's content for its title and visible words.
+        Args:
+            extract_links (bool): Also keep the same-site links of the page
+              from the same parse.
+            content (str): The content if it was already read.
+        """
+        html = self._parse(content)
+        self._name = self._find_title(html)
+        self._words = self.split_words(html)
+        if extract_links:
+            from objs.crawl import same_site_links
+
+            self._links = list(same_site_links(
+                self._url, [a['href'] for a in html.findAll('a', href=True)]))
 
-    def _find_title(self):
+    def add_page(self, page):
+        """
+        Adds the words and size of another crawled page of the site.
+        Args:
+            page (Website): Fetched and parsed page of the site.
+        """
+        self._words.extend(page.word_list)
+        self._content_size += page.content_size
+        self._pages_crawled += 1
+
+    def release_links(self):
+        """
+        Drops the links once the site has been crawled.
+        """
+        self._links = []
+
+    def calculate_fingerprint(self, content=None):
+        """
+        Calculates a SimHash of the site's content without parsing it, used
+        to find sites that are near duplicates of each other.
+        Args:
+            content (str): The content if it was already read.
+        """
+        from objs.dedupe import page_fingerprint
+
+        if content is None:
+            content = self.content
+        self._fingerprint = page_fingerprint(content)
+
+    def reuse_analysis(self, representative):
+        """
+        Copies the word counts of a near duplicate site instead of parsing
+        and counting this site's own content.
+        Args:
+            representative (Website): Analyzed site this one duplicates.
+        """
+        self._word_count = representative.word_count
+        self._word_sketch = representative.word_sketch
+        self._ngram_counts = representative.ngram_counts
+        self._duplicate_of = representative.url
+        self._set_content(None)
+
+    def _parse(self, content=None):
+        """
+        Parses the site's content so the title and words can be pulled out
+        of the same document.
+        Args:
+            content (str): The content if it was already read.
+        """
+        import bs4
+
+        if content is None:
+            content = self.content
+        return bs4.BeautifulSoup(str(content), "html.parser")
+
+    def _find_title(self, html=None):
         """
         Tries to get the title from the website to use as the name. If one
         is not found, the URL is used as the name.
+        Args:
+            html: Parsed content of the site. Parsed here if not passed in.
         """
-        html = bs4.BeautifulSoup(str(self.content), "html.parser")
+        if html is None:
+            html = self._parse()
         if html.title:
             return html.title.text
 
@@ -93,19 +252,22 @@ class Website(object):
         # we just care about the headers, not their value
         return headers.keys()
 
-    def split_words(self):
+    def split_words(self, html=None):
         """
         Creates a list of all the visible words found from the site's
         homepage content. This will attempt to remove any non-visible
         HTML tags and special characters like new-line and tab chars.
 
+        Args:
+            html: Parsed content of the site. Parsed here if not passed in.
         Returns:
             List of the visible words found after removing non-visible elements.
         """
         # TODO: figure out more efficient way to do this
         # TODO: could break this up in parts to split up work
         # parse the HTML
-        html = bs4.BeautifulSoup(str(self._content), "html.parser")
+        if html is None:
+            html = self._parse()
         data = html.findAll(text=True)
         # logging.info('visible: %s', html)
         # data = html.get_text()
@@ -157,9 +319,34 @@ class Website(object):
         return stripped
 
     # property getters for external use
+    def _set_content(self, content):
+        """
+        Stores the page content compressed, None drops it.
+        """
+        if content is None:
+            self._content_codec = self._content_blob = None
+            return
+        from objs.compression import compress
+
+        self._content_codec, self._content_blob = compress(content)
+
     @property
     def content(self):
-        return self._content
+        """
+        The page content. It is decompressed every time it is read.
+        """
+        if self._content_blob is None:
+            return None
+        from objs.compression import decompress
+
+        return decompress(self._content_codec, self._content_blob)
+
+    @property
+    def stored_content_size(self):
+        """
+        Bytes the compressed content takes.
+        """
+        return len(self._content_blob) if self._content_blob else 0
 
     @property
     def name(self):
@@ -169,14 +356,73 @@ class Website(object):
     def headers(self):
         return self._headers
 
+    @property
+    def header_values(self):
+        return self._header_values
+
     @property
     def url(self):
         return self._url
 
     @property
     def word_count_size(self):
+        if not self._word_count:
+            if self._word_sketch is not None:
+                return self._word_sketch.distinct_count
+            return self._distinct_words
         return len(self.word_count.keys())
 
+    @property
+    def total_word_count(self):
+        if self._words:
+            return len(self._words)
+        if not self._word_count:
+            if self._word_sketch is not None:
+                return self._word_sketch.total
+            return self._total_words
+        # sites restored from a record only keep their word counts
+        return sum(self._word_count.values())
+
+    @property
+    def word_sketch(self):
+        return self._word_sketch
+
+    @property
+    def fingerprint(self):
+        return self._fingerprint
+
+    @property
+    def duplicate_of(self):
+        return self._duplicate_of
+
+    @property
+    def content_size(self):
+        return self._content_size
+
+    @property
+    def fetch_time(self):
+        return self._fetch_time
+
+    @property
+    def ngram_counts(self):
+        return self._ngram_counts
+
+    @property
+    def links(self):
+        return self._links
+
+    @property
+    def pages_crawled(self):
+        return self._pages_crawled
+
+    @property
+    def fetch_attempts(self):
+        return self._fetch_attempts
+
+    @property
+    def fetch_error(self):
+        return self._fetch_error
+
     @property
     def word_count(self):
         return self._word_count
@@ -199,19 +445,123 @@ class Website(object):
 
         self._word_count = word_count
 
+    def calculate_word_sketch(self, mapper):
+        """
+        Estimates the distinct word count and top terms of the site's
+        homepage content in fixed memory instead of counting every word.
+        Args:
+            mapper (SketchMapper): Creates sketches with the error bounds
+              to use.
+        """
+        self._word_sketch = mapper(self.word_list)
+
+    def calculate_ngram_count(self, counter):
+        """
+        Finds the most frequent phrases of n words in the site's content.
+        Args:
+            counter (NgramCounter): n and how many phrases to keep.
+        """
+        counts = reduce_function([counter(self.word_list)])
+        self._ngram_counts = counter.top_phrases(counts, self.word_list)
+
+    def release_content(self):
+        """
+        Drops the page content and word list once the word count has been
+        calculated so the site only holds on to its analyzed values.
+        """
+        self._set_content(None)
+        self._words = []
+
+    def release_word_sketch(self):
+        """
+        Drops the word sketch once it has been merged into a CorpusSketch,
+        keeping only the site's distinct and total word estimates.
+        """
+        if self._word_sketch is not None:
+            self._distinct_words = self._word_sketch.distinct_count
+            self._total_words = self._word_sketch.total
+            self._word_sketch = None
+
+    def release_header_values(self):
+        """
+        Drops the header values once they have been interned into a
+        HeaderValueTable.
+        """
+        self._header_values = {}
+
+    def to_record(self):
+        """
+        Creates a plain dict of the analyzed site data that can be
+        serialized. The content and word list are left out to keep it small.
+        Returns:
+            dict with the analyzed values of the site.
+        """
+        return {
+            "url": self.url,
+            "name": self.name,
+            "headers": list(self.headers),
+            "word_count": self.word_count,
+            "word_sketch": self.word_sketch.to_record()
+            if self.word_sketch is not None else None,
+            "distinct_words": self.word_count_size,
+            "total_words": self.total_word_count,
+            "content_size": self.content_size,
+            "fetch_time": self.fetch_time,
+            "fetch_attempts": self.fetch_attempts,
+            "fetch_error": self.fetch_error,
+            "pages_crawled": self.pages_crawled,
+            "ngram_counts": self.ngram_counts,
+            "header_values": self.header_values,
+            "duplicate_of": self.duplicate_of
+        }
+
+    @classmethod
+    def from_record(cls, record):
+        """
+        Creates a site from a dict made by to_record.
+        Args:
+            record: dict with the analyzed values of the site.
+        Returns:
+            Website with the analyzed values filled in.
+        """
+        site = cls(url=record['url'], headers=record.get('headers', []))
+        site._name = record.get('name') or site.url
+        site._word_count = record.get('word_count') or {}
+        if record.get('word_sketch'):
+            from objs.sketch import WordSketch
+
+            site._word_sketch = WordSketch.from_record(record['word_sketch'])
+        site._distinct_words = record.get('distinct_words', 0)
+        site._total_words = record.get('total_words', 0)
+        site._content_size = record.get('content_size', 0)
+        site._fetch_time = record.get('fetch_time')
+        site._fetch_attempts = record.get('fetch_attempts', 0)
+        site._fetch_error = record.get('fetch_error')
+        site._pages_crawled = record.get('pages_crawled', 0)
+        site._ngram_counts = [tuple(ngram) for ngram in
+                              record.get('ngram_counts', [])]
+        site._header_values = record.get('header_values', {})
+        site._duplicate_of = record.get('duplicate_of')
+        return site
+
     def persist_to_db(self):
         """
         Persists this site's data to a DynamoDB table
         """
         # TODO: reconsider all of this
-        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-        table = dynamodb.Table(DB_TABLE)
+        table = _db_table()
         logger.debug('word count size: %s', self.word_count_size)
 
+        from boto3.dynamodb.types import Binary
+
+        # the compressed bytes are stored as a binary attribute as they are,
+        # a plain str would be sent as a string on python 2
         table.put_item(
             Item={
                 "url": self.url,
-                "content": self.content,
+                "content": Binary(self._content_blob)
+                if self._content_blob is not None else None,
+                "content_codec": self._content_codec,
                 "headers": self.headers,
                 "word_count": self.word_count,
                 "word_list": self.word_list,
@@ -224,8 +574,7 @@ class Website(object):
         Retrieves site from the database with the matching URL.
         """
         # TODO: reconsider all of this
-        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-        table = dynamodb.Table(DB_TABLE)
+        table = _db_table()
         logger.debug('word count size: %s', self.word_count_size)
 
         db_obj = table.get_item(
@@ -234,7 +583,14 @@ class Website(object):
             }
         )['Item']
 
-        self._content = db_obj.get('content', '')
+        content = db_obj.get('content')
+        if db_obj.get('content_codec'):
+            # boto3 hands binary attributes back wrapped in a Binary
+            self._content_codec = db_obj['content_codec']
+            self._content_blob = bytes(getattr(content, 'value', content))
+        else:
+            # items persisted before the content was compressed
+            self._set_content(content or '')
         self._headers = db_obj.get('headers', [])
         self._word_count = db_obj.get('word_count', {})
         self._words = db_obj.get('word_list', [])
@@ -261,6 +617,41 @@ class MapReduceSite(Website):
             worker_count=self.workers
         )
 
+    def calculate_word_sketch(self, mapper):
+        """
+        Sketches the words of each partition in a separate process and
+        merges the partition sketches.
+        Args:
+            mapper (SketchMapper): Creates sketches with the error bounds
+              to use.
+        """
+        from objs.sketch import sketch_reduce_function
+
+        self._word_sketch = mapreduce(
+            all_items=self._words,
+            partition_func=partition_data,
+            map_func=mapper,
+            reduce_func=sketch_reduce_function,
+            worker_count=self.workers
+        )
+
+    def calculate_ngram_count(self, counter):
+        """
+        Counts the n-gram keys of each partition in a separate process.
+        The partitions overlap by n - 1 words so no n-gram is lost at a
+        cut.
+        Args:
+            counter (NgramCounter): n and how many phrases to keep.
+        """
+        counts = mapreduce(
+            all_items=self._words,
+            partition_func=counter.partition,
+            map_func=counter,
+            reduce_func=reduce_function,
+            worker_count=self.workers
+        )
+        self._ngram_counts = counter.top_phrases(counts, self._words)
+
 
 def partition_data(items, workers):
     """
@@ -358,7 +749,9 @@ def mapreduce(
 
     # Call the map functions concurrently with a pool of processes
     pool = multiprocessing.Pool(processes=worker_count)
-    sub_map_result = pool.map(map_func, group_items)
+    sub_map_result = pool.map(profiled(map_func), group_items)
+    pool.close()
+    pool.join()
 
     # Reduce all the data captured
     return reduce_func(sub_map_result)
@@ -0,0 +1,418 @@
+from __future__ import division
+
+import base64
+import hashlib
+import heapq
+import math
+import operator
+import struct
+import sys
+import zlib
+from array import array
+
+# fixed size summaries that can be merged across mapreduce partitions and
+# processes so large crawls count words and headers in bounded memory
+
+
+def _array_bytes(values):
+    # the counters are stored little endian whatever the machine
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    if hasattr(values, 'tobytes'):
+        return values.tobytes()
+    return values.tostring()
+
+
+def _bytes_array(typecode, data):
+    values = array(typecode)
+    if hasattr(values, 'frombytes'):
+        values.frombytes(data)
+    else:
+        values.fromstring(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def _pack(data):
+    return base64.b64encode(zlib.compress(bytes(data))).decode('ascii')
+
+
+def _unpack(text):
+    return zlib.decompress(base64.b64decode(text))
+
+
+def _hash128(item):
+    """
+    Stable 128 bit hash of an item as two 64 bit integers. The builtin hash
+    is salted per process in python 3 so it can't be used for sketches
+    that are merged across processes.
+    """
+    if not isinstance(item, bytes):
+        item = item.encode('utf-8')
+    return struct.unpack('<QQ', hashlib.md5(item).digest())
+
+
+class HyperLogLog(object):
+    """
+    Estimates the number of distinct items seen in a fixed number of
+    registers. The relative error is about 1.04 / sqrt(registers).
+    """
+    def __init__(self, error_rate=0.02):
+        """
+        Args:
+            error_rate (float): Target relative standard error.
+        """
+        self._error_rate = error_rate
+        self._p = max(4, min(16, int(math.ceil(
+            math.log((1.04 / error_rate) ** 2, 2)))))
+        self._m = 1 << self._p
+        self._registers = bytearray(self._m)
+
+    def add(self, item):
+        value = _hash128(item)[0]
+        bits = 64 - self._p
+        index = value >> bits
+        # position of the first set bit in the bits left after the index
+        rank = bits - (value & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    def count(self):
+        """
+        Returns:
+            (int): Estimated number of distinct items.
+        """
+        m = self._m
+        if m >= 128:
+            alpha = 0.7213 / (1 + 1.079 / m)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}[m]
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self._registers)
+        zeros = self._registers.count(b'\x00')
+        if estimate <= 2.5 * m and zeros:
+            # linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def merge(self, other):
+        """
+        Combines another sketch with the same error rate into this one.
+        """
+        if other._m != self._m:
+            raise ValueError('Can only merge sketches of the same size')
+        self._registers = bytearray(map(max, self._registers,
+                                        other._registers))
+        return self
+
+    def to_record(self):
+        return {'error_rate': self._error_rate,
+                'registers': _pack(self._registers)}
+
+    @classmethod
+    def from_record(cls, record):
+        sketch = cls(error_rate=record['error_rate'])
+        registers = bytearray(_unpack(record['registers']))
+        if len(registers) != sketch._m:
+            raise ValueError('HyperLogLog record has %d registers, not %d' %
+                             (len(registers), sketch._m))
+        sketch._registers = registers
+        return sketch
+
+
+class CountMinSketch(object):
+    """
+    Estimates how often each item was seen. Estimates are never below the
+    true count and are over by at most epsilon * total with a probability
+    of 1 - delta.
+    """
+    def __init__(self, epsilon=0.005, delta=0.01):
+        self._epsilon = epsilon
+        self._delta = delta
+        self._width = int(math.ceil(math.e / epsilon))
+        self._depth = int(math.ceil(math.log(1 / delta)))
+        self._rows = [array('I', [0]) * self._width
+                      for _ in range(self._depth)]
+        self._total = 0
+
+    def _columns(self, item):
+        h1, h2 = _hash128(item)
+        width = self._width
+        return [(h1 + i * h2) % width for i in range(self._depth)]
+
+    def add(self, item, count=1):
+        self._total += count
+        for row, column in zip(self._rows, self._columns(item)):
+            row[column] += count
+        return self.estimate(item)
+
+    def estimate(self, item):
+        return min(row[column]
+                   for row, column in zip(self._rows, self._columns(item)))
+
+    @property
+    def total(self):
+        return self._total
+
+    def merge(self, other):
+        if other._width != self._width or other._depth != self._depth:
+            raise ValueError('Can only merge sketches of the same size')
+        self._rows = [array('I', map(operator.add, row, other_row))
+                      for row, other_row in zip(self._rows, other._rows)]
+        self._total += other._total
+        return self
+
+    def to_record(self):
+        rows = array('I')
+        for row in self._rows:
+            rows.extend(row)
+        return {'epsilon': self._epsilon, 'delta': self._delta,
+                'total': self._total, 'rows': _pack(_array_bytes(rows))}
+
+    @classmethod
+    def from_record(cls, record):
+        sketch = cls(epsilon=record['epsilon'], delta=record['delta'])
+        rows = _bytes_array('I', _unpack(record['rows']))
+        width = sketch._width
+        if len(rows) != width * sketch._depth:
+            raise ValueError('Count-Min record has %d counters, not %d' %
+                             (len(rows), width * sketch._depth))
+        sketch._rows = [rows[i * width:(i + 1) * width]
+                        for i in range(sketch._depth)]
+        sketch._total = record['total']
+        return sketch
+
+
+class TopItems(object):
+    """
+    Tracks the heavy hitters of a stream with a Count-Min Sketch. Only the
+    current top_k candidates are kept with their estimated counts.
+    """
+    def __init__(self, top_k=50, epsilon=0.005, delta=0.01):
+        self._top_k = top_k
+        self._sketch = CountMinSketch(epsilon=epsilon, delta=delta)
+        self._candidates = {}
+        # (estimate, item) min heap over the candidates, an entry is stale
+        # once its item was evicted or its estimate went up
+        self._heap = []
+
+    def add(self, item, count=1):
+        estimate = self._sketch.add(item, count)
+        self._offer(item, estimate)
+
+    def _offer(self, item, estimate):
+        candidates = self._candidates
+        if item not in candidates and len(candidates) >= self._top_k:
+            heap = self._heap
+            while candidates.get(heap[0][1]) != heap[0][0]:
+                heapq.heappop(heap)
+            if estimate <= heap[0][0]:
+                return
+            del candidates[heapq.heappop(heap)[1]]
+        candidates[item] = estimate
+        heapq.heappush(self._heap, (estimate, item))
+        if len(self._heap) > 4 * self._top_k:
+            self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        self._heap = [(estimate, item)
+                      for item, estimate in self._candidates.items()]
+        heapq.heapify(self._heap)
+
+    @property
+    def total(self):
+        return self._sketch.total
+
+    def estimate(self, item):
+        return self._sketch.estimate(item)
+
+    def merge(self, other):
+        self._sketch.merge(other._sketch)
+        items = set(self._candidates) | set(other._candidates)
+        self._candidates = {}
+        self._heap = []
+        for item in items:
+            self._offer(item, self._sketch.estimate(item))
+        return self
+
+    def top(self, count=None):
+        """
+        Returns:
+            (list): (item, estimated count) tuples with the most frequent
+            item first.
+        """
+        ranked = sorted(self._candidates.items(), key=lambda x: x[1],
+                        reverse=True)
+        return ranked[:count] if count else ranked
+
+    def to_record(self):
+        return {'top_k': self._top_k, 'sketch': self._sketch.to_record(),
+                'candidates': self.top()}
+
+    @classmethod
+    def from_record(cls, record):
+        top = cls(top_k=record['top_k'])
+        top._sketch = CountMinSketch.from_record(record['sketch'])
+        top._candidates = dict((item, count)
+                               for item, count in record['candidates'])
+        top._rebuild_heap()
+        return top
+
+
+class BloomFilter(object):
+    """
+    Set membership in fixed memory. An item that was added is always
+    found, an item that wasn't is wrongly found with about error_rate
+    probability while no more than capacity items have been added.
+    """
+    def __init__(self, capacity=100000, error_rate=0.001):
+        bits = int(math.ceil(-capacity * math.log(error_rate) /
+                             math.log(2) ** 2))
+        self._bits = max(8, bits)
+        self._hashes = max(1, int(round(self._bits / capacity *
+                                        math.log(2))))
+        self._array = bytearray((self._bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # double hashing, the k positions come from one 128 bit hash
+        h1, h2 = _hash128(item)
+        return [(h1 + i * h2) % self._bits for i in range(self._hashes)]
+
+    def add(self, item):
+        """
+        Returns:
+            (bool): True if the item wasn't in the filter yet.
+        """
+        added = False
+        for position in self._positions(item):
+            mask = 1 << (position & 7)
+            if not self._array[position >> 3] & mask:
+                self._array[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, item):
+        return all(self._array[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(item))
+
+    @property
+    def size_bytes(self):
+        return len(self._array)
+
+
+class WordSketch(object):
+    """
+    Distinct word count and top terms of some text in fixed memory.
+    """
+    def __init__(self, error_rate=0.02, epsilon=0.005, delta=0.01, top_k=50):
+        self.distinct = HyperLogLog(error_rate=error_rate)
+        self.terms = TopItems(top_k=top_k, epsilon=epsilon, delta=delta)
+
+    def add(self, word):
+        self.distinct.add(word)
+        self.terms.add(word)
+
+    def merge(self, other):
+        self.distinct.merge(other.distinct)
+        self.terms.merge(other.terms)
+        return self
+
+    @property
+    def distinct_count(self):
+        return self.distinct.count()
+
+    @property
+    def total(self):
+        return self.terms.total
+
+    def to_record(self):
+        """
+        Returns:
+            (dict): The sketch as plain values that can be serialized, the
+            registers and counters compressed.
+        """
+        return {'distinct': self.distinct.to_record(),
+                'terms': self.terms.to_record()}
+
+    @classmethod
+    def from_record(cls, record):
+        """
+        Creates a sketch from a dict made by to_record.
+        """
+        sketch = cls.__new__(cls)
+        sketch.distinct = HyperLogLog.from_record(record['distinct'])
+        sketch.terms = TopItems.from_record(record['terms'])
+        return sketch
+
+
+class SketchMapper(object):
+    """
+    Map function for mapreduce that sketches a partition of words. It is a
+    class so the error bounds go along with it to the worker processes.
+    """
+    def __init__(self, error_rate=0.02, epsilon=0.005, delta=0.01, top_k=50):
+        self.error_rate = error_rate
+        self.epsilon = epsilon
+        self.delta = delta
+        self.top_k = top_k
+
+    def new_sketch(self):
+        return WordSketch(error_rate=self.error_rate, epsilon=self.epsilon,
+                          delta=self.delta, top_k=self.top_k)
+
+    def __call__(self, words):
+        sketch = self.new_sketch()
+        for word in words:
+            sketch.add(word)
+        return sketch
+
+
+def sketch_reduce_function(sketches):
+    """
+    Merges the word sketches of all the partitions into one.
+    """
+    result = None
+    for sketch in sketches:
+        if result is None:
+            result = sketch
+        else:
+            result.merge(sketch)
+    return result
+
+
+class CorpusSketch(object):
+    """
+    Corpus wide distinct words, top terms and top headers merged from the
+    sketches of each site.
+    """
+    def __init__(self, mapper):
+        self.words = mapper.new_sketch()
+        self.headers = TopItems(top_k=mapper.top_k, epsilon=mapper.epsilon,
+                                delta=mapper.delta)
+        self._sites = 0
+
+    def add(self, site):
+        self._sites += 1
+        if site.word_sketch is not None:
+            self.words.merge(site.word_sketch)
+        else:
+            # sites counted exactly, like the ones restored from a journal
+            for word, count in site.word_count.items():
+                self.words.distinct.add(word)
+                self.words.terms.add(word, count)
+        for header in site.headers:
+            self.headers.add(header)
+
+    def top_headers(self, count=20):
+        """
+        Returns:
+            (list): (header, estimated percentage of sites) tuples.
+        """
+        if not self._sites:
+            return []
+        return [(header, site_count / self._sites * 100.0)
+                for header, site_count in self.headers.top(count)]
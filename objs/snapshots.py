@@ -0,0 +1,245 @@
+import hashlib
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+
+import numpy
+
+from objs.sources import SiteSource
+from objs.top_sites import SiteEntry
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b'TSSNAP01'
+SNAPSHOT_EXTENSION = '.snap'
+# length of the JSON header that follows the magic bytes
+_HEADER_LENGTH = struct.Struct('<I')
+
+# missing ranks are stored as -1 and missing reach and page views as NaN
+_NO_RANK = -1
+
+
+def _file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as source_file:
+        for block in iter(lambda: source_file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_signature(path):
+    """
+    Returns:
+        (dict): mtime, size and SHA-1 of a file, which tell whether a
+        snapshot of it is still current.
+    """
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'mtime': stat.st_mtime,
+            'size': stat.st_size, 'sha1': _file_digest(path)}
+
+
+class SiteSnapshot(SiteSource):
+    """
+    Site list loaded from a snapshot. The ranks, reach and page views are
+    numpy columns read straight from the file and the urls one newline
+    separated block, so loading a list of a million sites doesn't parse
+    anything.
+    """
+    def __init__(self, header, ranks, reach, page_views, urls):
+        self.header = header
+        self._ranks = ranks
+        self._reach = reach
+        self._page_views = page_views
+        self._urls = urls
+
+    def __len__(self):
+        return len(self._urls)
+
+    def entries(self):
+        for index, url in enumerate(self._urls):
+            rank = int(self._ranks[index])
+            reach = float(self._reach[index])
+            page_views = float(self._page_views[index])
+            yield SiteEntry(
+                url=url,
+                rank=None if rank == _NO_RANK else rank,
+                reach=None if numpy.isnan(reach) else reach,
+                page_views=None if numpy.isnan(page_views) else page_views
+            )
+
+    def urls(self):
+        return iter(self._urls)
+
+
+class SnapshotStore(object):
+    """
+    Directory of parsed site lists keyed by the parameters of the request
+    that produced them, so repeat runs and shards skip the Top Sites API
+    call and the XML parse.
+
+    Each snapshot is one file: the magic bytes, a JSON header with the
+    request parameters, the time it was taken, the signature of the
+    source file and a CRC of the body, then the body of fixed width rank,
+    reach and page view columns followed by the urls. A snapshot is used
+    until it is older than the TTL or, for a local file, until the file
+    changes. A file whose mtime changed is hashed to check that its
+    content really did.
+    """
+    def __init__(self, directory, ttl=86400):
+        """
+        Args:
+            directory (str): Where the snapshots are kept, created if
+              missing.
+            ttl (int): Seconds a snapshot is used for.
+        """
+        self._directory = directory
+        self._ttl = ttl
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    @staticmethod
+    def key(**params):
+        """
+        Returns:
+            (str): Name of the snapshot of a request, the hash of its
+            parameters.
+        """
+        encoded = json.dumps(params, sort_keys=True).encode('utf-8')
+        return hashlib.sha1(encoded).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self._directory, key + SNAPSHOT_EXTENSION)
+
+    def load(self, params, source_path=None):
+        """
+        Loads the snapshot of a request if there is a current one.
+        Args:
+            params (dict): Parameters of the request.
+            source_path (str): Local file the list is parsed from, checked
+              for changes since the snapshot.
+        Returns:
+            (SiteSnapshot): None if there is no current snapshot.
+        """
+        path = self.path(self.key(**params))
+        if not os.path.exists(path):
+            return None
+        try:
+            snapshot = self._read(path)
+        except (IOError, OSError, ValueError) as error:
+            logger.warning('Ignoring unreadable snapshot %s: %s', path, error)
+            return None
+
+        header = snapshot.header
+        age = time.time() - header['created']
+        if age > self._ttl:
+            logger.info('Snapshot %s expired %d seconds ago', path,
+                        age - self._ttl)
+            return None
+        if source_path and not self._source_unchanged(path, header,
+                                                      source_path):
+            logger.info('%s changed since snapshot %s', source_path, path)
+            return None
+        return snapshot
+
+    def _source_unchanged(self, path, header, source_path):
+        source = header.get('source')
+        if not source:
+            return False
+        try:
+            stat = os.stat(source_path)
+        except OSError:
+            return False
+        if stat.st_size != source['size']:
+            return False
+        if stat.st_mtime == source['mtime']:
+            return True
+        # touched or copied, only a different hash means a new list
+        if _file_digest(source_path) != source['sha1']:
+            return False
+        source['mtime'] = stat.st_mtime
+        self._rewrite_header(path, header)
+        return True
+
+    def save(self, params, entries, source_path=None):
+        """
+        Writes the snapshot of a request, replacing any older one.
+        Args:
+            params (dict): Parameters of the request.
+            entries (list SiteEntry): Parsed site list.
+            source_path (str): Local file the list was parsed from.
+        Returns:
+            (SiteSnapshot): The saved list.
+        """
+        count = len(entries)
+        ranks = numpy.full(count, _NO_RANK, dtype='<i4')
+        reach = numpy.full(count, numpy.nan, dtype='<f8')
+        page_views = numpy.full(count, numpy.nan, dtype='<f8')
+        for index, entry in enumerate(entries):
+            if entry.rank is not None:
+                ranks[index] = entry.rank
+            if entry.reach is not None:
+                reach[index] = entry.reach
+            if entry.page_views is not None:
+                page_views[index] = entry.page_views
+        urls = [entry.url for entry in entries]
+        body = b''.join([ranks.tobytes(), reach.tobytes(),
+                         page_views.tobytes(),
+                         '\n'.join(urls).encode('utf-8')])
+
+        header = {
+            'params': params,
+            'created': time.time(),
+            'count': count,
+            'crc32': zlib.crc32(body) & 0xffffffff,
+            'source': file_signature(source_path) if source_path else None
+        }
+        path = self.path(self.key(**params))
+        self._write(path, header, body)
+        logger.info('Saved a snapshot of %d sites to %s', count, path)
+        return SiteSnapshot(header, ranks, reach, page_views, urls)
+
+    @staticmethod
+    def _write(path, header, body):
+        encoded = json.dumps(header, sort_keys=True).encode('utf-8')
+        with open(path + '.tmp', 'wb') as snapshot_file:
+            snapshot_file.write(SNAPSHOT_MAGIC)
+            snapshot_file.write(_HEADER_LENGTH.pack(len(encoded)))
+            snapshot_file.write(encoded)
+            snapshot_file.write(body)
+        os.rename(path + '.tmp', path)
+
+    def _rewrite_header(self, path, header):
+        with open(path, 'rb') as snapshot_file:
+            data = snapshot_file.read()
+        start = len(SNAPSHOT_MAGIC)
+        length, = _HEADER_LENGTH.unpack_from(data, start)
+        self._write(path, header, data[start + _HEADER_LENGTH.size + length:])
+
+    @staticmethod
+    def _read(path):
+        with open(path, 'rb') as snapshot_file:
+            data = snapshot_file.read()
+        if not data.startswith(SNAPSHOT_MAGIC):
+            raise ValueError('not a snapshot')
+        start = len(SNAPSHOT_MAGIC)
+        length, = _HEADER_LENGTH.unpack_from(data, start)
+        start += _HEADER_LENGTH.size
+        header = json.loads(data[start:start + length].decode('utf-8'))
+        body = data[start + length:]
+        if zlib.crc32(body) & 0xffffffff != header['crc32']:
+            raise ValueError('CRC mismatch')
+
+        count = header['count']
+        ranks = numpy.frombuffer(body, dtype='<i4', count=count)
+        offset = ranks.nbytes
+        reach = numpy.frombuffer(body, dtype='<f8', count=count,
+                                 offset=offset)
+        offset += reach.nbytes
+        page_views = numpy.frombuffer(body, dtype='<f8', count=count,
+                                      offset=offset)
+        offset += page_views.nbytes
+        urls = body[offset:].decode('utf-8').split('\n') if count else []
+        return SiteSnapshot(header, ranks, reach, page_views, urls)
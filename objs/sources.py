@@ -0,0 +1,183 @@
+import logging
+import mmap
+import os
+
+from objs.top_sites import SiteEntry
+
+logger = logging.getLogger(__name__)
+
+
+class SiteSource(object):
+    """
+    Where the list of sites to analyze comes from.
+    """
+    def entries(self):
+        """
+        Returns:
+            Iterable of SiteEntry in the order of the list.
+        """
+        raise NotImplementedError()
+
+    def urls(self):
+        """
+        Returns:
+            Generator of the URLs of the sites, read as they are needed.
+        """
+        for entry in self.entries():
+            yield entry.url
+
+
+class TopSitesSource(SiteSource):
+    """
+    Sites of an Alexa Top Sites XML document that has already been loaded.
+    """
+    def __init__(self, top_sites):
+        """
+        Args:
+            top_sites (AlexaTopSites): Loaded from a file, S3 or the API.
+        """
+        self._top_sites = top_sites
+
+    def entries(self):
+        return self._top_sites.get_site_entries()
+
+    def urls(self):
+        return iter(self._top_sites.get_site_urls())
+
+
+class RankFileSource(SiteSource):
+    """
+    Sites of a plain text ranking list, like the top 1M CSV exports. Each
+    line is either rank,domain or just a domain, in which case the line
+    number is its rank. A header line, like rank,domain or domain, is
+    skipped.
+
+    The file is memory-mapped and read a line at a time, so opening a
+    large list is instant. When the lines have ranks the start of a rank
+    range is found with a binary search over the file instead of reading
+    everything before it.
+    """
+    def __init__(self, path, start_rank=None, end_rank=None, delimiter=','):
+        """
+        Args:
+            path (str): Path of the ranking list.
+            start_rank (int): First rank to read, from the start if None.
+            end_rank (int): Last rank to read, to the end if None.
+            delimiter (str): Separates the rank from the domain.
+        """
+        self._path = path
+        self._start_rank = start_rank
+        self._end_rank = end_rank
+        self._delimiter = delimiter.encode('utf-8')
+
+    def _parse(self, line):
+        """
+        Returns:
+            (rank, domain) of a line. rank is None when the line has no
+            rank column and domain is None for blank or header lines.
+        """
+        line = line.strip()
+        if not line:
+            return None, None
+        fields = line.split(self._delimiter)
+        if len(fields) == 1:
+            return None, fields[0].decode('utf-8')
+        try:
+            rank = int(fields[0])
+        except ValueError:
+            # a header like rank,domain
+            return None, None
+        return rank, fields[1].strip().decode('utf-8')
+
+    @staticmethod
+    def _line_end(data, start):
+        end = data.find(b'\n', start)
+        return len(data) if end == -1 else end
+
+    def _lines(self, data, start):
+        """
+        Yields (offset, line) from the line that starts at start.
+        """
+        size = len(data)
+        while start < size:
+            end = self._line_end(data, start)
+            yield start, data[start:end]
+            start = end + 1
+
+    @staticmethod
+    def _is_header(rank, domain):
+        # a plain list's header is a column name like domain, which has
+        # none of the dots or ports of a real host
+        return rank is None and '.' not in domain and ':' not in domain
+
+    def _first_line(self, data):
+        """
+        Finds the first line with a domain, skipping a header line.
+        Returns:
+            (offset, rank) of the line, or (None, None) for an empty list.
+        """
+        first = True
+        for offset, line in self._lines(data, 0):
+            rank, domain = self._parse(line)
+            if domain is None:
+                continue
+            if first and self._is_header(rank, domain):
+                first = False
+                continue
+            return offset, rank
+        return None, None
+
+    def _seek_rank(self, data, low, rank):
+        """
+        Binary search for the first line with at least the given rank. The
+        lines have to be sorted by rank.
+        Args:
+            low (int): Offset of the first line with a domain.
+        Returns:
+            (int): Offset of the line.
+        """
+        high = len(data)
+        while low < high:
+            middle = (low + high) // 2
+            newline = data.rfind(b'\n', low, middle)
+            start = low if newline == -1 else newline + 1
+            end = self._line_end(data, start)
+            line_rank, _ = self._parse(data[start:end])
+            if line_rank is not None and line_rank < rank:
+                low = end + 1
+            else:
+                high = start
+        return low
+
+    def entries(self):
+        if not os.path.getsize(self._path):
+            return
+        with open(self._path, 'rb') as rank_file:
+            data = mmap.mmap(rank_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            offset, first_rank = self._first_line(data)
+            if offset is None:
+                return
+            ranked = first_rank is not None
+            if ranked and self._start_rank:
+                offset = self._seek_rank(data, offset, self._start_rank)
+
+            line_number = 0
+            for _, line in self._lines(data, offset):
+                rank, domain = self._parse(line)
+                if domain is None:
+                    continue
+                line_number += 1
+                if not ranked:
+                    rank = line_number
+                if rank is None or \
+                        self._start_rank and rank < self._start_rank:
+                    # the search lands on the line after a blank or
+                    # unparsable one, which can still be before the range
+                    continue
+                if self._end_rank and rank > self._end_rank:
+                    break
+                yield SiteEntry(url=domain, rank=rank, reach=None,
+                                page_views=None)
+        finally:
+            data.close()
@@ -0,0 +1,272 @@
+from __future__ import division
+
+import logging
+
+import numpy
+
+logger = logging.getLogger(__name__)
+
+# number of set bits for every possible byte value, used to count
+# the packed header bitmap columns without unpacking them
+_POPCOUNT = numpy.array([bin(i).count('1') for i in range(256)],
+                        dtype=numpy.uint32)
+
+METRICS = (
+    'distinct_words',
+    'total_words',
+    'content_size',
+    'fetch_time'
+)
+
+DEFAULT_PERCENTILES = (25, 50, 75, 90, 95, 99)
+
+
+class CorpusStats(object):
+    """
+    Column oriented statistics over a set of analyzed websites. The per-site
+    metrics are pulled out of the Website objects once and kept as NumPy
+    arrays so that every summary after that is computed in bulk instead of
+    looping over the sites in Python.
+    """
+    def __init__(
+            self,
+            urls,
+            distinct_words,
+            total_words,
+            content_size,
+            fetch_time,
+            header_names,
+            header_bitmap
+    ):
+        self._urls = urls
+        self._metrics = {
+            'distinct_words': numpy.asarray(distinct_words,
+                                            dtype=numpy.int64),
+            'total_words': numpy.asarray(total_words, dtype=numpy.int64),
+            'content_size': numpy.asarray(content_size, dtype=numpy.int64),
+            'fetch_time': numpy.asarray(fetch_time, dtype=numpy.float64)
+        }
+        self._header_names = header_names
+        # one bit per site (packed along the site axis) for every header
+        self._header_bitmap = header_bitmap
+
+    @classmethod
+    def from_sites(cls, sites):
+        """
+        Builds the metric arrays and header bitmap from analyzed websites.
+        Args:
+            sites (list Website): Websites that have their word counts
+              calculated.
+        Returns:
+            CorpusStats for the given sites.
+        """
+        site_count = len(sites)
+        urls = []
+        distinct_words = numpy.zeros(site_count, dtype=numpy.int64)
+        total_words = numpy.zeros(site_count, dtype=numpy.int64)
+        content_size = numpy.zeros(site_count, dtype=numpy.int64)
+        # sites that were never fetched have no latency
+        fetch_time = numpy.full(site_count, numpy.nan, dtype=numpy.float64)
+
+        header_index = {}
+        header_rows = []
+        header_cols = []
+        for row, site in enumerate(sites):
+            urls.append(site.url)
+            distinct_words[row] = site.word_count_size
+            total_words[row] = site.total_word_count
+            content_size[row] = site.content_size
+            if site.fetch_time is not None:
+                fetch_time[row] = site.fetch_time
+
+            for header in site.headers:
+                col = header_index.setdefault(header, len(header_index))
+                header_rows.append(row)
+                header_cols.append(col)
+
+        header_names = [None] * len(header_index)
+        for header, col in header_index.items():
+            header_names[col] = header
+
+        # set the bits straight into the packed array, a site by header
+        # matrix of bools would take a byte per bit
+        header_bitmap = numpy.zeros(((site_count + 7) // 8,
+                                     len(header_names)), dtype=numpy.uint8)
+        if header_rows:
+            rows = numpy.asarray(header_rows, dtype=numpy.int64)
+            numpy.bitwise_or.at(
+                header_bitmap, (rows // 8, header_cols),
+                (1 << (7 - rows % 8)).astype(numpy.uint8))
+
+        return cls(
+            urls=urls,
+            distinct_words=distinct_words,
+            total_words=total_words,
+            content_size=content_size,
+            fetch_time=fetch_time,
+            header_names=header_names,
+            header_bitmap=header_bitmap
+        )
+
+    def __len__(self):
+        return len(self._urls)
+
+    @property
+    def urls(self):
+        return self._urls
+
+    @property
+    def header_names(self):
+        return self._header_names
+
+    def metric(self, name):
+        """
+        Gets the raw array for one of the per-site metrics.
+        Args:
+            name (str): One of METRICS.
+        Returns:
+            numpy array with one entry per site.
+        """
+        return self._metrics[name]
+
+    def _values(self, name):
+        values = self._metrics[name]
+        # fetch time is NaN for sites that were loaded instead of fetched
+        return values[~numpy.isnan(values)] if values.dtype.kind == 'f' \
+            else values
+
+    def mean(self, name):
+        values = self._values(name)
+        if not len(values):
+            return 0.0
+        return float(values.mean())
+
+    def median(self, name):
+        values = self._values(name)
+        if not len(values):
+            return 0.0
+        return float(numpy.median(values))
+
+    def percentiles(self, name, percentiles=DEFAULT_PERCENTILES):
+        """
+        Calculates several percentiles of a metric in a single pass.
+        Args:
+            name (str): One of METRICS.
+            percentiles (tuple int): Percentiles to calculate.
+        Returns:
+            (list): (percentile, value) tuples.
+        """
+        values = self._values(name)
+        if not len(values):
+            return [(p, 0.0) for p in percentiles]
+        results = numpy.percentile(values, percentiles)
+        return [(p, float(v)) for p, v in zip(percentiles, results)]
+
+    def histogram(self, name, bins=10):
+        """
+        Buckets a metric into a histogram.
+        Args:
+            name (str): One of METRICS.
+            bins (int): Number of equal width buckets.
+        Returns:
+            (counts, edges) numpy arrays.
+        """
+        return numpy.histogram(self._values(name), bins=bins)
+
+    def summary(self, name):
+        """
+        Builds a summary of the distribution of a metric.
+        Args:
+            name (str): One of METRICS.
+        Returns:
+            (dict): count, mean, median, min, max, std and percentiles.
+        """
+        values = self._values(name)
+        if not len(values):
+            return {'count': 0}
+        return {
+            'count': int(len(values)),
+            'mean': float(values.mean()),
+            'median': float(numpy.median(values)),
+            'min': float(values.min()),
+            'max': float(values.max()),
+            'std': float(values.std()),
+            'percentiles': self.percentiles(name)
+        }
+
+    def summaries(self):
+        """
+        Builds the summary of every per-site metric.
+        Returns:
+            (list): (metric, summary) tuples in the order of METRICS.
+        """
+        return [(name, self.summary(name)) for name in METRICS]
+
+    def header_counts(self):
+        """
+        Counts the number of sites that returned each header.
+        Returns:
+            numpy array of counts lined up with header_names.
+        """
+        if not len(self._header_names):
+            return numpy.zeros(0, dtype=numpy.uint32)
+        return _POPCOUNT[self._header_bitmap].sum(axis=0)
+
+    def header_percentages(self):
+        """
+        Calculates the percentage of sites that returned each header.
+        Returns:
+            (list): (header, percentage) tuples sorted by percentage with
+            the most common header first.
+        """
+        if not len(self) or not len(self._header_names):
+            return []
+        percentages = self.header_counts() / len(self) * 100.0
+        # stable sort so ties keep their first seen order
+        order = numpy.argsort(-percentages, kind='mergesort')
+        return [(self._header_names[i], float(percentages[i]))
+                for i in order]
+
+    def top_headers(self, count=20):
+        return self.header_percentages()[:count]
+
+    def header_bitmap(self, site_order=None, header_order=None):
+        """
+        Gets the packed header bitmap with the sites and headers in another
+        order. Headers are reordered one column at a time so the full
+        unpacked matrix is never built.
+        Args:
+            site_order: Indexes of the sites in their new order.
+            header_order: Indexes of the headers in their new order.
+        Returns:
+            numpy uint8 array, one bit per site packed along the first axis
+            and one column per header.
+        """
+        if site_order is None and header_order is None:
+            return self._header_bitmap
+        if header_order is None:
+            header_order = numpy.arange(len(self._header_names))
+        columns = []
+        for col in header_order:
+            mask = numpy.unpackbits(self._header_bitmap[:, col])[:len(self)]
+            if site_order is not None:
+                mask = mask[site_order]
+            columns.append(numpy.packbits(mask))
+        if not columns:
+            return numpy.zeros(((len(self) + 7) // 8, 0), dtype=numpy.uint8)
+        return numpy.column_stack(columns)
+
+    def sites_with_header(self, header):
+        """
+        Finds the sites that returned a header.
+        Args:
+            header (str): Header name.
+        Returns:
+            (list): URLs of the sites that returned the header.
+        """
+        try:
+            col = self._header_names.index(header)
+        except ValueError:
+            return []
+        mask = numpy.unpackbits(self._header_bitmap[:, col])[:len(self)]
+        return [self._urls[i] for i in numpy.flatnonzero(mask)]
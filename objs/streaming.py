@@ -0,0 +1,335 @@
+from __future__ import division
+
+import heapq
+import logging
+import os
+import tempfile
+import time
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+logger = logging.getLogger(__name__)
+
+
+def _task_key(item):
+    return getattr(item, 'url', item)
+
+
+class SafeTask(object):
+    """
+    Wraps a function sent to a pool so a task that raises is logged in the
+    worker and returns None. apply_async only calls back for the tasks
+    that return, so one that raised would never be seen to finish.
+    """
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, item):
+        try:
+            return self.func(item)
+        except Exception:
+            logger.exception('Task for %s failed', _task_key(item))
+            return None
+
+
+class PendingTasks(object):
+    """
+    Tasks submitted to a pool whose results haven't been taken yet. A task
+    that raises gives None through SafeTask. A task whose result can't be
+    sent back from its worker never calls back, and Python 2 has no
+    error_callback, so while waiting the tasks are polled for ones that
+    finished without succeeding, and those give None too.
+    """
+    def __init__(self, poll_interval=1.0):
+        """
+        Args:
+            poll_interval (float): Seconds between checks for tasks that
+              failed without calling back.
+        """
+        self._poll_interval = poll_interval
+        self._finished = Queue()
+        # task id -> its AsyncResult, the context it was submitted with
+        # and its argument
+        self._tasks = {}
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def submit(self, pool, func, item, context=None):
+        """
+        Submits a task that calls func with item.
+        Args:
+            pool: multiprocessing Pool to run the function with.
+            func: Function to call with the item.
+            item: Argument of the task.
+            context: Handed back along with the result of the task.
+        """
+        task_id = self._next_id
+        self._next_id += 1
+
+        def finished(result):
+            self._finished.put((task_id, result))
+
+        result = pool.apply_async(SafeTask(func), args=(item,),
+                                  callback=finished)
+        self._tasks[task_id] = (result, context, item)
+
+    def _failed_task(self):
+        """
+        Returns:
+            Id of a task that finished without succeeding, None if there
+            is none.
+        """
+        for task_id, (result, _, item) in self._tasks.items():
+            # a task that succeeded calls back before it is ready
+            if result.ready() and not result.successful():
+                try:
+                    result.get(0)
+                except Exception as error:
+                    logger.error('Task for %s failed: %r', _task_key(item),
+                                 error)
+                return task_id
+        return None
+
+    def get(self, timeout=None):
+        """
+        Waits for the next task to finish.
+        Args:
+            timeout (float): Most seconds to wait, forever if None.
+        Returns:
+            The context the task was submitted with and its result, None
+            if it failed.
+        Raises:
+            Empty: The timeout ran out first.
+        """
+        end = None if timeout is None else time.time() + timeout
+        while True:
+            wait = self._poll_interval
+            if end is not None:
+                wait = max(0, min(wait, end - time.time()))
+            try:
+                task_id, result = self._finished.get(timeout=wait)
+            except Empty:
+                task_id, result = self._failed_task(), None
+                if task_id is None:
+                    if end is not None and time.time() >= end:
+                        raise
+                    continue
+            context = self._tasks.pop(task_id)[1]
+            return context, result
+
+
+def bounded_apply(pool, func, items, max_in_flight, deadline=None):
+    """
+    Runs a function over the items with a pool while never having more than
+    max_in_flight of them submitted at once. Results are yielded as soon as
+    they finish so they can be reduced and released instead of held.
+    Args:
+        pool: multiprocessing Pool to run the function with.
+        func: Function to call with each item. An item it raises for, or
+          whose result can't be sent back, gives None.
+        items: Iterable of items, it is only read as the window has room.
+        max_in_flight (int): Most items submitted at the same time.
+        deadline (Deadline): Stop submitting and waiting for results once
+          it runs out. The tasks still in flight are abandoned.
+    Returns:
+        Generator of the function results in the order they finish.
+    """
+    tasks = PendingTasks()
+
+    def wait():
+        timeout = deadline.remaining() if deadline is not None else None
+        return tasks.get(timeout=timeout)[1]
+
+    try:
+        for item in items:
+            while len(tasks) >= max_in_flight:
+                yield wait()
+            if deadline is not None and deadline.check():
+                return
+            tasks.submit(pool, func, item)
+
+        while len(tasks):
+            yield wait()
+    except Empty:
+        deadline.check()
+
+
+class TopRanking(object):
+    """
+    Keeps only the top N sites by word count with a bounded heap.
+    """
+    def __init__(self, limit):
+        self._limit = limit
+        self._heap = []
+        self._seq = 0
+
+    def add(self, word_count_size, url):
+        # the sequence number keeps the fetch order for ties, lower first
+        entry = (word_count_size, -self._seq, url)
+        self._seq += 1
+        if len(self._heap) < self._limit:
+            heapq.heappush(self._heap, entry)
+        elif entry > self._heap[0]:
+            heapq.heapreplace(self._heap, entry)
+
+    def __iter__(self):
+        """
+        Yields (url, word_count_size) with the most words first.
+        """
+        for size, _, url in sorted(self._heap, reverse=True):
+            yield url, size
+
+    def close(self):
+        self._heap = []
+
+
+class ExternalRanking(object):
+    """
+    Ranks every site by word count using an external merge sort. Entries
+    are buffered up to chunk_size, then sorted and spilled to a temporary
+    file, and the spilled runs are merged lazily when iterated.
+    """
+    def __init__(self, chunk_size=100000, tmp_dir=None):
+        self._chunk_size = chunk_size
+        self._tmp_dir = tmp_dir
+        self._buffer = []
+        self._runs = []
+        self._seq = 0
+
+    def add(self, word_count_size, url):
+        self._buffer.append((-word_count_size, self._seq, url))
+        self._seq += 1
+        if len(self._buffer) >= self._chunk_size:
+            self._spill()
+
+    def _spill(self):
+        self._buffer.sort()
+        handle, path = tempfile.mkstemp(prefix='topsites-rank-',
+                                        dir=self._tmp_dir)
+        with os.fdopen(handle, 'w') as run_file:
+            for size, seq, url in self._buffer:
+                run_file.write('%d\t%d\t%s\n' % (size, seq, url))
+        logger.debug('Spilled %d ranked sites to %s',
+                     len(self._buffer), path)
+        self._runs.append(path)
+        self._buffer = []
+
+    @staticmethod
+    def _read_run(path):
+        with open(path, 'r') as run_file:
+            for line in run_file:
+                size, seq, url = line.rstrip('\n').split('\t', 2)
+                yield int(size), int(seq), url
+
+    def __iter__(self):
+        """
+        Yields (url, word_count_size) with the most words first.
+        """
+        self._buffer.sort()
+        runs = [self._read_run(path) for path in self._runs]
+        runs.append(iter(self._buffer))
+        for size, _, url in heapq.merge(*runs):
+            yield url, -size
+
+    def close(self):
+        for path in self._runs:
+            try:
+                os.remove(path)
+            except OSError:
+                logger.warning('Could not remove %s', path)
+        self._runs = []
+        self._buffer = []
+
+
+class StreamingReducer(object):
+    """
+    Reduces analyzed sites one at a time into running totals so nothing but
+    the ranking has to be kept for each site.
+    """
+    def __init__(self, ranking):
+        """
+        Args:
+            ranking: TopRanking or ExternalRanking to rank the sites with.
+        """
+        self._ranking = ranking
+        self._count = 0
+        self._totals = {}
+        self._minimums = {}
+        self._maximums = {}
+        self._header_counts = {}
+
+    def _add_metric(self, name, value):
+        if value is None:
+            return
+        total, count = self._totals.get(name, (0, 0))
+        self._totals[name] = (total + value, count + 1)
+        self._minimums[name] = min(self._minimums.get(name, value), value)
+        self._maximums[name] = max(self._maximums.get(name, value), value)
+
+    def add(self, site):
+        """
+        Folds an analyzed site into the totals. The site can be released
+        after this.
+        """
+        self._count += 1
+        self._add_metric('distinct_words', site.word_count_size)
+        self._add_metric('total_words', site.total_word_count)
+        self._add_metric('content_size', site.content_size)
+        self._add_metric('fetch_time', site.fetch_time)
+        for header in site.headers:
+            self._header_counts[header] = \
+                self._header_counts.get(header, 0) + 1
+        self._ranking.add(site.word_count_size, site.url)
+
+    def __len__(self):
+        return self._count
+
+    def mean(self, name):
+        total, count = self._totals.get(name, (0, 0))
+        if not count:
+            return 0.0
+        return total / count
+
+    def summaries(self):
+        """
+        Builds the running summary of every per-site metric.
+        Returns:
+            (list): (metric, summary) tuples.
+        """
+        summaries = []
+        for name in ('distinct_words', 'total_words', 'content_size',
+                     'fetch_time'):
+            total, count = self._totals.get(name, (0, 0))
+            if not count:
+                summaries.append((name, {'count': 0}))
+                continue
+            summaries.append((name, {
+                'count': count,
+                'mean': total / count,
+                'min': self._minimums[name],
+                'max': self._maximums[name]
+            }))
+        return summaries
+
+    def top_headers(self, count=20):
+        """
+        Returns:
+            (list): (header, percentage) tuples of the most common headers.
+        """
+        if not self._count:
+            return []
+        percentages = [(header, site_count / self._count * 100.0)
+                       for header, site_count in self._header_counts.items()]
+        percentages.sort(key=lambda x: x[1], reverse=True)
+        return percentages[:count]
+
+    def ranking(self):
+        return iter(self._ranking)
+
+    def close(self):
+        self._ranking.close()
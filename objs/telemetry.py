@@ -0,0 +1,404 @@
+from __future__ import division
+
+import binascii
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from multiprocessing.managers import BaseManager
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+
+logger = logging.getLogger(__name__)
+
+# where the pool workers and local worker nodes find the telemetry served
+# by the main process
+TELEMETRY_ENV = 'TOPSITES_TELEMETRY'
+TELEMETRY_AUTHKEY_ENV = 'TOPSITES_TELEMETRY_AUTHKEY'
+
+# stage of the tasks that fetch the sites, the first of every run
+STAGE_FETCH = 'fetch'
+
+# per process connection to the telemetry, replaced when a forked worker
+# sees a new pid
+_process_telemetry = None
+_telemetry_pid = None
+
+
+def _task_key(item):
+    """
+    Returns:
+        (str): Url of a task's argument, a url or a site.
+    """
+    return getattr(item, 'url', item)
+
+
+def _result_counts(result):
+    """
+    Returns:
+        (int, int, bool): Pages and bytes fetched by a task and whether the
+        site failed, from a Website, a site record or None for a site that
+        was dropped.
+    """
+    if result is None:
+        return 0, 0, True
+    if isinstance(result, dict):
+        return (result.get('pages_crawled', 0),
+                result.get('content_size', 0),
+                bool(result.get('fetch_error')))
+    return (getattr(result, 'pages_crawled', 0),
+            getattr(result, 'content_size', 0),
+            bool(getattr(result, 'fetch_error', None)))
+
+
+class RunTelemetry(object):
+    """
+    Live counters of a run, kept in the main process. The main process
+    counts the sites handed to the fetchers and the sites it is done
+    with, and the pool workers report when each of their tasks starts and
+    finishes through a manager.
+    """
+    def __init__(self, window=10.0, slowest=10):
+        """
+        Args:
+            window (float): Seconds the recent rates are measured over.
+            slowest (int): In flight tasks listed in a status, the
+              longest running first.
+        """
+        self._lock = threading.Lock()
+        self._window = window
+        self._slowest = slowest
+        self._started = time.time()
+        self._samples = deque()
+        self._stages = {}
+        self._in_flight = {}
+        self.listed = 0
+        self.completed = 0
+        self.pages = 0
+        self.bytes = 0
+        self.finished = False
+
+    def _stage(self, stage):
+        counters = self._stages.get(stage)
+        if counters is None:
+            counters = self._stages[stage] = {
+                'started': 0, 'finished': 0, 'failed': 0, 'dropped': 0}
+        return counters
+
+    def track(self, urls):
+        """
+        Counts the urls as they are handed to the fetchers.
+        Args:
+            urls: Iterable of site urls.
+        Returns:
+            Generator of the same urls.
+        """
+        for url in urls:
+            with self._lock:
+                self.listed += 1
+            yield url
+
+    def task_started(self, stage, key, pid):
+        with self._lock:
+            self._stage(stage)['started'] += 1
+            self._in_flight[(stage, key, pid)] = time.time()
+
+    def task_finished(self, stage, key, pid, pages, size, failed,
+                      dropped=False):
+        with self._lock:
+            counters = self._stage(stage)
+            counters['finished'] += 1
+            if failed:
+                counters['failed'] += 1
+            if dropped:
+                counters['dropped'] += 1
+            self._in_flight.pop((stage, key, pid), None)
+            # later stages get the sites the fetch stage already counted
+            if stage == STAGE_FETCH:
+                self.pages += pages
+                self.bytes += size
+
+    def site_completed(self):
+        """
+        Counts a site the main process is done with.
+        """
+        with self._lock:
+            self.completed += 1
+
+    def finish(self):
+        with self._lock:
+            self.finished = True
+
+    def _recent_rates(self, now):
+        """
+        Returns:
+            (float, float): Pages and bytes per second over the window.
+        """
+        self._samples.append((now, self.pages, self.bytes))
+        while len(self._samples) > 2 and \
+                now - self._samples[1][0] >= self._window:
+            self._samples.popleft()
+        first_time, first_pages, first_bytes = self._samples[0]
+        elapsed = now - first_time
+        if elapsed <= 0:
+            return 0.0, 0.0
+        return ((self.pages - first_pages) / elapsed,
+                (self.bytes - first_bytes) / elapsed)
+
+    def status(self):
+        """
+        Returns:
+            (dict): Progress of the run: sites listed, queued, in flight,
+            completed and failed, the page and byte rates over the whole
+            run and the recent window, the tasks queued and running in
+            each stage and the slowest tasks in flight.
+        """
+        now = time.time()
+        with self._lock:
+            elapsed = now - self._started
+            recent_pages, recent_bytes = self._recent_rates(now)
+            fetch = self._stage(STAGE_FETCH)
+            stages = {}
+            for stage, counters in self._stages.items():
+                stages[stage] = dict(
+                    counters, running=counters['started'] -
+                    counters['finished'])
+            # fetched sites the main process hasn't got to yet, like the
+            # word counts of the pool mode or sites in the dedupe stage
+            fetched = fetch['finished'] - fetch['dropped']
+            slowest = sorted(self._in_flight.items(),
+                             key=lambda item: item[1])[:self._slowest]
+            return {
+                'finished': self.finished,
+                'elapsed': elapsed,
+                'sites': {
+                    'listed': self.listed,
+                    'queued': self.listed - fetch['started'],
+                    'in_flight': fetch['started'] - fetch['finished'],
+                    'completed': self.completed,
+                    'failed': fetch['failed'],
+                },
+                'pages': self.pages,
+                'bytes': self.bytes,
+                'pages_per_second': self.pages / elapsed if elapsed else 0.0,
+                'bytes_per_second': self.bytes / elapsed if elapsed else 0.0,
+                'recent_pages_per_second': recent_pages,
+                'recent_bytes_per_second': recent_bytes,
+                'queues': {
+                    'fetch': self.listed - fetch['started'],
+                    'results': max(0, fetched - self.completed),
+                },
+                'stages': stages,
+                'slowest': [{'stage': stage, 'url': key, 'pid': pid,
+                             'seconds': now - started}
+                            for (stage, key, pid), started in slowest],
+            }
+
+
+class TelemetryManager(BaseManager):
+    pass
+
+
+def _connect():
+    """
+    Returns:
+        Proxy of the telemetry of the main process, None when it isn't
+        being served or can't be reached.
+    """
+    address = os.environ.get(TELEMETRY_ENV)
+    if not address:
+        return None
+    host, port = address.rsplit(':', 1)
+    TelemetryManager.register('get_telemetry')
+    manager = TelemetryManager(
+        address=(host, int(port)),
+        authkey=binascii.unhexlify(os.environ[TELEMETRY_AUTHKEY_ENV]))
+    try:
+        manager.connect()
+        return manager.get_telemetry()
+    except Exception:
+        logger.warning('Could not connect to the run telemetry at %s',
+                       address)
+        return None
+
+
+def _telemetry_for_process():
+    global _process_telemetry, _telemetry_pid
+    if _telemetry_pid != os.getpid():
+        _telemetry_pid = os.getpid()
+        _process_telemetry = _connect()
+    return _process_telemetry
+
+
+class TrackedTask(object):
+    """
+    Wraps a function sent to a pool so the worker reports when each task
+    starts and finishes. A report that fails never fails the task.
+    """
+    def __init__(self, func, stage):
+        self.func = func
+        self.stage = stage
+
+    def _report(self, method, *args):
+        telemetry = _telemetry_for_process()
+        if telemetry is None:
+            return
+        try:
+            getattr(telemetry, method)(self.stage, *args)
+        except Exception:
+            logger.debug('Could not report to the run telemetry',
+                         exc_info=True)
+
+    def __call__(self, item, *args, **kwargs):
+        key = _task_key(item)
+        pid = os.getpid()
+        self._report('task_started', key, pid)
+        result = None
+        try:
+            result = self.func(item, *args, **kwargs)
+            return result
+        finally:
+            pages, size, failed = _result_counts(result)
+            self._report('task_finished', key, pid, pages, size, failed,
+                         result is None)
+
+
+def tracked(func, stage=STAGE_FETCH):
+    """
+    Wraps a pool task function to report its progress when the run
+    telemetry is being served.
+    Args:
+        func: Function that is going to be run in a worker process, its
+          first argument is a url or a site.
+        stage (str): Name of the stage the tasks belong to.
+    Returns:
+        The wrapped function, or the function itself if telemetry is off.
+    """
+    if os.environ.get(TELEMETRY_ENV):
+        return TrackedTask(func, stage)
+    return func
+
+
+class StatusRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answers GET /status with the status of the run as JSON.
+    """
+    def do_GET(self):
+        if self.path.split('?', 1)[0].rstrip('/') in ('', '/status'):
+            status, body = 200, self.server.telemetry.status()
+        else:
+            status, body = 404, {'error': 'not found'}
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug('%s - %s', self.address_string(), format % args)
+
+
+class StatusServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, telemetry, address):
+        HTTPServer.__init__(self, address, StatusRequestHandler)
+        self.telemetry = telemetry
+
+
+class StatusReporter(object):
+    """
+    Serves the telemetry of a run to its workers and shows its status in
+    a file rewritten every interval, on a local HTTP endpoint or both.
+    """
+    def __init__(self, status_file=None, status_port=None, interval=5.0,
+                 host='127.0.0.1'):
+        """
+        Args:
+            status_file (str): JSON file the status is rewritten to.
+            status_port (int): Port of the HTTP endpoint, GET /status.
+            interval (float): Seconds between rewrites of the status file.
+            host (str): Address the HTTP endpoint listens on.
+        """
+        self.telemetry = RunTelemetry()
+        self._status_file = status_file
+        self._status_port = status_port
+        self._interval = interval
+        self._host = host
+        self._manager_server = None
+        self._http_server = None
+        self._stop = threading.Event()
+        self._writer = None
+
+    def start(self):
+        """
+        Serves the telemetry to the pool workers started after this.
+        """
+        TelemetryManager.register('get_telemetry',
+                                  callable=lambda: self.telemetry)
+        authkey = os.urandom(16)
+        manager = TelemetryManager(address=('127.0.0.1', 0), authkey=authkey)
+        self._manager_server = manager.get_server()
+        thread = threading.Thread(target=self._manager_server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        os.environ[TELEMETRY_ENV] = '%s:%d' % self._manager_server.address
+        os.environ[TELEMETRY_AUTHKEY_ENV] = \
+            binascii.hexlify(authkey).decode()
+
+        if self._status_port is not None:
+            self._http_server = StatusServer(
+                self.telemetry, (self._host, self._status_port))
+            thread = threading.Thread(
+                target=self._http_server.serve_forever)
+            thread.daemon = True
+            thread.start()
+            logger.info('Run status at http://%s:%d/status',
+                        *self._http_server.server_address[:2])
+        if self._status_file:
+            self._writer = threading.Thread(target=self._write_loop)
+            self._writer.daemon = True
+            self._writer.start()
+        return self
+
+    def write_status(self):
+        with open(self._status_file + '.tmp', 'w') as status_file:
+            json.dump(self.telemetry.status(), status_file, indent=2,
+                      sort_keys=True)
+        os.rename(self._status_file + '.tmp', self._status_file)
+
+    def _write_loop(self):
+        while not self._stop.wait(self._interval):
+            try:
+                self.write_status()
+            except (IOError, OSError):
+                logger.warning('Could not write the run status to %s',
+                               self._status_file, exc_info=True)
+
+    def stop(self):
+        """
+        Marks the run finished and writes the last status. The manager
+        thread ends with the process.
+        """
+        self.telemetry.finish()
+        self._stop.set()
+        if self._writer is not None:
+            self._writer.join()
+            self.write_status()
+        if self._http_server is not None:
+            self._http_server.shutdown()
+            self._http_server.server_close()
+        os.environ.pop(TELEMETRY_ENV, None)
+        os.environ.pop(TELEMETRY_AUTHKEY_ENV, None)
+        status = self.telemetry.status()
+        logger.info('Run status: %d sites completed, %d failed, %.1f pages '
+                    'per second', status['sites']['completed'],
+                    status['sites']['failed'], status['pages_per_second'])
@@ -0,0 +1,234 @@
+import logging
+import random
+import threading
+import time
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+
+logger = logging.getLogger(__name__)
+
+# words the synthetic homepages are made of
+VOCABULARY = (
+    'news search video mail shop deals music sports weather maps travel '
+    'games photos cloud drive account login sign help about contact blog '
+    'jobs careers privacy terms cookies store app download free online best '
+    'new top world local home live watch read more share follow subscribe'
+).split()
+
+SERVER_NAMES = ['nginx', 'Apache', 'cloudflare', 'gws', 'AmazonS3', 'ECS']
+
+# headers a host picks its extra header set from, with their values
+EXTRA_HEADERS = [
+    ('X-Powered-By', ['PHP/7.4', 'Express', 'ASP.NET', 'Next.js']),
+    ('Vary', ['Accept-Encoding', 'Accept-Encoding, Cookie', 'User-Agent']),
+    ('X-Frame-Options', ['SAMEORIGIN', 'DENY']),
+    ('X-Content-Type-Options', ['nosniff']),
+    ('Strict-Transport-Security', ['max-age=31536000',
+                                   'max-age=31536000; includeSubDomains']),
+    ('X-XSS-Protection', ['1; mode=block', '0']),
+    ('Content-Security-Policy', ["default-src 'self'", 'upgrade-insecure-'
+                                 'requests']),
+    ('Referrer-Policy', ['no-referrer', 'strict-origin-when-cross-origin']),
+    ('Access-Control-Allow-Origin', ['*']),
+    ('X-Cache', ['HIT', 'MISS']),
+    ('Via', ['1.1 varnish', '1.1 google']),
+    ('Accept-Ranges', ['bytes']),
+]
+
+LATENCY_UNIFORM = 'uniform'
+LATENCY_EXPONENTIAL = 'exponential'
+LATENCY_LOGNORMAL = 'lognormal'
+LATENCY_DISTRIBUTIONS = (LATENCY_UNIFORM, LATENCY_EXPONENTIAL,
+                         LATENCY_LOGNORMAL)
+
+
+def sample_latency(rng, mean, distribution=LATENCY_UNIFORM):
+    """
+    Returns:
+        (float): Seconds to wait, with the given mean. Uniform latencies are
+        between half and one and a half times the mean, exponential and
+        lognormal ones have a long tail like real hosts.
+    """
+    if distribution == LATENCY_EXPONENTIAL:
+        return rng.expovariate(1.0 / mean)
+    if distribution == LATENCY_LOGNORMAL:
+        # sigma of 1 puts the p99 at about 5 times the mean
+        return mean * rng.lognormvariate(-0.5, 1.0)
+    return mean * rng.uniform(0.5, 1.5)
+
+
+def synthetic_page(path, min_words=200, max_words=2000, seed=None):
+    """
+    Builds the same homepage for a path every time, with a title, some
+    script that is not visible, links to deeper pages of the same site
+    and another site, and paragraphs of words.
+    Args:
+        seed (str): Picks the words and links, defaults to the path.
+    Returns:
+        (str): The page HTML.
+    """
+    rng = random.Random(seed or path)
+    word_count = rng.randint(min_words, max_words)
+    words = [rng.choice(VOCABULARY) for _ in range(word_count)]
+    paragraphs = ['<p>%s</p>' % ' '.join(words[i:i + 50])
+                  for i in range(0, len(words), 50)]
+    links = ['<a href="%s/p%d">%s</a>' % (path.rstrip('/'), i,
+                                         rng.choice(VOCABULARY))
+             for i in range(rng.randint(2, 6))]
+    links.append('<a href="http://example.com/">example</a>')
+    return ('<html><head><title>%s</title>'
+            '<script>var tracking = "%s";</script></head>'
+            '<body><nav>%s</nav>%s</body></html>' %
+            (path, path, ' '.join(links), ''.join(paragraphs)))
+
+
+class CorpusRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves a synthetic homepage for any host and path, after the server's
+    latency and injected delays, and failing with a 500 for the server's
+    share of errors. The Host header is part of the page, so one server
+    can stand in for any number of virtual hosts.
+    """
+    def do_GET(self):
+        server = self.server
+        rng = random.Random()
+        host = (self.headers.get('Host') or '').split(':')[0].lower()
+        page_key = host + self.path
+        if server.latency:
+            time.sleep(sample_latency(rng, server.latency,
+                                      server.latency_distribution))
+        if server.slow_rate and \
+                random.Random(page_key + 'slow').random() < server.slow_rate:
+            # the same pages are always slow, like an overloaded host
+            time.sleep(server.slow_latency * rng.uniform(0.8, 1.2))
+        if server.stall_rate and rng.random() < server.stall_rate:
+            # any request can stall now and then
+            time.sleep(server.stall_time)
+        if server.error_rate and rng.random() < server.error_rate:
+            self.send_error(500)
+            return
+
+        body = synthetic_page(self.path, server.min_words, server.max_words,
+                              seed=page_key).encode('utf-8')
+        page_rng = random.Random(page_key)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Server', page_rng.choice(SERVER_NAMES))
+        self.send_header('Cache-Control', 'max-age=%d' %
+                         page_rng.choice([0, 60, 300, 3600]))
+        # every host sends its own set of extra headers
+        host_rng = random.Random(host)
+        for name, values in host_rng.sample(
+                EXTRA_HEADERS, min(server.extra_headers,
+                                   len(EXTRA_HEADERS))):
+            self.send_header(name, host_rng.choice(values))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug('%s - %s', self.address_string(), format % args)
+
+
+class TestServer(ThreadingMixIn, HTTPServer):
+    """
+    Local HTTP server with a synthetic corpus of homepages, used to measure
+    the crawler without going out to the real sites.
+    """
+    daemon_threads = True
+    # many fetch workers connect at once while tuning
+    request_queue_size = 128
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0,
+                 error_rate=0.0, min_words=200, max_words=2000,
+                 slow_rate=0.0, slow_latency=2.0, stall_rate=0.0,
+                 stall_time=5.0, latency_distribution=LATENCY_UNIFORM,
+                 extra_headers=0):
+        """
+        Args:
+            address (tuple): (host, port) to listen on. Port 0 picks a free
+              port.
+            latency (float): Average seconds to wait before each response.
+            error_rate (float): Share of requests that fail with a 500.
+            min_words (int): Fewest words on a page.
+            max_words (int): Most words on a page.
+            slow_rate (float): Share of pages that are always slow.
+            slow_latency (float): Average extra seconds of a slow page.
+            stall_rate (float): Share of requests that stall.
+            stall_time (float): Seconds a stalled request waits.
+            latency_distribution (str): One of LATENCY_DISTRIBUTIONS.
+            extra_headers (int): Most extra headers sent by a host, picked
+              per host from EXTRA_HEADERS.
+        """
+        HTTPServer.__init__(self, address, CorpusRequestHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.min_words = min_words
+        self.max_words = max_words
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.stall_rate = stall_rate
+        self.stall_time = stall_time
+        self.latency_distribution = latency_distribution
+        self.extra_headers = extra_headers
+        self._thread = None
+
+    @property
+    def host(self):
+        """
+        Host and port of the server the way they appear in the top sites
+        list, without a scheme.
+        """
+        return '%s:%d' % self.server_address[:2]
+
+    def site_urls(self, count):
+        """
+        Returns:
+            (list str): URLs of count different homepages on the server.
+        """
+        return ['%s/site%d' % (self.host, i) for i in range(count)]
+
+    def virtual_host_urls(self, count, domain='stress.test'):
+        """
+        Returns:
+            (list str): Homepage URLs of count different virtual hosts on
+            the server, which need to resolve to its address, e.g. with
+            write_hosts_file.
+        """
+        port = self.server_address[1]
+        return ['site%d.%s:%d/' % (i, domain, port) for i in range(count)]
+
+    def write_hosts_file(self, path, urls):
+        """
+        Writes a hosts file pointing the hosts of the urls at the server,
+        the format StaticResolver and --dns-hosts read.
+        """
+        from objs.dns_cache import url_host
+
+        with open(path, 'w') as hosts_file:
+            for url in urls:
+                hosts_file.write('%s %s\n' % (self.server_address[0],
+                                               url_host(url)))
+
+    def start(self):
+        """
+        Serves requests from a background thread.
+        """
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info('Test server listening on %s', self.host)
+        return self
+
+    def handle_error(self, request, client_address):
+        # clients that gave up on a delayed page are expected
+        logger.debug('Request from %s failed', client_address, exc_info=True)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -3,13 +3,28 @@ import hashlib
 import base64
 from xml.etree import ElementTree
 
-import boto3
-import requests
 import logging
+from collections import namedtuple
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+NAMESPACES = {'aws': 'http://ats.amazonaws.com/doc/2005-11-21'}
+
+# a site from the top sites list with the traffic data that came with it,
+# values that are missing from the document are None
+SiteEntry = namedtuple('SiteEntry', ['url', 'rank', 'reach', 'page_views'])
+
+
+def _number(element, path, cast):
+    value = element.findtext(path, namespaces=NAMESPACES)
+    if value is None:
+        return None
+    try:
+        return cast(value)
+    except ValueError:
+        return None
+
 
 class AlexaTopSites(object):
     def __init__(
@@ -32,7 +47,17 @@ class AlexaTopSites(object):
         self._aws_access_key_id = aws_access_key_id
         self._aws_secret_access_key = aws_secret_access_key
 
-    def request_top_sites(self, count=100, start=1):
+    def _s3_object(self, bucket, object_key, region):
+        import boto3
+
+        s3 = boto3.resource('s3', region_name=region,
+                            aws_access_key_id=self._aws_access_key_id,
+                            aws_secret_access_key=self._aws_secret_access_key)
+        return s3.Object(bucket, object_key)
+
+    def request_top_sites(self, count=100, start=1, country='us'):
+        import requests
+
         # get the current time stamp
         timestamp = datetime.utcnow()
         timestamp = timestamp.replace(microsecond=0)
@@ -44,7 +69,7 @@ class AlexaTopSites(object):
             ('AWSAccessKeyId', self._aws_access_key_id),
             ('Action', 'TopSites'),
             ('Count', count),
-            ('CountryCode', 'us'),
+            ('CountryCode', country),
             ('ResponseGroup', 'Country'),
             ('SignatureMethod', 'HmacSHA256'),
             ('SignatureVersion', '2'),
@@ -117,10 +142,7 @@ class AlexaTopSites(object):
                          ' Alexa Top Sites service first!')
 
         # create S3 resource
-        s3 = boto3.resource('s3', region_name=region,
-                            aws_access_key_id=self._aws_access_key_id,
-                            aws_secret_access_key=self._aws_secret_access_key)
-        s3_object = s3.Object(bucket, object_key)
+        s3_object = self._s3_object(bucket, object_key, region)
 
         # put the text found from top site text
         s3_object.put(Body=self._top_sites_text)
@@ -135,10 +157,7 @@ class AlexaTopSites(object):
             region (str): AWS region the bucket is in.
         """
         # create S3 resource
-        s3 = boto3.resource('s3', region_name=region,
-                            aws_access_key_id=self._aws_access_key_id,
-                            aws_secret_access_key=self._aws_secret_access_key)
-        s3_object = s3.Object(bucket, object_key)
+        s3_object = self._s3_object(bucket, object_key, region)
 
         # put the text found from top site text
         self._top_sites_text = s3_object.get()['Body'].read()
@@ -182,3 +201,26 @@ class AlexaTopSites(object):
 
         logger.debug('Parsed URLs: %s', parsed_urls)
         return parsed_urls
+
+    def get_site_entries(self):
+        """
+        Gets the sites found from the Top Sites query along with their rank,
+        reach and page views.
+        Returns:
+            List of SiteEntry in the order of the Top Site query document
+        """
+        logger.debug('Reading XML to get site entries')
+        xml = ElementTree.fromstring(self._top_sites_text)
+        entries = []
+        for site in xml.findall('.//aws:Site', NAMESPACES):
+            url = site.findtext('aws:DataUrl', namespaces=NAMESPACES)
+            if not url:
+                continue
+            entries.append(SiteEntry(
+                url=url,
+                rank=_number(site, './/aws:Rank', int),
+                reach=_number(site, './/aws:Reach/aws:PerMillion', float),
+                page_views=_number(site, './/aws:PageViews/aws:PerMillion',
+                                   float)
+            ))
+        return entries
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+# built in
+import argparse
+import logging
+import time
+
+# local imports
+from objs.index import Index, merge_segments
+
+logger = logging.getLogger(__name__)
+
+
+def main(index_dir, terms, match_all=False, top=20, merge=False):
+    if merge:
+        merge_segments(index_dir)
+    if not terms:
+        return
+
+    index = Index(index_dir)
+    try:
+        start = time.time()
+        results = index.top(terms, top=top, match_all=match_all)
+        elapsed_ms = (time.time() - start) * 1000
+    finally:
+        index.close()
+
+    logger.info('Sites using %s of %s (%.2f ms)',
+                'all' if match_all else 'any', ', '.join(terms), elapsed_ms)
+    for url, count in results:
+        logger.info('Site: %s - Count: %d', url, count)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(
+        description='Find the sites that use some words in an index written '
+                    'with --index-dir')
+
+    parser.add_argument(
+        'index_dir',
+        help='Directory of the index'
+    )
+    parser.add_argument(
+        'terms',
+        nargs='*',
+        help='Words to look up'
+    )
+    parser.add_argument(
+        '--all',
+        dest='match_all',
+        action='store_true',
+        help='Only show sites that use every word instead of any of them'
+    )
+    parser.add_argument(
+        '--top',
+        dest='top',
+        default=20,
+        type=int,
+        help='Number of sites to show, ranked by how often they use the words'
+    )
+    parser.add_argument(
+        '--merge',
+        dest='merge',
+        action='store_true',
+        help='Merge the index segments into one before querying'
+    )
+
+    args = parser.parse_args()
+
+    main(args.index_dir, args.terms, match_all=args.match_all, top=args.top,
+         merge=args.merge)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+# built in
+import argparse
+import logging
+
+# local imports
+from objs.results_service import ResultsService, ResultsServer
+
+logger = logging.getLogger(__name__)
+
+
+def main(run_dir=None, output_dir=None, host='127.0.0.1', port=8000,
+         watch_interval=10.0):
+    service = ResultsService(run_dir=run_dir, output_dir=output_dir)
+    if output_dir and watch_interval:
+        service.watch(watch_interval)
+
+    server = ResultsServer(service, address=(host, port))
+    logger.info('Serving results on http://%s:%d', *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(
+        description='Answer ranking, percentile, header and per-site queries '
+                    'about a run written with --output-dir over HTTP/JSON')
+
+    runs = parser.add_mutually_exclusive_group(required=True)
+    runs.add_argument(
+        '--run',
+        dest='run_dir',
+        default=None,
+        help='Directory of the run to serve'
+    )
+    runs.add_argument(
+        '--output-dir',
+        dest='output_dir',
+        default=None,
+        help='Serve the newest run of this directory and swap in newer runs '
+             'as they are written'
+    )
+    parser.add_argument(
+        '--host',
+        dest='host',
+        default='127.0.0.1',
+        help='Address to listen on'
+    )
+    parser.add_argument(
+        '--port',
+        dest='port',
+        default=8000,
+        type=int,
+        help='Port to listen on'
+    )
+    parser.add_argument(
+        '--watch-interval',
+        dest='watch_interval',
+        default=10.0,
+        type=float,
+        help='Seconds between checks of the output directory for a newer '
+             'run, 0 to only swap runs on POST /reload'
+    )
+
+    args = parser.parse_args()
+
+    main(run_dir=args.run_dir, output_dir=args.output_dir, host=args.host,
+         port=args.port, watch_interval=args.watch_interval)
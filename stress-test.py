@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+
+# built in
+from __future__ import division
+
+import argparse
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# local imports
+from objs.testserver import TestServer, LATENCY_DISTRIBUTIONS, \
+    LATENCY_UNIFORM
+
+logger = logging.getLogger(__name__)
+
+TOP_SITES_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'top-sites.py')
+
+# fetch paths of top-sites.py that can be measured, and their flags
+MODES = {
+    'pool': [],
+    'stream': ['--stream'],
+    'dedupe': ['--dedupe'],
+}
+
+FETCHED_PATTERN = re.compile(r'Fetched (\d+) of (\d+) sites')
+LATENCY_PATTERN = re.compile(
+    r'Fetch latency p50 ([\d.]+)s p95 ([\d.]+)s p99 ([\d.]+)s')
+
+
+def write_site_list(path, urls, dead_hosts=0):
+    """
+    Writes the virtual hosts as a rank,domain list for --rank-file. The
+    first dead_hosts of every hundred sites get hosts that don't resolve.
+    Returns:
+        (list str): Urls of the hosts that resolve to the test server.
+    """
+    live = []
+    with open(path, 'w') as rank_file:
+        for rank, url in enumerate(urls, 1):
+            if rank % 100 < dead_hosts:
+                url = url.replace('.', '-dead.', 1)
+            else:
+                live.append(url)
+            rank_file.write('%d,%s\n' % (rank, url))
+    return live
+
+
+def run_top_sites(mode, workers, rank_file, hosts_file, python, extra_args):
+    """
+    Runs top-sites.py over the site list in its own process, with the
+    virtual hosts resolved from the hosts file.
+    Returns:
+        (dict): Wall seconds, CPU seconds of the run and its pool workers,
+        peak resident memory of the largest process and what top-sites.py
+        reported about the fetches.
+    """
+    command = [python, TOP_SITES_SCRIPT, '--rank-file', rank_file,
+               '--dns-hosts', hosts_file, '--fetch-workers', str(workers)] + \
+        MODES[mode] + extra_args
+    start = time.time()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT,
+                               universal_newlines=True)
+    output = process.stdout.read()
+    # the usage of the run includes the pool workers it waited for
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = status
+    elapsed = time.time() - start
+    if status:
+        logger.error('top-sites.py failed:\n%s', output[-2000:])
+        return None
+
+    result = {'elapsed': elapsed, 'cpu': usage.ru_utime + usage.ru_stime,
+              # ru_maxrss is in KB on Linux and bytes on macOS
+              'max_rss_mb': usage.ru_maxrss / (
+                  1024 * 1024 if sys.platform == 'darwin' else 1024),
+              'fetched': 0, 'sites': 0, 'p50': None, 'p95': None,
+              'p99': None}
+    fetched = FETCHED_PATTERN.search(output)
+    if fetched:
+        result['fetched'] = int(fetched.group(1))
+        result['sites'] = int(fetched.group(2))
+    latency = LATENCY_PATTERN.search(output)
+    if latency:
+        result['p50'], result['p95'], result['p99'] = \
+            [float(value) for value in latency.groups()]
+    return result
+
+
+def _seconds(value):
+    return '%6.3fs' % value if value is not None else '     - '
+
+
+def report(mode, workers, result):
+    pages = result['fetched']
+    logger.info('%-7s %4d workers  %7.1f pages/s  %6.2f ms CPU/page  '
+                '%6.0f MB peak  p50 %s  p95 %s  p99 %s  (%d of %d sites, '
+                '%.1fs)', mode, workers,
+                pages / result['elapsed'] if result['elapsed'] else 0.0,
+                result['cpu'] / pages * 1000.0 if pages else 0.0,
+                result['max_rss_mb'], _seconds(result['p50']),
+                _seconds(result['p95']), _seconds(result['p99']), pages,
+                result['sites'], result['elapsed'])
+
+
+def main(sites=1000, modes=('pool',), worker_counts=(8, 32), latency=0.05,
+         latency_distribution=LATENCY_UNIFORM, min_words=200, max_words=2000,
+         extra_headers=6, error_rate=0.01, slow_rate=0.02, slow_latency=1.0,
+         stall_rate=0.0, stall_time=5.0, dead_hosts=2, python=None,
+         extra_args=()):
+    work_dir = tempfile.mkdtemp(prefix='topsites-stress-')
+    server = TestServer(latency=latency, error_rate=error_rate,
+                        min_words=min_words, max_words=max_words,
+                        slow_rate=slow_rate, slow_latency=slow_latency,
+                        stall_rate=stall_rate, stall_time=stall_time,
+                        latency_distribution=latency_distribution,
+                        extra_headers=extra_headers)
+    try:
+        server.start()
+        rank_file = os.path.join(work_dir, 'sites.csv')
+        hosts_file = os.path.join(work_dir, 'hosts')
+        live = write_site_list(rank_file, server.virtual_host_urls(sites),
+                               dead_hosts=dead_hosts)
+        server.write_hosts_file(hosts_file, live)
+        logger.info('%d virtual hosts, %d of them resolve to %s', sites,
+                    len(live), server.host)
+
+        for mode in modes:
+            for workers in worker_counts:
+                result = run_top_sites(mode, workers, rank_file, hosts_file,
+                                       python or sys.executable,
+                                       list(extra_args))
+                if result is not None:
+                    report(mode, workers, result)
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _int_list(value):
+    return [int(count) for count in value.split(',')]
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    parser = argparse.ArgumentParser(
+        description='Measure the throughput of top-sites.py end to end '
+                    'against a local server that acts as any number of '
+                    'virtual hosts',
+        epilog='Arguments after -- are passed on to top-sites.py')
+
+    parser.add_argument(
+        '--sites',
+        dest='sites',
+        default=1000,
+        type=int,
+        help='Number of virtual hosts in the site list'
+    )
+    parser.add_argument(
+        '--modes',
+        dest='modes',
+        default='pool',
+        help='Comma separated fetch modes to measure, of %s' %
+             ', '.join(sorted(MODES))
+    )
+    parser.add_argument(
+        '--workers',
+        dest='worker_counts',
+        default=[8, 32],
+        type=_int_list,
+        help='Comma separated fetch worker counts to measure each mode with'
+    )
+    parser.add_argument(
+        '--latency',
+        dest='latency',
+        default=0.05,
+        type=float,
+        help='Mean seconds the test server waits before each response'
+    )
+    parser.add_argument(
+        '--latency-distribution',
+        dest='latency_distribution',
+        default=LATENCY_UNIFORM,
+        choices=LATENCY_DISTRIBUTIONS,
+        help='Distribution of the response latencies'
+    )
+    parser.add_argument(
+        '--min-words',
+        dest='min_words',
+        default=200,
+        type=int,
+        help='Fewest words on a homepage'
+    )
+    parser.add_argument(
+        '--max-words',
+        dest='max_words',
+        default=2000,
+        type=int,
+        help='Most words on a homepage'
+    )
+    parser.add_argument(
+        '--extra-headers',
+        dest='extra_headers',
+        default=6,
+        type=int,
+        help='Extra headers each host sends, picked per host'
+    )
+    parser.add_argument(
+        '--error-rate',
+        dest='error_rate',
+        default=0.01,
+        type=float,
+        help='Share of requests that fail with a 500'
+    )
+    parser.add_argument(
+        '--slow-rate',
+        dest='slow_rate',
+        default=0.02,
+        type=float,
+        help='Share of hosts that are always slow'
+    )
+    parser.add_argument(
+        '--slow-latency',
+        dest='slow_latency',
+        default=1.0,
+        type=float,
+        help='Mean extra seconds of a slow host'
+    )
+    parser.add_argument(
+        '--stall-rate',
+        dest='stall_rate',
+        default=0.0,
+        type=float,
+        help='Share of requests that stall'
+    )
+    parser.add_argument(
+        '--stall-time',
+        dest='stall_time',
+        default=5.0,
+        type=float,
+        help='Seconds a stalled request waits'
+    )
+    parser.add_argument(
+        '--dead-hosts',
+        dest='dead_hosts',
+        default=2,
+        type=int,
+        help='Hosts out of every hundred that do not resolve'
+    )
+    parser.add_argument(
+        '--python',
+        dest='python',
+        default=None,
+        help='Interpreter to run top-sites.py with, defaults to this one'
+    )
+
+    argv = sys.argv[1:]
+    extra_args = []
+    if '--' in argv:
+        extra_args = argv[argv.index('--') + 1:]
+        argv = argv[:argv.index('--')]
+    args = parser.parse_args(argv)
+
+    modes = args.modes.split(',')
+    for mode in modes:
+        if mode not in MODES:
+            parser.error('unknown mode %s' % mode)
+
+    main(sites=args.sites, modes=modes, worker_counts=args.worker_counts,
+         latency=args.latency,
+         latency_distribution=args.latency_distribution,
+         min_words=args.min_words, max_words=args.max_words,
+         extra_headers=args.extra_headers, error_rate=args.error_rate,
+         slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+         stall_rate=args.stall_rate, stall_time=args.stall_time,
+         dead_hosts=args.dead_hosts, python=args.python,
+         extra_args=extra_args)
@@ -0,0 +1,37 @@
+import shutil
+import tempfile
+import unittest
+
+from objs.site import Website
+
+
+def make_site(url, word_count=None, headers=None, fetch_time=0.1,
+              fetch_error=None):
+    """
+    Returns:
+        (Website): An analyzed site built the way the journal rebuilds
+        them, so no page has to be fetched or parsed.
+    """
+    word_count = word_count or {}
+    return Website.from_record({
+        'url': url,
+        'headers': headers or [],
+        'word_count': word_count,
+        'content_size': sum(len(word) * count
+                            for word, count in word_count.items()),
+        'fetch_time': None if fetch_error else fetch_time,
+        'fetch_attempts': 1,
+        'fetch_error': fetch_error,
+        'pages_crawled': 0 if fetch_error else 1
+    })
+
+
+class TempDirTestCase(unittest.TestCase):
+    """
+    Gives every test its own directory, removed afterwards.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='topsites-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
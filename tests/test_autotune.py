@@ -0,0 +1,81 @@
+import json
+import os
+import unittest
+
+from objs import autotune, testserver
+from objs.autotune import _climb, load_settings, save_settings, \
+    measure_fetch, measure_mapreduce
+from tests.helpers import TempDirTestCase
+
+
+class ClimbTest(unittest.TestCase):
+    def test_stops_when_the_throughput_plateaus(self):
+        rates = {1: 10.0, 2: 19.0, 4: 30.0, 8: 31.0, 16: 50.0}
+        best, trials = _climb([1, 2, 4, 8, 16], rates.get, min_gain=0.1)
+        self.assertEqual(best, 4)
+        # 16 is never tried once 8 didn't help
+        self.assertEqual([level for level, _, _ in trials], [1, 2, 4, 8])
+
+    def test_stops_when_errors_climb(self):
+        results = {1: (10.0, 0.0), 2: (20.0, 0.01), 4: (40.0, 0.2),
+                   8: (80.0, 0.0)}
+        best, trials = _climb([1, 2, 4, 8], results.get, min_gain=0.1,
+                              max_error_rate=0.05)
+        self.assertEqual(best, 2)
+        self.assertEqual(trials[-1], (4, 40.0, 0.2))
+
+    def test_first_level_wins_if_nothing_helps(self):
+        best, trials = _climb([1, 2], lambda level: 5.0, min_gain=0.1)
+        self.assertEqual(best, 1)
+
+
+class SettingsTest(TempDirTestCase):
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.path = os.path.join(self.directory, 'tuned', 'autotune.json')
+
+    def test_untuned_host(self):
+        self.assertEqual(load_settings(self.path), {})
+
+    def test_round_trip_keeps_other_hosts(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w') as settings_file:
+            json.dump({'other-host': {'fetch_workers': 3}}, settings_file)
+        save_settings(16, 4, path=self.path)
+
+        settings = load_settings(self.path)
+        self.assertEqual((settings['fetch_workers'],
+                          settings['worker_processes']), (16, 4))
+        with open(self.path) as settings_file:
+            self.assertEqual(json.load(settings_file)['other-host'],
+                             {'fetch_workers': 3})
+
+    def test_settings_are_per_host(self):
+        save_settings(16, 4, path=self.path)
+        host_key = autotune._host_key
+        autotune._host_key = lambda: 'another-host'
+        try:
+            self.assertEqual(load_settings(self.path), {})
+        finally:
+            autotune._host_key = host_key
+
+    def test_unreadable_file(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w') as settings_file:
+            settings_file.write('{not json')
+        self.assertEqual(load_settings(self.path), {})
+
+
+class MeasureTest(unittest.TestCase):
+    def test_measure_fetch(self):
+        server = testserver.TestServer().start()
+        try:
+            rate, error_rate = measure_fetch(server.site_urls(4), 2)
+        finally:
+            server.stop()
+        self.assertGreater(rate, 0)
+        self.assertEqual(error_rate, 0.0)
+
+    def test_measure_mapreduce(self):
+        self.assertGreater(measure_mapreduce(['alpha', 'beta'] * 100, 2,
+                                             repeat=1), 0)
@@ -0,0 +1,144 @@
+import time
+import unittest
+
+from objs.cluster import HashRing, Coordinator, reduce_batch, \
+    resolve_authkey, parse_address, is_loopback
+from objs.sketch import SketchMapper
+from tests.helpers import make_site
+
+URLS = ['site%d.com' % number for number in range(200)]
+
+
+class HashRingTest(unittest.TestCase):
+    def test_empty_ring(self):
+        self.assertIsNone(HashRing().node_for('a.com'))
+
+    def test_same_owner_every_time(self):
+        first = HashRing(['a', 'b', 'c'])
+        second = HashRing(['c', 'a', 'b'])
+        self.assertEqual([first.node_for(url) for url in URLS],
+                         [second.node_for(url) for url in URLS])
+        self.assertEqual(set(first.node_for(url) for url in URLS),
+                         set(['a', 'b', 'c']))
+
+    def test_joining_node_only_takes_urls(self):
+        ring = HashRing(['a', 'b'])
+        before = dict((url, ring.node_for(url)) for url in URLS)
+        ring.add('c')
+        moved = [url for url in URLS if ring.node_for(url) != before[url]]
+        self.assertTrue(moved)
+        self.assertEqual(set(ring.node_for(url) for url in moved),
+                         set(['c']))
+
+        ring.remove('c')
+        self.assertEqual(dict((url, ring.node_for(url)) for url in URLS),
+                         before)
+        self.assertEqual(ring.nodes, set(['a', 'b']))
+
+
+class CoordinatorTest(unittest.TestCase):
+    def drain(self, coordinator, node):
+        leased = []
+        while True:
+            batch = coordinator.get_batch(node)
+            if batch is None:
+                return leased
+            leased.append(batch)
+
+    def test_urls_wait_for_a_node(self):
+        coordinator = Coordinator(URLS[:5])
+        self.assertIsNone(coordinator.get_batch('a'))
+        self.assertEqual(coordinator.status()['queued'], 5)
+        coordinator.register('a')
+        batch_id, urls = coordinator.get_batch('a')
+        self.assertEqual(urls, URLS[:5])
+        self.assertEqual(coordinator.status()['leased'], 5)
+        self.assertFalse(coordinator.is_finished())
+
+    def test_batches_follow_the_ring(self):
+        coordinator = Coordinator(URLS, batch_size=7)
+        for node in ('a', 'b'):
+            coordinator.register(node)
+        ring = HashRing(['a', 'b'])
+        for node in ('a', 'b'):
+            batches = self.drain(coordinator, node)
+            self.assertTrue(all(len(urls) <= 7 for _, urls in batches))
+            self.assertEqual(sorted(url for _, urls in batches
+                                    for url in urls),
+                             sorted(url for url in URLS
+                                    if ring.node_for(url) == node))
+
+    def test_submit_adds_to_the_shard(self):
+        coordinator = Coordinator(['a.com', 'b.com'])
+        coordinator.register('a')
+        batch_id, urls = coordinator.get_batch('a')
+        batch = reduce_batch([make_site('a.com', {'alpha': 2}, ['Server']),
+                              make_site('b.com', fetch_error='Timeout')])
+        self.assertTrue(coordinator.submit('a', batch_id, batch))
+        # a batch is only counted once
+        self.assertFalse(coordinator.submit('a', batch_id, batch))
+
+        self.assertTrue(coordinator.is_finished())
+        counters = coordinator.shards()['a']['counters']
+        self.assertEqual((counters['sites'], counters['failed'],
+                          counters['total_words']), (2, 1, 2))
+        self.assertEqual(sorted(record['url']
+                                for record in coordinator.records()),
+                         ['a.com', 'b.com'])
+
+    def test_lost_node_hands_its_urls_on(self):
+        coordinator = Coordinator(URLS[:40], batch_size=5, node_timeout=30)
+        coordinator.register('a')
+        coordinator.register('b')
+        leased = coordinator.get_batch('a')
+        # a stops sending heartbeats
+        coordinator._heartbeats['a'] = time.time() - 60
+        batches = self.drain(coordinator, 'b')
+        self.assertEqual(sorted(url for _, urls in batches for url in urls),
+                         sorted(URLS[:40]))
+        self.assertFalse(coordinator.heartbeat('a'))
+        # the lease a held was given away
+        self.assertFalse(coordinator.submit('a', leased[0],
+                                            reduce_batch([])))
+
+
+class ReduceBatchTest(unittest.TestCase):
+    def test_word_counts_stay_on_the_node(self):
+        batch = reduce_batch([make_site('a.com', {'alpha': 2, 'beta': 1},
+                                        ['Server', 'Via']),
+                              make_site('b.com', {'alpha': 1}, ['Server'])])
+        self.assertEqual([record['word_count'] for record in batch['sites']],
+                         [{}, {}])
+        self.assertEqual(batch['sites'][0]['distinct_words'], 2)
+        self.assertEqual(batch['counters']['distinct_words'], 3)
+        self.assertEqual(batch['counters']['total_words'], 4)
+        self.assertEqual(batch['headers'], {'Server': 2, 'Via': 1})
+        self.assertIsNone(batch['word_sketch'])
+
+    def test_sketches_are_merged(self):
+        sites = []
+        for url, words in (('a.com', ['alpha', 'beta']),
+                           ('b.com', ['alpha'])):
+            site = make_site(url)
+            site._words = words
+            site.calculate_word_sketch(SketchMapper())
+            sites.append(site)
+        batch = reduce_batch(sites)
+        self.assertEqual(batch['word_sketch']['terms']['candidates'][0],
+                         ('alpha', 2))
+        self.assertEqual([record['word_sketch']
+                          for record in batch['sites']], [None, None])
+
+
+class AuthkeyTest(unittest.TestCase):
+    def test_loopback_gets_a_random_key(self):
+        self.assertTrue(is_loopback('127.0.0.1'))
+        self.assertFalse(is_loopback('10.0.0.1'))
+        self.assertEqual(len(resolve_authkey('127.0.0.1')), 16)
+        self.assertEqual(resolve_authkey('10.0.0.1', 'secret'), b'secret')
+        self.assertRaises(ValueError, resolve_authkey, '10.0.0.1')
+        self.assertRaises(ValueError, resolve_authkey, None)
+
+    def test_parse_address(self):
+        self.assertEqual(parse_address('127.0.0.1:8080'),
+                         ('127.0.0.1', 8080))
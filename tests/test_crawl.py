@@ -0,0 +1,73 @@
+import unittest
+
+from objs import testserver
+from objs.crawl import same_site_links, CrawlFrontier, SiteCrawler
+from objs.site import Website
+
+
+class SameSiteLinksTest(unittest.TestCase):
+    def test_resolves_and_filters(self):
+        links = list(same_site_links('www.a.com/docs/index.html', [
+            'intro.html', '/about#team', 'http://a.com/?q=1',
+            'https://www.a.com', 'http://b.com/', 'mailto:me@a.com',
+            '  /padded  ']))
+        self.assertEqual(links, ['www.a.com/docs/intro.html',
+                                 'www.a.com/about', 'a.com/?q=1',
+                                 'www.a.com/', 'www.a.com/padded'])
+
+    def test_ports_are_part_of_the_site(self):
+        self.assertEqual(list(same_site_links(
+            'a.com:8080/', ['/one', 'http://a.com/two'])),
+            ['a.com:8080/one'])
+
+
+class CrawlFrontierTest(unittest.TestCase):
+    def drain(self, frontier):
+        popped = []
+        while True:
+            item = frontier.pop()
+            if item is None:
+                return popped
+            frontier.visit(item[0])
+            popped.append(item)
+
+    def test_breadth_first_without_repeats(self):
+        frontier = CrawlFrontier(max_pages=10, max_depth=2)
+        frontier.visit('a.com/')
+        frontier.add(['a.com/x', 'a.com/y', 'a.com/x', 'a.com/'], 1)
+        self.assertEqual(frontier.pop(), ('a.com/x', 1))
+        frontier.visit('a.com/x')
+        frontier.add(['a.com/z', 'a.com/y'], 2)
+        self.assertEqual(self.drain(frontier), [('a.com/y', 1),
+                                                ('a.com/z', 2)])
+        self.assertEqual(frontier.crawled, 4)
+        self.assertEqual(frontier.discovered, 4)
+
+    def test_depth_limit(self):
+        frontier = CrawlFrontier(max_pages=10, max_depth=1)
+        frontier.add(['a.com/deep'], 2)
+        self.assertIsNone(frontier.pop())
+
+    def test_page_budget(self):
+        frontier = CrawlFrontier(max_pages=3, max_depth=5)
+        frontier.visit('a.com/')
+        # only as many pages are queued as the budget has left
+        frontier.add(['a.com/%d' % number for number in range(10)], 1)
+        self.assertEqual(len(self.drain(frontier)), 2)
+        frontier.add(['a.com/more'], 2)
+        self.assertIsNone(frontier.pop())
+
+
+class SiteCrawlerTest(unittest.TestCase):
+    def test_crawls_linked_pages(self):
+        server = testserver.TestServer(min_words=20, max_words=40).start()
+        try:
+            site = Website(url=server.site_urls(1)[0])
+            site.request_homepage(crawler=SiteCrawler(max_depth=2,
+                                                      max_pages=4))
+        finally:
+            server.stop()
+        self.assertIsNone(site.fetch_error)
+        self.assertEqual(site.pages_crawled, 4)
+        self.assertEqual(site.links, [])
+        self.assertGreater(len(site.word_list), 40)
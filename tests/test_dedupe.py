@@ -0,0 +1,104 @@
+import unittest
+
+from objs.dedupe import NearDuplicateIndex, DuplicateGroups, \
+    page_fingerprint, hamming_distance
+from tests.helpers import make_site
+
+
+def _fetched(url, fingerprint):
+    site = make_site(url)
+    site._fingerprint = fingerprint
+    return site
+
+
+def _analyzed(site, word_count):
+    analyzed = make_site(site.url, word_count)
+    analyzed._fingerprint = site.fingerprint
+    return analyzed
+
+
+class FingerprintTest(unittest.TestCase):
+    def test_near_duplicates_are_close(self):
+        page = '<p>%s</p>' % ' '.join('word%d' % i for i in range(200))
+        edited = page.replace('word100', 'changed')
+        other = '<p>%s</p>' % ' '.join('other%d' % i for i in range(200))
+        self.assertLessEqual(hamming_distance(page_fingerprint(page),
+                                              page_fingerprint(edited)), 3)
+        self.assertGreater(hamming_distance(page_fingerprint(page),
+                                            page_fingerprint(other)), 3)
+
+    def test_ignores_markup_and_scripts(self):
+        self.assertEqual(
+            page_fingerprint('<b>a b c</b><script>var x;</script>'),
+            page_fingerprint('a b c'))
+        self.assertIsNone(page_fingerprint(''))
+
+
+class NearDuplicateIndexTest(unittest.TestCase):
+    def test_find_within_distance(self):
+        index = NearDuplicateIndex(max_distance=3)
+        index.add(0b1111, 'a')
+        self.assertEqual(index.find(0b1000), 'a')
+        self.assertIsNone(index.find(0b1111 << 40))
+        self.assertIsNone(index.find(None))
+
+    def test_remove(self):
+        index = NearDuplicateIndex(max_distance=3)
+        index.add(0b1111, 'a')
+        index.add(0b1111, 'b')
+        index.remove(0b1111, 'a')
+        self.assertEqual(index.find(0b1111), 'b')
+        self.assertEqual(len(index), 1)
+        index.remove(0b1111, 'b')
+        self.assertIsNone(index.find(0b1111))
+        self.assertEqual(len(index), 0)
+
+
+class DuplicateGroupsTest(unittest.TestCase):
+    def test_duplicates_reuse_the_analysis(self):
+        groups = DuplicateGroups()
+        first, second, third = [_fetched('site%d' % i, 42)
+                                for i in range(3)]
+        self.assertEqual(groups.fetched(first), ([first], []))
+        self.assertEqual(groups.fetched(second), ([], []))
+
+        analyzed = _analyzed(first, {'alpha': 2})
+        self.assertEqual(groups.analyzed(first.url, analyzed),
+                         ([], [analyzed, second]))
+        self.assertEqual(second.word_count, {'alpha': 2})
+        self.assertEqual(second.duplicate_of, 'site0')
+
+        self.assertEqual(groups.fetched(third), ([], [third]))
+        self.assertEqual(third.duplicate_of, 'site0')
+        self.assertEqual(groups.reused, 2)
+
+    def test_failed_representative(self):
+        groups = DuplicateGroups()
+        sites = [_fetched('site%d' % i, 42) for i in range(4)]
+        groups.fetched(sites[0])
+        groups.fetched(sites[1])
+        groups.fetched(sites[2])
+
+        # the first duplicate takes over the group
+        self.assertEqual(groups.analyzed('site0', None), ([sites[1]], []))
+        # a duplicate fetched after the failure waits on the new
+        # representative instead of the failed one
+        self.assertEqual(groups.fetched(sites[3]), ([], []))
+        analyzed = _analyzed(sites[1], {'alpha': 1})
+        self.assertEqual(groups.analyzed('site1', analyzed),
+                         ([], [analyzed, sites[2], sites[3]]))
+        self.assertEqual(sites[3].duplicate_of, 'site1')
+
+    def test_failed_representative_without_duplicates(self):
+        groups = DuplicateGroups()
+        first, second = _fetched('site0', 42), _fetched('site1', 42)
+        groups.fetched(first)
+        self.assertEqual(groups.analyzed('site0', None), ([], []))
+        # the next duplicate is analyzed on its own
+        self.assertEqual(groups.fetched(second), ([second], []))
+
+    def test_sites_without_fingerprints(self):
+        groups = DuplicateGroups()
+        first, second = _fetched('site0', None), _fetched('site1', None)
+        self.assertEqual(groups.fetched(first), ([first], []))
+        self.assertEqual(groups.fetched(second), ([second], []))
@@ -0,0 +1,107 @@
+import multiprocessing
+import os
+import socket
+import time
+import unittest
+
+from objs.dns_cache import url_host, StaticResolver, DnsCache, \
+    DnsPrefetcher, install_resolver_hook, _cached_getaddrinfo
+from tests.helpers import TempDirTestCase
+
+
+def _resolve_in_worker(host):
+    install_resolver_hook()
+    try:
+        return sorted(set(info[4][0] for info in
+                          socket.getaddrinfo(host, 80)))
+    except socket.gaierror:
+        return None
+
+
+class UrlHostTest(unittest.TestCase):
+    def test_hosts(self):
+        self.assertEqual(url_host('Example.com/path'), 'example.com')
+        self.assertEqual(url_host('example.com:8080/path'), 'example.com')
+        self.assertEqual(url_host('[::1]:8080/path'), '::1')
+
+
+class StaticResolverTest(TempDirTestCase):
+    def test_hosts_file(self):
+        path = os.path.join(self.directory, 'hosts')
+        with open(path, 'w') as hosts_file:
+            hosts_file.write('# comment\n127.0.0.1 a.test B.test\n'
+                             '::1 a.test  # also ipv6\nbroken\n')
+        resolver = StaticResolver.from_file(path, ttl=60)
+        self.assertEqual(resolver.resolve('a.test'),
+                         (['127.0.0.1', '::1'], 60))
+        self.assertEqual(resolver.resolve('b.test'), (['127.0.0.1'], 60))
+        self.assertEqual(resolver.resolve('c.test'), ([], 60))
+
+
+class DnsCacheTest(unittest.TestCase):
+    def test_hits_and_expiry(self):
+        cache = DnsCache()
+        self.assertIsNone(cache.get('a.test'))
+        cache.put('a.test', ['127.0.0.1'], 60)
+        cache.put('old.test', ['127.0.0.2'], -1)
+        self.assertEqual(cache.get('a.test'), ['127.0.0.1'])
+        self.assertIsNone(cache.get('old.test'))
+        self.assertTrue(cache.fresh('a.test'))
+        self.assertFalse(cache.fresh('old.test'))
+        self.assertEqual(cache.stats(), {'hosts': 2, 'hits': 1,
+                                         'misses': 2})
+
+    def test_missing_hosts_expire_sooner(self):
+        cache = DnsCache(negative_ttl=0)
+        cache.put('missing.test', [], 300)
+        time.sleep(0.01)
+        self.assertIsNone(cache.get('missing.test'))
+
+
+class CachedGetaddrinfoTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = DnsCache()
+        self.cache.put('both.test', ['127.0.0.1', '::1'], 60)
+        self.cache.put('missing.test', [], 60)
+        self.getaddrinfo = _cached_getaddrinfo(self.cache)
+
+    def test_answers_from_the_cache(self):
+        infos = self.getaddrinfo('Both.test', 80)
+        self.assertEqual([info[4] for info in infos],
+                         [('127.0.0.1', 80), ('::1', 80, 0, 0)])
+        infos = self.getaddrinfo(b'both.test', 'http', socket.AF_INET)
+        self.assertEqual([info[4] for info in infos], [('127.0.0.1', 80)])
+
+    def test_missing_host(self):
+        self.assertRaises(socket.gaierror, self.getaddrinfo,
+                          'missing.test', 80)
+
+    def test_falls_back_to_the_system_resolver(self):
+        infos = self.getaddrinfo('127.0.0.1', 80, socket.AF_INET)
+        self.assertEqual(infos[0][4], ('127.0.0.1', 80))
+
+
+class DnsPrefetcherTest(unittest.TestCase):
+    def test_resolves_ahead_in_order(self):
+        prefetcher = DnsPrefetcher(
+            resolver=StaticResolver({'a.test': ['127.0.0.1'],
+                                     'b.test': ['127.0.0.2']}),
+            threads=4, lookahead=2).start()
+        try:
+            urls = ['a.test/one', 'b.test:8080', 'c.test', 'a.test/two']
+            self.assertEqual(list(prefetcher.resolve_ahead(urls)), urls)
+            self.assertEqual(prefetcher.cache.get('b.test'), ['127.0.0.2'])
+            self.assertEqual(prefetcher.cache.get('c.test'), [])
+
+            # the fetch processes look the hosts up in the shared cache
+            pool = multiprocessing.Pool(processes=1)
+            try:
+                self.assertEqual(pool.map(_resolve_in_worker,
+                                          ['a.test', 'c.test']),
+                                 [['127.0.0.1'], None])
+            finally:
+                pool.close()
+                pool.join()
+        finally:
+            prefetcher.stop()
+        self.assertGreaterEqual(prefetcher.cache.stats()['hits'], 2)
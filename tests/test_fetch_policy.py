@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+import unittest
+
+import requests
+
+from objs import fetch_policy
+from objs.fetch_policy import LatencyHistory, FetchPolicy, FetchReport, \
+    configure_policy, get_policy, FETCH_POLICY_ENV, FETCH_HISTORY_ENV
+from tests.helpers import TempDirTestCase, make_site
+
+
+class _Response(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class ScriptedPolicy(FetchPolicy):
+    """
+    Answers each request with the next scripted (delay, status or error).
+    """
+    def __init__(self, script, **kwargs):
+        FetchPolicy.__init__(self, backoff=0.0, **kwargs)
+        self._script = list(script)
+        self._script_lock = threading.Lock()
+        self.timeouts = []
+
+    def _request(self, url, timeout):
+        with self._script_lock:
+            self.timeouts.append(timeout)
+            delay, outcome = self._script.pop(0)
+        time.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return _Response(outcome)
+
+
+class LatencyHistoryTest(TempDirTestCase):
+    def test_window_and_percentiles(self):
+        history = LatencyHistory(window=3)
+        for latency in (5.0, 1.0, 2.0, 3.0):
+            history.record('a', latency)
+        self.assertEqual(history.count('a'), 3)
+        self.assertEqual(history.percentile('a', 100), 3.0)
+        self.assertEqual(history.percentile('a', 0), 1.0)
+        self.assertIsNone(history.percentile('b', 50))
+
+    def test_save_and_load(self):
+        path = os.path.join(self.directory, 'history.json')
+        history = LatencyHistory()
+        history.record('a', 0.5)
+        history.save(path)
+        loaded = LatencyHistory()
+        loaded.load(path)
+        loaded.load(os.path.join(self.directory, 'missing.json'))
+        self.assertEqual(loaded.percentile('a', 50), 0.5)
+
+
+class TimeoutTest(unittest.TestCase):
+    def test_fixed_timeout(self):
+        policy = FetchPolicy(timeout=2.0)
+        for _ in range(10):
+            policy.record('a.com', 0.1)
+        self.assertEqual(policy.timeout_for('a.com'), 2.0)
+
+    def test_adaptive_timeout_falls_back(self):
+        policy = FetchPolicy(timeout=3.0, adaptive=True, min_samples=2,
+                             min_timeout=0.1, timeout_multiplier=2.0)
+        self.assertEqual(policy.timeout_for('www.a.com'), 3.0)
+        policy.record('www.a.com', 0.4)
+        policy.record('www.a.com', 0.5)
+        self.assertEqual(policy.timeout_for('www.a.com'), 1.0)
+        # another host of the same domain
+        self.assertEqual(policy.timeout_for('img.a.com/path'), 1.0)
+        policy.record('b.com', 3.0)
+        policy.record('b.com', 3.0)
+        self.assertEqual(policy.timeout_for('b.com'), 6.0)
+        # every host together for an unknown domain
+        self.assertEqual(policy.timeout_for('c.com'), 6.0)
+        policy.record('b.com', 20.0)
+        self.assertEqual(policy.timeout_for('b.com'), policy.max_timeout)
+
+
+class RetryTest(unittest.TestCase):
+    def test_server_errors_are_retried(self):
+        policy = ScriptedPolicy([(0, 503), (0, 502), (0, 200)], retries=3)
+        response, attempts = policy.get('a.com')
+        self.assertEqual((response.status_code, attempts), (200, 3))
+        self.assertEqual(policy.retried, 2)
+
+    def test_gives_up_after_the_retries(self):
+        policy = ScriptedPolicy([(0, 503), (0, 503)], retries=1)
+        response, attempts = policy.get('a.com')
+        self.assertEqual((response.status_code, attempts), (503, 2))
+
+    def test_timeouts_double(self):
+        policy = ScriptedPolicy(
+            [(0, requests.exceptions.Timeout()), (0, 200)], timeout=1.0,
+            retries=1)
+        policy.get('a.com')
+        self.assertEqual(policy.timeouts, [1.0, 2.0])
+        # the timeout is recorded as the latency it took at least
+        self.assertEqual(policy.history.percentile('host:a.com', 100), 1.0)
+
+    def test_last_error_is_raised(self):
+        policy = ScriptedPolicy(
+            [(0, requests.exceptions.ConnectionError())] * 2, retries=1)
+        self.assertRaises(requests.exceptions.ConnectionError, policy.get,
+                          'a.com')
+
+    def test_retry_budget(self):
+        policy = ScriptedPolicy([(0, 503)] * 20, retries=5, min_retries=1,
+                                retry_budget=0.0)
+        self.assertEqual(policy.get('a.com')[1], 2)
+        # the budget is spent, no more retries for anyone
+        self.assertEqual(policy.get('b.com')[1], 1)
+
+
+class HedgeTest(unittest.TestCase):
+    def test_slow_request_is_hedged(self):
+        policy = ScriptedPolicy([(1.0, 500), (0, 200)], hedge=True,
+                                min_samples=1, timeout=5.0)
+        policy.record('a.com', 0.05)
+        start = time.time()
+        response, attempts = policy.get('a.com')
+        self.assertLess(time.time() - start, 0.9)
+        self.assertEqual((response.status_code, attempts), (200, 1))
+        self.assertEqual(policy.hedged, 1)
+
+    def test_no_hedge_without_history(self):
+        policy = ScriptedPolicy([(0.1, 200)], hedge=True)
+        self.assertEqual(policy.get('a.com')[0].status_code, 200)
+        self.assertEqual(policy.hedged, 0)
+
+
+class FetchReportTest(unittest.TestCase):
+    def test_tallies(self):
+        policy = FetchPolicy()
+        report = FetchReport(policy)
+        report.add(make_site('a.com', fetch_time=0.2))
+        report.add(make_site('b.com', fetch_error='Timeout'))
+        report.add(make_site('c.com', fetch_error='Timeout'))
+        self.assertEqual((report.sites, report.failed), (3, 2))
+        self.assertEqual(report.errors, {'Timeout': 2})
+        self.assertEqual(report.latency_percentile(50), 0.2)
+        self.assertEqual(policy.history.count('host:a.com'), 1)
+
+
+class ConfigureTest(TempDirTestCase):
+    def tearDown(self):
+        for name in (FETCH_POLICY_ENV, FETCH_HISTORY_ENV):
+            os.environ.pop(name, None)
+        fetch_policy._process_policy = None
+        TempDirTestCase.tearDown(self)
+
+    def test_workers_rebuild_the_policy(self):
+        path = os.path.join(self.directory, 'history.json')
+        history = LatencyHistory()
+        history.record('host:a.com', 0.3)
+        history.save(path)
+        configure_policy(FetchPolicy(timeout=4.0, retries=2),
+                         history_path=path)
+        # what a forked worker with another pid does
+        fetch_policy._process_policy = None
+        policy = get_policy()
+        self.assertEqual((policy.timeout, policy.retries), (4.0, 2))
+        self.assertEqual(policy.history.count('host:a.com'), 1)
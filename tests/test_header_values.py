@@ -0,0 +1,81 @@
+import unittest
+
+from objs.header_values import content_length_bucket, \
+    normalize_header_values, StringTable, HeaderValueTable, \
+    MAX_VALUE_LENGTH
+from tests.helpers import make_site
+
+
+def _site(url, header_values):
+    site = make_site(url, headers=list(header_values))
+    site._header_values = normalize_header_values(header_values)
+    return site
+
+
+class NormalizeTest(unittest.TestCase):
+    def test_content_length_buckets(self):
+        self.assertEqual(content_length_bucket('0'), '0')
+        self.assertEqual(content_length_bucket('1'), '1-1')
+        self.assertEqual(content_length_bucket('1500'), '1024-2047')
+        self.assertEqual(content_length_bucket('2048'), '2048-4095')
+        self.assertEqual(content_length_bucket('chunked'), 'chunked')
+
+    def test_names_and_values(self):
+        values = normalize_header_values({
+            'Server': ' nginx ', 'Date': 'Mon, 01 Jan 2024',
+            'Content-Length': '300', 'X-Long': 'x' * 500})
+        self.assertEqual(values, {'server': 'nginx',
+                                  'content-length': '256-511',
+                                  'x-long': 'x' * MAX_VALUE_LENGTH})
+
+    def test_only_some_headers(self):
+        self.assertEqual(normalize_header_values(
+            {'Server': 'nginx', 'Date': 'today', 'Via': 'proxy'},
+            only=set(['server', 'date'])),
+            {'server': 'nginx', 'date': 'today'})
+
+
+class StringTableTest(unittest.TestCase):
+    def test_each_string_is_stored_once(self):
+        table = StringTable()
+        ids = [table.intern(value) for value in ('a', 'b', 'a', 'c', 'b')]
+        self.assertEqual(ids, [0, 1, 0, 2, 1])
+        self.assertEqual(len(table), 3)
+        self.assertEqual(table[2], 'c')
+
+
+class HeaderValueTableTest(unittest.TestCase):
+    def setUp(self):
+        self.table = HeaderValueTable()
+        self.sites = [
+            _site('a.com', {'Server': 'nginx', 'Via': 'cache'}),
+            _site('b.com', {'Server': 'nginx'}),
+            _site('c.com', {'Server': 'apache', 'Via': 'cache'}),
+            _site('d.com', {})]
+        for site in self.sites:
+            self.table.add(site)
+
+    def test_sites_release_their_values(self):
+        self.assertEqual([site.header_values for site in self.sites],
+                         [{}, {}, {}, {}])
+        self.assertEqual(len(self.table), 4)
+        # server, nginx, via, cache and apache
+        self.assertEqual(len(self.table.strings), 5)
+        self.assertEqual(self.table.values_of(0),
+                         ('a.com', {'server': 'nginx', 'via': 'cache'}))
+        self.assertEqual(self.table.values_of(3), ('d.com', {}))
+
+    def test_distributions(self):
+        distributions = self.table.distributions(worker_count=2)
+        self.assertEqual(distributions, {
+            'server': [('nginx', 2), ('apache', 1)],
+            'via': [('cache', 2)]})
+        self.assertEqual(
+            self.table.top_values(distributions, ['Server', 'Missing'],
+                                  count=1),
+            [('Server', [('nginx', 50.0)]), ('Missing', [])])
+
+    def test_empty_table(self):
+        table = HeaderValueTable()
+        self.assertEqual(table.distributions(), {})
+        self.assertEqual(table.top_values({}), [])
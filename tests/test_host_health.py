@@ -0,0 +1,85 @@
+import os
+import unittest
+
+from objs.host_health import HostHealth, HEALTHY, PROBE, SKIP
+from tests.helpers import make_site, TempDirTestCase
+
+
+def _failed(url):
+    return make_site(url, fetch_error='ConnectionError')
+
+
+class HostHealthTest(unittest.TestCase):
+    def setUp(self):
+        self.health = HostHealth(probe_interval=100, max_interval=350)
+
+    def test_new_hosts_are_healthy(self):
+        self.assertEqual(self.health.status('a.com', now=1), HEALTHY)
+
+    def test_backoff_doubles_up_to_max(self):
+        now = 1000
+        intervals = []
+        for _ in range(4):
+            self.health.record(_failed('a.com'), now=now)
+            next_probe = self.health.host('a.com')['next_probe']
+            intervals.append(next_probe - now)
+            self.assertEqual(self.health.status('a.com', now=now), SKIP)
+            self.assertEqual(self.health.status('a.com', now=next_probe),
+                             PROBE)
+            now = next_probe
+        self.assertEqual(intervals, [100, 200, 350, 350])
+        self.assertEqual(self.health.host('a.com')['failures'], 4)
+
+    def test_failures_within_a_probe_count_once(self):
+        self.health.record(_failed('a.com'), now=1000)
+        self.health.record(_failed('a.com/page'), now=1010)
+        entry = self.health.host('a.com')
+        self.assertEqual(entry['failures'], 1)
+        self.assertEqual(entry['next_probe'], 1100)
+        self.assertEqual(entry['last_failure'], 1010)
+
+    def test_success_recovers(self):
+        self.health.record(_failed('a.com'), now=1000)
+        self.health.record(make_site('a.com', fetch_time=2.0), now=1100)
+        self.health.record(make_site('a.com', fetch_time=1.0), now=1200)
+        entry = self.health.host('A.com')
+        self.assertEqual(entry['failures'], 0)
+        self.assertIsNone(entry['error'])
+        self.assertEqual(entry['last_success'], 1200)
+        self.assertAlmostEqual(entry['latency'], 1.7)
+        self.assertEqual(self.health.status('a.com', now=1200), HEALTHY)
+        self.assertEqual(self.health.recovered, 1)
+
+    def test_schedule(self):
+        self.health.record(_failed('skip.com'), now=1000)
+        self.health.record(_failed('probe.com'), now=800)
+        urls = ['probe.com', 'skip.com', 'a.com', 'b.com']
+        self.assertEqual(list(self.health.schedule(urls, now=950)),
+                         ['a.com', 'b.com', 'probe.com'])
+        self.assertEqual(self.health.skipped, 1)
+        self.assertEqual(self.health.probed, 1)
+
+
+class HostHealthFileTest(TempDirTestCase):
+    def test_save_and_load(self):
+        path = os.path.join(self.directory, 'health.json')
+        health = HostHealth()
+        health.record(_failed('a.com'), now=1000)
+        health.record(make_site('b.com'), now=1000)
+        health.save(path)
+        self.assertFalse(os.path.exists(path + '.tmp'))
+
+        loaded = HostHealth()
+        loaded.load(path)
+        self.assertEqual(len(loaded), 2)
+        self.assertEqual(loaded.host('a.com'), health.host('a.com'))
+        self.assertEqual(loaded.status('a.com', now=1001), SKIP)
+
+    def test_unreadable_file(self):
+        path = os.path.join(self.directory, 'health.json')
+        with open(path, 'w') as health_file:
+            health_file.write('{not json')
+        health = HostHealth()
+        health.load(path)
+        health.load(os.path.join(self.directory, 'missing.json'))
+        self.assertEqual(len(health), 0)
@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# libraries a worker or a cold start should only load once it uses them
+HEAVY_MODULES = ['requests', 'bs4', 'boto3', 'botocore', 'numpy', 'pyarrow',
+                 'cProfile']
+
+CHILD = '''
+import json, sys
+{statement}
+print(json.dumps([m for m in {heavy!r} if m in sys.modules]))
+'''
+
+
+def heavy_modules_loaded(statement):
+    """
+    Returns:
+        (list str): Heavy modules a fresh interpreter has loaded after
+        running the statement.
+    """
+    output = subprocess.check_output(
+        [sys.executable, '-c', CHILD.format(statement=statement,
+                                            heavy=HEAVY_MODULES)],
+        cwd=ROOT)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+class LazyImportTest(unittest.TestCase):
+    def test_worker_modules(self):
+        for module in ('objs.site', 'objs.top_sites', 'objs.streaming',
+                       'objs.cluster', 'objs.sketch', 'objs.crawl'):
+            self.assertEqual(heavy_modules_loaded('import %s' % module), [],
+                             module)
+
+    def test_lambda_handler(self):
+        self.assertEqual(heavy_modules_loaded(
+            'import runpy; runpy.run_path("lambda.py", run_name="test")'),
+            [])
+
+    @unittest.skipIf(sys.version_info[0] > 2,
+                     'top-sites.py only runs on python 2')
+    def test_top_sites_script(self):
+        self.assertEqual(heavy_modules_loaded(
+            'import runpy; runpy.run_path("top-sites.py", run_name="test")'),
+            [])
+
+    def test_parsing_loads_bs4(self):
+        # the lazy import still happens once the module is used
+        self.assertEqual(heavy_modules_loaded(
+            'from objs.site import Website; '
+            'Website("a.com", content="<p>hello</p>", headers={})'),
+            ['bs4'])
@@ -0,0 +1,204 @@
+import json
+import os
+import random
+
+from objs import index as index_module
+from objs.index import IndexWriter, Index, MANIFEST, merge_segments, \
+    encode_varint, encode_postings, decode_varints, decode_postings
+from tests.helpers import TempDirTestCase, make_site
+
+
+class PostingsTest(TempDirTestCase):
+    def test_varint_round_trip(self):
+        values = [0, 1, 127, 128, 300, 16383, 16384, 2 ** 32, 2 ** 63 - 1]
+        data = bytearray()
+        for value in values:
+            encode_varint(value, data)
+        self.assertEqual(decode_varints(bytes(data)).tolist(), values)
+
+    def test_postings_round_trip(self):
+        generator = random.Random(7)
+        doc_ids = sorted(generator.sample(range(10 ** 6), 500))
+        postings = [(doc_id, generator.randint(1, 10 ** 5))
+                    for doc_id in doc_ids]
+        self.assertEqual(decode_postings(bytes(encode_postings(postings))),
+                         postings)
+
+    def test_empty_postings(self):
+        self.assertEqual(decode_postings(b''), [])
+
+
+class IndexTest(TempDirTestCase):
+    def write(self, sites, segment_size=10000):
+        writer = IndexWriter(self.directory, segment_size=segment_size)
+        for site in sites:
+            writer.add(site)
+        writer.close()
+
+    def manifest(self):
+        with open(os.path.join(self.directory, MANIFEST)) as manifest_file:
+            return json.load(manifest_file)
+
+    def test_query(self):
+        self.write([make_site('a.com', {'alpha': 3, 'beta': 1}),
+                    make_site('b.com', {'alpha': 1}),
+                    make_site('c.com', {'beta': 2})], segment_size=2)
+        index = Index(self.directory)
+        try:
+            self.assertEqual(index.term('alpha'),
+                             [('a.com', 3), ('b.com', 1)])
+            self.assertEqual(index.all_of(['alpha', 'beta']), set(['a.com']))
+            self.assertEqual(index.any_of(['alpha', 'beta']),
+                             set(['a.com', 'b.com', 'c.com']))
+            self.assertEqual(index.top(['alpha', 'beta']),
+                             [('a.com', 4), ('c.com', 2), ('b.com', 1)])
+            self.assertEqual(index.term('missing'), [])
+        finally:
+            index.close()
+        self.assertEqual(len(self.manifest()['segments']), 2)
+
+    def test_reindexed_site_replaces_older_doc(self):
+        self.write([make_site('a.com', {'alpha': 1}),
+                    make_site('b.com', {'alpha': 2})])
+        self.write([make_site('a.com', {'alpha': 7})])
+
+        manifest = self.manifest()
+        deleted_file = manifest['deleted']['segment-000000']
+        self.assertEqual(deleted_file, 'segment-000000.del.1')
+        with open(os.path.join(self.directory, deleted_file)) as del_file:
+            self.assertEqual(json.load(del_file), [0])
+
+        index = Index(self.directory)
+        try:
+            self.assertEqual(index.term('alpha'),
+                             [('a.com', 7), ('b.com', 2)])
+        finally:
+            index.close()
+
+    def test_reindexed_in_the_same_run(self):
+        self.write([make_site('a.com', {'alpha': 1}),
+                    make_site('b.com', {'alpha': 2}),
+                    make_site('a.com', {'alpha': 3}),
+                    make_site('c.com', {'alpha': 4}),
+                    make_site('a.com', {'alpha': 5})], segment_size=2)
+        self.assertEqual(self.manifest()['deleted'],
+                         {'segment-000000': 'segment-000000.del.1',
+                          'segment-000001': 'segment-000001.del.2'})
+        index = Index(self.directory)
+        try:
+            self.assertEqual(index.term('alpha'), [('a.com', 5),
+                                                   ('c.com', 4),
+                                                   ('b.com', 2)])
+        finally:
+            index.close()
+
+    def test_flush_only_opens_the_segments_it_replaces_docs_in(self):
+        opened = []
+        open_segment = index_module._open_segment
+
+        def counting_open(index_dir, manifest, name):
+            opened.append(name)
+            return open_segment(index_dir, manifest, name)
+
+        index_module._open_segment = counting_open
+        try:
+            writer = IndexWriter(self.directory, segment_size=1)
+            for number in range(5):
+                writer.add(make_site('site%d.com' % number, {'alpha': 1}))
+            writer.add(make_site('site1.com', {'alpha': 2}))
+            writer.close()
+        finally:
+            index_module._open_segment = open_segment
+        self.assertEqual(opened, ['segment-000001'])
+
+    def test_writer_after_a_merge(self):
+        self.write([make_site('a.com', {'alpha': 1}),
+                    make_site('b.com', {'alpha': 2})], segment_size=1)
+        writer = IndexWriter(self.directory, segment_size=1)
+        writer.add(make_site('c.com', {'alpha': 3}))
+        merge_segments(self.directory)
+        writer.add(make_site('a.com', {'alpha': 4}))
+        writer.close()
+        index = Index(self.directory)
+        try:
+            self.assertEqual(index.term('alpha'), [('a.com', 4),
+                                                   ('c.com', 3),
+                                                   ('b.com', 2)])
+        finally:
+            index.close()
+
+    def test_repeated_query_terms_count_once(self):
+        self.write([make_site('a.com', {'alpha': 3}),
+                    make_site('b.com', {'alpha': 1, 'beta': 2})])
+        index = Index(self.directory)
+        try:
+            self.assertEqual(index.top(['alpha', 'alpha']),
+                             [('a.com', 3), ('b.com', 1)])
+            self.assertEqual(index.top(['beta', 'alpha', 'beta'],
+                                       match_all=True), [('b.com', 3)])
+        finally:
+            index.close()
+
+    def test_deletions_only_count_once_in_the_manifest(self):
+        self.write([make_site('a.com', {'alpha': 1})])
+        # a run that stopped after writing its deletions but before the
+        # manifest leaves a file the manifest doesn't name
+        with open(os.path.join(self.directory, 'segment-000000.del.1'),
+                  'w') as del_file:
+            json.dump([0], del_file)
+        index = Index(self.directory)
+        try:
+            self.assertEqual(index.term('alpha'), [('a.com', 1)])
+        finally:
+            index.close()
+
+    def test_superseded_deletions_are_removed(self):
+        self.write([make_site('a.com', {'alpha': 1}),
+                    make_site('b.com', {'alpha': 1})])
+        self.write([make_site('a.com', {'alpha': 2})])
+        self.write([make_site('b.com', {'alpha': 2})])
+        files = os.listdir(self.directory)
+        self.assertNotIn('segment-000000.del.1', files)
+        self.assertIn('segment-000000.del.2', files)
+
+    def test_merge_drops_deleted_docs(self):
+        self.write([make_site('a.com', {'alpha': 1}),
+                    make_site('b.com', {'beta': 1})])
+        self.write([make_site('a.com', {'alpha': 4})])
+        name = merge_segments(self.directory)
+
+        self.assertEqual(self.manifest()['segments'], [name])
+        self.assertEqual(self.manifest()['deleted'], {})
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         sorted([MANIFEST] + [name + extension for extension
+                                              in ('.docs', '.lex', '.post',
+                                                  '.terms')]))
+        index = Index(self.directory)
+        try:
+            self.assertEqual(index.term('alpha'), [('a.com', 4)])
+            self.assertEqual(index.term('beta'), [('b.com', 1)])
+        finally:
+            index.close()
+
+    def test_reads_older_del_files(self):
+        self.write([make_site('a.com', {'alpha': 1}),
+                    make_site('b.com', {'alpha': 1})])
+        manifest = self.manifest()
+        del manifest['deleted']
+        with open(os.path.join(self.directory, MANIFEST), 'w') as \
+                manifest_file:
+            json.dump(manifest, manifest_file)
+        with open(os.path.join(self.directory, 'segment-000000.del'),
+                  'w') as del_file:
+            json.dump([1], del_file)
+
+        index = Index(self.directory)
+        try:
+            self.assertEqual(index.term('alpha'), [('a.com', 1)])
+        finally:
+            index.close()
+
+    def test_sites_without_word_counts_are_skipped(self):
+        self.write([make_site('a.com')])
+        self.assertFalse(os.path.exists(os.path.join(self.directory,
+                                                     MANIFEST)))
@@ -0,0 +1,86 @@
+import json
+import os
+
+from objs.journal import SiteJournal, read_journal
+from objs.sketch import SketchMapper
+from tests.helpers import TempDirTestCase, make_site
+
+
+class SiteJournalTest(TempDirTestCase):
+    def setUp(self):
+        super(SiteJournalTest, self).setUp()
+        self.path = os.path.join(self.directory, 'crawl.journal')
+
+    def test_round_trip(self):
+        sites = [make_site('a.com', {'alpha': 2, 'beta': 1}, ['Server']),
+                 make_site('b.com', fetch_error='ConnectionError')]
+        with SiteJournal(self.path, batch_size=1) as journal:
+            for site in sites:
+                journal.record(site)
+
+        restored = read_journal(self.path)
+        self.assertEqual([site.url for site in restored], ['a.com', 'b.com'])
+        self.assertEqual(restored[0].word_count, {'alpha': 2, 'beta': 1})
+        self.assertEqual(restored[0].headers, ['Server'])
+        self.assertEqual(restored[0].word_count_size, 2)
+        self.assertEqual(restored[0].total_word_count, 3)
+        self.assertEqual(restored[1].fetch_error, 'ConnectionError')
+
+    def test_one_json_record_per_line(self):
+        with SiteJournal(self.path) as journal:
+            journal.record(make_site('a.com', {'alpha': 1}))
+            journal.record(make_site('b.com', {'beta': 1}))
+        with open(self.path) as journal_file:
+            lines = journal_file.read().splitlines()
+        self.assertEqual([json.loads(line)['url'] for line in lines],
+                         ['a.com', 'b.com'])
+
+    def test_last_record_wins(self):
+        with SiteJournal(self.path) as journal:
+            journal.record(make_site('a.com', {'alpha': 1}))
+            journal.record(make_site('a.com', {'alpha': 5}))
+        restored = read_journal(self.path)
+        self.assertEqual(len(restored), 1)
+        self.assertEqual(restored[0].word_count, {'alpha': 5})
+
+    def test_resume_drops_partial_line(self):
+        with SiteJournal(self.path) as journal:
+            journal.record(make_site('a.com', {'alpha': 1}))
+        with open(self.path, 'a') as journal_file:
+            journal_file.write('{"url": "b.co')
+
+        with SiteJournal(self.path, resume=True) as journal:
+            journal.record(make_site('c.com', {'gamma': 1}))
+        self.assertEqual([site.url for site in read_journal(self.path)],
+                         ['a.com', 'c.com'])
+
+    def test_without_resume_starts_over(self):
+        with SiteJournal(self.path) as journal:
+            journal.record(make_site('a.com', {'alpha': 1}))
+        SiteJournal(self.path).close()
+        self.assertEqual(read_journal(self.path), [])
+
+    def test_skips_unreadable_lines(self):
+        with open(self.path, 'w') as journal_file:
+            journal_file.write('not json\n')
+            journal_file.write(json.dumps(make_site('a.com').to_record()))
+            journal_file.write('\n')
+        self.assertEqual([site.url for site in read_journal(self.path)],
+                         ['a.com'])
+
+    def test_missing_journal(self):
+        self.assertEqual(read_journal(self.path), [])
+
+    def test_sketched_sites_keep_their_sketch(self):
+        site = make_site('a.com')
+        site._words = ['alpha', 'beta', 'alpha', 'gamma']
+        site.calculate_word_sketch(SketchMapper())
+        site.release_content()
+        with SiteJournal(self.path) as journal:
+            journal.record(site)
+
+        restored, = read_journal(self.path)
+        self.assertEqual(restored.word_count, {})
+        self.assertEqual(restored.word_count_size, 3)
+        self.assertEqual(restored.total_word_count, 4)
+        self.assertEqual(restored.word_sketch.terms.top(1), [('alpha', 2)])
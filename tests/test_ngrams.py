@@ -0,0 +1,79 @@
+import random
+import unittest
+
+from objs.ngrams import ngram_keys, partition_overlapping, NgramCounter, \
+    CorpusNgrams
+from objs.site import MapReduceSite
+from tests.helpers import make_site
+
+WORDS = 'the cat sat on the mat and the cat sat on the hat'.split()
+
+
+def _counts(words, n):
+    counts = {}
+    for start in range(len(words) - n + 1):
+        phrase = ' '.join(words[start:start + n])
+        counts[phrase] = counts.get(phrase, 0) + 1
+    return counts
+
+
+class NgramKeysTest(unittest.TestCase):
+    def test_same_phrase_same_key(self):
+        keys = list(ngram_keys(WORDS, 3))
+        self.assertEqual(len(keys), len(WORDS) - 2)
+        # the rolling key matches hashing the phrase on its own
+        for start, key in enumerate(keys):
+            self.assertEqual(list(ngram_keys(WORDS[start:start + 3], 3)),
+                             [key])
+        # "the cat sat", "cat sat on" and "sat on the" appear twice
+        self.assertEqual(len(set(keys)), len(keys) - 3)
+
+    def test_word_order_matters(self):
+        self.assertNotEqual(list(ngram_keys(['a', 'b'], 2)),
+                            list(ngram_keys(['b', 'a'], 2)))
+
+    def test_too_few_words(self):
+        self.assertEqual(list(ngram_keys(['a', 'b'], 3)), [])
+
+
+class NgramCounterTest(unittest.TestCase):
+    def test_cuts_lose_no_ngrams(self):
+        rng = random.Random(0)
+        words = [rng.choice('abcd') for _ in range(101)]
+        counter = NgramCounter(n=3)
+        for workers in (1, 3, 7, 200):
+            merged = {}
+            for part in partition_overlapping(words, workers, 3):
+                for key, count in counter(part).items():
+                    merged[key] = merged.get(key, 0) + count
+            self.assertEqual(merged, counter(words))
+
+    def test_top_phrases(self):
+        counter = NgramCounter(n=2, top=2, min_count=2)
+        phrases = counter.top_phrases(counter(WORDS), WORDS)
+        expected = _counts(WORDS, 2)
+        self.assertEqual([count for _, count in phrases], [2, 2])
+        for phrase, count in phrases:
+            self.assertEqual(expected[phrase], count)
+
+    def test_min_count(self):
+        counter = NgramCounter(n=3, min_count=3)
+        self.assertEqual(counter.top_phrases(counter(WORDS), WORDS), [])
+
+    def test_mapreduce_site(self):
+        counter = NgramCounter(n=2, top=20, min_count=1)
+        site = MapReduceSite(worker_processes=3, url='a.com')
+        site._words = list(WORDS)
+        site.calculate_ngram_count(counter)
+        self.assertEqual(dict(site.ngram_counts), _counts(WORDS, 2))
+
+
+class CorpusNgramsTest(unittest.TestCase):
+    def test_merges_the_sites(self):
+        corpus = CorpusNgrams()
+        for url, ngrams in (('a.com', [('the cat', 3), ('on the', 2)]),
+                            ('b.com', [('on the', 4)])):
+            site = make_site(url)
+            site._ngram_counts = ngrams
+            corpus.add(site)
+        self.assertEqual(corpus.top(), [('on the', 6), ('the cat', 3)])
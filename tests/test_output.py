@@ -0,0 +1,116 @@
+import json
+import os
+import unittest
+
+import numpy
+
+from objs.output import write_run, RunResults, compare_runs, \
+    FORMAT_ARROW, FORMAT_CSV, FORMAT_PARQUET, RUN_META_FILE, _pyarrow
+from objs.stats import CorpusStats
+from tests.helpers import TempDirTestCase, make_site
+
+
+def _sites():
+    return [make_site('small.com', {'alpha': 1}, ['Server']),
+            make_site('large.com', {'alpha': 2, 'beta': 1, 'gamma': 1},
+                      ['Server', 'X-Frame-Options']),
+            make_site('failed.com', fetch_error='Timeout'),
+            make_site('medium.com', {'alpha': 1, 'beta': 1},
+                      ['X-Frame-Options', 'Via'])]
+
+
+class RunOutputTest(TempDirTestCase):
+    def write(self, output_format, sites=None, run_id='run-1', labels=None):
+        stats = CorpusStats.from_sites(sites or _sites())
+        run_dir = write_run(self.directory, stats,
+                            output_format=output_format, run_id=run_id,
+                            labels=labels)
+        return RunResults(run_dir)
+
+    def check_round_trip(self, output_format):
+        results = self.write(output_format, labels={'budget': 10})
+
+        self.assertEqual(results.run_id, 'run-1')
+        self.assertEqual(results.meta['format'], output_format)
+        self.assertEqual(results.meta['site_count'], 4)
+        self.assertEqual(results.meta['budget'], 10)
+        self.assertEqual(list(results.urls),
+                         ['large.com', 'medium.com', 'small.com',
+                          'failed.com'])
+        self.assertEqual(results.ranks.tolist(), [1, 2, 3, 4])
+        self.assertEqual(results.distinct_words.tolist(), [3, 2, 1, 0])
+        self.assertEqual(results.total_words.tolist(), [4, 2, 1, 0])
+        self.assertTrue(numpy.isnan(results.fetch_time[3]))
+        self.assertAlmostEqual(results.fetch_time[0], 0.1)
+
+        self.assertEqual(list(results.header_names),
+                         ['Server', 'X-Frame-Options', 'Via'])
+        self.assertEqual(results.header_counts.tolist(), [2, 2, 1])
+        self.assertEqual(results.header_percentages.tolist(),
+                         [50.0, 50.0, 25.0])
+
+        # one bit per site in rank order, one column per header
+        bitmap = numpy.unpackbits(numpy.asarray(results.header_bitmap),
+                                  axis=0)[:len(results)]
+        self.assertEqual(bitmap.T.tolist(), [[1, 0, 1, 0],
+                                             [1, 1, 0, 0],
+                                             [0, 1, 0, 0]])
+
+    def test_csv_round_trip(self):
+        self.check_round_trip(FORMAT_CSV)
+
+    @unittest.skipIf(_pyarrow() is None, 'pyarrow is not installed')
+    def test_arrow_round_trip(self):
+        self.check_round_trip(FORMAT_ARROW)
+
+    @unittest.skipIf(_pyarrow() is None, 'pyarrow is not installed')
+    def test_parquet_round_trip(self):
+        self.check_round_trip(FORMAT_PARQUET)
+
+    def test_unknown_format(self):
+        stats = CorpusStats.from_sites(_sites())
+        self.assertRaises(ValueError, write_run, self.directory, stats,
+                          output_format='xml')
+
+    def test_default_run_ids_are_unique(self):
+        stats = CorpusStats.from_sites(_sites())
+        first = write_run(self.directory, stats, output_format=FORMAT_CSV)
+        second = write_run(self.directory, stats, output_format=FORMAT_CSV)
+        self.assertNotEqual(first, second)
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         [os.path.basename(first), os.path.basename(second)])
+
+    def test_existing_run_is_not_overwritten(self):
+        self.write(FORMAT_CSV, run_id='run-1')
+        stats = CorpusStats.from_sites(_sites()[:1])
+        self.assertRaises(ValueError, write_run, self.directory, stats,
+                          output_format=FORMAT_CSV, run_id='run-1')
+        self.assertEqual(len(RunResults(os.path.join(self.directory,
+                                                     'run-1'))), 4)
+
+    def test_empty_run(self):
+        results = self.write(FORMAT_CSV, sites=[make_site('failed.com')])
+        self.assertEqual(len(results), 1)
+        self.assertEqual(len(results.header_names), 0)
+
+    def test_run_meta_is_written_last(self):
+        results = self.write(FORMAT_CSV)
+        with open(os.path.join(self.directory, results.run_id,
+                               RUN_META_FILE)) as meta_file:
+            self.assertEqual(json.load(meta_file)['site_count'], 4)
+
+    def test_compare_runs(self):
+        run_a = self.write(FORMAT_CSV, run_id='a')
+        sites = _sites()[:3] + [
+            make_site('medium.com', {'alpha': 1, 'beta': 1, 'gamma': 1,
+                                     'delta': 1}, ['Via'])]
+        run_b = self.write(FORMAT_CSV, sites=sites, run_id='b')
+        diff = compare_runs(run_a, run_b)
+
+        self.assertEqual(diff['common_sites'], 4)
+        self.assertEqual(diff['only_in_a'], 0)
+        self.assertEqual(diff['average_word_count'], (1.5, 2.0))
+        self.assertEqual(diff['rank_changes'],
+                         [('large.com', 1, 2, 0), ('medium.com', 2, 1, 2)])
+        self.assertEqual(diff['header_changes'][0],
+                         ('X-Frame-Options', 50.0, 25.0))
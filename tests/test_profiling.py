@@ -0,0 +1,69 @@
+import glob
+import json
+import multiprocessing
+import os
+
+from objs.profiling import RunProfiler, profiled, DUMP_EVERY_TASKS
+from tests.helpers import TempDirTestCase
+
+
+def calculate_word_count(number):
+    return number * number
+
+
+class RunProfilerTest(TempDirTestCase):
+    def worker_files(self, extension):
+        return [path for path in glob.glob(os.path.join(self.directory,
+                                                        '*.' + extension))
+                if not os.path.basename(path).startswith('main-')]
+
+    def test_workers_dump_when_they_exit(self):
+        profiler = RunProfiler(profile_dir=self.directory)
+        try:
+            pool = multiprocessing.Pool(processes=2)
+            task = profiled(calculate_word_count)
+            self.assertEqual(pool.map(task, range(10), chunksize=1),
+                             [number * number for number in range(10)])
+            # fewer tasks than DUMP_EVERY_TASKS, nothing written yet
+            self.assertEqual(self.worker_files('prof'), [])
+            pool.close()
+            pool.join()
+            workers = len(self.worker_files('prof'))
+            self.assertGreaterEqual(workers, 1)
+            self.assertEqual(len(self.worker_files('memory')), workers)
+        finally:
+            report = profiler.finish()
+        self.assertIn('Merged profile of %d processes' % (workers + 1),
+                      report)
+        self.assertIn('calculate_word_count', report.split(
+            'Peak memory of a single worker task')[1])
+
+    def test_workers_dump_every_few_tasks(self):
+        profiler = RunProfiler(profile_dir=self.directory)
+        try:
+            pool = multiprocessing.Pool(processes=1)
+            pool.map(profiled(calculate_word_count),
+                     range(DUMP_EVERY_TASKS), chunksize=1)
+            # a terminated pool still leaves the stats dumped so far
+            pool.terminate()
+            pool.join()
+            self.assertEqual(len(self.worker_files('prof')), 1)
+        finally:
+            profiler.finish()
+
+    def test_sample_report_merges_processes(self):
+        profiler = RunProfiler(profile_dir=self.directory, mode='sample')
+        for pid, count in ((1, 3), (2, 5)):
+            with open(os.path.join(self.directory, '%d.samples' % pid),
+                      'w') as samples_file:
+                json.dump({'self': {'a.py:1(work)': count},
+                           'total': {'a.py:1(work)': count}}, samples_file)
+        report = profiler.finish()
+        self.assertIn('Merged samples of 3 processes', report)
+        self.assertIn('       8  a.py:1(work)', report)
+
+    def test_profiling_is_off_by_default(self):
+        self.assertIs(profiled(calculate_word_count), calculate_word_count)
+
+    def test_unknown_mode(self):
+        self.assertRaises(ValueError, RunProfiler, self.directory, 'trace')
@@ -0,0 +1,148 @@
+import json
+import os
+import threading
+
+try:
+    from urllib2 import urlopen, Request, HTTPError
+except ImportError:
+    from urllib.request import urlopen, Request
+    from urllib.error import HTTPError
+
+from objs.output import write_run, FORMAT_CSV
+from objs.results_service import ResultsIndex, ResultsService, \
+    ResultsServer, latest_run
+from objs.stats import CorpusStats
+from tests.helpers import TempDirTestCase, make_site
+
+
+def _sites():
+    return [make_site('small.com', {'alpha': 1}, ['Server']),
+            make_site('large.com', {'alpha': 2, 'beta': 1, 'gamma': 1},
+                      ['Server', 'X-Frame-Options']),
+            make_site('failed.com', fetch_error='Timeout'),
+            make_site('medium.com', {'alpha': 1, 'beta': 1},
+                      ['X-Frame-Options', 'Via'])]
+
+
+class ResultsTestCase(TempDirTestCase):
+    def write(self, run_id, sites=None):
+        return write_run(self.directory,
+                         CorpusStats.from_sites(sites or _sites()),
+                         output_format=FORMAT_CSV, run_id=run_id)
+
+
+class ResultsIndexTest(ResultsTestCase):
+    def setUp(self):
+        ResultsTestCase.setUp(self)
+        self.index = ResultsIndex(self.write('run-1'))
+
+    def test_rankings(self):
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual([site['url'] for site in self.index.ranking()],
+                         ['large.com', 'medium.com', 'small.com',
+                          'failed.com'])
+        self.assertEqual([site['url'] for site in self.index.ranking(
+            offset=1, limit=2, metric='content_size')],
+            ['medium.com', 'small.com'])
+        self.assertEqual(self.index.ranking(offset=10), [])
+
+    def test_percentiles_skip_missing_values(self):
+        self.assertEqual(self.index.percentile('distinct_words', 0), 0)
+        self.assertEqual(self.index.percentile('distinct_words', 100), 3)
+        self.assertAlmostEqual(self.index.percentile('fetch_time', 50), 0.1)
+
+    def test_headers(self):
+        self.assertEqual(self.index.headers(top=1), [{
+            'header': 'Server', 'site_count': 2, 'percentage': 50.0}])
+        self.assertEqual(self.index.sites_with_header('x-frame-options'),
+                         ['large.com', 'medium.com'])
+        self.assertIsNone(self.index.sites_with_header('Missing'))
+
+    def test_site(self):
+        site = self.index.site('failed.com')
+        self.assertEqual((site['rank'], site['distinct_words'],
+                          site['fetch_time'], site['headers']),
+                         (4, 0, None, []))
+        self.assertEqual(self.index.site('medium.com')['headers'],
+                         ['X-Frame-Options', 'Via'])
+        self.assertIsNone(self.index.site('missing.com'))
+
+
+class ResultsServiceTest(ResultsTestCase):
+    def test_serves_the_newest_run(self):
+        self.assertIsNone(latest_run(self.directory))
+        service = ResultsService(output_dir=self.directory)
+        self.assertIsNone(service.index)
+
+        self.write('20240101T000000.000000')
+        # a run still being written has no run.json yet
+        os.makedirs(os.path.join(self.directory, '20240102T000000.000000'))
+        self.assertTrue(service.reload())
+        self.assertEqual(service.index.run_id, '20240101T000000.000000')
+        self.assertFalse(service.reload())
+
+        self.write('20240103T000000.000000', _sites()[:2])
+        self.assertTrue(service.reload())
+        self.assertEqual(len(service.index), 2)
+
+    def test_run_path_stays_in_the_output_directory(self):
+        self.write('run-1')
+        service = ResultsService(output_dir=self.directory)
+        self.assertEqual(service.run_path('run-1'),
+                         os.path.realpath(os.path.join(self.directory,
+                                                       'run-1')))
+        self.assertIsNone(service.run_path('run-2'))
+        self.assertRaises(ValueError, service.run_path, '../run-1')
+        self.assertRaises(ValueError, ResultsService(
+            run_dir=os.path.join(self.directory, 'run-1')).run_path, 'run-1')
+
+
+class ResultsServerTest(ResultsTestCase):
+    def setUp(self):
+        ResultsTestCase.setUp(self)
+        self.write('run-1')
+        self.write('run-2', _sites()[:2])
+        self.server = ResultsServer(ResultsService(
+            run_dir=os.path.join(self.directory, 'run-1'),
+            output_dir=self.directory), address=('127.0.0.1', 0))
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        ResultsTestCase.tearDown(self)
+
+    def request(self, path, method='GET'):
+        url = 'http://127.0.0.1:%d%s' % (self.server.server_address[1], path)
+        request = Request(url, data=b'' if method == 'POST' else None)
+        try:
+            response = urlopen(request)
+        except HTTPError as e:
+            response = e
+        return response.getcode(), json.loads(response.read().decode('utf-8'))
+
+    def test_queries(self):
+        status, body = self.request('/ranking?limit=1')
+        self.assertEqual(status, 200)
+        self.assertEqual(body['sites'][0]['url'], 'large.com')
+        self.assertEqual(self.request('/headers/Via')[1]['sites'],
+                         ['medium.com'])
+        self.assertEqual(self.request('/site?url=small.com')[1]['rank'], 3)
+        self.assertEqual(self.request('/percentile?metric=total_words&p=100')
+                         [1]['value'], 4)
+
+    def test_errors(self):
+        self.assertEqual(self.request('/ranking?metric=size')[0], 400)
+        self.assertEqual(self.request('/ranking?limit=-1')[0], 400)
+        self.assertEqual(self.request('/site?url=missing.com')[0], 404)
+        self.assertEqual(self.request('/missing')[0], 404)
+        self.assertEqual(self.request('/run', method='POST')[0], 405)
+        self.assertEqual(self.request('/reload?run=../x', 'POST')[0], 400)
+
+    def test_reload(self):
+        self.assertEqual(self.request('/reload?run=run-2', 'POST'),
+                         (200, {'run_id': 'run-2', 'changed': True}))
+        self.assertEqual(len(self.request('/ranking')[1]['sites']), 2)
+        self.assertEqual(self.request('/reload?run=run-3', 'POST')[0], 404)
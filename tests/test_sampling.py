@@ -0,0 +1,83 @@
+from __future__ import division
+
+import unittest
+
+from objs.sampling import StratifiedSample
+from objs.top_sites import SiteEntry
+from tests.helpers import make_site
+
+ENTRIES = [SiteEntry('site%d.com' % rank, rank, None, None)
+           for rank in range(1, 101)]
+
+
+def _words(url):
+    # higher ranked sites have more words so the strata differ
+    return 200 - int(url[4:-4]) + int(url[4:-4]) % 7
+
+
+def _analyze(sample, urls, headers=lambda url: ['Server']):
+    for url in urls:
+        sample.add(make_site(url, dict(('w%d' % number, 1) for number
+                                       in range(_words(url))), headers(url)))
+
+
+class StratifiedSampleTest(unittest.TestCase):
+    def test_grows_every_stratum(self):
+        sample = StratifiedSample(ENTRIES, strata=4, seed=1)
+        first = sample.grow(0.1)
+        # 3 of every 25 sites, the fraction is rounded up
+        self.assertEqual(len(first), 12)
+        for bucket in range(4):
+            self.assertEqual(len([url for url in first
+                                  if bucket * 25 < int(url[4:-4]) <=
+                                  (bucket + 1) * 25]), 3)
+        second = sample.grow(0.2)
+        self.assertEqual(len(second), 8)
+        self.assertFalse(set(first) & set(second))
+        self.assertEqual(sample.sampled, 20)
+        self.assertEqual(sample.grow(0.2), [])
+
+    def test_same_seed_same_sample(self):
+        self.assertEqual(StratifiedSample(ENTRIES, seed=3).grow(0.1),
+                         StratifiedSample(ENTRIES, seed=3).grow(0.1))
+
+    def test_at_least_two_sites_per_stratum(self):
+        sample = StratifiedSample(ENTRIES, strata=10, seed=1)
+        self.assertEqual(len(sample.grow(0.01)), 20)
+
+    def test_interval_shrinks_to_zero_on_full_coverage(self):
+        sample = StratifiedSample(ENTRIES, strata=4, seed=1)
+        _analyze(sample, sample.grow(0.2))
+        mean, half_width = sample.mean()
+        self.assertGreater(half_width, 0)
+        self.assertFalse(sample.precision_met(0.0001))
+
+        _analyze(sample, sample.grow(1.0))
+        mean, half_width = sample.mean()
+        self.assertEqual(sample.analyzed, 100)
+        self.assertAlmostEqual(mean, sum(_words(entry.url)
+                                         for entry in ENTRIES) / 100)
+        self.assertEqual(half_width, 0.0)
+        self.assertTrue(sample.precision_met(0.0001))
+
+    def test_estimate_is_weighted_by_stratum_size(self):
+        # a 1 site stratum and a 3 site one, sampled in full
+        entries = ENTRIES[:4]
+        sample = StratifiedSample(entries, strata=2, seed=1)
+        _analyze(sample, sample.grow(1.0))
+        mean, _ = sample.mean()
+        self.assertAlmostEqual(mean, sum(_words(entry.url)
+                                         for entry in entries) / 4)
+
+    def test_header_percentages(self):
+        sample = StratifiedSample(ENTRIES, strata=2, seed=1)
+        # every site in the first half returns Via, none in the second
+        _analyze(sample, sample.grow(1.0), lambda url: (
+            ['Server', 'Via'] if int(url[4:-4]) <= 50 else ['Server']))
+        self.assertEqual(sample.header_percentages(),
+                         [('Server', 100.0, 0.0), ('Via', 50.0, 0.0)])
+
+    def test_sites_outside_the_sample_are_ignored(self):
+        sample = StratifiedSample(ENTRIES, seed=1)
+        _analyze(sample, ['site1000.com'])
+        self.assertEqual(sample.analyzed, 0)
@@ -0,0 +1,90 @@
+import math
+import unittest
+
+from objs.scheduler import prioritize, Deadline, BudgetReport
+from objs.top_sites import SiteEntry
+from tests.helpers import make_site
+
+ENTRIES = [SiteEntry('a.com', 1, 50.0, 10.0),
+           SiteEntry('b.com', 2, 30.0, 60.0),
+           SiteEntry('c.com', None, 15.0, None),
+           SiteEntry('d.com', 3, 5.0, 30.0)]
+
+
+def _expired():
+    deadline = Deadline(0)
+    deadline.check()
+    return deadline
+
+
+class PrioritizeTest(unittest.TestCase):
+    def urls(self, key):
+        return [entry.url for entry in prioritize(ENTRIES, key)]
+
+    def test_keys(self):
+        self.assertEqual(self.urls('rank'),
+                         ['a.com', 'b.com', 'd.com', 'c.com'])
+        self.assertEqual(self.urls('reach'),
+                         ['a.com', 'b.com', 'c.com', 'd.com'])
+        self.assertEqual(self.urls('page-views'),
+                         ['b.com', 'd.com', 'a.com', 'c.com'])
+        self.assertEqual(self.urls(lambda entry: entry.url[::-1]),
+                         ['a.com', 'b.com', 'c.com', 'd.com'])
+
+    def test_unknown_key(self):
+        self.assertRaises(ValueError, prioritize, ENTRIES, 'size')
+
+
+class DeadlineTest(unittest.TestCase):
+    def test_no_budget(self):
+        deadline = Deadline()
+        self.assertIsNone(deadline.remaining())
+        self.assertFalse(deadline.check())
+
+    def test_budget_runs_out(self):
+        self.assertGreater(Deadline(60).remaining(), 59)
+        self.assertFalse(Deadline(60).check())
+        deadline = _expired()
+        self.assertEqual(deadline.remaining(), 0.0)
+        self.assertTrue(deadline.expired)
+
+
+class BudgetReportTest(unittest.TestCase):
+    def report(self, deadline, counts):
+        report = BudgetReport(ENTRIES, deadline)
+        for url, words in counts:
+            report.add(make_site(url, dict(('w%d' % number, 1)
+                                           for number in range(words))))
+        return report
+
+    def test_partial_run(self):
+        labels = self.report(_expired(), [('a.com', 10), ('b.com', 20),
+                                          ('d.com', 30)]).labels()
+        self.assertFalse(labels['complete'])
+        self.assertEqual(labels['analyzed_sites'], 3)
+        self.assertEqual(labels['site_coverage'], 0.75)
+        # c.com is the first scheduled site that wasn't analyzed
+        self.assertEqual(labels['priority_prefix'], 2)
+        self.assertEqual(labels['rank_range'], [1, 3])
+        self.assertEqual(labels['reach_coverage'], 0.85)
+        self.assertEqual(labels['page_views_coverage'], 1.0)
+
+        low, high = labels['word_count_interval']
+        self.assertAlmostEqual((low + high) / 2, 20.0)
+        # narrowed by the share of the sites left out
+        margin = 1.96 * math.sqrt(100.0 / 3) * math.sqrt(1.0 / 3)
+        self.assertAlmostEqual(high - 20.0, margin)
+
+    def test_interval_closes_when_every_site_is_analyzed(self):
+        labels = self.report(_expired(), [('a.com', 10), ('b.com', 20),
+                                          ('c.com', 25),
+                                          ('d.com', 30)]).labels()
+        low, high = labels['word_count_interval']
+        self.assertAlmostEqual(low, high)
+
+    def test_complete_run(self):
+        labels = self.report(Deadline(60), [('a.com', 10)]).labels()
+        self.assertTrue(labels['complete'])
+        self.assertEqual(labels['time_budget'], 60)
+        # a single site has no interval
+        self.assertIsNone(labels['word_count_interval'])
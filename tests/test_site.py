@@ -0,0 +1,42 @@
+import pickle
+import unittest
+
+from objs.site import Website
+
+PAGE = ('<html><head><title>Example</title></head><body><p>%s</p>'
+        '</body></html>' % ' '.join('word%d' % (i % 40) for i in range(400)))
+
+
+class WebsiteContentTest(unittest.TestCase):
+    def assertOnlyCompressed(self, site):
+        for name, value in vars(site).items():
+            self.assertNotEqual(value, PAGE, '%s holds the page text' % name)
+        self.assertIsNotNone(site._content_blob)
+        self.assertLess(site.stored_content_size, len(PAGE))
+
+    def test_stored_site_holds_only_the_blob(self):
+        site = Website('a.com', content=PAGE)
+        self.assertOnlyCompressed(site)
+        self.assertEqual(site.content, PAGE)
+        self.assertEqual(site.name, 'Example')
+        self.assertEqual(len(site.word_list), 400)
+
+    def test_pickled_site_holds_only_the_blob(self):
+        site = pickle.loads(pickle.dumps(Website('a.com', content=PAGE)))
+        self.assertOnlyCompressed(site)
+        self.assertEqual(site.content, PAGE)
+
+    def test_fingerprint_from_the_stored_content(self):
+        site = Website('a.com', content=PAGE)
+        site.calculate_fingerprint()
+        fingerprint = site.fingerprint
+        site.calculate_fingerprint(content=PAGE)
+        self.assertEqual(site.fingerprint, fingerprint)
+
+    def test_release_content(self):
+        site = Website('a.com', content=PAGE)
+        site.calculate_word_count()
+        site.release_content()
+        self.assertIsNone(site.content)
+        self.assertEqual(site.word_list, [])
+        self.assertEqual(site.word_count_size, 40)
@@ -0,0 +1,203 @@
+from __future__ import division
+
+import json
+import random
+import unittest
+
+from objs.sketch import HyperLogLog, CountMinSketch, TopItems, \
+    BloomFilter, WordSketch, SketchMapper, CorpusSketch, \
+    sketch_reduce_function
+from tests.helpers import make_site
+
+
+def _words(count, vocabulary, seed=1):
+    generator = random.Random(seed)
+    # a skewed vocabulary so the top terms stand out
+    return ['word%d' % (int(generator.paretovariate(1.2)) % vocabulary)
+            for _ in range(count)]
+
+
+def _round_trip(sketch):
+    return type(sketch).from_record(json.loads(json.dumps(
+        sketch.to_record())))
+
+
+class HyperLogLogTest(unittest.TestCase):
+    def test_error_bound(self):
+        sketch = HyperLogLog(error_rate=0.02)
+        for number in range(20000):
+            sketch.add('item%d' % number)
+        self.assertLess(abs(sketch.count() - 20000) / 20000, 0.06)
+
+    def test_small_counts(self):
+        sketch = HyperLogLog()
+        self.assertEqual(sketch.count(), 0)
+        for item in ['a', 'b', 'c', 'a', 'b']:
+            sketch.add(item)
+        self.assertEqual(sketch.count(), 3)
+
+    def test_merge_is_union(self):
+        first, second, both = HyperLogLog(), HyperLogLog(), HyperLogLog()
+        for number in range(3000):
+            first.add('item%d' % number)
+            both.add('item%d' % number)
+        for number in range(2000, 5000):
+            second.add('item%d' % number)
+            both.add('item%d' % number)
+        self.assertEqual(first.merge(second).count(), both.count())
+
+    def test_record_round_trip(self):
+        sketch = HyperLogLog()
+        for number in range(1000):
+            sketch.add('item%d' % number)
+        self.assertEqual(_round_trip(sketch).count(), sketch.count())
+
+
+class CountMinSketchTest(unittest.TestCase):
+    def test_never_underestimates(self):
+        words = _words(20000, 5000)
+        sketch = CountMinSketch(epsilon=0.005, delta=0.01)
+        counts = {}
+        for word in words:
+            sketch.add(word)
+            counts[word] = counts.get(word, 0) + 1
+        self.assertEqual(sketch.total, len(words))
+        for word, count in counts.items():
+            estimate = sketch.estimate(word)
+            self.assertGreaterEqual(estimate, count)
+            self.assertLessEqual(estimate, count + 0.005 * len(words) * 4)
+
+    def test_merge_adds_counts(self):
+        first, second = CountMinSketch(), CountMinSketch()
+        first.add('a', 3)
+        second.add('a', 4)
+        second.add('b')
+        first.merge(second)
+        self.assertEqual(first.estimate('a'), 7)
+        self.assertEqual(first.total, 8)
+
+    def test_record_round_trip(self):
+        sketch = CountMinSketch()
+        for word in _words(2000, 500):
+            sketch.add(word)
+        restored = _round_trip(sketch)
+        self.assertEqual(restored.total, sketch.total)
+        for word in set(_words(2000, 500)):
+            self.assertEqual(restored.estimate(word), sketch.estimate(word))
+
+
+class TopItemsTest(unittest.TestCase):
+    def test_finds_the_top_items(self):
+        words = _words(20000, 5000)
+        sketch = TopItems(top_k=5)
+        counts = {}
+        for word in words:
+            sketch.add(word)
+            counts[word] = counts.get(word, 0) + 1
+        expected = sorted(counts, key=lambda word: -counts[word])[:5]
+        self.assertEqual(set(word for word, _ in sketch.top(5)),
+                         set(expected))
+
+    def test_record_round_trip(self):
+        sketch = TopItems(top_k=10)
+        for word in _words(5000, 1000):
+            sketch.add(word)
+        restored = _round_trip(sketch)
+        self.assertEqual(restored.top(), sketch.top())
+        self.assertEqual(restored.total, sketch.total)
+        # the restored candidates still get evicted for heavier items
+        restored.add('heavy', 10000)
+        self.assertEqual(restored.top(1), [('heavy', 10000)])
+        self.assertEqual(len(restored.top()), 10)
+
+    def test_keeps_the_top_k_estimates(self):
+        sketch = TopItems(top_k=3)
+        for word, count in [('a', 5), ('b', 1), ('c', 3), ('a', 1),
+                            ('d', 2), ('b', 4), ('e', 1)]:
+            sketch.add(word, count)
+        self.assertEqual(sketch.top(), [('a', 6), ('b', 5), ('c', 3)])
+        self.assertLessEqual(len(sketch._heap), 4 * 3)
+
+
+class BloomFilterTest(unittest.TestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for number in range(1000):
+            bloom.add('item%d' % number)
+        for number in range(1000):
+            self.assertIn('item%d' % number, bloom)
+        false_positives = sum(1 for number in range(1000, 11000)
+                              if 'item%d' % number in bloom)
+        self.assertLess(false_positives / 10000, 0.03)
+
+
+class WordSketchTest(unittest.TestCase):
+    def test_mapper_and_reduce(self):
+        words = _words(6000, 2000)
+        mapper = SketchMapper()
+        merged = sketch_reduce_function(
+            [mapper(words[start:start + 2000])
+             for start in range(0, len(words), 2000)])
+        whole = mapper(words)
+        self.assertEqual(merged.total, len(words))
+        self.assertEqual(merged.distinct_count, whole.distinct_count)
+        # ties can come out in another order
+        self.assertEqual(dict(merged.terms.top(5)), dict(whole.terms.top(5)))
+
+    def test_record_round_trip(self):
+        sketch = SketchMapper(top_k=10)(_words(3000, 800))
+        restored = _round_trip(sketch)
+        self.assertEqual(restored.distinct_count, sketch.distinct_count)
+        self.assertEqual(restored.total, sketch.total)
+        self.assertEqual(restored.terms.top(), sketch.terms.top())
+        # the restored sketch keeps merging with the same bounds
+        restored.merge(SketchMapper(top_k=10)(['extra']))
+        self.assertEqual(restored.total, sketch.total + 1)
+
+    def test_site_record_keeps_the_sketch(self):
+        site = make_site('a.com', headers=['Server'])
+        site._words = ['alpha', 'beta', 'alpha']
+        site.calculate_word_sketch(SketchMapper())
+        site.release_content()
+        record = json.loads(json.dumps(site.to_record()))
+        self.assertEqual(record['distinct_words'], 2)
+        self.assertEqual(record['total_words'], 3)
+
+        restored = type(site).from_record(record)
+        self.assertEqual(restored.word_count_size, 2)
+        self.assertEqual(restored.total_word_count, 3)
+        self.assertEqual(restored.word_sketch.terms.top(1), [('alpha', 2)])
+
+        del record['word_sketch']
+        summary = type(site).from_record(record)
+        self.assertIsNone(summary.word_sketch)
+        self.assertEqual(summary.word_count_size, 2)
+        self.assertEqual(summary.total_word_count, 3)
+
+    def test_release_keeps_the_estimates(self):
+        site = make_site('a.com')
+        site._words = ['alpha', 'beta', 'alpha']
+        site.calculate_word_sketch(SketchMapper())
+        site.release_content()
+        site.release_word_sketch()
+        self.assertIsNone(site.word_sketch)
+        self.assertEqual(site.word_count_size, 2)
+        self.assertEqual(site.total_word_count, 3)
+        self.assertEqual(site.to_record()['distinct_words'], 2)
+
+
+class CorpusSketchTest(unittest.TestCase):
+    def test_sketched_and_counted_sites(self):
+        mapper = SketchMapper()
+        corpus = CorpusSketch(mapper)
+        sketched = make_site('a.com', headers=['Server', 'Via'])
+        sketched._words = ['alpha', 'beta', 'alpha']
+        sketched.calculate_word_sketch(mapper)
+        corpus.add(sketched)
+        corpus.add(make_site('b.com', {'alpha': 1, 'gamma': 2}, ['Server']))
+
+        self.assertEqual(corpus.words.distinct_count, 3)
+        self.assertEqual(corpus.words.total, 6)
+        self.assertEqual(corpus.words.terms.top(1), [('alpha', 3)])
+        self.assertEqual(corpus.top_headers(),
+                         [('Server', 100.0), ('Via', 50.0)])
@@ -0,0 +1,104 @@
+import os
+import time
+
+from objs.snapshots import SnapshotStore, SNAPSHOT_MAGIC
+from objs.top_sites import SiteEntry
+from tests.helpers import TempDirTestCase
+
+ENTRIES = [SiteEntry('a.com', 1, 120.5, 300.25),
+           SiteEntry('b.com', None, None, None),
+           SiteEntry(u'caf\xe9.com', 3, 0.0, None)]
+PARAMS = {'count': 3, 'start': 1, 'country': 'us'}
+
+
+class SnapshotStoreTest(TempDirTestCase):
+    def setUp(self):
+        super(SnapshotStoreTest, self).setUp()
+        self.store = SnapshotStore(os.path.join(self.directory, 'snapshots'))
+        self.source = os.path.join(self.directory, 'sites.csv')
+        self.write_source(b'1,a.com\n2,b.com\n3,caf\xc3\xa9.com\n')
+
+    def write_source(self, data):
+        with open(self.source, 'wb') as source_file:
+            source_file.write(data)
+
+    def test_round_trip(self):
+        self.store.save(PARAMS, ENTRIES)
+        snapshot = self.store.load(PARAMS)
+        self.assertEqual(len(snapshot), 3)
+        self.assertEqual(list(snapshot.entries()), ENTRIES)
+        self.assertEqual(list(snapshot.urls()),
+                         [entry.url for entry in ENTRIES])
+
+    def test_file_layout(self):
+        self.store.save(PARAMS, ENTRIES)
+        path = self.store.path(SnapshotStore.key(**PARAMS))
+        with open(path, 'rb') as snapshot_file:
+            self.assertTrue(snapshot_file.read().startswith(SNAPSHOT_MAGIC))
+        self.assertFalse(os.path.exists(path + '.tmp'))
+
+    def test_empty_list(self):
+        self.store.save(PARAMS, [])
+        self.assertEqual(list(self.store.load(PARAMS).entries()), [])
+
+    def test_key_ignores_param_order(self):
+        self.assertEqual(SnapshotStore.key(count=1, start=2),
+                         SnapshotStore.key(start=2, count=1))
+        self.assertNotEqual(SnapshotStore.key(count=1),
+                            SnapshotStore.key(count=2))
+
+    def test_missing_snapshot(self):
+        self.assertIsNone(self.store.load(PARAMS))
+
+    def test_corrupt_body(self):
+        self.store.save(PARAMS, ENTRIES)
+        path = self.store.path(SnapshotStore.key(**PARAMS))
+        with open(path, 'rb') as snapshot_file:
+            data = bytearray(snapshot_file.read())
+        data[-1] ^= 0xff
+        with open(path, 'wb') as snapshot_file:
+            snapshot_file.write(bytes(data))
+        self.assertIsNone(self.store.load(PARAMS))
+
+    def test_not_a_snapshot(self):
+        with open(self.store.path(SnapshotStore.key(**PARAMS)), 'wb') as \
+                snapshot_file:
+            snapshot_file.write(b'garbage')
+        self.assertIsNone(self.store.load(PARAMS))
+
+    def test_expired(self):
+        self.store.save(PARAMS, ENTRIES)
+        store = SnapshotStore(os.path.join(self.directory, 'snapshots'),
+                              ttl=0)
+        time.sleep(0.01)
+        self.assertIsNone(store.load(PARAMS))
+
+    def test_unchanged_source(self):
+        self.store.save(PARAMS, ENTRIES, source_path=self.source)
+        self.assertIsNotNone(self.store.load(PARAMS,
+                                             source_path=self.source))
+
+    def test_touched_source_is_still_current(self):
+        self.store.save(PARAMS, ENTRIES, source_path=self.source)
+        stat = os.stat(self.source)
+        os.utime(self.source, (stat.st_atime, stat.st_mtime + 60))
+        mtime = os.stat(self.source).st_mtime
+        snapshot = self.store.load(PARAMS, source_path=self.source)
+        self.assertIsNotNone(snapshot)
+        self.assertEqual(snapshot.header['source']['mtime'], mtime)
+        # the new mtime was saved so the file isn't hashed again
+        reloaded = self.store.load(PARAMS)
+        self.assertEqual(reloaded.header['source']['mtime'], mtime)
+        self.assertEqual(list(reloaded.entries()), ENTRIES)
+
+    def test_changed_source(self):
+        self.store.save(PARAMS, ENTRIES, source_path=self.source)
+        stat = os.stat(self.source)
+        # same size, different content
+        self.write_source(b'1,x.com\n2,y.com\n3,caf\xc3\xa9.com\n')
+        os.utime(self.source, (stat.st_atime, stat.st_mtime + 60))
+        self.assertIsNone(self.store.load(PARAMS, source_path=self.source))
+
+    def test_snapshot_without_source(self):
+        self.store.save(PARAMS, ENTRIES)
+        self.assertIsNone(self.store.load(PARAMS, source_path=self.source))
@@ -0,0 +1,57 @@
+import os
+
+from objs.sources import RankFileSource
+from tests.helpers import TempDirTestCase
+
+
+class RankFileSourceTest(TempDirTestCase):
+    def source(self, text, **kwargs):
+        path = os.path.join(self.directory, 'ranks.csv')
+        with open(path, 'wb') as rank_file:
+            rank_file.write(text.encode('utf-8'))
+        return RankFileSource(path, **kwargs)
+
+    def ranked(self, count=1000):
+        return 'rank,domain\n' + ''.join('%d,site%d.com\n' % (rank, rank)
+                                         for rank in range(1, count + 1))
+
+    def test_ranked_list(self):
+        entries = list(self.source(self.ranked(3)).entries())
+        self.assertEqual([(entry.url, entry.rank) for entry in entries],
+                         [('site1.com', 1), ('site2.com', 2),
+                          ('site3.com', 3)])
+        self.assertIsNone(entries[0].reach)
+
+    def test_rank_range(self):
+        source = self.source(self.ranked(), start_rank=500, end_rank=503)
+        self.assertEqual(list(source.urls()),
+                         ['site%d.com' % rank for rank in range(500, 504)])
+        self.assertEqual(list(self.source(self.ranked(),
+                                          start_rank=999).urls()),
+                         ['site999.com', 'site1000.com'])
+        self.assertEqual(list(self.source(self.ranked(),
+                                          start_rank=2000).urls()), [])
+
+    def test_range_with_blank_lines(self):
+        text = '1,a.com\n\n2,b.com\n\n\n3,c.com\n4,d.com\n'
+        self.assertEqual(list(self.source(text, start_rank=3).urls()),
+                         ['c.com', 'd.com'])
+
+    def test_plain_list_ranks_by_line(self):
+        source = self.source('domain\na.com\n\nb.com\nc.com:8080\n',
+                             start_rank=2)
+        self.assertEqual([(entry.url, entry.rank)
+                          for entry in source.entries()],
+                         [('b.com', 2), ('c.com:8080', 3)])
+
+    def test_plain_list_without_header(self):
+        self.assertEqual(list(self.source('a.com\nb.com').urls()),
+                         ['a.com', 'b.com'])
+
+    def test_delimiter(self):
+        source = self.source('1\ta.com\n2\tb.com\n', delimiter='\t')
+        self.assertEqual(list(source.urls()), ['a.com', 'b.com'])
+
+    def test_empty_lists(self):
+        self.assertEqual(list(self.source('').entries()), [])
+        self.assertEqual(list(self.source('rank,domain\n\n').entries()), [])
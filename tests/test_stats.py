@@ -0,0 +1,83 @@
+import unittest
+
+import numpy
+
+from objs.stats import CorpusStats, METRICS
+from tests.helpers import make_site
+
+
+def _sites():
+    # ten sites so the header bitmap takes more than one byte per header
+    sites = []
+    for number in range(10):
+        headers = ['Server']
+        if number % 3 == 0:
+            headers.append('Via')
+        if number == 9:
+            headers.append('X-Cache')
+        sites.append(make_site('site%d.com' % number,
+                               {'alpha': number + 1, 'beta': 1}, headers,
+                               fetch_time=number / 10.0))
+    sites.append(make_site('failed.com', fetch_error='Timeout'))
+    return sites
+
+
+class CorpusStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.sites = _sites()
+        self.stats = CorpusStats.from_sites(self.sites)
+
+    def test_metrics(self):
+        self.assertEqual(len(self.stats), 11)
+        self.assertEqual(self.stats.urls, [site.url for site in self.sites])
+        self.assertEqual(list(self.stats.metric('total_words')),
+                         list(range(2, 12)) + [0])
+        self.assertEqual(self.stats.mean('total_words'),
+                         sum(range(2, 12)) / 11.0)
+        self.assertEqual(self.stats.median('distinct_words'), 2.0)
+        # the failed site has no fetch time
+        self.assertTrue(numpy.isnan(self.stats.metric('fetch_time')[-1]))
+        self.assertAlmostEqual(self.stats.mean('fetch_time'), 0.45)
+        summary = self.stats.summary('fetch_time')
+        self.assertEqual(summary['count'], 10)
+        self.assertAlmostEqual(summary['max'], 0.9)
+        self.assertEqual([name for name, _ in self.stats.summaries()],
+                         list(METRICS))
+
+    def test_percentiles_and_histogram(self):
+        percentiles = dict(self.stats.percentiles('total_words', (50, 100)))
+        self.assertEqual(percentiles, {50: 6.0, 100: 11.0})
+        counts, edges = self.stats.histogram('total_words', bins=2)
+        self.assertEqual(list(counts), [5, 6])
+        self.assertEqual(list(edges), [0.0, 5.5, 11.0])
+
+    def test_header_percentages(self):
+        self.assertEqual(self.stats.header_names,
+                         ['Server', 'Via', 'X-Cache'])
+        self.assertEqual(list(self.stats.header_counts()), [10, 4, 1])
+        percentages = self.stats.header_percentages()
+        self.assertEqual([header for header, _ in percentages],
+                         ['Server', 'Via', 'X-Cache'])
+        self.assertAlmostEqual(percentages[1][1], 400 / 11.0)
+        self.assertEqual(self.stats.top_headers(1), percentages[:1])
+
+    def test_header_bitmap(self):
+        self.assertEqual(self.stats.header_bitmap().shape, (2, 3))
+        self.assertEqual(self.stats.sites_with_header('Via'),
+                         ['site0.com', 'site3.com', 'site6.com',
+                          'site9.com'])
+        self.assertEqual(self.stats.sites_with_header('Missing'), [])
+        # the last site first and only the X-Cache column
+        order = list(range(10, -1, -1))
+        bitmap = self.stats.header_bitmap(site_order=order,
+                                          header_order=[2])
+        self.assertEqual(bitmap.shape, (2, 1))
+        self.assertEqual(list(numpy.unpackbits(bitmap[:, 0])[:11]),
+                         [0, 1] + [0] * 9)
+
+    def test_empty(self):
+        stats = CorpusStats.from_sites([])
+        self.assertEqual(stats.mean('total_words'), 0.0)
+        self.assertEqual(stats.header_percentages(), [])
+        self.assertEqual(stats.summary('fetch_time'), {'count': 0})
+        self.assertEqual(stats.header_bitmap(header_order=[]).shape, (0, 0))
@@ -0,0 +1,138 @@
+import os
+import multiprocessing
+import threading
+import time
+import unittest
+
+from objs.streaming import PendingTasks, bounded_apply, TopRanking, \
+    ExternalRanking, StreamingReducer
+from tests.helpers import TempDirTestCase, make_site
+
+
+def _square(number):
+    if number == 3:
+        raise ValueError('three')
+    return number * number
+
+
+def _unpicklable(number):
+    if number == 2:
+        # a lock can't be sent back from the worker
+        return threading.Lock()
+    return number
+
+
+def _slow(number):
+    time.sleep(number)
+    return number
+
+
+class PoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pool = multiprocessing.Pool(processes=2)
+
+    def tearDown(self):
+        self.pool.terminate()
+        self.pool.join()
+
+
+class PendingTasksTest(PoolTestCase):
+    def test_results_and_failures(self):
+        tasks = PendingTasks(poll_interval=0.05)
+        for number in range(5):
+            tasks.submit(self.pool, _square, number, context=number)
+        results = dict(tasks.get(timeout=10) for _ in range(5))
+        self.assertEqual(results, {0: 0, 1: 1, 2: 4, 3: None, 4: 16})
+        self.assertEqual(len(tasks), 0)
+
+    def test_result_that_cannot_be_sent_back(self):
+        tasks = PendingTasks(poll_interval=0.05)
+        for number in range(4):
+            tasks.submit(self.pool, _unpicklable, number, context=number)
+        results = dict(tasks.get(timeout=10) for _ in range(4))
+        self.assertEqual(results, {0: 0, 1: 1, 2: None, 3: 3})
+
+    def test_timeout(self):
+        tasks = PendingTasks(poll_interval=0.05)
+        tasks.submit(self.pool, _slow, 5)
+        start = time.time()
+        self.assertRaises(Exception, tasks.get, 0.2)
+        self.assertLess(time.time() - start, 2)
+        self.assertEqual(len(tasks), 1)
+
+
+class BoundedApplyTest(PoolTestCase):
+    def test_every_item_gives_a_result(self):
+        results = list(bounded_apply(self.pool, _unpicklable, range(6),
+                                     max_in_flight=2))
+        self.assertEqual(sorted(results, key=str),
+                         sorted([0, 1, None, 3, 4, 5], key=str))
+
+    def test_reads_items_as_the_window_has_room(self):
+        read = []
+
+        def items():
+            for number in range(10):
+                read.append(number)
+                yield number
+
+        results = bounded_apply(self.pool, _square, items(), max_in_flight=3)
+        next(results)
+        self.assertLessEqual(len(read), 4)
+        self.assertEqual(len(list(results)), 9)
+
+
+RANKED = [('a.com', 5), ('b.com', 9), ('c.com', 5), ('d.com', 1),
+          ('e.com', 9), ('f.com', 7)]
+# most words first, ties in the order they were added
+EXPECTED = [('b.com', 9), ('e.com', 9), ('f.com', 7), ('a.com', 5),
+            ('c.com', 5), ('d.com', 1)]
+
+
+class RankingTest(TempDirTestCase):
+    def test_top_ranking(self):
+        ranking = TopRanking(3)
+        for url, size in RANKED:
+            ranking.add(size, url)
+        self.assertEqual(list(ranking), EXPECTED[:3])
+
+    def test_external_ranking_spills_and_merges(self):
+        ranking = ExternalRanking(chunk_size=2, tmp_dir=self.directory)
+        for url, size in RANKED + [('g.com', 3)]:
+            ranking.add(size, url)
+        self.assertEqual(len(os.listdir(self.directory)), 3)
+        self.assertEqual(list(ranking),
+                         EXPECTED[:5] + [('g.com', 3), ('d.com', 1)])
+        ranking.close()
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_external_ranking_matches_a_sort(self):
+        ranking = ExternalRanking(chunk_size=7, tmp_dir=self.directory)
+        sizes = [(number * 37) % 11 for number in range(100)]
+        for number, size in enumerate(sizes):
+            ranking.add(size, 'site%d' % number)
+        expected = sorted(enumerate(sizes), key=lambda x: (-x[1], x[0]))
+        self.assertEqual(list(ranking), [('site%d' % number, size)
+                                         for number, size in expected])
+        ranking.close()
+
+
+class StreamingReducerTest(unittest.TestCase):
+    def test_totals(self):
+        reducer = StreamingReducer(TopRanking(2))
+        reducer.add(make_site('a.com', {'alpha': 1, 'beta': 3}, ['Server']))
+        reducer.add(make_site('b.com', {'alpha': 2}, ['Server', 'Via']))
+        reducer.add(make_site('c.com', fetch_error='Timeout'))
+
+        self.assertEqual(len(reducer), 3)
+        self.assertEqual(reducer.mean('distinct_words'), 1.0)
+        summaries = dict(reducer.summaries())
+        self.assertEqual(summaries['total_words'],
+                         {'count': 3, 'mean': 2.0, 'min': 0, 'max': 4})
+        # failed sites have no fetch time
+        self.assertEqual(summaries['fetch_time']['count'], 2)
+        header, percent = reducer.top_headers()[0]
+        self.assertEqual(header, 'Server')
+        self.assertAlmostEqual(percent, 200.0 / 3)
+        self.assertEqual(list(reducer.ranking()), [('a.com', 2),
+                                                   ('b.com', 1)])
@@ -0,0 +1,106 @@
+import os
+import random
+import sys
+import unittest
+
+try:
+    from urllib2 import urlopen, Request
+except ImportError:
+    from urllib.request import urlopen, Request
+
+from objs import testserver
+from objs.dns_cache import StaticResolver
+from tests.helpers import TempDirTestCase
+
+STRESS_SCRIPT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'stress-test.py')
+
+
+def _load_stress_test():
+    """
+    Returns:
+        The stress-test.py script as a module, its name isn't importable.
+    """
+    if sys.version_info[0] < 3:
+        import imp
+        return imp.load_source('stress_test', STRESS_SCRIPT)
+    import importlib.util
+    spec = importlib.util.spec_from_file_location('stress_test',
+                                                  STRESS_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class LatencyTest(unittest.TestCase):
+    def test_means(self):
+        rng = random.Random(0)
+        for distribution in testserver.LATENCY_DISTRIBUTIONS:
+            samples = [testserver.sample_latency(rng, 0.2, distribution)
+                       for _ in range(20000)]
+            self.assertTrue(min(samples) >= 0)
+            self.assertAlmostEqual(sum(samples) / len(samples), 0.2,
+                                   delta=0.02)
+        uniform = [testserver.sample_latency(rng, 0.2)
+                   for _ in range(1000)]
+        self.assertTrue(0.1 <= min(uniform) and max(uniform) <= 0.3)
+
+
+class VirtualHostTest(TempDirTestCase):
+    def setUp(self):
+        super(VirtualHostTest, self).setUp()
+        self.server = testserver.TestServer(
+            min_words=20, max_words=40, extra_headers=4).start()
+
+    def tearDown(self):
+        self.server.stop()
+        super(VirtualHostTest, self).tearDown()
+
+    def fetch(self, url):
+        host, path = url.split('/', 1)
+        request = Request('http://%s/%s' % (self.server.host, path),
+                          headers={'Host': host})
+        response = urlopen(request, timeout=10)
+        return response.read(), dict(
+            (name.lower(), value) for name, value in response.info().items())
+
+    def test_pages_depend_on_the_host(self):
+        urls = self.server.virtual_host_urls(3)
+        self.assertEqual(urls[0], 'site0.stress.test:%d/' %
+                         self.server.server_address[1])
+        pages = [self.fetch(url) for url in urls]
+        self.assertEqual(pages[0], self.fetch(urls[0]))
+        self.assertEqual(len(set(body for body, _ in pages)), 3)
+        for _, headers in pages:
+            self.assertEqual(len(set(headers) - set(
+                ['content-type', 'content-length', 'server',
+                 'cache-control', 'date'])), 4)
+
+    def test_hosts_file(self):
+        urls = self.server.virtual_host_urls(2)
+        path = os.path.join(self.directory, 'hosts')
+        self.server.write_hosts_file(path, urls)
+        resolver = StaticResolver.from_file(path)
+        for host in ('site0.stress.test', 'SITE1.stress.test'):
+            self.assertEqual(resolver.resolve(host)[0], ['127.0.0.1'])
+        self.assertEqual(resolver.resolve('site2.stress.test')[0], [])
+
+
+class SiteListTest(TempDirTestCase):
+    def test_dead_hosts(self):
+        stress_test = _load_stress_test()
+        urls = ['site%d.stress.test:80/' % i for i in range(200)]
+        path = os.path.join(self.directory, 'sites.csv')
+        live = stress_test.write_site_list(path, urls, dead_hosts=2)
+        with open(path) as rank_file:
+            rows = [line.strip().split(',') for line in rank_file]
+        self.assertEqual([int(rank) for rank, _ in rows],
+                         list(range(1, 201)))
+        dead = [url for _, url in rows if url not in live]
+        # ranks 1, 100, 101 and 200 don't resolve
+        self.assertEqual(len(live), 196)
+        self.assertEqual(dead, ['site0-dead.stress.test:80/',
+                                'site99-dead.stress.test:80/',
+                                'site100-dead.stress.test:80/',
+                                'site199-dead.stress.test:80/'])
@@ -0,0 +1,101 @@
+import json
+import multiprocessing
+import os
+import unittest
+
+try:
+    from urllib2 import urlopen, HTTPError
+except ImportError:
+    from urllib.request import urlopen
+    from urllib.error import HTTPError
+
+from objs import telemetry
+from objs.telemetry import RunTelemetry, StatusReporter, STAGE_FETCH
+from tests.helpers import TempDirTestCase, make_site
+
+
+def _fetch(url):
+    if url.startswith('failed'):
+        return make_site(url, fetch_error='Timeout')
+    return make_site(url, {'alpha': 2})
+
+
+class RunTelemetryTest(unittest.TestCase):
+    def test_status(self):
+        run = RunTelemetry(slowest=1)
+        urls = list(run.track(['a.com', 'b.com', 'failed.com', 'c.com']))
+        self.assertEqual(len(urls), 4)
+        run.task_started(STAGE_FETCH, 'a.com', 1)
+        run.task_started(STAGE_FETCH, 'b.com', 2)
+        run.task_started(STAGE_FETCH, 'failed.com', 3)
+        run.task_finished(STAGE_FETCH, 'a.com', 1, 2, 100, False)
+        run.task_finished(STAGE_FETCH, 'failed.com', 3, 0, 0, True, True)
+        run.task_started('dedupe', 'a.com', 1)
+        run.task_finished('dedupe', 'a.com', 1, 2, 100, False)
+        run.site_completed()
+
+        status = run.status()
+        self.assertEqual(status['sites'], {
+            'listed': 4, 'queued': 1, 'in_flight': 1, 'completed': 1,
+            'failed': 1})
+        # later stages don't count the pages again
+        self.assertEqual((status['pages'], status['bytes']), (2, 100))
+        self.assertEqual(status['queues'], {'fetch': 1, 'results': 0})
+        self.assertEqual(status['stages'][STAGE_FETCH], {
+            'started': 3, 'finished': 2, 'failed': 1, 'dropped': 1,
+            'running': 1})
+        self.assertEqual(status['stages']['dedupe']['running'], 0)
+        self.assertEqual([task['url'] for task in status['slowest']],
+                         ['b.com'])
+        self.assertFalse(status['finished'])
+        run.finish()
+        self.assertTrue(run.status()['finished'])
+
+    def test_result_counts(self):
+        self.assertEqual(telemetry._result_counts(None), (0, 0, True))
+        self.assertEqual(telemetry._result_counts(
+            {'pages_crawled': 1, 'content_size': 10}), (1, 10, False))
+        site = make_site('a.com', {'alpha': 2})
+        self.assertEqual(telemetry._result_counts(site),
+                         (1, site.content_size, False))
+
+    def test_untracked_without_telemetry(self):
+        self.assertNotIn(telemetry.TELEMETRY_ENV, os.environ)
+        self.assertIs(telemetry.tracked(_fetch), _fetch)
+
+
+class StatusReporterTest(TempDirTestCase):
+    def test_pool_workers_report(self):
+        status_path = os.path.join(self.directory, 'status.json')
+        reporter = StatusReporter(status_file=status_path, status_port=0,
+                                  interval=0.05).start()
+        try:
+            urls = ['a.com', 'failed.com', 'b.com']
+            pool = multiprocessing.Pool(2)
+            try:
+                sites = pool.map(telemetry.tracked(_fetch),
+                                 reporter.telemetry.track(urls))
+            finally:
+                pool.close()
+                pool.join()
+            for _ in sites:
+                reporter.telemetry.site_completed()
+
+            address = '%s:%d' % reporter._http_server.server_address[:2]
+            status = json.loads(urlopen(
+                'http://%s/status' % address, timeout=10).read().decode())
+            self.assertEqual(status['sites'], {
+                'listed': 3, 'queued': 0, 'in_flight': 0, 'completed': 3,
+                'failed': 1})
+            self.assertEqual(status['pages'], 2)
+            with self.assertRaises(HTTPError) as raised:
+                urlopen('http://%s/other' % address, timeout=10)
+            self.assertEqual(raised.exception.code, 404)
+        finally:
+            reporter.stop()
+
+        self.assertNotIn(telemetry.TELEMETRY_ENV, os.environ)
+        with open(status_path) as status_file:
+            status = json.load(status_file)
+        self.assertTrue(status['finished'])
+        self.assertEqual(status['sites']['completed'], 3)
@@ -4,26 +4,41 @@
 from __future__ import division
 
 import argparse
-import cProfile
 import logging
 import os
-import pstats
 from datetime import datetime
-from functools import wraps
-import StringIO
+from functools import wraps, partial
 import multiprocessing
 import re
 
-# external
-import requests
+try:
+    from Queue import Empty
+except ImportError:
+    from queue import Empty
 
 # local imports
-from objs.site import Website, mapreduce, map_function, \
-    reduce_function, partition_data, MapReduceSite
+# heavier libraries (requests, numpy, pyarrow, cProfile) are imported where
+# they are used to keep startup and pool worker spawn cost low
+from objs.site import Website, MapReduceSite
 from objs.top_sites import AlexaTopSites
+from objs.sources import TopSitesSource, RankFileSource
+from objs.journal import SiteJournal, read_journal
+from objs.profiling import profiled, begin_stage, end_stage
+from objs.telemetry import tracked
+from objs.streaming import StreamingReducer, TopRanking, ExternalRanking, \
+    bounded_apply, PendingTasks
+from objs.cluster import run_coordinator, run_worker_node, parse_address, \
+    resolve_authkey, is_loopback, CLUSTER_KEY_ENV
 
 logger = logging.getLogger(__name__)
 
+# the Top Sites API request made when the list isn't loaded from a file
+TOP_SITES_REQUEST = {'count': 100, 'start': 1, 'country': 'us'}
+
+# formats objs.output writes, listed here so the argument parser doesn't
+# import numpy with it
+OUTPUT_FORMATS = ('arrow', 'csv', 'parquet')
+
 
 def timed(f):
     """
@@ -48,21 +63,27 @@ def timed(f):
 
 
 @timed
-def fill_site_data(url):
+def fill_site_data(url, header_values=False, crawler=None):
     """
     Makes a request to the URL and then runs a map reduce method to
     count the words on the site and the number of times they appear.
     Args:
         url: HTTP URL to call and run analysis on.
+        header_values (bool): Keep the header values of the response.
+        crawler (SiteCrawler): Also crawl the pages linked from the
+          homepage.
 
     Returns:
         Website containing calculated values as well as the content of the
         response to the URL.
         None if there was an error reading the site.
     """
+    import requests
+
     try:
         site = MapReduceSite(url=url)
-        site.request_homepage()
+        site.request_homepage(capture_header_values=header_values,
+                              crawler=crawler)
         # site.calculate_word_count()
         return site
     except requests.exceptions.ConnectionError as e:
@@ -73,20 +94,126 @@ def fill_site_data(url):
         return None
 
 @timed
-def find_average_word_count(sites):
+def stream_site_data(url, word_sketch=None, header_values=False,
+                     crawler=None, ngram_counter=None):
     """
-    Find the average of the total word count for all the sites read.
+    Makes a request to the URL and counts the words on the site inside the
+    worker process. The content and word list are dropped before the site
+    is sent back so only the analyzed values cross the process boundary.
+    Args:
+        url: HTTP URL to call and run analysis on.
+        word_sketch (SketchMapper): Sketch the words with this instead of
+          counting them exactly.
+        header_values (bool): Keep the header values of the response.
+        crawler (SiteCrawler): Also crawl the pages linked from the
+          homepage.
+        ngram_counter (NgramCounter): Also find the most frequent
+          phrases.
+
+    Returns:
+        Website with its word count calculated and content released.
+        None if there was an error reading the site.
+    """
+    try:
+        site = Website(url=url)
+        site.request_homepage(capture_header_values=header_values,
+                              crawler=crawler)
+        if word_sketch:
+            site.calculate_word_sketch(word_sketch)
+        else:
+            site.calculate_word_count()
+        if ngram_counter:
+            site.calculate_ngram_count(ngram_counter)
+        site.release_content()
+        return site
+    except:
+        logger.exception('Error connecting to site!')
+        return None
+
+
+@timed
+def fetch_site_fingerprint(url, header_values=False):
+    """
+    Makes a request to the URL and fingerprints the content without
+    parsing it, so near duplicate sites can be found before any of them
+    are analyzed.
+    Args:
+        url: HTTP URL to call.
+        header_values (bool): Keep the header values of the response.
+
+    Returns:
+        Website with its content and fingerprint.
+        None if there was an error reading the site.
+    """
+    try:
+        site = Website(url=url)
+        site.request_homepage(capture_header_values=header_values,
+                              parse=False, fingerprint=True)
+        return site
+    except:
+        logger.exception('Error connecting to site!')
+        return None
+
+
+@timed
+def analyze_site_content(site, word_sketch=None, ngram_counter=None):
+    """
+    Parses the content of a fetched site and counts its words.
+    Args:
+        site (Website): Site fetched by fetch_site_fingerprint.
+        word_sketch (SketchMapper): Sketch the words with this instead of
+          counting them exactly.
+        ngram_counter (NgramCounter): Also find the most frequent
+          phrases.
+
+    Returns:
+        Website with its word count calculated and content released.
+        None if the content could not be analyzed.
+    """
+    try:
+        # decompressed once, this task didn't fetch the site
+        content = site.content
+        if content:
+            site.parse_content(content=content)
+        if word_sketch:
+            site.calculate_word_sketch(word_sketch)
+        else:
+            site.calculate_word_count()
+        if ngram_counter:
+            site.calculate_ngram_count(ngram_counter)
+        site.release_content()
+        return site
+    except:
+        logger.exception('Error analyzing %s', site.url)
+        return None
+
+
+@timed
+def find_corpus_stats(sites):
+    """
+    Builds the vectorized per-site metrics used for the summary stats.
     Args:
         sites (list Website): List of all the websites analyzed.
 
     Returns:
-        (float): Average number of words per site.
+        (CorpusStats): Metric arrays and header bitmap for the sites.
     """
-    total = 0
-    for site in sites:
-        total += site.word_count_size
+    from objs.stats import CorpusStats
+
+    return CorpusStats.from_sites(sites)
+
+
+@timed
+def find_average_word_count(stats):
+    """
+    Find the average of the total word count for all the sites read.
+    Args:
+        stats (CorpusStats): Metrics for all the websites analyzed.
 
-    return total / len(sites)
+    Returns:
+        (float): Average number of words per site.
+    """
+    return stats.mean('distinct_words')
 
 
 @timed
@@ -123,48 +250,19 @@ def find_top_20_headers(sites):
 
 
 @timed
-def find_top_20_headers_map_reduce(sites, worker_count):
+def find_top_20_headers_vectorized(stats):
     """
     Find the top 20 headers returned from the website requests and the
-    percentage of sites that returned that header. This method uses a
-    map-reduce algorithm to count the headers.
+    percentage of sites that returned that header. This method counts
+    the header bitmap columns in bulk.
     Args:
-        sites (list Website): List of websites that have their word counts
-          analyzed.
-        worker_count (int): Number of sub processes to use to run map-reduce
-          header count.
+        stats (CorpusStats): Metrics for all the websites analyzed.
 
     Returns:
-        (dict): Dict where the key is the header and the value is the percentage
-        of sites that returned the header. Only returns the first 20 sorted by
-        their percentage value.
-
+        (list): (header, percentage) tuples for the first 20 headers sorted
+        by their percentage value.
     """
-    all_headers = []
-    for site in sites:
-        all_headers.extend(site.headers)
-    logging.debug('all headers: %s', all_headers)
-
-    header_count = mapreduce(
-        all_items=all_headers,
-        worker_count=worker_count,
-        partition_func=partition_data,
-        reduce_func=reduce_function,
-        map_func=map_function
-    )
-
-    logging.debug('header count: %s', header_count)
-
-    headers_with_percent = {}
-    for header in header_count:
-        logging.debug('Header: %s', header)
-        headers_with_percent[header] = (header_count[header] / len(
-            sites)) * 100.0
-
-    sorted_headers = sorted(headers_with_percent.items(), key=lambda x: x[1],
-                            reverse=True)
-    # logging.info('Headers with pct: %s', sorted_headers)
-    return sorted_headers[:20]
+    return stats.top_headers(20)
 
 
 def parse_s3_url(url):
@@ -199,52 +297,738 @@ def parse_s3_url(url):
     return None, None
 
 
+def site_list_params(local_file_location=None, s3_file_location=None):
+    """
+    Parameters of the request that loads the site list, which key its
+    snapshot.
+    Args:
+        local_file_location (str): Local top sites XML file.
+        s3_file_location (str): Top sites XML file in S3.
+    Returns:
+        (dict): The file for local and S3 files, otherwise the Top Sites
+        API parameters and today's date, so the API list is requested at
+        most once a day.
+    """
+    if local_file_location:
+        return {'source': 'file',
+                'path': os.path.abspath(local_file_location)}
+    if s3_file_location:
+        bucket, key = parse_s3_url(s3_file_location)
+        return {'source': 's3', 'bucket': bucket, 'key': key}
+    params = dict(TOP_SITES_REQUEST, source='api')
+    params['date'] = datetime.utcnow().strftime('%Y-%m-%d')
+    return params
+
+
+def _shutdown_pool(pool, deadline=None):
+    """
+    Waits for the pool workers to finish, unless the time budget ran out
+    and the tasks still in flight are abandoned.
+    """
+    if deadline is not None and deadline.expired:
+        pool.terminate()
+    else:
+        pool.close()
+    pool.join()
+
+
+def analyze_sites_in_pool(urls, worker_processes, word_sketch=None,
+                          header_values=False, deadline=None, map_workers=4,
+                          crawler=None, ngram_counter=None):
+    """
+    Fetches the sites with a local pool of processes and calculates their
+    word counts as the results come back.
+    Args:
+        urls (list str): URLs of the sites to analyze.
+        worker_processes (int): Number of sub processes fetching sites.
+        word_sketch (SketchMapper): Sketch the words with this instead of
+          counting them exactly.
+        header_values (bool): Keep the header values of the responses.
+        deadline (Deadline): Stop waiting for sites once it runs out. The
+          pool works through the URLs in the order they are given.
+        map_workers (int): Number of processes each site's words are
+          counted with.
+        crawler (SiteCrawler): Also crawl the pages linked from the
+          homepages.
+        ngram_counter (NgramCounter): Also find the most frequent
+          phrases.
+    Returns:
+        Generator of the analyzed Website objects.
+    """
+    pool = multiprocessing.Pool(processes=worker_processes)
+    fetch = profiled(tracked(partial(fill_site_data,
+                                     header_values=header_values,
+                                     crawler=crawler)))
+    results = [pool.apply_async(fetch, args=(url,)) for url in urls]
+
+    for result in results:
+        if deadline is None:
+            site = result.get()
+        else:
+            try:
+                if deadline.check():
+                    raise multiprocessing.TimeoutError()
+                site = result.get(timeout=deadline.remaining())
+            except multiprocessing.TimeoutError:
+                deadline.check()
+                # drop the sites that are still queued or being fetched
+                _shutdown_pool(pool, deadline)
+                return
+        # skip sites with no return result
+        if site is None:
+            continue
+
+        # do separate calculation here
+        site.workers = map_workers
+        if word_sketch:
+            site.calculate_word_sketch(word_sketch)
+        else:
+            site.calculate_word_count()
+        if ngram_counter:
+            site.calculate_ngram_count(ngram_counter)
+        yield site
+
+
+def analyze_sites_streaming(urls, worker_processes, max_in_flight,
+                            word_sketch=None, header_values=False,
+                            deadline=None, crawler=None, ngram_counter=None):
+    """
+    Fetches and counts the sites with a local pool of processes while only
+    keeping max_in_flight of them submitted at a time.
+    Args:
+        urls (list str): URLs of the sites to analyze.
+        worker_processes (int): Number of sub processes fetching sites.
+        max_in_flight (int): Most sites submitted to the pool at once.
+        word_sketch (SketchMapper): Sketch the words with this instead of
+          counting them exactly.
+        header_values (bool): Keep the header values of the responses.
+        deadline (Deadline): Stop submitting sites once it runs out.
+        crawler (SiteCrawler): Also crawl the pages linked from the
+          homepages.
+        ngram_counter (NgramCounter): Also find the most frequent
+          phrases.
+    Returns:
+        Generator of the analyzed Website objects in the order they finish.
+    """
+    pool = multiprocessing.Pool(processes=worker_processes)
+    try:
+        fetch = profiled(tracked(partial(stream_site_data,
+                                         word_sketch=word_sketch,
+                                         header_values=header_values,
+                                         crawler=crawler,
+                                         ngram_counter=ngram_counter)))
+        for site in bounded_apply(pool, fetch, urls, max_in_flight,
+                                  deadline=deadline):
+            # skip sites with no return result
+            if site is not None:
+                yield site
+    finally:
+        _shutdown_pool(pool, deadline)
+
+
+def analyze_sites_deduped(urls, worker_processes, max_in_flight,
+                          word_sketch=None, header_values=False,
+                          max_distance=3, deadline=None, ngram_counter=None):
+    """
+    Fetches and fingerprints the sites with a local pool of processes and
+    only parses and counts the words of one site out of each group of near
+    duplicates, like regional mirrors and parked domains. The other sites
+    in the group reuse its word counts.
+    Args:
+        urls (list str): URLs of the sites to analyze.
+        worker_processes (int): Number of sub processes fetching sites.
+        max_in_flight (int): Most fetch and analysis tasks submitted to the
+          pool at once.
+        word_sketch (SketchMapper): Sketch the words with this instead of
+          counting them exactly.
+        header_values (bool): Keep the header values of the responses.
+        max_distance (int): Most fingerprint bits two sites can differ by
+          and still be near duplicates.
+        deadline (Deadline): Stop submitting and waiting for sites once it
+          runs out.
+        ngram_counter (NgramCounter): Also find the most frequent
+          phrases.
+    Returns:
+        Generator of the analyzed Website objects in the order they finish.
+    """
+    from objs.dedupe import DuplicateGroups
+
+    fetch = profiled(tracked(partial(fetch_site_fingerprint,
+                                     header_values=header_values)))
+    analyze = profiled(tracked(partial(analyze_site_content,
+                                       word_sketch=word_sketch,
+                                       ngram_counter=ngram_counter),
+                               stage='analyze'))
+    groups = DuplicateGroups(max_distance=max_distance)
+
+    tasks = PendingTasks()
+    pending = iter(urls)
+
+    pool = multiprocessing.Pool(processes=worker_processes)
+    try:
+        while True:
+            if deadline is not None and deadline.check():
+                break
+            # only fetch more sites while there is room in the window
+            while len(tasks) < max_in_flight:
+                url = next(pending, None)
+                if url is None:
+                    break
+                tasks.submit(pool, fetch, url, ('fetched', url))
+            if not len(tasks):
+                break
+
+            try:
+                (stage, url), site = tasks.get(
+                    timeout=deadline.remaining() if deadline else None)
+            except Empty:
+                deadline.check()
+                break
+
+            if stage == 'fetched':
+                if site is None:
+                    continue
+                to_analyze, done = groups.fetched(site)
+            else:
+                to_analyze, done = groups.analyzed(url, site)
+            for site in to_analyze:
+                tasks.submit(pool, analyze, site, ('analyzed', site.url))
+            for site in done:
+                yield site
+    finally:
+        _shutdown_pool(pool, deadline)
+    logger.info('Reused the analysis of a near duplicate for %d sites',
+                groups.reused)
+
+
+def analyze_sample(sample, worker_processes, max_in_flight, fraction,
+                   precision=None, growth=2.0, deadline=None,
+                   host_health=None, dns_prefetcher=None,
+                   status_reporter=None):
+    """
+    Analyzes a stratified sample of the sites, growing it until the
+    average word count is estimated precisely enough.
+    Args:
+        sample (StratifiedSample): Sites split up by rank bucket.
+        worker_processes (int): Number of sub processes fetching sites.
+        max_in_flight (int): Most sites submitted to the pool at once.
+        fraction (float): Share of each rank bucket sampled first.
+        precision (float): Relative half width of the 95% interval of the
+          average word count to reach. The first sample is kept if None.
+        growth (float): How much the fraction grows each round.
+        deadline (Deadline): Stop sampling once it runs out.
+        host_health (HostHealth): Skip the hosts that keep failing and
+          record how the sampled hosts did.
+        dns_prefetcher (DnsPrefetcher): Resolve the sampled hosts ahead of
+          the fetchers.
+        status_reporter (StatusReporter): Show the progress of the
+          sampling.
+    """
+    while True:
+        urls = sample.grow(fraction)
+        logger.info('Sampling %d more sites (%.1f%% of each rank bucket)',
+                    len(urls), fraction * 100.0)
+        if host_health is not None:
+            urls = host_health.schedule(urls)
+        if dns_prefetcher is not None:
+            urls = dns_prefetcher.resolve_ahead(urls)
+        if status_reporter is not None:
+            urls = status_reporter.telemetry.track(urls)
+        for site in analyze_sites_streaming(urls, worker_processes,
+                                            max_in_flight,
+                                            deadline=deadline):
+            sample.add(site)
+            if host_health is not None:
+                host_health.record(site)
+            if status_reporter is not None:
+                status_reporter.telemetry.site_completed()
+
+        mean, half_width = sample.mean()
+        logger.info('Average word count after %d of %d sites: %.2f +/- %.2f',
+                    sample.analyzed, sample.population, mean, half_width)
+        if precision is None or sample.precision_met(precision):
+            break
+        if deadline is not None and deadline.check():
+            logger.warning('Time budget ran out before the precision was met')
+            break
+        fraction = min(1.0, fraction * growth)
+
+
+def report_sample_results(sample):
+    """
+    Logs the estimated average word count and top headers of a sampled run
+    with their 95% confidence intervals.
+    Args:
+        sample (StratifiedSample): Analyzed sample of the sites.
+    """
+    mean, half_width = sample.mean()
+    logger.info('Estimated from %d of %d sites (%.1f%%)', sample.analyzed,
+                sample.population,
+                sample.analyzed / (sample.population or 1) * 100.0)
+    logger.info('Average word count: %.2f +/- %.2f (95%% interval)',
+                mean, half_width)
+
+    logging.info('Top 20 headers and the estimated percentage of sites that '
+                 'returned them')
+    for header, pct, pct_half_width in sample.header_percentages(20):
+        logging.info('Header: %s - Pct: %05.2f +/- %.2f', header, pct,
+                     pct_half_width)
+
+
+def report_streaming_results(reducer):
+    """
+    Logs the ranking, averages and top headers of a streaming run.
+    Args:
+        reducer (StreamingReducer): Running totals of the analyzed sites.
+    """
+    logging.info('Websites sorted by their word count')
+    for index, (url, _) in enumerate(reducer.ranking()):
+        logging.info('Site: %s - Rank: %d', url, index + 1)
+
+    logger.info('Average word count: %s', reducer.mean('distinct_words'))
+
+    for metric, summary in reducer.summaries():
+        logger.info('Distribution of %s: %s', metric, summary)
+
+    logging.info('Top 20 headers and the percentage of sites that returned '
+                 'them')
+    for header in reducer.top_headers(20):
+        logging.info('Header: %s - Pct: %05.2f', header[0], header[1])
+
+
+def report_sketch_results(corpus_sketch):
+    """
+    Logs the estimated corpus wide distinct words, top terms and top
+    headers of a sketch mode run.
+    Args:
+        corpus_sketch (CorpusSketch): Sketches merged from every site.
+    """
+    logger.info('Estimated distinct words across all sites: %d',
+                corpus_sketch.words.distinct_count)
+
+    logging.info('Top 20 terms across all sites (estimated count)')
+    for term, count in corpus_sketch.words.terms.top(20):
+        logging.info('Term: %s - Count: %d', term, count)
+
+    logging.info('Top 20 headers by sketch (estimated percentage)')
+    for header, pct in corpus_sketch.top_headers(20):
+        logging.info('Header: %s - Pct: %05.2f', header, pct)
+
+
+def report_ngram_results(corpus_ngrams, n):
+    """
+    Logs the most frequent phrases across all the sites.
+    Args:
+        corpus_ngrams (CorpusNgrams): Frequent phrases merged from every
+          site.
+        n (int): Words per phrase.
+    """
+    logging.info('Top 20 %d word phrases across all sites (estimated count)',
+                 n)
+    for phrase, count in corpus_ngrams.top(20):
+        logging.info('Phrase: %s - Count: %d', phrase, count)
+
+
+@timed
+def report_header_values(header_table, worker_processes, headers=10,
+                         values=5):
+    """
+    Logs the most common values of the most common headers.
+    Args:
+        header_table (HeaderValueTable): Interned header values of the
+          sites.
+        worker_processes (int): Number of sub processes counting values.
+        headers (int): Number of headers to show.
+        values (int): Number of values to show per header.
+    """
+    distributions = header_table.distributions(worker_processes)
+    most_common = sorted(
+        distributions,
+        key=lambda name: -sum(count for _, count in distributions[name]))
+
+    logging.info('Most common values of the top %d headers (%d distinct '
+                 'strings interned)', headers, len(header_table.strings))
+    for header, top_values in header_table.top_values(
+            distributions, most_common[:headers], count=values):
+        for value, pct in top_values:
+            logging.info('Header: %s - Value: %s - Pct: %05.2f',
+                         header, value, pct)
+
+
 def main(
         aws_access_key_id=None,
         aws_secret_access_key=None,
         local_file_location=None,
         s3_file_location=None,
-        worker_processes=1
+        worker_processes=1,
+        fetch_workers=None,
+        output_dir=None,
+        output_format=None,
+        journal_path=None,
+        journal_batch_size=50,
+        resume=False,
+        cluster_nodes=0,
+        coordinator_address=None,
+        cluster_authkey=None,
+        cluster_batch_size=10,
+        stream=False,
+        max_in_flight=None,
+        rank_limit=None,
+        word_sketch=None,
+        ngram_counter=None,
+        index_dir=None,
+        index_segment_size=10000,
+        header_values=False,
+        dedupe=False,
+        dedupe_distance=3,
+        priority=None,
+        time_budget=None,
+        sample_fraction=None,
+        precision=None,
+        sample_strata=10,
+        rank_file=None,
+        rank_start=None,
+        rank_end=None,
+        fetch_history=None,
+        dns_prefetch=False,
+        dns_hosts=None,
+        dns_threads=32,
+        dns_lookahead=200,
+        dns_ttl=300,
+        crawl_depth=0,
+        crawl_pages=10,
+        snapshot_dir=None,
+        snapshot_ttl=86400,
+        health_file=None,
+        health_probe_interval=3600,
+        status_file=None,
+        status_port=None,
+        status_interval=5.0
 ):
     if not aws_access_key_id and not aws_secret_access_key:
-        aws_access_key_id = os.environ['AWS_ACCESS_KEY_ID']
-        aws_secret_access_key = os.environ['AWS_SECRET_ACCESS_KEY']
+        # rank files and local XML files don't need AWS keys
+        aws_access_key_id = os.environ.get('AWS_ACCESS_KEY_ID')
+        aws_secret_access_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
 
-    top_sites = AlexaTopSites(
-        aws_secret_access_key=aws_secret_access_key,
-        aws_access_key_id=aws_access_key_id
-    )
+    # fetching is network bound and can use more processes than counting
+    fetch_workers = fetch_workers or worker_processes
 
-    # top_sites.request_top_sites()
-    # print top_sites.get_site_urls()
+    deadline = None
+    if time_budget:
+        from objs.scheduler import Deadline
 
-    if local_file_location:
-        top_sites.load_from_local_file(local_file_location)
-    elif s3_file_location:
-        # parse the S3 URL into a bucket and object key
-        bucket, key = parse_s3_url(s3_file_location)
-        top_sites.load_from_s3(bucket, key)
+        # the budget covers the whole run, loading the site list included
+        deadline = Deadline(time_budget)
+
+    begin_stage('load_site_list')
+    source = None
+    if rank_file:
+        # plain rank,domain lists are read lazily from a memory map
+        source = RankFileSource(rank_file, start_rank=rank_start,
+                                end_rank=rank_end)
+    elif snapshot_dir:
+        from objs.snapshots import SnapshotStore
+
+        # repeat runs load the parsed list instead of the API or XML
+        snapshots = SnapshotStore(snapshot_dir, ttl=snapshot_ttl)
+        snapshot_params = site_list_params(local_file_location,
+                                           s3_file_location)
+        source = snapshots.load(snapshot_params,
+                                source_path=local_file_location)
+        if source is not None:
+            logger.info('Loaded %d sites from a snapshot', len(source))
+
+    if source is None:
+        top_sites = AlexaTopSites(
+            aws_secret_access_key=aws_secret_access_key,
+            aws_access_key_id=aws_access_key_id
+        )
+
+        # top_sites.request_top_sites()
+        # print top_sites.get_site_urls()
+
+        if local_file_location:
+            top_sites.load_from_local_file(local_file_location)
+        elif s3_file_location:
+            # parse the S3 URL into a bucket and object key
+            bucket, key = parse_s3_url(s3_file_location)
+            top_sites.load_from_s3(bucket, key)
+        else:
+            top_sites.request_top_sites(**TOP_SITES_REQUEST)
+        source = TopSitesSource(top_sites)
+        if snapshot_dir:
+            source = snapshots.save(snapshot_params, source.entries(),
+                                    source_path=local_file_location)
+
+    host_health = None
+    if health_file:
+        from objs.host_health import HostHealth
+
+        host_health = HostHealth(probe_interval=health_probe_interval)
+        if os.path.exists(health_file):
+            host_health.load(health_file)
+
+    dns_prefetcher = None
+    if dns_prefetch or dns_hosts:
+        from objs.dns_cache import DnsPrefetcher, StaticResolver, \
+            default_resolver
+
+        # the cache is shared by the fetch processes started after this
+        if dns_hosts:
+            resolver = StaticResolver.from_file(dns_hosts, ttl=dns_ttl)
+        else:
+            resolver = default_resolver(ttl=dns_ttl)
+        dns_prefetcher = DnsPrefetcher(resolver, threads=dns_threads,
+                                       lookahead=dns_lookahead).start()
+
+    status_reporter = None
+    if status_file or status_port is not None:
+        from objs.telemetry import StatusReporter
+
+        # the pool workers report their tasks to the main process, which
+        # shows the progress of the run while it goes
+        status_reporter = StatusReporter(status_file=status_file,
+                                         status_port=status_port,
+                                         interval=status_interval).start()
+
+    if sample_fraction or precision:
+        from objs.sampling import StratifiedSample
+
+        # only estimates are needed, so analyze a sample of the list
+        sample = StratifiedSample(source.entries(), strata=sample_strata)
+        begin_stage('analyze_sites')
+        try:
+            analyze_sample(sample, fetch_workers,
+                           max_in_flight or fetch_workers * 4,
+                           sample_fraction or 0.01, precision=precision,
+                           deadline=deadline, host_health=host_health,
+                           dns_prefetcher=dns_prefetcher,
+                           status_reporter=status_reporter)
+        finally:
+            if dns_prefetcher is not None:
+                dns_prefetcher.stop()
+            if status_reporter is not None:
+                status_reporter.stop()
+        begin_stage('summarize')
+        if host_health is not None:
+            host_health.log()
+            host_health.save(health_file)
+        report_sample_results(sample)
+        end_stage()
+        return
+
+    entries = None
+    if priority or deadline:
+        from objs.scheduler import prioritize
+
+        # fetch the most important sites first so they make the budget
+        entries = prioritize(source.entries(), priority or 'rank')
+        sites = [entry.url for entry in entries]
     else:
-        top_sites.request_top_sites()
+        # only read from the source as the sites are submitted
+        sites = source.urls()
 
-    sites = top_sites.get_site_urls()
+    full_sites = []
+    journal = None
+    if journal_path:
+        if resume:
+            # rebuild the finished sites and only fetch what is left
+            full_sites = read_journal(journal_path)
+            finished = set(site.url for site in full_sites)
+            sites = (url for url in sites if url not in finished)
+            logger.info('Resuming after %d finished sites', len(finished))
+        journal = SiteJournal(journal_path, batch_size=journal_batch_size,
+                              resume=resume)
 
-    pool = multiprocessing.Pool(processes=worker_processes)
-    results = [pool.apply_async(fill_site_data, args=(site,)) for site in sites]
-    full_sites = [p.get() for p in results]
+    budget_report = None
+    if deadline:
+        from objs.scheduler import BudgetReport
+
+        budget_report = BudgetReport(entries, deadline)
+        for site in full_sites:
+            budget_report.add(site)
+
+    if host_health is not None:
+        # hosts that keep failing are skipped until their next re-probe
+        sites = host_health.schedule(sites)
+    if dns_prefetcher is not None:
+        # resolve the hosts ahead of the fetchers so fetches don't wait
+        # on DNS
+        sites = dns_prefetcher.resolve_ahead(sites)
+    if status_reporter is not None:
+        sites = status_reporter.telemetry.track(sites)
+
+    crawler = None
+    if crawl_depth:
+        from objs.crawl import SiteCrawler
+
+        # the pages linked from each homepage are added to its site
+        crawler = SiteCrawler(max_depth=crawl_depth, max_pages=crawl_pages)
+        if dedupe:
+            logger.warning('--crawl-depth is not supported with --dedupe, '
+                           'only the homepages will be analyzed')
+
+    cluster_sketch = None
+    if cluster_nodes or coordinator_address:
+        # shard the sites across worker nodes instead of the local pool,
+        # the nodes only send back word totals and a merged word sketch
+        analyzed_sites, cluster_sketch = run_coordinator(
+            list(sites),
+            address=parse_address(coordinator_address or '127.0.0.1:0'),
+            authkey=cluster_authkey,
+            local_nodes=cluster_nodes,
+            worker_processes=fetch_workers,
+            batch_size=cluster_batch_size,
+            header_values=header_values,
+            crawler=crawler,
+            word_sketch=word_sketch
+        )
+    elif dedupe:
+        analyzed_sites = analyze_sites_deduped(
+            sites, fetch_workers, max_in_flight or fetch_workers * 4,
+            word_sketch=word_sketch, header_values=header_values,
+            max_distance=dedupe_distance, deadline=deadline,
+            ngram_counter=ngram_counter)
+    elif stream:
+        analyzed_sites = analyze_sites_streaming(
+            sites, fetch_workers, max_in_flight or fetch_workers * 4,
+            word_sketch=word_sketch, header_values=header_values,
+            deadline=deadline, crawler=crawler,
+            ngram_counter=ngram_counter)
+    else:
+        analyzed_sites = analyze_sites_in_pool(sites, fetch_workers,
+                                               word_sketch=word_sketch,
+                                               header_values=header_values,
+                                               deadline=deadline,
+                                               map_workers=worker_processes,
+                                               crawler=crawler,
+                                               ngram_counter=ngram_counter)
+
+    corpus_ngrams = None
+    if ngram_counter:
+        from objs.ngrams import CorpusNgrams
+
+        corpus_ngrams = CorpusNgrams()
+        for site in full_sites:
+            corpus_ngrams.add(site)
+
+    corpus_sketch = None
+    if word_sketch:
+        from objs.sketch import CorpusSketch
+
+        # a site sketch is about as big as an exact count of a homepage,
+        # so each one is merged and dropped instead of kept with its site
+        corpus_sketch = CorpusSketch(word_sketch)
+        for site in full_sites:
+            corpus_sketch.add(site)
+            site.release_word_sketch()
+        if cluster_sketch is not None:
+            corpus_sketch.words.merge(cluster_sketch)
+
+    header_table = None
+    if header_values:
+        from objs.header_values import HeaderValueTable
+
+        # values are interned once in the main process, sites only keep
+        # their header keys after this
+        header_table = HeaderValueTable()
+        for site in full_sites:
+            header_table.add(site)
+
+    index_writer = None
+    if index_dir:
+        from objs.index import IndexWriter
+
+        # sites restored from the journal are indexed again, replacing
+        # them if the earlier run got to write its segment
+        index_writer = IndexWriter(index_dir, segment_size=index_segment_size)
+        for site in full_sites:
+            index_writer.add(site)
+
+    begin_stage('analyze_sites')
+    reducer = None
+    if stream:
+        # only a bounded heap of the top sites, or a ranking spilled to
+        # disk, is kept instead of every site
+        if rank_limit:
+            ranking = TopRanking(rank_limit)
+        else:
+            ranking = ExternalRanking()
+        reducer = StreamingReducer(ranking)
+        for site in full_sites:
+            reducer.add(site)
+        full_sites = []
+
+    from objs.fetch_policy import FetchReport, get_policy
+
+    fetch_report = FetchReport(get_policy())
+
+    try:
+        for site in analyzed_sites:
+            if reducer is not None:
+                reducer.add(site)
+            else:
+                full_sites.append(site)
+            if corpus_sketch is not None:
+                corpus_sketch.add(site)
+            if corpus_ngrams is not None:
+                corpus_ngrams.add(site)
+            if index_writer is not None:
+                index_writer.add(site)
+            if journal:
+                journal.record(site)
+            if header_table is not None:
+                header_table.add(site)
+            if budget_report is not None:
+                budget_report.add(site)
+            fetch_report.add(site)
+            if host_health is not None:
+                host_health.record(site)
+            if corpus_sketch is not None:
+                site.release_word_sketch()
+            if status_reporter is not None:
+                status_reporter.telemetry.site_completed()
+    finally:
+        if journal:
+            journal.close()
+        if index_writer is not None:
+            index_writer.close()
+        if dns_prefetcher is not None:
+            dns_prefetcher.stop()
+        if status_reporter is not None:
+            status_reporter.stop()
+
+    begin_stage('summarize')
+    fetch_report.log()
+    if fetch_history:
+        fetch_report.save(fetch_history)
+    if host_health is not None:
+        host_health.log()
+        host_health.save(health_file)
+    if budget_report is not None:
+        # label the results with how much of the list they cover
+        budget_report.log()
+    if corpus_sketch is not None:
+        report_sketch_results(corpus_sketch)
+    if corpus_ngrams is not None:
+        report_ngram_results(corpus_ngrams, ngram_counter.n)
 
-    # remove site with no return result
-    full_sites = [site for site in full_sites if site is not None]
+    if header_table is not None:
+        report_header_values(header_table, worker_processes)
 
-    # do separate calculation here
-    for site in full_sites:
-        site.calculate_word_count()
+    if reducer is not None:
+        try:
+            report_streaming_results(reducer)
+        finally:
+            reducer.close()
+        return
 
-    average_word_count = find_average_word_count(full_sites)
+    stats = find_corpus_stats(full_sites)
+    average_word_count = find_average_word_count(stats)
     sorted_by_word_count = sorted(full_sites, key=lambda x: x.word_count_size,
                                   reverse=True)
 
-    top_headers = find_top_20_headers_map_reduce(full_sites, worker_processes)
+    top_headers = find_top_20_headers_vectorized(stats)
 
     logger.debug('Sorted by word count: %s', sorted_by_word_count)
 
@@ -254,12 +1038,24 @@ def main(
 
     logger.info('Average word count: %s', average_word_count)
 
+    for metric, summary in stats.summaries():
+        logger.info('Distribution of %s: %s', metric, summary)
+
     logger.debug('Top 20 headers: %s', top_headers)
     logging.info('Top 20 headers and the percentage of sites that returned '
                  'them')
     for header in top_headers:
         logging.info('Header: %s - Pct: %05.2f', header[0], header[1])
 
+    if output_dir:
+        from objs.output import write_run
+
+        begin_stage('write_output')
+        write_run(output_dir, stats, output_format=output_format,
+                  labels={'coverage': budget_report.labels()}
+                  if budget_report is not None else None)
+    end_stage()
+
 
 if __name__ == '__main__':
     # TODO: add proper log configuration
@@ -298,34 +1094,669 @@ if __name__ == '__main__':
         help='Location of the top sites data file in S3.'
     )
 
+    parser.add_argument(
+        '--rank-file',
+        dest='rank_file',
+        default=None,
+        help='Read the sites from a rank,domain CSV or a plain list of '
+             'domains instead of the top sites XML'
+    )
+
+    parser.add_argument(
+        '--rank-start',
+        dest='rank_start',
+        default=None,
+        type=int,
+        help='First rank to read from --rank-file'
+    )
+
+    parser.add_argument(
+        '--rank-end',
+        dest='rank_end',
+        default=None,
+        type=int,
+        help='Last rank to read from --rank-file'
+    )
+
+    parser.add_argument(
+        '--snapshot-dir',
+        dest='snapshot_dir',
+        default=None,
+        help='Directory of parsed site list snapshots, reused instead of '
+             'calling the Top Sites API or parsing the XML again'
+    )
+
+    parser.add_argument(
+        '--snapshot-ttl',
+        dest='snapshot_ttl',
+        default=86400,
+        type=int,
+        help='Seconds a site list snapshot is reused for'
+    )
+
     parser.add_argument(
         '--worker-processes',
         dest='worker_count',
-        default=4,
+        default=None,
         type=int,
-        help='Number of sub processes to use for requesting site home pages'
+        help='Number of sub processes to use for counting words and headers. '
+             'Defaults to the tuned value for this host or 4'
+    )
+
+    parser.add_argument(
+        '--fetch-workers',
+        dest='fetch_workers',
+        default=None,
+        type=int,
+        help='Number of sub processes to use for requesting site home pages. '
+             'Defaults to the tuned value for this host or '
+             '--worker-processes'
+    )
+
+    parser.add_argument(
+        '--fetch-timeout',
+        dest='fetch_timeout',
+        default=1.0,
+        type=float,
+        help='Seconds to wait for a homepage, and the starting timeout of '
+             'hosts without history with --adaptive-timeouts'
+    )
+
+    parser.add_argument(
+        '--adaptive-timeouts',
+        dest='adaptive_timeouts',
+        action='store_true',
+        help='Base each timeout on the p99 latency seen for the host, its '
+             'domain or all hosts'
+    )
+
+    parser.add_argument(
+        '--max-fetch-timeout',
+        dest='max_fetch_timeout',
+        default=10.0,
+        type=float,
+        help='Longest adaptive or retry timeout in seconds'
+    )
+
+    parser.add_argument(
+        '--fetch-retries',
+        dest='fetch_retries',
+        default=0,
+        type=int,
+        help='Times to retry a homepage that timed out, could not be '
+             'connected to or returned a 5xx status'
+    )
+
+    parser.add_argument(
+        '--retry-budget',
+        dest='retry_budget',
+        default=0.1,
+        type=float,
+        help='Retries and hedged requests allowed as a share of all the '
+             'requests of a worker'
+    )
+
+    parser.add_argument(
+        '--hedge',
+        dest='hedge',
+        action='store_true',
+        help='Send a second request for a homepage once the first is slower '
+             'than the p95 latency of its host'
+    )
+
+    parser.add_argument(
+        '--fetch-history',
+        dest='fetch_history',
+        default=None,
+        help='File the per host fetch latencies are loaded from and saved '
+             'to, so timeouts and hedging start from the last run'
+    )
+
+    parser.add_argument(
+        '--status-file',
+        dest='status_file',
+        default=None,
+        help='JSON file the live status of the run is rewritten to'
+    )
+
+    parser.add_argument(
+        '--status-port',
+        dest='status_port',
+        default=None,
+        type=int,
+        help='Serve the live status of the run at '
+             'http://127.0.0.1:<port>/status'
+    )
+
+    parser.add_argument(
+        '--status-interval',
+        dest='status_interval',
+        default=5.0,
+        type=float,
+        help='Seconds between rewrites of --status-file'
+    )
+
+    parser.add_argument(
+        '--health-file',
+        dest='health_file',
+        default=None,
+        help='File the health of every fetched host is loaded from and '
+             'saved to, hosts that keep failing are skipped'
+    )
+
+    parser.add_argument(
+        '--health-probe-interval',
+        dest='health_probe_interval',
+        default=3600,
+        type=int,
+        help='Seconds a failed host is skipped for, doubled with every '
+             'failure in a row'
+    )
+
+    parser.add_argument(
+        '--crawl-depth',
+        dest='crawl_depth',
+        default=0,
+        type=int,
+        help='Also crawl the same-site pages up to this many links away '
+             'from each homepage and count their words with the site'
+    )
+
+    parser.add_argument(
+        '--crawl-pages',
+        dest='crawl_pages',
+        default=10,
+        type=int,
+        help='Most pages crawled per site with --crawl-depth, the homepage '
+             'included'
+    )
+
+    parser.add_argument(
+        '--dns-prefetch',
+        dest='dns_prefetch',
+        action='store_true',
+        help='Resolve the site hosts ahead of the fetchers into a DNS cache '
+             'shared by all the fetch processes'
+    )
+
+    parser.add_argument(
+        '--dns-hosts',
+        dest='dns_hosts',
+        default=None,
+        help='Resolve the hosts from this hosts file instead of DNS, '
+             'implies --dns-prefetch'
+    )
+
+    parser.add_argument(
+        '--dns-threads',
+        dest='dns_threads',
+        default=32,
+        type=int,
+        help='Number of hosts resolved at once'
+    )
+
+    parser.add_argument(
+        '--dns-lookahead',
+        dest='dns_lookahead',
+        default=200,
+        type=int,
+        help='Most sites resolved ahead of the ones being fetched'
+    )
+
+    parser.add_argument(
+        '--dns-ttl',
+        dest='dns_ttl',
+        default=300,
+        type=int,
+        help='Seconds answers are cached for when the resolver gives no TTL'
+    )
+
+    parser.add_argument(
+        '--output-dir',
+        dest='output_dir',
+        default=None,
+        help='Directory to write the run results to for later comparison'
+    )
+
+    parser.add_argument(
+        '--output-format',
+        dest='output_format',
+        default=None,
+        choices=OUTPUT_FORMATS,
+        help='Format of the run results, one of arrow, parquet or csv. '
+             'Defaults to arrow when pyarrow is '
+             'installed, otherwise csv'
+    )
+
+    parser.add_argument(
+        '--journal',
+        dest='journal_path',
+        default=None,
+        help='File to append each completed site to so the run can be '
+             'resumed'
+    )
+
+    parser.add_argument(
+        '--journal-batch-size',
+        dest='journal_batch_size',
+        default=50,
+        type=int,
+        help='Number of completed sites written between each sync of the '
+             'journal to disk'
+    )
+
+    parser.add_argument(
+        '--resume',
+        dest='resume',
+        action='store_true',
+        help='Skip the sites already completed in the journal and rebuild '
+             'the results from it'
+    )
+
+    parser.add_argument(
+        '--cluster-nodes',
+        dest='cluster_nodes',
+        default=0,
+        type=int,
+        help='Number of local worker nodes to start and shard the sites '
+             'across'
+    )
+
+    parser.add_argument(
+        '--coordinator-address',
+        dest='coordinator_address',
+        default=None,
+        help='host:port for the coordinator to listen on for worker nodes'
+    )
+
+    parser.add_argument(
+        '--worker-node',
+        dest='worker_node',
+        default=None,
+        help='Run as a worker node for the coordinator at host:port'
+    )
+
+    parser.add_argument(
+        '--cluster-authkey',
+        dest='cluster_authkey',
+        default=os.environ.get(CLUSTER_KEY_ENV),
+        help='Shared key used between the coordinator and worker nodes, '
+             'needed unless the coordinator only listens on loopback'
+    )
+
+    parser.add_argument(
+        '--cluster-authkey-file',
+        dest='cluster_authkey_file',
+        default=None,
+        help='File holding the shared key used between the coordinator and '
+             'worker nodes'
+    )
+
+    parser.add_argument(
+        '--cluster-batch-size',
+        dest='cluster_batch_size',
+        default=10,
+        type=int,
+        help='Number of sites handed to a worker node at a time'
+    )
+
+    parser.add_argument(
+        '--stream',
+        dest='stream',
+        action='store_true',
+        help='Reduce the sites as they finish with a bounded number in '
+             'flight instead of holding every site in memory'
+    )
+
+    parser.add_argument(
+        '--max-in-flight',
+        dest='max_in_flight',
+        default=None,
+        type=int,
+        help='Most sites submitted to the pool at once in stream mode. '
+             'Defaults to 4 times the worker processes'
+    )
+
+    parser.add_argument(
+        '--rank-limit',
+        dest='rank_limit',
+        default=None,
+        type=int,
+        help='Only rank the top N sites by word count in stream mode. '
+             'Without it every site is ranked with an external sort'
+    )
+
+    parser.add_argument(
+        '--index-dir',
+        dest='index_dir',
+        default=None,
+        help='Add the word counts of the sites to an inverted index in this '
+             'directory that can be searched with query-index.py'
+    )
+
+    parser.add_argument(
+        '--index-segment-size',
+        dest='index_segment_size',
+        default=10000,
+        type=int,
+        help='Number of sites held in memory before they are written out '
+             'as a new index segment'
+    )
+
+    parser.add_argument(
+        '--header-values',
+        dest='header_values',
+        action='store_true',
+        help='Keep the header values and report the most common values of '
+             'each header'
+    )
+
+    parser.add_argument(
+        '--dedupe',
+        dest='dedupe',
+        action='store_true',
+        help='Fingerprint the sites before parsing them and reuse the word '
+             'counts of one site for its near duplicates'
+    )
+
+    parser.add_argument(
+        '--dedupe-distance',
+        dest='dedupe_distance',
+        default=3,
+        type=int,
+        help='Most bits two site fingerprints can differ by for the sites '
+             'to be near duplicates'
+    )
+
+    parser.add_argument(
+        '--priority',
+        dest='priority',
+        default=None,
+        choices=['rank', 'reach', 'page-views'],
+        help='Fetch the sites in order of their rank, or of their reach or '
+             'page views with the highest first'
+    )
+
+    parser.add_argument(
+        '--time-budget',
+        dest='time_budget',
+        default=None,
+        type=float,
+        help='Seconds the run has to analyze sites. Sites that are not done '
+             'in time are left out and the results are labeled partial'
+    )
+
+    parser.add_argument(
+        '--sample-fraction',
+        dest='sample_fraction',
+        default=None,
+        type=float,
+        help='Only analyze this fraction of the sites, sampled from each '
+             'rank bucket, and estimate the results'
+    )
+
+    parser.add_argument(
+        '--precision',
+        dest='precision',
+        default=None,
+        type=float,
+        help='Grow the sample until the 95%% interval of the average word '
+             'count is within this fraction of the average'
+    )
+
+    parser.add_argument(
+        '--sample-strata',
+        dest='sample_strata',
+        default=10,
+        type=int,
+        help='Number of rank buckets the sites are sampled from'
+    )
+
+    parser.add_argument(
+        '--ngrams',
+        dest='ngrams',
+        default=0,
+        type=int,
+        help='Also count the phrases of this many words, like 2 for bigrams, '
+             'per site and across all sites'
+    )
+
+    parser.add_argument(
+        '--ngram-top',
+        dest='ngram_top',
+        default=20,
+        type=int,
+        help='Most frequent phrases kept per site with --ngrams'
+    )
+
+    parser.add_argument(
+        '--ngram-min-count',
+        dest='ngram_min_count',
+        default=2,
+        type=int,
+        help='Fewest times a phrase has to appear on a site to be kept'
+    )
+
+    parser.add_argument(
+        '--sketch',
+        dest='sketch',
+        action='store_true',
+        help='Estimate distinct words and top terms and headers with fixed '
+             'size sketches instead of exact counts'
+    )
+
+    parser.add_argument(
+        '--sketch-error',
+        dest='sketch_error',
+        default=0.02,
+        type=float,
+        help='Relative error of the distinct word estimates in sketch mode'
+    )
+
+    parser.add_argument(
+        '--sketch-epsilon',
+        dest='sketch_epsilon',
+        default=0.005,
+        type=float,
+        help='Most a term or header count is over estimated in sketch '
+             'mode, as a fraction of all the items counted'
+    )
+
+    parser.add_argument(
+        '--sketch-delta',
+        dest='sketch_delta',
+        default=0.01,
+        type=float,
+        help='Probability that a count goes over the epsilon bound in '
+             'sketch mode'
+    )
+
+    parser.add_argument(
+        '--sketch-top-k',
+        dest='sketch_top_k',
+        default=50,
+        type=int,
+        help='Number of top terms and headers tracked in sketch mode'
+    )
+
+    parser.add_argument(
+        '--profile',
+        dest='profile',
+        action='store_true',
+        help='Profile the run, including every pool worker, and print the '
+             'merged stats at the end'
+    )
+
+    parser.add_argument(
+        '--profile-mode',
+        dest='profile_mode',
+        default='cprofile',
+        choices=['cprofile', 'sample'],
+        help='Use cProfile or the lower overhead sampling profiler'
+    )
+
+    parser.add_argument(
+        '--profile-interval',
+        dest='profile_interval',
+        default=0.005,
+        type=float,
+        help='Seconds of CPU time between samples in sample mode'
+    )
+
+    parser.add_argument(
+        '--profile-dir',
+        dest='profile_dir',
+        default=None,
+        help='Directory to keep the per-process profiles in. A temporary '
+             'directory is used and removed when not set'
     )
 
     args = parser.parse_args()
-    pr = cProfile.Profile()
-    pr.enable()
-
-    main(
-        aws_access_key_id=args.access_key_id,
-        aws_secret_access_key=args.secret_access_key,
-        local_file_location=args.local_file_location,
-        s3_file_location=args.s3_location,
-        worker_processes=args.worker_count
-    )
-
-    pr.disable()
-    s = StringIO.StringIO()
-    sortby = 'cumulative'
-    ps = pstats.Stats(pr, stream=s).sort_stats(sortby)
-    ps.print_stats('get_site_urls')
-    ps.print_stats('fill_site_data')
-    ps.print_stats('calculate_word_count')
-    ps.print_stats('find_average_word_count')
-    ps.print_stats('find_top_20_headers_map_reduce')
-
-    print(s.getvalue())
+
+    # fall back on the settings autotune.py saved for this host
+    from objs.autotune import load_settings
+
+    tuned = load_settings()
+    if args.worker_count is None:
+        args.worker_count = tuned.get('worker_processes', 4)
+    if args.fetch_workers is None:
+        args.fetch_workers = tuned.get('fetch_workers', args.worker_count)
+
+    from objs.fetch_policy import FetchPolicy, configure_policy
+
+    # every fetch process picks the policy up from the environment
+    configure_policy(FetchPolicy(
+        timeout=args.fetch_timeout,
+        adaptive=args.adaptive_timeouts,
+        max_timeout=args.max_fetch_timeout,
+        retries=args.fetch_retries,
+        retry_budget=args.retry_budget,
+        hedge=args.hedge
+    ), history_path=args.fetch_history)
+
+    # the coordinator's manager unpickles what it is sent, only a
+    # loopback coordinator can do without a secret key
+    cluster_authkey = None
+    if args.cluster_authkey or args.cluster_authkey_file:
+        cluster_authkey = resolve_authkey(None, args.cluster_authkey,
+                                          args.cluster_authkey_file)
+    elif args.worker_node or (args.coordinator_address and not is_loopback(
+            parse_address(args.coordinator_address)[0])):
+        parser.error('--cluster-authkey or --cluster-authkey-file is needed '
+                     'for worker nodes and coordinators that are not on '
+                     'loopback')
+
+    # a streaming run doesn't keep the sites to write the tables from
+    if args.stream and args.output_dir:
+        parser.error('--output-dir is not supported with --stream')
+
+    # the nodes only send back word totals and can't be stopped early
+    if args.cluster_nodes or args.coordinator_address:
+        for flag, value in (('--time-budget', args.time_budget),
+                            ('--ngrams', args.ngrams),
+                            ('--index-dir', args.index_dir)):
+            if value:
+                parser.error('%s is not supported with --cluster-nodes or '
+                             '--coordinator-address' % flag)
+
+    word_sketch = None
+    if args.sketch:
+        from objs.sketch import SketchMapper
+
+        word_sketch = SketchMapper(
+            error_rate=args.sketch_error,
+            epsilon=args.sketch_epsilon,
+            delta=args.sketch_delta,
+            top_k=args.sketch_top_k
+        )
+
+    if args.worker_node:
+        from objs.crawl import SiteCrawler
+
+        run_worker_node(
+            parse_address(args.worker_node),
+            authkey=cluster_authkey,
+            worker_processes=args.fetch_workers,
+            header_values=args.header_values,
+            crawler=SiteCrawler(max_depth=args.crawl_depth,
+                                max_pages=args.crawl_pages)
+            if args.crawl_depth else None,
+            word_sketch=word_sketch
+        )
+        raise SystemExit()
+
+    ngram_counter = None
+    if args.ngrams:
+        from objs.ngrams import NgramCounter
+
+        ngram_counter = NgramCounter(
+            n=args.ngrams,
+            top=args.ngram_top,
+            min_count=args.ngram_min_count
+        )
+
+    if args.profile:
+        from objs.profiling import RunProfiler
+
+        profiler = RunProfiler(
+            profile_dir=args.profile_dir,
+            mode=args.profile_mode,
+            interval=args.profile_interval
+        )
+
+    try:
+        main(
+            aws_access_key_id=args.access_key_id,
+            aws_secret_access_key=args.secret_access_key,
+            local_file_location=args.local_file_location,
+            s3_file_location=args.s3_location,
+            worker_processes=args.worker_count,
+            fetch_workers=args.fetch_workers,
+            output_dir=args.output_dir,
+            output_format=args.output_format,
+            journal_path=args.journal_path,
+            journal_batch_size=args.journal_batch_size,
+            resume=args.resume,
+            cluster_nodes=args.cluster_nodes,
+            coordinator_address=args.coordinator_address,
+            cluster_authkey=cluster_authkey,
+            cluster_batch_size=args.cluster_batch_size,
+            stream=args.stream,
+            max_in_flight=args.max_in_flight,
+            rank_limit=args.rank_limit,
+            word_sketch=word_sketch,
+            ngram_counter=ngram_counter,
+            index_dir=args.index_dir,
+            index_segment_size=args.index_segment_size,
+            header_values=args.header_values,
+            dedupe=args.dedupe,
+            dedupe_distance=args.dedupe_distance,
+            priority=args.priority,
+            time_budget=args.time_budget,
+            sample_fraction=args.sample_fraction,
+            precision=args.precision,
+            sample_strata=args.sample_strata,
+            rank_file=args.rank_file,
+            rank_start=args.rank_start,
+            rank_end=args.rank_end,
+            fetch_history=args.fetch_history,
+            dns_prefetch=args.dns_prefetch,
+            dns_hosts=args.dns_hosts,
+            dns_threads=args.dns_threads,
+            dns_lookahead=args.dns_lookahead,
+            dns_ttl=args.dns_ttl,
+            crawl_depth=args.crawl_depth,
+            crawl_pages=args.crawl_pages,
+            snapshot_dir=args.snapshot_dir,
+            snapshot_ttl=args.snapshot_ttl,
+            health_file=args.health_file,
+            health_probe_interval=args.health_probe_interval,
+            status_file=args.status_file,
+            status_port=args.status_port,
+            status_interval=args.status_interval
+        )
+    finally:
+        # stop the profiler even when the run fails, the sampling timer
+        # would otherwise kill the interpreter while it shuts down
+        if args.profile:
+            print(profiler.finish())